@@ -18,20 +18,58 @@ VERSION = "0.6.2"
 
 STASH_UUID = "plum123456789987654321plum"
 COMMAND_TIMEOUT = 3  # 执行命令超时时间
-PROCESSES_NUMBER = 100  # 进程数量
 LOCAL_HOST = "__localhost__"
+PING_TIMEOUT = 3  # 主机存活探测超时时间
+PING_CONCURRENCY = 1024  # 同时进行的主机存活探测数量
+PING_TCP_PORTS = (22, 80, 443)  # 无法使用ICMP时进行TCP探测的端口
+PING_MIN_TIMEOUT = 0.2  # 自适应超时时间的下限
+PING_RATE = 5000  # 每秒最多发出的探测数量
+PING_STATS_COUNT = 3  # 统计往返时间时每个ip的探测次数
+PING_BACKOFF_BASE = 60  # 离线主机第一次重新探测的退避时间
+PING_BACKOFF_MAX = 3600  # 离线主机最长的退避时间
+PING_CACHE_TIMEOUT = 30  # 其他 pping 正在写缓存时最长的等待时间，单位秒
+PING_WATCH_INTERVAL = 10  # 持续探测的间隔时间
+PSSH_CONCURRENCY = 64  # 同时执行命令的主机数量
+PSSH_TIMEOUT = 60  # 每台主机执行命令的超时时间
+# ssh主连接在最后一个会话结束后保持的时间，no 表示不复用连接
+SSH_CONTROL_PERSIST = os.environ.get("PLUM_SSH_CONTROL_PERSIST", "10m")
+SSH_CONTROL_PATH_MAX = 90  # unix socket 路径的长度限制，ssh创建时还会加上临时后缀，超过时使用 %C 哈希作为文件名
+GITREPO_IGNORE = (".git", "node_modules", ".venv", "venv", "__pycache__", ".tox", ".mypy_cache")  # 查找仓库时跳过的目录
+GITREPO_SCAN_WORKERS = 16  # 并行遍历目录的线程数量
+GITREPO_SCAN_BATCH = 64  # 每个遍历任务处理的目录数量
+# 同时检查的仓库数量，主要时间花在等待git子进程和磁盘io上，线程数可以大于cpu数量
+GITREPO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+GITREPO_DETAIL_LIMIT = 20  # 每个仓库最多保存的改动文件、未跟踪文件数量，超过的只计数
+GITREPO_WATCH_INTERVAL = 1  # 不支持inotify时检查文件变化的间隔时间
+GITREPO_WATCH_DEBOUNCE = 0.1  # 文件变化停止多久后重新检查仓库
+GITREPO_WATCH_SETTLE_ROUNDS = 10  # 文件持续变化时最多等待的轮数
+GITSTASH_WORKERS = min(8, (os.cpu_count() or 1) * 2)  # 同时切换分支的仓库数量，切换分支会大量读写磁盘
+GITSTASH_WORKTREE_MAX = 5  # 最多缓存的分支工作区数量，超过时删除最久没有使用的
+GITMETA_MAX_ENTRIES = 5000  # 索引中文件数量超过此值时不直接读取 .git 目录判断仓库状态
+GITBATCH_MAX_PROCESSES = 32  # 最多同时保留的 git cat-file 常驻进程数量，超过时关闭最久没有使用的
+GITBATCH_WALK_LIMIT = 2000  # 通过 git cat-file 统计超前落后的提交数时最多读取的提交数量，超过时执行 git rev-list
 
 
 class GitCommand(StrEnum):
     """git 相关命令"""
 
     STASH_LIST = "git stash list"  # 检查是否有文件在储藏区
+    STASH_MESSAGES = "git stash list --format=%gs"  # 只输出每个储藏的说明，第n行对应 stash@{n}
     STATUS_DEFAULT = "git status"  # 检查文件状态
     STATUS_SHORT = "git status -s"  # 检查文件状态，简短输出，只能看到文件是否有改动，无法确认是否落后、超前远程分支
     BRANCH_ABBREV = "git rev-parse --abbrev-ref HEAD"  # 查询当前分支名
-    STASH_SAVE = 'git stash save "%s"'  # 保存修改的文件到储藏区
+    STASH_SAVE = "git stash save %s"  # 保存修改的文件到储藏区
     STASH_POP = "git stash pop --index %s"  # 把储藏的文件恢复
     GIT_CHECKOUT = "git checkout %s"  # 切换分支
+    WORKTREE_ADD = "git worktree add %s %s"  # 为分支创建工作区
+    WORKTREE_REMOVE = "git worktree remove %s"  # 删除工作区，有未提交的修改时会失败
+    WORKTREE_PRUNE = "git worktree prune"  # 清理已经被删除的工作区记录
+    # 一次查询分支、超前落后的提交数、改动的文件和储藏数量，-z 输出的文件名不会被转义
+    STATUS_PORCELAIN = "git status --porcelain=v2 --branch --show-stash -z"
+    STATUS_IGNORED = "git status --porcelain=v2 --branch --show-stash -z --ignored=matching"  # 同时输出被忽略的文件
+    REV_LIST_COUNT = "git rev-list --left-right --count %s...%s"  # 两个提交各自独有的提交数
+    CAT_FILE_CHECK = "git cat-file --batch-check"  # 常驻进程，每行输入一个对象名，输出对象的提交、类型和大小
+    CAT_FILE_BATCH = "git cat-file --batch"  # 常驻进程，每行输入一个对象名，输出对象的提交、类型、大小和内容
 
     PULL_KEYWORD = '"git pull"'  # 落后远程分支关键字
     PUSH_KEYWORD = '"git push"'  # 超前远程分支关键字
@@ -54,6 +92,15 @@ class SSHConfig(IntEnum):
     CONNECT_TIMEOUT = 3
 
 
+class PingExitCode(IntEnum):
+    """pping --exit-status 时的退出码，1 表示参数错误，2 是 argparse 的用法错误，不能使用"""
+
+    ALL_UP = 0  # 所有主机都能ping通
+    PARTIAL = 3  # 部分主机能ping通
+    NONE_UP = 4  # 所有主机都ping不通
+    INTERRUPTED = 130  # 第一轮探测完成前被 Ctrl-C 中断
+
+
 class PathConfig(StrEnum):
     """相关配置文件"""
 
@@ -63,3 +110,15 @@ class PathConfig(StrEnum):
     PLUM_YML_PATH = os.path.join(HOME, PLUM_YML_NAME)  # 项目需要的配置文件路径
     SSH_CONFIG_NAME = ".ssh/config"  # ssh配置文件名
     SSH_CONFIG_PATH = os.path.join(HOME, SSH_CONFIG_NAME)  # ssh配置文件路径
+    CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(HOME, ".cache"), "plum_tools")  # 缓存目录
+    PING_CACHE_PATH = os.path.join(CACHE_DIR, "pping.db")  # 主机存活状态缓存文件路径
+    GITREPO_INDEX_PATH = os.path.join(CACHE_DIR, "gitrepo_index.json")  # git仓库索引文件路径
+    SSH_CONFIG_INDEX_PATH = os.path.join(CACHE_DIR, "ssh_config_index.json")  # ~/.ssh/config 解析结果缓存文件路径
+    PLUM_YML_CACHE_PATH = os.path.join(CACHE_DIR, "plum_tools_yaml.marshal")  # 校验后的yml配置快照路径
+    # 运行时目录，保存 ssh 主连接的 socket，没有 XDG_RUNTIME_DIR 时使用临时目录下每个用户独立的目录
+    RUNTIME_DIR = (
+        os.path.join(os.environ["XDG_RUNTIME_DIR"], "plum_tools")
+        if os.environ.get("XDG_RUNTIME_DIR")
+        else os.path.join("/tmp", f"plum_tools-{os.getuid()}")  # nosec B108
+    )
+    SSH_CONTROL_DIR = os.path.join(RUNTIME_DIR, "ssh")  # ssh主连接的socket目录
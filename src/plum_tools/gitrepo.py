@@ -10,34 +10,115 @@
 #=============================================================================
 """
 
+import argparse
+import contextlib
+import dataclasses
 import functools
 import os
-from collections.abc import Generator
-from multiprocessing import Pool
+import queue
+import threading
+import time
+from collections.abc import Callable, Generator, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 
-from .conf import PROCESSES_NUMBER
-from .utils.git import check_is_git_repository, check_repository_modify_status, check_repository_stash
+from .conf import (
+    GITREPO_DETAIL_LIMIT,
+    GITREPO_IGNORE,
+    GITREPO_WATCH_DEBOUNCE,
+    GITREPO_WATCH_SETTLE_ROUNDS,
+    GITREPO_WORKERS,
+    PathConfig,
+)
+from .exceptions import RunCmdError, RunCmdTimeout
+from .utils.drift import BranchDrift, check_drift, find_mirror
+from .utils.git import RepoStatus, format_status, get_repository_status, iter_status_lines
+from .utils.gitmeta import STATE_CLEAN, STATE_DIRTY, quick_status, record_clean
+from .utils.output import STRUCTURED_FORMATS, RecordWriter, get_writer
 from .utils.parser import get_base_parser
-from .utils.printer import print_error, print_warn
+from .utils.printer import print_error, print_ok, print_warn
+from .utils.repoindex import RepositoryIndex
+from .utils.scanner import RepositoryScanner
+from .utils.timing import Profiler, print_profile
+from .utils.watcher import BaseWatcher, create_watcher, iter_new_watch_dirs, iter_watch_dirs
 
+RECORD_FIELDS = (
+    "path",
+    "state",
+    "branch",
+    "upstream",
+    "ahead",
+    "behind",
+    "dirty",
+    "untracked",
+    "stash",
+    "latency_ms",
+    "error",
+)
+# 表格中路径的长度不固定，放在最后一列
+TABLE_FIELDS = ("state", "branch", "ahead", "behind", "dirty", "untracked", "stash", "latency_ms", "path")
+OUTPUT_FORMATS = ("text", *STRUCTURED_FORMATS, "table")
+# 分支差异检查每个分支输出一条记录
+DRIFT_FIELDS = (
+    "path",
+    "branch",
+    "upstream",
+    "ahead",
+    "behind",
+    "mirror_ahead",
+    "mirror_behind",
+    "error",
+    "mirror_error",
+)
+DRIFT_TABLE_FIELDS = ("branch", "ahead", "behind", "mirror_ahead", "mirror_behind", "error", "mirror_error", "path")
 
-def find_git_project_for_python(path: str) -> Generator[str, None, None]:
+
+def find_git_project_for_python(
+    path: str,
+    nested: bool = False,
+    ignore: Iterable[str] = GITREPO_IGNORE,
+) -> Generator[str, None, None]:
     """查找目录下所有的 git仓库
 
     :param path 要被检查的目录
     :example path "/tmp/git"
 
+    :param nested 是否查找仓库内嵌套的仓库
+    :example nested False
+
+    :param ignore 不需要遍历的目录名
+    :example ignore (".git", "node_modules")
+
     >>> for path in find_git_project_for_python("/tmp"):
     ...    print path
 
 
     """
-    for root, _, _ in os.walk(path):
-        if check_is_git_repository(root):
-            yield root
+    yield from RepositoryScanner(ignore, nested).scan([path])
+
 
+def phase(profiler: Profiler | None, name: str, key: str = "") -> contextlib.AbstractContextManager:
+    """记录一个阶段的耗时，没有 profiler 时不记录
+
+    :param profiler 耗时记录，None表示不记录
+    :example profiler Profiler()
+
+    :param name 阶段名
+    :example name status
+
+    :param key 所属的仓库
+    :example key /tmp/git
+    """
+    return profiler.span(name, key) if profiler is not None else contextlib.nullcontext()
 
-def check_project(path: str, stash: bool = True) -> dict:
+
+def check_project(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+    path: str,
+    stash: bool = True,
+    fast: bool = False,
+    detail: bool = True,
+    profiler: Profiler | None = None,
+    limit: int | None = GITREPO_DETAIL_LIMIT,
+) -> dict:
     """检查git项目
 
     :param path 仓库路径
@@ -46,41 +127,230 @@ def check_project(path: str, stash: bool = True) -> dict:
     :param stash 是否显示储藏信息
     :example stash True
 
+    :param fast 是否先直接读取 .git 目录判断仓库状态，无法判断时再执行git命令
+    :example fast False
+
+    :param detail 是否需要详细信息，不需要时确定仓库有改动就不再执行git命令
+    :example detail True
+
+    :param profiler 记录读取 .git 目录(meta)、执行git命令(status)和整个仓库(repo)的耗时，None表示不记录
+    :example profiler Profiler()
+
+    :param limit 改动的文件、未跟踪的文件最多保存的数量，超过的只计数，None表示不限制
+    :example limit 20
+
     :return result {
         path: 仓库路径
         output: 检查输出信息
         status:
             True 仓库有文件进行了修改或有储藏文件
             False 仓库没有和远程一致。且没有储藏文件
+        repo: 仓库状态，无法得到详细状态时为None
+        error: git命令执行失败的错误信息
+        latency: 检查耗时，单位秒
     }
     :example result {
         "path": "/tmp/git",
         "status": False,
-        "output": ""
+        "output": "",
+        "repo": RepoStatus("/tmp/git", "master"),
+        "error": None,
+        "latency": 0.003,
     }
     """
-    result = {
+    start = time.perf_counter()
+    result = _check_project(path, stash, fast, detail, profiler, limit)
+    result["latency"] = time.perf_counter() - start
+    if profiler is not None:
+        profiler.add("repo", path, start, result["latency"])
+    return result
+
+
+def _check_project(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+    path: str,
+    stash: bool,
+    fast: bool,
+    detail: bool,
+    profiler: Profiler | None,
+    limit: int | None,
+) -> dict:
+    """检查git项目，参数和返回值见 `check_project`"""
+    result: dict = {
         "path": path,
         "status": False,
+        "repo": None,
+        "error": None,
     }
-    # 检查文件是否改动
-    status_result, status_out = check_repository_modify_status(path)
-    if status_result:
+    if fast:
+        with phase(profiler, "meta", path):
+            quick = quick_status(path)
+        if quick.state == STATE_CLEAN and not (stash and quick.stash):
+            result["repo"] = RepoStatus(path, quick.branch, stash=quick.stash)
+            return result
+        if quick.state == STATE_DIRTY and not detail:
+            result["status"] = True
+            result["output"] = ""
+            return result
+    # 一次git命令查询文件是否改动、是否和远程一致、储藏数量
+    try:
+        with phase(profiler, "status", path):
+            status = get_repository_status(path, ignored=fast, limit=limit)
+    except (RunCmdError, RunCmdTimeout) as e:
         result["status"] = True
-        result["output"] = status_out
-        return result
-
-    if not stash:
+        result["output"] = result["error"] = getattr(e, "err_msg", "").strip() or str(e)
         return result
-    # 检查是否有文件储藏
-    stash_result, stash_out = check_repository_stash(path)
-    if stash_result:
+    result["repo"] = status
+    if fast and not status.dirty:
+        # 记录仓库干净时的工作区快照，下次可以不执行git命令
+        record_clean(path, status.ignored)
+        # 检查结果会保留到输出结束，被忽略的目录只有快照需要
+        status.ignored = []
+    if status.modified or (stash and status.stash):
         result["status"] = True
-        result["output"] = stash_out
+        result["output"] = format_status(status)
     return result
 
 
-def check_projects(projects: list[str], detail: bool, stash: bool = True) -> None:
+def get_state(item: dict) -> str:
+    """仓库状态 clean/modified/error
+
+    :param item `check_project` 的返回值
+    :example item {"path": "/tmp/git", "status": False}
+    """
+    if item.get("error"):
+        return "error"
+    return "modified" if item["status"] else "clean"
+
+
+def to_record(item: dict) -> dict:
+    """把检查结果转换为结构化输出的记录
+
+    :param item `check_project` 的返回值
+    :example item {"path": "/tmp/git", "status": False, "repo": RepoStatus("/tmp/git", "master")}
+
+    :return 记录，无法得到的值为None
+    """
+    repo: RepoStatus | None = item.get("repo")
+    record = {
+        "path": item["path"],
+        "state": get_state(item),
+        "error": item.get("error"),
+        "latency_ms": round(item.get("latency", 0) * 1000, 3),
+    }
+    if repo is not None:
+        record.update(
+            branch=repo.branch,
+            upstream=repo.upstream,
+            ahead=repo.ahead,
+            behind=repo.behind,
+            dirty=repo.changed_count,
+            untracked=repo.untracked_count,
+            stash=repo.stash,
+        )
+    return record
+
+
+def iter_check_projects(
+    targets: Iterable[str],
+    check: Callable[[str], dict],
+    workers: int = GITREPO_WORKERS,
+) -> Iterator[dict]:
+    """用线程池检查仓库，边查找仓库边检查，检查完一个返回一个
+
+    git命令通过 `cwd` 参数指定仓库目录，不会切换当前进程的工作目录，可以在多个线程中同时执行
+
+    :param targets 仓库路径，可以是查找仓库的生成器
+    :example targets ["/tmp/git"]
+
+    :param check 检查单个仓库的函数
+    :example check check_project
+
+    :param workers 同时检查的仓库数量
+    :example workers 16
+
+    :return 检查结果，和 `check_project` 的返回值一致
+    """
+    results: queue.SimpleQueue = queue.SimpleQueue()
+
+    def submit_all() -> None:
+        """在单独的线程中查找仓库，找到后立即提交检查，最后放入仓库总数"""
+        count = 0
+        try:
+            for path in targets:
+                pool.submit(check, path).add_done_callback(results.put)
+                count += 1
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            results.put(e)
+            return
+        results.put(count)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        feeder = threading.Thread(target=submit_all, daemon=True)
+        feeder.start()
+        total, done = None, 0
+        try:
+            while total is None or done < total:
+                item = results.get()
+                if isinstance(item, Exception):
+                    raise item
+                if isinstance(item, int):
+                    total = item
+                    continue
+                done += 1
+                yield item.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def find_repositories(
+    projects: list[str],
+    ignore: Iterable[str] = GITREPO_IGNORE,
+    nested: bool = False,
+    index: RepositoryIndex | None = None,
+    profiler: Profiler | None = None,
+) -> Iterable[str]:
+    """查找目录下所有的仓库，找到一个返回一个
+
+    :param projects 需要检查的目录列表
+    :example ["/tmp"]
+
+    :param ignore 不需要遍历的目录名
+    :example (".git", "node_modules")
+
+    :param nested 是否查找仓库内嵌套的仓库
+    :example False
+
+    :param index 仓库索引，None表示不使用索引
+    :example RepositoryIndex("~/.cache/plum_tools/gitrepo_index.json")
+
+    :param profiler 耗时记录，None表示不记录
+    :example Profiler()
+
+    :return 仓库路径
+    """
+    # 索引中以绝对路径记录目录
+    projects = [os.path.abspath(path) for path in projects]
+    targets: Iterable[str] = RepositoryScanner(ignore, nested, index=index).scan(projects)
+    if profiler is not None:
+        # 在提交检查任务的线程中查找仓库，提交不会阻塞，耗时就是查找仓库的时间
+        targets = profiler.iter_span("discovery", targets)
+    return targets
+
+
+def check_projects(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+    projects: list[str],
+    detail: bool,
+    stash: bool = True,
+    nested: bool = False,
+    ignore: Iterable[str] = GITREPO_IGNORE,
+    index: RepositoryIndex | None = None,
+    fast: bool = False,
+    workers: int = GITREPO_WORKERS,
+    fmt: str = "text",
+    profiler: Profiler | None = None,
+    limit: int | None = GITREPO_DETAIL_LIMIT,
+    full: bool = False,
+) -> None:
     """检查指导目录下所有的仓库是否有修改
 
     当仓库中有内容被修改时，打印黄色警告信息
@@ -93,22 +363,393 @@ def check_projects(projects: list[str], detail: bool, stash: bool = True) -> Non
 
     :param stash 是否显示储藏信息
     :example False
+
+    :param nested 是否查找仓库内嵌套的仓库
+    :example False
+
+    :param ignore 不需要遍历的目录名
+    :example (".git", "node_modules")
+
+    :param index 仓库索引，None表示不使用索引
+    :example RepositoryIndex("~/.cache/plum_tools/gitrepo_index.json")
+
+    :param fast 是否先直接读取 .git 目录判断仓库状态
+    :example False
+
+    :param workers 同时检查的仓库数量
+    :example 16
+
+    :param fmt 输出格式，text 只输出有改动的仓库，其他格式每个仓库输出一条记录
+    :example text
+
+    :param profiler 耗时记录，None表示不记录
+    :example Profiler()
+
+    :param limit 详细信息中每个仓库最多显示的改动文件、未跟踪文件数量，None表示不限制
+    :example 20
+
+    :param full 输出有改动的仓库时重新执行git命令，逐行输出完整的状态，不在检查结果中保存
+    :example False
+    """
+    check = make_check(stash, fast, detail, fmt, profiler, 0 if full else limit)
+    writer = get_writer(fmt, TABLE_FIELDS if fmt == "table" else RECORD_FIELDS) if fmt != "text" else None
+    try:
+        for item in iter_check_projects(find_repositories(projects, ignore, nested, index, profiler), check, workers):
+            report(item, detail, writer, full)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def make_check(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+    stash: bool,
+    fast: bool,
+    detail: bool,
+    fmt: str,
+    profiler: Profiler | None = None,
+    limit: int | None = GITREPO_DETAIL_LIMIT,
+) -> Callable[[str], dict]:
+    """创建检查单个仓库的函数
+
+    :param stash 是否显示储藏信息
+    :example False
+
+    :param fast 是否先直接读取 .git 目录判断仓库状态
+    :example False
+
+    :param detail 是否显示详细错误信息
+    :example False
+
+    :param fmt 输出格式
+    :example text
+
+    :param profiler 耗时记录，None表示不记录
+    :example Profiler()
+
+    :param limit 每个仓库最多保存的改动文件、未跟踪文件数量，None表示不限制
+    :example 20
+    """
+    # 结构化输出需要超前、落后的提交数等详细信息
+    return functools.partial(
+        check_project,
+        stash=stash,
+        fast=fast,
+        detail=detail or fmt != "text",
+        profiler=profiler,
+        limit=limit,
+    )
+
+
+def report(item: dict, detail: bool, writer: RecordWriter | None = None, full: bool = False) -> None:
+    """输出一个仓库的检查结果
+
+    :param item `check_project` 的返回值
+    :example item {"path": "/tmp/git", "status": True, "output": "## master"}
+
+    :param detail 是否显示详细错误信息
+    :example detail False
+
+    :param writer 结构化输出对象，None表示输出文本，只输出有改动的仓库
+    :example writer NdjsonWriter(RECORD_FIELDS)
+
+    :param full 是否重新执行git命令逐行输出完整的状态
+    :example full False
     """
-    targets = [path for project_path in projects for path in find_git_project_for_python(project_path)]
-    with Pool(processes=PROCESSES_NUMBER) as pool:
-        result = pool.map(functools.partial(check_project, stash=stash), targets)
-    for item in result:
-        # 仓库中文件没有被改动而且没有文件被储藏了
-        if not item["status"]:
-            continue
-        print_warn(item["path"])
-
-        # 打印详细错误信息
-        if not detail:
-            continue
+    if writer is not None:
+        writer.write(to_record(item))
+        return
+    # 仓库中文件没有被改动而且没有文件被储藏了
+    if not item["status"]:
+        return
+    print_warn(item["path"])
+
+    if full and not item.get("error"):
+        # 边执行边输出，文件再多也不会保存在内存中
+        try:
+            for line in iter_status_lines(item["path"]):
+                print_error(line)
+        except (RunCmdError, RunCmdTimeout) as e:
+            print_error(getattr(e, "err_msg", "").strip() or str(e))
+    # 打印详细错误信息
+    elif detail:
         print_error(item["output"])
 
 
+def check_project_drift(path: str, mirror_dir: str | None = None, profiler: Profiler | None = None) -> dict:
+    """检查仓库所有分支和上游分支、镜像中同名分支的差异
+
+    :param path 仓库路径
+    :example path /tmp/git
+
+    :param mirror_dir 保存裸仓库镜像的目录，None表示不和镜像比较
+    :example mirror_dir /data/mirrors
+
+    :param profiler 记录整个仓库(repo)的耗时，None表示不记录
+    :example profiler Profiler()
+
+    :return result {
+        path: 仓库路径
+        status: 是否有分支和上游分支或镜像不一致
+        branches: 每个本地分支的差异
+        error: git命令执行失败的错误信息
+        mirror_error: 镜像目录中没有仓库的镜像，只提示不算作不一致
+        latency: 检查耗时，单位秒
+    }
+    """
+    start = time.perf_counter()
+    result: dict = {"path": path, "status": False, "branches": [], "error": None, "mirror_error": None}
+    mirror = find_mirror(mirror_dir, path) if mirror_dir else None
+    if mirror_dir and mirror is None:
+        result["mirror_error"] = "mirror not found"
+    try:
+        result["branches"] = check_drift(path, mirror)
+    except (RunCmdError, RunCmdTimeout) as e:
+        result["error"] = getattr(e, "err_msg", "").strip() or str(e)
+    result["status"] = bool(result["error"]) or any(drift.drifted for drift in result["branches"])
+    result["latency"] = time.perf_counter() - start
+    if profiler is not None:
+        profiler.add("repo", path, start, result["latency"])
+    return result
+
+
+def format_drift(drift: BranchDrift) -> str:
+    """分支差异的文本描述
+
+    :param drift 分支差异
+    :example drift BranchDrift("master", "4b825dc", "refs/remotes/origin/master", 1, 0)
+
+    :return master...origin/master [ahead 1], mirror [behind 2]
+    """
+    upstream = drift.upstream or ""
+    for prefix in ("refs/remotes/", "refs/heads/"):
+        if upstream.startswith(prefix):
+            upstream = upstream[len(prefix) :]
+    parts = [f"{drift.branch}...{upstream}" if upstream else drift.branch]
+    for name, ahead, behind in (
+        ("", drift.ahead, drift.behind),
+        ("mirror ", drift.mirror_ahead, drift.mirror_behind),
+    ):
+        counts = [f"ahead {ahead}" if ahead else "", f"behind {behind}" if behind else ""]
+        if any(counts):
+            parts.append(f"{name}[{', '.join(count for count in counts if count)}]")
+    if drift.error:
+        parts.append(f"({drift.error})")
+    return " ".join(parts)
+
+
+def report_drift(item: dict, writer: RecordWriter | None = None) -> None:
+    """输出一个仓库的分支差异
+
+    :param item `check_project_drift` 的返回值
+    :example item {"path": "/tmp/git", "status": False, "branches": [], "error": None, "mirror_error": None}
+
+    :param writer 结构化输出对象，每个分支输出一条记录，None表示只输出不一致的分支
+    :example writer NdjsonWriter(DRIFT_FIELDS)
+    """
+    if writer is not None:
+        if item["error"] or item["mirror_error"]:
+            writer.write({"path": item["path"], "error": item["error"], "mirror_error": item["mirror_error"]})
+        for drift in item["branches"]:
+            writer.write({"path": item["path"], **dataclasses.asdict(drift)})
+        return
+    if not item["status"] and not item["mirror_error"]:
+        return
+    print_warn(item["path"])
+    if item["error"]:
+        print_error(item["error"])
+    if item["mirror_error"]:
+        print_warn(f"    ({item['mirror_error']})")
+    for drift in item["branches"]:
+        if drift.drifted:
+            print_error(f"    {format_drift(drift)}")
+
+
+def drift_projects(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+    projects: list[str],
+    mirror_dir: str | None = None,
+    nested: bool = False,
+    ignore: Iterable[str] = GITREPO_IGNORE,
+    index: RepositoryIndex | None = None,
+    workers: int = GITREPO_WORKERS,
+    fmt: str = "text",
+    profiler: Profiler | None = None,
+) -> None:
+    """并行检查目录下所有仓库的分支差异
+
+    :param projects 需要检查的目录列表
+    :example ["/tmp"]
+
+    :param mirror_dir 保存裸仓库镜像的目录，None表示不和镜像比较
+    :example /data/mirrors
+
+    :param nested 是否查找仓库内嵌套的仓库
+    :example False
+
+    :param ignore 不需要遍历的目录名
+    :example (".git", "node_modules")
+
+    :param index 仓库索引，None表示不使用索引
+    :example RepositoryIndex("~/.cache/plum_tools/gitrepo_index.json")
+
+    :param workers 同时检查的仓库数量
+    :example 16
+
+    :param fmt 输出格式，text 只输出不一致的分支，其他格式每个分支输出一条记录
+    :example text
+
+    :param profiler 耗时记录，None表示不记录
+    :example Profiler()
+    """
+    targets = find_repositories(projects, ignore, nested, index, profiler)
+    check = functools.partial(check_project_drift, mirror_dir=mirror_dir, profiler=profiler)
+    writer = get_writer(fmt, DRIFT_TABLE_FIELDS if fmt == "table" else DRIFT_FIELDS) if fmt != "text" else None
+    try:
+        for item in iter_check_projects(targets, check, workers):
+            report_drift(item, writer)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def watch_repository(watcher: BaseWatcher, repo: str, ignore: Iterable[str] = GITREPO_IGNORE) -> int:
+    """监听仓库中的目录，已经监听的目录不会重复监听
+
+    :param watcher 监听对象
+    :example watcher InotifyWatcher()
+
+    :param repo 仓库路径
+    :example repo /tmp/git
+
+    :param ignore 不需要监听的目录名
+    :example ignore (".git", "node_modules")
+
+    :return 无法监听的目录数量
+    """
+    failed = 0
+    for path in iter_watch_dirs(repo, ignore):
+        try:
+            watcher.add(repo, path)
+        except OSError:
+            failed += 1
+    return failed
+
+
+def watch_repositories(watcher: BaseWatcher, repos: Iterable[str], ignore: Iterable[str] = GITREPO_IGNORE) -> None:
+    """监听所有仓库，有目录无法监听时提示调整系统限制
+
+    :param watcher 监听对象
+    :example watcher InotifyWatcher()
+
+    :param repos 仓库路径
+    :example repos ["/tmp/git"]
+
+    :param ignore 不需要监听的目录名
+    :example ignore (".git", "node_modules")
+    """
+    failed = sum(watch_repository(watcher, repo, ignore) for repo in repos)
+    if failed:
+        print_warn(f"有 {failed} 个目录无法监听，可以调大 fs.inotify.max_user_watches 或者使用 --poll")
+
+
+def watch_new_dirs(watcher: BaseWatcher, ignore: Iterable[str] = GITREPO_IGNORE) -> None:
+    """只监听上次等待后新建的目录，不重新遍历整个仓库
+
+    :param watcher 监听对象
+    :example watcher InotifyWatcher()
+
+    :param ignore 不需要监听的目录名
+    :example ignore (".git", "node_modules")
+    """
+    for repo, new_dir in sorted(watcher.pop_new_dirs()):
+        for path in iter_new_watch_dirs(repo, new_dir, ignore):
+            try:
+                watcher.add(repo, path)
+            except OSError:
+                # 目录已经被删除或者超过监听数量限制
+                continue
+
+
+def wait_changes(watcher: BaseWatcher) -> set[str]:
+    """等待仓库变化，变化停止一小段时间后再返回，避免git命令执行过程中反复检查
+
+    :param watcher 监听对象
+    :example watcher InotifyWatcher()
+
+    :return 有变化的仓库
+    """
+    changed = watcher.wait()
+    for _ in range(GITREPO_WATCH_SETTLE_ROUNDS):
+        more = watcher.wait(GITREPO_WATCH_DEBOUNCE)
+        if not more:
+            break
+        changed |= more
+    return changed
+
+
+def watch_projects(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+    targets: list[str],
+    check: Callable[[str], dict],
+    detail: bool,
+    watcher: BaseWatcher,
+    workers: int = GITREPO_WORKERS,
+    fmt: str = "text",
+    ignore: Iterable[str] = GITREPO_IGNORE,
+    rounds: int = 0,
+) -> None:
+    """先检查所有仓库，然后监听仓库的工作区和 .git 目录，只重新检查有变化的仓库，输出状态变化
+
+    :param targets 仓库路径
+    :example targets ["/tmp/git"]
+
+    :param check 检查单个仓库的函数
+    :example check check_project
+
+    :param detail 是否显示详细错误信息
+    :example detail False
+
+    :param watcher 监听对象
+    :example watcher InotifyWatcher()
+
+    :param workers 同时检查的仓库数量
+    :example workers 16
+
+    :param fmt 输出格式，text 只输出有改动的仓库，其他格式每个仓库输出一条记录
+    :example fmt text
+
+    :param ignore 不需要监听的目录名
+    :example ignore (".git", "node_modules")
+
+    :param rounds 重新检查的轮数，0表示一直监听
+    :example rounds 0
+    """
+    writer = get_writer(fmt, TABLE_FIELDS if fmt == "table" else RECORD_FIELDS) if fmt != "text" else None
+    states: dict[str, str] = {}
+    try:
+        for item in iter_check_projects(targets, check, workers):
+            states[item["path"]] = get_state(item)
+            report(item, detail, writer)
+        watch_repositories(watcher, targets, ignore)
+        count = 0
+        while not rounds or count < rounds:
+            changed = wait_changes(watcher)
+            count += 1
+            watch_new_dirs(watcher, ignore)
+            for item in iter_check_projects(sorted(changed), check, workers):
+                path = item["path"]
+                state = get_state(item)
+                if states.get(path) == state:
+                    continue
+                states[path] = state
+                if writer is None and state == "clean":
+                    print_ok(f"{path} clean")
+                    continue
+                report(item, detail, writer)
+    finally:
+        if writer is not None:
+            writer.close()
+        watcher.close()
+
+
 def main() -> None:
     """程序主入口"""
     parser = get_base_parser()
@@ -140,5 +781,188 @@ def main() -> None:
         default=False,
         help="display stash details",
     )
+    parser.add_argument(
+        "--nested",
+        action="store_true",
+        required=False,
+        dest="nested",
+        default=False,
+        help="continue searching for repositories nested inside a repository",
+    )
+    parser.add_argument(
+        "--ignore",
+        action="store",
+        required=False,
+        dest="ignore",
+        nargs="*",
+        default=list(GITREPO_IGNORE),
+        help="directory names that are not searched",
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        required=False,
+        dest="rebuild_index",
+        default=False,
+        help="ignore the repository index and walk every directory again",
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        required=False,
+        dest="no_index",
+        default=False,
+        help="do not read or update the repository index",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        required=False,
+        dest="fast",
+        default=False,
+        help="read .git metadata directly and only run git when the state cannot be decided",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        required=False,
+        type=int,
+        dest="jobs",
+        default=GITREPO_WORKERS,
+        help="number of repositories checked at the same time",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        action="store",
+        required=False,
+        dest="format",
+        choices=OUTPUT_FORMATS,
+        default="text",
+        help="output format, structured formats stream one record per repository",
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        required=False,
+        dest="watch",
+        default=False,
+        help="keep running and re-check repositories whose files change",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        required=False,
+        dest="poll",
+        default=False,
+        help="watch by polling file mtimes instead of inotify",
+    )
+    parser.add_argument(
+        "--drift",
+        action="store_true",
+        required=False,
+        dest="drift",
+        default=False,
+        help="compare every local branch with its upstream using local refs only, without fetching",
+    )
+    parser.add_argument(
+        "--mirror",
+        action="store",
+        required=False,
+        dest="mirror",
+        default=None,
+        help="directory of bare mirrors (<name>.git) to compare branches with, implies --drift",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store",
+        required=False,
+        type=int,
+        dest="profile",
+        default=0,
+        help="print phase timings, the N slowest repositories and a latency histogram to stderr",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store",
+        required=False,
+        dest="trace",
+        default=None,
+        help="write a Chrome trace-event JSON file with the timing of every repository",
+    )
+    parser.add_argument(
+        "--limit",
+        action="store",
+        required=False,
+        type=int,
+        dest="limit",
+        default=GITREPO_DETAIL_LIMIT,
+        help="maximum changed and untracked paths shown per repository, the rest are only counted",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        required=False,
+        dest="full",
+        default=False,
+        help="stream the complete status of every modified repository, implies --detail",
+    )
     args = parser.parse_args()
-    check_projects(args.path, args.detail, args.stash)
+    profiler = Profiler() if args.profile or args.trace else None
+    try:
+        run(args, profiler)
+    finally:
+        if profiler is not None and args.profile:
+            print_profile(profiler, "repo", args.profile)
+        if profiler is not None and args.trace:
+            profiler.write_trace(args.trace)
+
+
+def run(args: argparse.Namespace, profiler: Profiler | None = None) -> None:
+    """根据命令行参数查找并检查仓库
+
+    :param args 命令行参数
+    :example args Namespace(path=["/tmp"], detail=False)
+
+    :param profiler 耗时记录，None表示不记录
+    :example profiler Profiler()
+    """
+    index = None
+    if not args.no_index:
+        index = RepositoryIndex(PathConfig.GITREPO_INDEX_PATH, args.ignore, args.rebuild_index)
+        index.load()
+    if args.drift or args.mirror:
+        drift_projects(args.path, args.mirror, args.nested, args.ignore, index, args.jobs, args.format, profiler)
+        if index is not None:
+            index.save()
+        return
+    if args.watch:
+        projects = [os.path.abspath(path) for path in args.path]
+        targets = sorted(RepositoryScanner(args.ignore, args.nested, index=index).scan(projects))
+        if index is not None:
+            index.save()
+        check = make_check(args.stash, args.fast, args.detail, args.format, profiler, args.limit)
+        watcher = create_watcher(args.poll)
+        try:
+            watch_projects(targets, check, args.detail, watcher, args.jobs, args.format, args.ignore)
+        except KeyboardInterrupt:
+            pass
+        return
+    check_projects(
+        args.path,
+        args.detail,
+        args.stash,
+        args.nested,
+        args.ignore,
+        index,
+        args.fast,
+        args.jobs,
+        args.format,
+        profiler,
+        args.limit,
+        args.full,
+    )
+    if index is not None:
+        index.save()
@@ -5,6 +5,10 @@
 #         Desc: 外部传入一个branch，保存本地未提交的修改，然后切换到branch，将上次该branch保存的未提交的结果stash pop出来
 #               命令: gitstash master
 #               描述: 在当前路径下切换到master分支
+#               命令: gitstash master --repos ~/services
+#               描述: 同时把 ~/services 下所有仓库切换到master分支
+#               命令: cd $(gitstash master --worktree)
+#               描述: 不改动当前工作区，使用master分支缓存的工作区
 #       Author: seekplum
 #        Email: 1131909224m@sina.cn
 #     HomePage: seekplum.github.io
@@ -12,21 +16,76 @@
 #=============================================================================
 """
 
+import json
 import os
+import shlex
 import sys
+import time
+import urllib.parse
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 
-from .conf import STASH_UUID, GitCommand
-from .exceptions import RunCmdError
-from .utils.git import check_repository_modify_status, check_repository_stash, get_current_branch_name
+from .conf import GITSTASH_WORKERS, GITSTASH_WORKTREE_MAX, STASH_UUID, GitCommand
+from .exceptions import RunCmdError, RunCmdTimeout
+from .utils.git import RepoStatus, get_repository_status, get_stash_messages, run_git
+from .utils.gitbatch import resolve_ref
+from .utils.gitmeta import SNAPSHOT_DIR, GitMeta
+from .utils.output import get_writer
 from .utils.parser import get_base_parser
-from .utils.printer import print_warn
-from .utils.utils import cd, run_cmd
+from .utils.printer import print_error, print_text, print_warn
+from .utils.scanner import RepositoryScanner
+
+# 多个仓库切换分支后输出的汇总表格，路径长度不固定，放在最后一列
+SUMMARY_FIELDS = ("state", "from", "to", "stashed", "popped", "latency_ms", "path")
+WORKTREE_DIR = "worktrees"  # 在 .git/plum_tools 下保存分支工作区的目录
+WORKTREE_INDEX = "worktrees.json"  # 分支工作区最近一次使用的时间
+STASH_INDEX = "stash.json"  # 分支最近一次储藏的提交
+STASH_REF = "refs/stash"
+
+
+def load_sidecar(meta: GitMeta, name: str) -> dict:
+    """读取保存在 .git/plum_tools 下的数据，多个工作区共享
+
+    :param meta 仓库元数据
+    :example meta GitMeta.discover("/tmp/git")
+
+    :param name 文件名
+    :example name stash.json
+
+    :return 文件不存在或格式错误时返回空字典
+    """
+    try:
+        with open(os.path.join(meta.common_dir, SNAPSHOT_DIR, name), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_sidecar(meta: GitMeta, name: str, data: dict) -> None:
+    """保存数据到 .git/plum_tools 下，先写临时文件再替换
+
+    :param meta 仓库元数据
+    :example meta GitMeta.discover("/tmp/git")
+
+    :param name 文件名
+    :example name stash.json
+
+    :param data 数据
+    :example data {"master": "4b825dc642cb6eb9a060e54bf8d69288fbee4904"}
+    """
+    path = os.path.join(meta.common_dir, SNAPSHOT_DIR, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
 
 
 class GitCheckoutStash:
     """切换分支前储藏文件"""
 
-    def __init__(self, current_branch: str, new_branch: str) -> None:
+    def __init__(self, current_branch: str, new_branch: str, path: str | None = None) -> None:
         """初始化信息
 
         :param current_branch: 当前分支名
@@ -34,21 +93,73 @@ class GitCheckoutStash:
 
         :param new_branch: 新的分支名
         :example new_branch release-1.0.0
+
+        :param path: 仓库路径，默认为当前执行命令的路径
+        :example path /tmp/git
         """
         self._current_branch = current_branch
-        self._current_path = os.getcwd()  # 当前执行命令的路径
+        self._current_path = path or os.getcwd()  # 当前执行命令的路径
         self._new_branch = new_branch
         self._mark = "-"
-        self._stash_uuid = f"{self._current_branch}{self._mark}{STASH_UUID}"
+        self._stash_uuid = self._get_stash_name(self._current_branch)
+        self.stashed = False  # 切换前是否储藏了文件
+        self.popped: str | None = None  # 切换后恢复的储藏
+
+    def _get_stash_name(self, branch: str) -> str:
+        """分支储藏时使用的说明
+
+        :param branch 分支名
+        :example branch master
+        """
+        return f"{branch}{self._mark}{STASH_UUID}"
+
+    def _find_stash(self, meta: GitMeta | None, index: dict[str, str]) -> int | None:
+        """查找要切换的分支最新储藏的序号
+
+        先用索引中记录的储藏提交在 `refs/stash` 的引用日志中定位序号，
+        索引中没有记录或者储藏已经被删除时，再按储藏说明查找
 
-    def _stash(self) -> None:
-        """储藏文件"""
-        # 分支有修改,先进行stash储藏
-        is_modify, _ = check_repository_modify_status(self._current_path)
-        if is_modify:
-            cmd = GitCommand.STASH_SAVE % self._stash_uuid
-            with cd(self._current_path):
-                run_cmd(cmd)
+        :param meta 仓库元数据，None表示无法直接读取 .git 目录
+        :example meta GitMeta.discover("/tmp/git")
+
+        :param index 分支到储藏提交的索引
+        :example index {"feature": "4b825dc642cb6eb9a060e54bf8d69288fbee4904"}
+
+        :return 储藏的序号，没有储藏时返回None
+        """
+        commit = index.get(self._new_branch)
+        entries = meta.read_reflog(STASH_REF) if meta is not None and commit else None
+        if entries is not None:
+            for position, (sha, _) in enumerate(entries):
+                if sha == commit:
+                    return position
+        return self._find_stashes().get(self._get_stash_name(self._new_branch))
+
+    def _find_stashes(self) -> dict[str, int]:
+        """储藏说明到储藏序号的索引，同一个说明只保留最新的储藏
+
+        :return {"master-plum123456789987654321plum": 0}
+        """
+        stashes: dict[str, int] = {}
+        for position, message in enumerate(get_stash_messages(self._current_path)):
+            # 说明的格式为 "On <分支>: <储藏时的说明>"，分支名中不能有冒号
+            _, _, name = message.partition(": ")
+            stashes.setdefault(name, position)
+        return stashes
+
+    def _stash(self, status: RepoStatus) -> bool:
+        """储藏文件
+
+        :param status 仓库状态
+        :example status RepoStatus("/tmp/git", "master", omitted_changed=1)
+
+        :return 是否新增了储藏
+        """
+        # 只有已跟踪的文件有修改时 `git stash` 才会储藏
+        if not status.changed_count:
+            return False
+        run_git(GitCommand.STASH_SAVE % shlex.quote(self._stash_uuid), self._current_path)
+        return True
 
     def _check_branch(self) -> bool:
         """检查分支是否一致
@@ -62,45 +173,321 @@ class GitCheckoutStash:
     def _checkout(self) -> None:
         """切换分支"""
         # 切换到新分支
-        cmd = GitCommand.GIT_CHECKOUT % self._new_branch
-        with cd(self._current_path):
-            run_cmd(cmd)
-
-    def _apply(self) -> None:
-        """恢复储藏的文件"""
-        # 检查切换后的分支是否有储藏文件
-        is_stash, stash_out = check_repository_stash(self._current_path)
-        if not is_stash:
+        run_git(GitCommand.GIT_CHECKOUT % shlex.quote(self._new_branch), self._current_path)
+
+    def _apply(self, position: int | None, offset: int = 0) -> None:
+        """恢复储藏的文件
+
+        :param position 切换分支前储藏的序号，None表示没有储藏
+        :example position 0
+
+        :param offset 切换分支前新增的储藏数量，储藏的序号需要向后移动
+        :example offset 1
+        """
+        if position is None:
             return
-        for line in stash_out.splitlines():
-            stash_string, _ = line.split(":", 1)
-            stash_save = f"{self._new_branch}{self._mark}{STASH_UUID}"
-            if stash_save.strip() in line:
-                cmd = GitCommand.STASH_POP % stash_string
-                with cd(self._current_path):
-                    run_cmd(cmd)
-                break
+        ref = f"stash@{{{position + offset}}}"
+        run_git(GitCommand.STASH_POP % ref, self._current_path)
+        self.popped = ref
 
     def checkout(self) -> None:
-        """储藏文件切换分支"""
+        """储藏文件切换分支
+
+        一次git命令查询文件是否修改，通过 .git/plum_tools/stash.json 中记录的储藏提交
+        和 `refs/stash` 的引用日志定位储藏，之后只执行储藏、切换分支、恢复储藏必须的git命令
+        """
         # 不需要切换
         if self._check_branch():
             return
-        self._stash()
-        self._checkout()
-        self._apply()
+        # 只需要知道是否有文件修改，不保存文件列表
+        status = get_repository_status(self._current_path, limit=0)
+        meta = GitMeta.discover(self._current_path)
+        index = load_sidecar(meta, STASH_INDEX) if meta is not None else {}
+        position = self._find_stash(meta, index)
+        saved = dict(index)
+        try:
+            self.stashed = self._stash(status)
+            commit = resolve_ref(self._current_path, STASH_REF, meta) if self.stashed else None
+            if commit:
+                index[self._current_branch] = commit
+            try:
+                self._checkout()
+            except (RunCmdError, RunCmdTimeout):
+                # 切换失败时恢复刚储藏的文件，仓库保持切换前的状态
+                if self.stashed:
+                    run_git(GitCommand.STASH_POP % "stash@{0}", self._current_path)
+                    self.stashed = False
+                    index.pop(self._current_branch, None)
+                raise
+            self._apply(position, 1 if self.stashed else 0)
+            # 储藏已经恢复，或者记录的储藏已经不存在
+            index.pop(self._new_branch, None)
+        finally:
+            # 记录的储藏有变化时才写入，写入失败只提示，不能掩盖切换分支的异常
+            if meta is not None and index != saved:
+                try:
+                    save_sidecar(meta, STASH_INDEX, index)
+                except OSError as e:
+                    print_warn(f"保存储藏记录失败: {e}")
+
+    def _evict_worktrees(self, worktrees: dict[str, dict], keep: Iterable[str], capacity: int) -> None:
+        """删除最久没有使用的工作区，直到数量不超过上限
+
+        :param worktrees 缓存的分支工作区，删除成功的会从中移除
+        :example worktrees {"feature": {"path": "/tmp/feature", "used": 1700000000.0}}
+
+        :param keep 不能删除的工作区路径，如当前所在的工作区
+        :example keep ["/tmp/feature"]
+
+        :param capacity 最多缓存的工作区数量
+        :example capacity 5
+        """
+        keep = set(keep)
+        for branch in sorted(worktrees, key=lambda name: worktrees[name]["used"]):
+            if len(worktrees) <= capacity:
+                return
+            path = worktrees[branch]["path"]
+            if path in keep:
+                continue
+            if not os.path.exists(path):
+                # 工作区已经被手动删除
+                del worktrees[branch]
+                continue
+            try:
+                # 有未提交的修改时删除失败，保留工作区，不丢失修改
+                run_git(GitCommand.WORKTREE_REMOVE % shlex.quote(path), self._current_path)
+            except (RunCmdError, RunCmdTimeout):
+                continue
+            del worktrees[branch]
+
+    def checkout_worktree(self, link: str | None = None, capacity: int = GITSTASH_WORKTREE_MAX) -> str:
+        """使用分支缓存的工作区切换分支，不储藏、不改动当前工作区的文件
+
+        每个分支在 .git/plum_tools/worktrees 下保留一个 `git worktree`，切换时直接返回工作区路径，
+        超过数量上限时删除最久没有使用的工作区
+
+        :param link 指向工作区的符号链接，None表示不创建
+        :example link ~/work/current
+
+        :param capacity 最多缓存的工作区数量
+        :example capacity 5
+
+        :return 分支所在的工作区路径
+
+        :raise RunCmdError 不在git仓库中或者创建工作区失败
+        :raise OSError 创建符号链接失败
+        """
+        meta = GitMeta.discover(self._current_path)
+        if meta is None:
+            raise RunCmdError("not a git repository", "", "not a git repository")
+        checked_out = meta.list_worktrees()
+        # 工作区被手动删除或者切换到了其他分支的记录也保留，超过数量上限时和其他工作区一样删除
+        worktrees = load_sidecar(meta, WORKTREE_INDEX)
+        path = checked_out.get(self._new_branch)
+        if path is None:
+            path = self._add_worktree(meta, worktrees)
+        elif worktrees.get(self._new_branch, {}).get("path") == path:
+            worktrees[self._new_branch]["used"] = time.time()
+        self._evict_worktrees(worktrees, [path, meta.worktree], capacity)
+        try:
+            save_sidecar(meta, WORKTREE_INDEX, worktrees)
+        except OSError as e:
+            # 工作区已经创建好了，记录写入失败只提示
+            print_warn(f"保存工作区记录失败: {e}")
+        if link:
+            link_worktree(path, link)
+        return path
+
+    def _add_worktree(self, meta: GitMeta, worktrees: dict[str, dict]) -> str:
+        """在 .git/plum_tools/worktrees 下为分支创建工作区
+
+        工作区目录已经存在时(在缓存的工作区中切换到了其他分支)，直接在这个工作区中切换回分支
+
+        :param meta 仓库元数据
+        :example meta GitMeta.discover("/tmp/git")
+
+        :param worktrees 缓存的分支工作区，会记录新的工作区
+        :example worktrees {"feature": {"path": "/tmp/feature", "used": 1700000000.0}}
+
+        :return 工作区路径
+
+        :raise RunCmdError 创建工作区失败，或者目录已经存在且不是工作区
+        """
+        if any(not os.path.exists(item.get("path", "")) for item in worktrees.values()):
+            run_git(GitCommand.WORKTREE_PRUNE, self._current_path)
+        name = urllib.parse.quote(self._new_branch, safe="")
+        # git 记录的工作区路径是真实路径
+        path = os.path.join(os.path.realpath(meta.common_dir), SNAPSHOT_DIR, WORKTREE_DIR, name)
+        if os.path.isfile(os.path.join(path, ".git")):
+            # 工作区的 .git 是指向仓库的文件
+            run_git(GitCommand.GIT_CHECKOUT % shlex.quote(self._new_branch), path)
+        elif os.path.exists(path):
+            raise RunCmdError(f"{path} already exists", "", f"{path} already exists")
+        else:
+            run_git(GitCommand.WORKTREE_ADD % (shlex.quote(path), shlex.quote(self._new_branch)), self._current_path)
+        for branch in [branch for branch, item in worktrees.items() if item.get("path") == path]:
+            del worktrees[branch]
+        worktrees[self._new_branch] = {"path": path, "used": time.time()}
+        return path
+
+
+def link_worktree(path: str, link: str) -> None:
+    """把符号链接指向工作区，先创建临时链接再替换，链接始终指向一个完整的工作区
+
+    :param path 工作区路径
+    :example path /tmp/git/.git/plum_tools/worktrees/feature
+
+    :param link 符号链接路径
+    :example link ~/work/current
+
+    :raise OSError 创建符号链接失败
+    """
+    link = os.path.abspath(os.path.expanduser(link))
+    temp_link = f"{link}.{os.getpid()}.tmp"
+    os.symlink(path, temp_link)
+    try:
+        os.replace(temp_link, link)
+    except OSError:
+        os.remove(temp_link)
+        raise
+
+
+def switch_repository(path: str, branch: str) -> dict:
+    """储藏文件后把仓库切换到指定分支，失败时不抛出异常
+
+    :param path 仓库路径
+    :example path /tmp/git
+
+    :param branch 要切换的分支
+    :example branch release-1.0.0
+
+    :return result {
+        path: 仓库路径
+        state: switched 切换成功 / skipped 已经在这个分支 / error 切换失败
+        from: 切换前的分支
+        to: 要切换的分支
+        stashed: 切换前是否储藏了文件
+        popped: 切换后恢复的储藏
+        error: 失败原因
+        latency_ms: 耗时，单位毫秒
+    }
+    """
+    start = time.perf_counter()
+    result: dict = {"path": path, "state": "error", "to": branch, "stashed": False}
+    meta = GitMeta.open(path)
+    if meta is None:
+        result["error"] = "not a git repository"
+    else:
+        current_branch, _ = meta.read_head()
+        result["from"] = current_branch or "HEAD"
+        stash = GitCheckoutStash(result["from"], branch, path)
+        try:
+            stash.checkout()
+        except (RunCmdError, RunCmdTimeout) as e:
+            result["error"] = getattr(e, "err_msg", "").strip() or str(e)
+        else:
+            result["state"] = "skipped" if result["from"] == branch else "switched"
+        result["stashed"] = stash.stashed
+        result["popped"] = stash.popped
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return result
+
+
+def switch_repositories(paths: Iterable[str], branch: str, workers: int = GITSTASH_WORKERS) -> bool:
+    """并行把多个仓库切换到指定分支，每个仓库独立储藏、切换、恢复，最后输出汇总表格
+
+    :param paths 仓库路径或包含仓库的目录，目录下的仓库和 gitrepo 一样查找
+    :example paths ["~/services"]
+
+    :param branch 要切换的分支
+    :example branch release-1.0.0
+
+    :param workers 同时切换的仓库数量
+    :example workers 8
+
+    :return 是否所有仓库都切换成功
+    """
+    repos = sorted(set(RepositoryScanner().scan(os.path.abspath(os.path.expanduser(path)) for path in paths)))
+    if not repos:
+        print_warn("没有找到git仓库")
+        return False
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        results = list(pool.map(lambda repo: switch_repository(repo, branch), repos))
+    with get_writer("table", SUMMARY_FIELDS) as writer:
+        for result in results:
+            writer.write(result)
+    failed = [result for result in results if result["state"] == "error"]
+    for result in failed:
+        print_warn(f"{result['path']}: {result['error']}")
+    return not failed
 
 
 def main() -> None:
     """程序主入口"""
     parser = get_base_parser()
     parser.add_argument(dest="branch", action="store", help="specify branch")
+    parser.add_argument(
+        "--repos",
+        action="store",
+        required=False,
+        dest="repos",
+        nargs="+",
+        default=None,
+        help="switch every repository in these directories at the same time",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        required=False,
+        type=int,
+        dest="jobs",
+        default=GITSTASH_WORKERS,
+        help="number of repositories switched at the same time",
+    )
+    parser.add_argument(
+        "--worktree",
+        action="store_true",
+        required=False,
+        dest="worktree",
+        default=False,
+        help="switch by reusing a cached git worktree of the branch and print its path",
+    )
+    parser.add_argument(
+        "--link",
+        action="store",
+        required=False,
+        dest="link",
+        default=None,
+        help="symlink to point at the worktree of the branch, implies --worktree",
+    )
     args = parser.parse_args()
     new_branch = args.branch
-    try:
-        current_branch = get_current_branch_name()
-    except RunCmdError:
+    if args.repos:
+        sys.exit(0 if switch_repositories(args.repos, new_branch, args.jobs) else 1)
+    # 直接读取 HEAD 得到当前分支，不执行git命令
+    meta = GitMeta.discover(os.getcwd())
+    if meta is None:
         print_warn("当前目录不是一个git仓库")
         sys.exit(1)
-    stash = GitCheckoutStash(current_branch, new_branch)
+    current_branch, _ = meta.read_head()
+    stash = GitCheckoutStash(current_branch or "HEAD", new_branch)
+    if args.worktree or args.link:
+        link = os.path.expanduser(args.link or "")
+        if link and os.path.isdir(link) and not os.path.islink(link):
+            print_error(f"{args.link} 是已经存在的目录，不能替换为指向工作区的符号链接")
+            sys.exit(1)
+        try:
+            path = stash.checkout_worktree()
+        except (RunCmdError, RunCmdTimeout) as e:
+            print_warn(getattr(e, "err_msg", "").strip() or str(e))
+            sys.exit(1)
+        print_text(path)
+        if link:
+            try:
+                link_worktree(path, link)
+            except OSError as e:
+                print_error(f"创建符号链接 {args.link} 失败: {e}")
+                sys.exit(1)
+        return
     stash.checkout()
@@ -16,20 +16,25 @@ import argparse
 import sys
 from collections.abc import Generator
 from contextlib import contextmanager
-from typing import Any
-
-import paramiko
+from typing import TYPE_CHECKING, Any
 
 from .conf import COMMAND_TIMEOUT, OsCommand, PathConfig
 from .exceptions import RunCmdError, SSHException
+from .utils.lazy import lazy_import
 from .utils.parser import get_base_parser
 from .utils.printer import print_error, print_text
 from .utils.sshconf import get_host_ip
 from .utils.utils import YmlConfig, ensure_str, get_file_abspath
 
+if TYPE_CHECKING:
+    import paramiko
+else:
+    # paramiko 依赖的 cryptography 导入较慢，--help、--version 时不需要导入
+    paramiko = lazy_import("paramiko")
+
 
-class PSSHClient(paramiko.SSHClient):
-    """SSH连接客户端"""
+class PSSHClient:
+    """SSH连接客户端，其他方法直接使用 paramiko.SSHClient 的方法"""
 
     def __init__(self, host: str) -> None:
         """初始化
@@ -37,8 +42,15 @@ class PSSHClient(paramiko.SSHClient):
         :param host 主机ip
         :example host 10.10.100.1
         """
-        super().__init__()  # pylint: disable=R1725
         self.host = host
+        self._client = paramiko.SSHClient()
+
+    def __getattr__(self, name: str) -> Any:
+        # 只有实例中没有的属性才会调用，__init__ 前(如 copy、pickle 创建的实例)不能访问 self._client，否则会无限递归
+        client = self.__dict__.get("_client")
+        if client is None:
+            raise AttributeError(name)
+        return getattr(client, name)
 
     def run_cmd(self, cmd: str, is_raise_exception: bool = True, **kwargs: Any) -> str:
         """执行系统命令
@@ -3,6 +3,8 @@
 #  ProjectName: plum_tools
 #     FileName: pping
 #         Desc: ping指定网段所有ip是否能ping通
+#               命令: pping 10.10.0.0/16 10.10.100.1-10.10.100.50
+#               描述: 探测网段/范围内所有ip，能ping通的ip一旦有应答就输出
 #       Author: seekplum
 #        Email: 1131909224m@sina.cn
 #     HomePage: seekplum.github.io
@@ -10,65 +12,486 @@
 #=============================================================================
 """
 
-from multiprocessing import Pool
+import asyncio
+import ipaddress
+import itertools
+import sys
+import time
+from collections.abc import AsyncGenerator, Iterable, Iterator, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timezone
 
-from .conf import PROCESSES_NUMBER, OsCommand
-from .exceptions import RunCmdError
+from .conf import (
+    PING_BACKOFF_BASE,
+    PING_BACKOFF_MAX,
+    PING_CONCURRENCY,
+    PING_MIN_TIMEOUT,
+    PING_RATE,
+    PING_STATS_COUNT,
+    PING_TCP_PORTS,
+    PING_TIMEOUT,
+    PING_WATCH_INTERVAL,
+    PathConfig,
+    PingExitCode,
+)
+from .utils.output import STRUCTURED_FORMATS, RecordWriter, get_writer
 from .utils.parser import get_base_parser
-from .utils.printer import print_text
+from .utils.printer import print_error, print_ok, print_text
+from .utils.probe import ProbeResult, create_prober, iter_sweep, iter_sweep_ordered, limit_concurrency
+from .utils.reachability import STATE_DOWN, STATE_UP, ReachabilityCache
 from .utils.sshconf import get_prefix_host_ip
-from .utils.utils import run_cmd
 
+RECORD_FIELDS = ("ip", "state", "rtt", "rtt_min", "rtt_p95", "sent", "received", "probe", "timestamp")
 
-def ping(ip: str) -> str | None:
+
+def parse_target(spec: str) -> range:
+    """把目标描述解析为ip的整数范围，不会展开成ip列表
+
+    :param spec 目标描述，支持以下格式
+        CIDR: 10.10.0.0/16
+        范围: 10.10.100.1-10.10.100.50 或 10.10.100.1-50
+        前三段ip: 10.10.100 或 10.10.100.  表示 10.10.100.1 ~ 10.10.100.254
+        单个ip: 10.10.100.1
+    :example spec 10.10.0.0/16
+
+    :return ip对应整数的范围
+
+    :raise ValueError 目标描述格式错误
+    """
+    spec = spec.strip()
+    if "/" in spec:
+        network = ipaddress.IPv4Network(spec, strict=False)
+        first, last = int(network.network_address), int(network.broadcast_address)
+        # 和 `IPv4Network.hosts` 一致，/31 /32 以外不包含网络地址和广播地址
+        if network.prefixlen < 31:
+            first, last = first + 1, last - 1
+        return range(first, last + 1)
+    if "-" in spec:
+        start, end = spec.split("-", 1)
+        first = int(ipaddress.IPv4Address(start))
+        if "." not in end:
+            end = f"{start.rsplit('.', 1)[0]}.{end}"
+        last = int(ipaddress.IPv4Address(end))
+        if last < first:
+            raise ValueError(f"{spec} 范围的结束ip小于起始ip")
+        return range(first, last + 1)
+    parts = [part for part in spec.split(".") if part]
+    if len(parts) == 3:
+        base = int(ipaddress.IPv4Address(".".join([*parts, "0"])))
+        return range(base + 1, base + 255)
+    address = int(ipaddress.IPv4Address(spec))
+    return range(address, address + 1)
+
+
+def iter_targets(specs: Iterable[str]) -> Iterator[str]:
+    """按顺序逐个生成所有目标ip
+
+    :param specs 目标描述
+    :example specs ["10.10.0.0/16"]
+    """
+    ranges = [parse_target(spec) for spec in specs]
+    for address in itertools.chain.from_iterable(ranges):
+        yield str(ipaddress.IPv4Address(address))
+
+
+def plan_targets(specs: Sequence[str], cache: ReachabilityCache | None, incremental: bool) -> Iterator[str]:
+    """按顺序生成需要探测的ip
+
+    增量探测时每个网段先探测最近在线的主机，跳过还在退避期的离线主机
+
+    :param specs 目标描述
+    :example specs ["10.10.0.0/16"]
+
+    :param cache 主机存活状态缓存
+    :example cache ReachabilityCache("~/.cache/plum_tools/pping.db", 60, 3600)
+
+    :param incremental 是否增量探测
+    :example incremental True
+    """
+    if cache is None or cache.disabled or not incremental:
+        yield from iter_targets(specs)
+        return
+    for spec in specs:
+        yield from cache.plan(spec, iter_targets([spec]))
+
+
+def get_spec(ip: str, spec_ranges: Sequence[tuple[str, range]]) -> str:
+    """查询ip所属的目标描述，作为缓存的key
+
+    :param ip 主机ip
+    :example ip 10.10.100.1
+
+    :param spec_ranges 目标描述及对应的ip范围
+    :example spec_ranges [("10.10.100", range(168453121, 168453375))]
+
+    :return 目标描述
+    """
+    address = int(ipaddress.IPv4Address(ip))
+    for spec, addresses in spec_ranges:
+        if address in addresses:
+            return spec
+    raise ValueError(f"{ip} 不属于任何目标")
+
+
+def get_target_specs(host_types: Sequence[str], specs: Sequence[str]) -> list[str]:
+    """查询需要探测的目标描述
+
+    命令行传入了目标时直接使用，否则使用 .plum_tools.yaml 中 host_type_* 配置的网段
+
+    :param host_types ip类型
+    :example host_types ["default"]
+
+    :param specs 命令行传入的目标描述
+    :example specs ["10.10.0.0/16"]
+
+    :return 目标描述
+    """
+    if specs:
+        return list(specs)
+    return [get_prefix_host_ip(host_type) for host_type in host_types]
+
+
+@dataclass
+class SweepOptions:
+    """探测参数"""
+
+    mode: str = "auto"  # 探测方式 auto/icmp/tcp
+    timeout: float = PING_TIMEOUT  # 单个探测的超时时间，单位秒
+    ports: Sequence[int] = PING_TCP_PORTS  # tcp探测的端口
+    concurrency: int = PING_CONCURRENCY  # 并发数量
+    rate: float = PING_RATE  # 每秒最多发出的探测数量，0表示不限速
+    count: int = 1  # 每个ip的探测次数
+    min_timeout: float | None = PING_MIN_TIMEOUT  # 自适应超时时间的下限，None表示使用固定的超时时间
+
+
+async def sweep(
+    targets: Iterable[str],
+    options: SweepOptions,
+    ordered: bool = True,
+) -> AsyncGenerator[ProbeResult, None]:
+    """在单个进程内并发探测所有ip，有结果就返回
+
+    :param targets 需要探测的ip
+    :example targets ["10.10.100.1"]
+
+    :param options 探测参数
+    :example options SweepOptions()
+
+    :param ordered 是否按目标顺序返回，否则按应答顺序返回
+    :example ordered True
+    """
+    prober = create_prober(
+        options.mode,
+        options.timeout,
+        options.ports,
+        options.rate,
+        options.count,
+        options.min_timeout,
+    )
+    iter_func = iter_sweep_ordered if ordered else iter_sweep
+    prober.open()
+    try:
+        async for result in iter_func(targets, prober, limit_concurrency(options.concurrency, prober)):
+            yield result
+    finally:
+        prober.close()
+
+
+def ping(ip: str, options: SweepOptions | None = None) -> str | None:
     """ping指定ip是否能ping通
 
     :param ip 主机ip
     :example ip 10.10.100.1
+
+    :param options 探测参数
+    :example options SweepOptions()
+    """
+
+    async def _ping() -> bool:
+        return any([result.alive async for result in sweep([ip], options or SweepOptions())])
+
+    if asyncio.run(_ping()):
+        return ip
+    return None
+
+
+def format_stats(result: ProbeResult) -> str:
+    """格式化单个主机的往返时间统计信息
+
+    :param result 探测结果
+    :example result ProbeResult("10.10.100.1", True, 0.001, "icmp", [0.001], 1)
+
+    :return 统计信息
+    :example 10.10.100.1  min/avg/p95 = 1.000/1.000/1.000 ms  1/1 icmp
+    """
+    values = "/".join(f"{(value or 0) * 1000:.3f}" for value in (result.rtt_min, result.rtt, result.rtt_p95))
+    return f"{result.ip}  min/avg/p95 = {values} ms  {len(result.rtts)}/{result.sent} {result.probe}"
+
+
+# pylint: disable=too-many-positional-arguments,too-many-arguments
+async def sweep_specs(
+    specs: Sequence[str],
+    options: SweepOptions,
+    ordered: bool = True,
+    cache: ReachabilityCache | None = None,
+    incremental: bool = False,
+) -> AsyncGenerator[ProbeResult, None]:
+    """探测所有目标，并把结果记录到缓存中，探测结束时提交缓存，不会在两轮探测之间占用缓存的写锁
+
+    :param specs 目标描述
+    :example specs ["10.10.0.0/16", "10.10.100"]
+
+    :param options 探测参数
+    :example options SweepOptions()
+
+    :param ordered 是否按探测顺序返回，否则按应答顺序返回
+    :example ordered True
+
+    :param cache 主机存活状态缓存，None表示不使用缓存
+    :example cache ReachabilityCache("~/.cache/plum_tools/pping.db", 60, 3600)
+
+    :param incremental 是否增量探测
+    :example incremental True
+    """
+    spec_ranges = [(spec, parse_target(spec)) for spec in specs]
+    async for result in sweep(plan_targets(specs, cache, incremental), options, ordered):
+        if cache is not None:
+            cache.update(get_spec(result.ip, spec_ranges), result.ip, result.alive)
+        yield result
+    if cache is not None:
+        cache.commit()
+
+
+@dataclass
+class SweepSummary:
+    """探测结果汇总"""
+
+    total: int = 0  # 探测的主机数量
+    up: int = 0  # 存活的主机数量
+
+    def add(self, result: ProbeResult) -> None:
+        """统计一个探测结果
+
+        :param result 探测结果
+        :example result ProbeResult("10.10.100.1", True)
+        """
+        self.total += 1
+        if result.alive:
+            self.up += 1
+
+    @property
+    def exit_code(self) -> int:
+        """根据探测结果得到进程退出码"""
+        if self.total and self.up == self.total:
+            return PingExitCode.ALL_UP
+        if self.up:
+            return PingExitCode.PARTIAL
+        return PingExitCode.NONE_UP
+
+    def __str__(self) -> str:
+        return f"swept {self.total} hosts, {self.up} up, {self.total - self.up} down"
+
+
+def to_record(result: ProbeResult) -> dict:
+    """把探测结果转换为结构化输出的记录
+
+    :param result 探测结果
+    :example result ProbeResult("10.10.100.1", True, 0.001, "icmp", [0.001], 1)
+
+    :return 记录，往返时间单位为毫秒
+    :example {
+        "ip": "10.10.100.1",
+        "state": "up",
+        "rtt": 1.0,
+        "rtt_min": 1.0,
+        "rtt_p95": 1.0,
+        "sent": 1,
+        "received": 1,
+        "probe": "icmp",
+        "timestamp": "2026-10-17T06:00:00.000+00:00"
+    }
     """
-    cmd = OsCommand.PING_COMMAND % ip
+
+    def to_ms(value: float | None) -> float | None:
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "ip": result.ip,
+        "state": STATE_UP if result.alive else STATE_DOWN,
+        "rtt": to_ms(result.rtt),
+        "rtt_min": to_ms(result.rtt_min),
+        "rtt_p95": to_ms(result.rtt_p95),
+        "sent": result.sent,
+        "received": len(result.rtts),
+        "probe": result.probe,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+    }
+
+
+# pylint: disable=too-many-positional-arguments,too-many-arguments
+def run(
+    specs: Sequence[str],
+    options: SweepOptions,
+    order: str = "sorted",
+    stats: bool = False,
+    cache: ReachabilityCache | None = None,
+    incremental: bool = False,
+    fmt: str = "text",
+) -> SweepSummary:
+    """输出所有能ping通的ip
+
+    :param specs 目标描述
+    :example specs ["10.10.0.0/16", "10.10.100"]
+
+    :param options 探测参数
+    :example options SweepOptions()
+
+    :param order 输出顺序 sorted: 按探测顺序 arrival: 按应答顺序
+    :example order sorted
+
+    :param stats 是否输出往返时间统计信息
+    :example stats False
+
+    :param cache 主机存活状态缓存，None表示不使用缓存
+    :example cache ReachabilityCache("~/.cache/plum_tools/pping.db", 60, 3600)
+
+    :param incremental 是否增量探测
+    :example incremental True
+
+    :param fmt 输出格式 text: 只输出能ping通的ip json/ndjson/csv: 每个主机输出一条记录
+    :example fmt text
+
+    :return 探测结果汇总
+    """
+    summary = SweepSummary()
+    writer = get_writer(fmt, RECORD_FIELDS) if fmt in STRUCTURED_FORMATS else None
+
+    async def _run() -> None:
+        async for result in sweep_specs(specs, options, order == "sorted", cache, incremental):
+            summary.add(result)
+            if writer is not None:
+                writer.write(to_record(result))
+            elif result.alive:
+                print_text(format_stats(result) if stats else result.ip)
+
     try:
-        run_cmd(cmd)
-    except RunCmdError:
-        return None
-    return ip
+        asyncio.run(_run())
+    finally:
+        if writer is not None:
+            writer.close()
+    return summary
 
 
-def run(host_type: str, prefix_host: str) -> None:
-    """打印IP段内所有能ping通的ip
+# pylint: disable=too-many-positional-arguments,too-many-arguments
+def report_change(result: ProbeResult, up: set[str], first: bool, writer: RecordWriter | None = None) -> None:
+    """主机状态发生变化时更新能ping通的ip并输出
 
-    :param host_type ip类型,不同的ip类型，ip前缀不一样
-    :example host_type default
+    :param result 探测结果
+    :example result ProbeResult("10.10.100.1", True)
 
-    :param prefix_host: 主机前缀
-    :example prefix_host 1.1.1
+    :param up 能ping通的ip
+    :example up {"10.10.100.1"}
+
+    :param first 是否为第一轮探测，第一轮只输出能ping通的ip
+    :example first True
+
+    :param writer 结构化输出，None表示输出文本
+    :example writer NdjsonWriter(RECORD_FIELDS)
     """
-    if not prefix_host:
-        prefix_host = get_prefix_host_ip(host_type)
+    if result.alive == (result.ip in up):
+        return
+    if result.alive:
+        up.add(result.ip)
+    else:
+        up.discard(result.ip)
+    if writer is not None:
+        writer.write(to_record(result))
+    elif first:
+        print_text(result.ip)
+    elif result.alive:
+        print_ok(f"{result.ip} up")
+    else:
+        print_error(f"{result.ip} down")
+
+
+def watch(
+    specs: Sequence[str],
+    options: SweepOptions,
+    interval: float,
+    cache: ReachabilityCache | None = None,
+    incremental: bool = False,
+    rounds: int = 0,
+    fmt: str = "text",
+) -> SweepSummary | None:
+    """按固定间隔持续探测，第一轮输出所有能ping通的ip，之后只输出状态发生变化的ip
+
+    :param specs 目标描述
+    :example specs ["10.10.0.0/16", "10.10.100"]
+
+    :param options 探测参数
+    :example options SweepOptions()
+
+    :param interval 两轮探测开始的间隔时间，单位秒
+    :example interval 10
+
+    :param cache 主机存活状态缓存，None表示不使用缓存
+    :example cache ReachabilityCache("~/.cache/plum_tools/pping.db", 60, 3600)
 
-    mark = "."
-    if not prefix_host.endswith(mark):
-        prefix_host += mark
+    :param incremental 是否增量探测
+    :example incremental True
 
-    targets = [f"{prefix_host}{i}" for i in range(1, 255)]
-    with Pool(processes=PROCESSES_NUMBER) as pool:
-        result = pool.map(ping, targets)
-    for ip in result:
-        if ip:
-            print_text(ip)
+    :param rounds 探测轮数，0表示一直探测
+    :example rounds 0
+
+    :param fmt 输出格式 text/json/ndjson/csv，结构化输出时每次状态变化输出一条记录
+    :example fmt ndjson
+
+    :return 最后一轮完整探测的结果汇总，第一轮探测完成前被中断时返回None
+    """
+    up: set[str] = set()
+    summaries: list[SweepSummary] = []
+    writer = get_writer(fmt, RECORD_FIELDS) if fmt in STRUCTURED_FORMATS else None
+
+    async def _watch() -> None:
+        for index in itertools.count(1):
+            start = time.monotonic()
+            summary = SweepSummary()
+            async for result in sweep_specs(specs, options, False, cache, incremental):
+                summary.add(result)
+                report_change(result, up, index == 1, writer)
+            summaries.append(summary)
+            if rounds and index >= rounds:
+                return
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+    try:
+        asyncio.run(_watch())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if writer is not None:
+            writer.close()
+    return summaries[-1] if summaries else None
 
 
 def main() -> None:
     """程序主入口"""
     parser = get_base_parser()
+    parser.add_argument(
+        dest="targets",
+        action="store",
+        nargs="*",
+        help="targets to probe, CIDR (10.10.0.0/16), range (10.10.100.1-50), prefix (10.10.100) or ip",
+    )
     parser.add_argument(
         "-t",
         "--type",
         action="store",
         required=False,
-        dest="type",
-        default="default",
-        help="host type",
+        dest="types",
+        nargs="+",
+        default=["default"],
+        help="host types, used when no targets are given",
     )
     parser.add_argument(
         "-p",
@@ -79,6 +502,190 @@ def main() -> None:
         default=None,
         help="host prefix",
     )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        action="store",
+        required=False,
+        dest="mode",
+        choices=["auto", "icmp", "tcp"],
+        default="auto",
+        help="probe mode, auto uses icmp when the kernel allows it and falls back to tcp",
+    )
+    parser.add_argument(
+        "-w",
+        "--timeout",
+        action="store",
+        required=False,
+        dest="timeout",
+        type=float,
+        default=PING_TIMEOUT,
+        help="probe timeout in seconds",
+    )
+    parser.add_argument(
+        "--ports",
+        action="store",
+        required=False,
+        dest="ports",
+        nargs="+",
+        type=int,
+        default=list(PING_TCP_PORTS),
+        help="tcp ports to probe",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        action="store",
+        required=False,
+        dest="concurrency",
+        type=int,
+        default=PING_CONCURRENCY,
+        help="number of concurrent probes",
+    )
+    parser.add_argument(
+        "-o",
+        "--order",
+        action="store",
+        required=False,
+        dest="order",
+        choices=["sorted", "arrival"],
+        default="sorted",
+        help="print reachable hosts in target order or as soon as they answer",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--rate",
+        action="store",
+        required=False,
+        dest="rate",
+        type=float,
+        default=PING_RATE,
+        help="max probes per second, 0 means unlimited",
+    )
+    parser.add_argument(
+        "--min-timeout",
+        action="store",
+        required=False,
+        dest="min_timeout",
+        type=float,
+        default=PING_MIN_TIMEOUT,
+        help="lower bound of the adaptive probe timeout in seconds",
+    )
+    parser.add_argument(
+        "--fixed-timeout",
+        action="store_true",
+        required=False,
+        dest="fixed_timeout",
+        default=False,
+        help="always wait the full timeout instead of adapting it to the observed rtt",
+    )
+    parser.add_argument(
+        "-n",
+        "--count",
+        action="store",
+        required=False,
+        dest="count",
+        type=int,
+        default=None,
+        help=f"probes per host, defaults to {PING_STATS_COUNT} with --stats and 1 otherwise",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        required=False,
+        dest="stats",
+        default=False,
+        help="print min/avg/p95 rtt of every reachable host",
+    )
+
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        required=False,
+        dest="incremental",
+        default=False,
+        help="probe recently-up hosts first and skip down hosts until their backoff expires",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store",
+        required=False,
+        dest="watch",
+        type=float,
+        nargs="?",
+        const=PING_WATCH_INTERVAL,
+        default=None,
+        help=f"re-sweep every N seconds (default {PING_WATCH_INTERVAL}) and print only state transitions",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        required=False,
+        dest="no_cache",
+        default=False,
+        help="do not read or update the reachability cache",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--format",
+        action="store",
+        required=False,
+        dest="format",
+        choices=["text", *STRUCTURED_FORMATS],
+        default="text",
+        help="output format, structured formats stream one record per host",
+    )
+    parser.add_argument(
+        "--exit-status",
+        action="store_true",
+        required=False,
+        dest="exit_status",
+        default=False,
+        help="exit with 3 when some hosts are down and 4 when all hosts are down",
+    )
 
     args = parser.parse_args()
-    run(args.type, args.prefix_host)
+    specs = list(args.targets)
+    if args.prefix_host:
+        specs.append(args.prefix_host)
+    specs = get_target_specs(args.types, specs)
+    try:
+        # 提前校验所有目标，避免探测到一半才发现格式错误
+        for spec in specs:
+            parse_target(spec)
+    except ValueError as e:
+        print_error(f"目标格式错误: {e}")
+        sys.exit(1)
+    options = SweepOptions(
+        mode=args.mode,
+        timeout=args.timeout,
+        ports=args.ports,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        count=args.count or (PING_STATS_COUNT if args.stats else 1),
+        min_timeout=None if args.fixed_timeout else args.min_timeout,
+    )
+    cache = None
+    if not args.no_cache:
+        cache = ReachabilityCache(PathConfig.PING_CACHE_PATH, PING_BACKOFF_BASE, PING_BACKOFF_MAX)
+        if not cache.open():
+            cache = None
+    start = time.monotonic()
+    try:
+        if args.watch:
+            summary = watch(specs, options, args.watch, cache, args.incremental, fmt=args.format)
+        else:
+            summary = run(specs, options, args.order, args.stats, cache, args.incremental, fmt=args.format)
+    finally:
+        if cache is not None:
+            cache.close()
+    if summary is None:
+        sys.exit(PingExitCode.INTERRUPTED)
+    if args.format in STRUCTURED_FORMATS:
+        # 汇总信息输出到标准错误，不影响标准输出的解析
+        sys.stderr.write(f"{summary} in {time.monotonic() - start:.2f}s\n")
+    # 默认和其他命令一样正常结束时退出码为0，指定 --exit-status 时才通过退出码返回探测结果
+    sys.exit(summary.exit_code if args.exit_status else PingExitCode.ALL_UP)
@@ -16,11 +16,12 @@ import os
 import subprocess
 import sys
 
-from .conf import LOCAL_HOST, PathConfig
+from .conf import LOCAL_HOST, PathConfig, SSHConfig
 from .exceptions import RunCmdError, SystemTypeError
 from .utils.parser import get_base_parser
 from .utils.printer import print_error, print_ok, print_text
 from .utils.sshconf import merge_ssh_config
+from .utils.sshctl import format_control_options
 from .utils.utils import YmlConfig, get_file_abspath, run_cmd
 
 
@@ -226,7 +227,12 @@ class SyncFiles:  # pylint: disable=too-many-instance-attributes
                 directory = self._dest
             option.append(f"'--rsync-path=mkdir -p {directory} && rsync'")
         if not self._is_localhost:
-            option.append(f'-e \'{ssh_cmd} -i {self._identity_file} -o "{known_host}" -o "{host_key}" -o "{timeout}"\'')
+            # 和 pssh 使用相同的主连接，已经登录过的主机不需要重新建立连接
+            control = format_control_options(self._user, self._hostname, self._port or SSHConfig.DEFAULT_SSH_PORT)
+            ssh_cmd = f'{ssh_cmd} -i {self._identity_file} -o "{known_host}" -o "{host_key}" -o "{timeout}"'
+            if control:
+                ssh_cmd = f"{ssh_cmd} {control}"
+            option.append(f"-e '{ssh_cmd}'")
         if self._delete:
             option.append(" --delete")
         for item in set(self._exclude):
@@ -5,6 +5,8 @@
 #         Desc: 通过密钥快速登录机器
 #                命令: pssh 1
 #                描述: 使用指定路径下的密钥登录 x.x.x.1
+#                命令: pssh -c "uptime" 1-40 web-*
+#                描述: 同时在 x.x.x.1 ~ x.x.x.40 和别名匹配 web-* 的主机上执行命令，输出相同的主机合并显示
 #       Author: seekplum
 #        Email: 1131909224m@sina.cn
 #     HomePage: seekplum.github.io
@@ -12,14 +14,47 @@
 #=============================================================================
 """
 
+import asyncio
+import fnmatch
 import os
+import re
+import shlex
+import subprocess
+import sys
+from collections.abc import Iterable
+from dataclasses import dataclass
 
-from .conf import SSHConfig
+from .conf import PSSH_CONCURRENCY, PSSH_TIMEOUT, SSH_CONTROL_PERSIST, SSHConfig
 from .utils.parser import get_base_parser
-from .utils.sshconf import merge_ssh_config
+from .utils.printer import get_green, get_red, print_error, print_text, print_warn
+from .utils.sshconf import get_ssh_aliases, is_known_host, merge_ssh_config
+from .utils.sshctl import format_control_options, list_masters, stop_masters
+from .utils.utils import ensure_str
 
+HOST_RANGE = re.compile(r"^((?:\d+\.){0,3})(\d+)-(\d+)$")  # ip简写的范围，如 1-40、100.1-40
+HOST_NUMBER = re.compile(r"^(.*?)(\d+)$")  # 以数字结尾的主机名，合并显示时按前缀分组
+HOST_WILDCARDS = "*?["  # 主机别名中的通配符
+SEPARATOR = "-" * 15
 
-def get_login_ssh_cmd(hostname: str, user: str, port: int, identityfile: str) -> str:
+
+@dataclass
+class HostResult:
+    """在一台主机上执行命令的结果"""
+
+    host: str  # 命令行中的主机
+    returncode: int | None = None  # 退出码，没有执行完成时为None
+    output: str = ""  # 标准输出和标准错误
+    error: str | None = None  # 超时等没有退出码的原因
+
+    @property
+    def ok(self) -> bool:
+        """命令是否执行成功"""
+        return self.error is None and self.returncode == 0
+
+
+def get_login_ssh_cmd(
+    hostname: str, user: str, port: int, identityfile: str, persist: str | None = SSH_CONTROL_PERSIST
+) -> str:
     """组合登陆的命令
 
     :param hostname 主机ip
@@ -34,18 +69,31 @@ def get_login_ssh_cmd(hostname: str, user: str, port: int, identityfile: str) ->
     :param identityfile 主机ip
     :example identityfile ~/.ssh/id_rsa
 
+    :param persist 主连接在最后一个会话结束后保持的时间，None 或 no 表示不复用连接
+    :example persist 10m
+
     :return cmd ssh登陆的命令
     """
+    control_options = format_control_options(user, hostname, port, persist)
     return (
         f"ssh  -i {identityfile} "
         '-o "UserKnownHostsFile=/dev/null" '
         '-o "StrictHostKeyChecking no" '
         f'-o  "ConnectTimeout={SSHConfig.CONNECT_TIMEOUT}" '
-        f"{user}@{hostname} -p {port}"
+        + (f"{control_options} " if control_options else "")
+        + f"{user}@{hostname} -p {port}"
     )
 
 
-def login(host: str, host_type: str, user: str, port: int, identityfile: str) -> None:
+# pylint: disable=too-many-positional-arguments,too-many-arguments
+def login(
+    host: str,
+    host_type: str,
+    user: str,
+    port: int,
+    identityfile: str,
+    persist: str | None = SSH_CONTROL_PERSIST,
+) -> None:
     """登陆主机
 
     :param host: ip的简写或者主机的别名
@@ -65,17 +113,304 @@ def login(host: str, host_type: str, user: str, port: int, identityfile: str) ->
 
     :param identityfile ssh登陆私钥文件路径
     :example identityfile ~/.ssh/id_rsa
+
+    :param persist 主连接在最后一个会话结束后保持的时间，None 或 no 表示不复用连接
+    :example persist 10m
     """
     ssh_conf = merge_ssh_config(host, host_type, user, port, identityfile)
-    cmd = get_login_ssh_cmd(**ssh_conf)
+    cmd = get_login_ssh_cmd(**ssh_conf, persist=persist)
     # 不能使用run_cmd，因为会导致夯住，需要等待结果返回
     os.system(cmd)  # nosec B605
 
 
+def expand_hosts(specs: Iterable[str]) -> list[str]:
+    """展开命令行中的主机
+
+    :param specs 主机描述，支持以下格式
+        ip简写的范围: 1-40 或 100.1-40
+        通配符: web-*  匹配 ~/.ssh/config 中的主机别名
+        其他: ip、ip简写、主机别名
+    :example specs ["1-40", "web-*"]
+
+    :return 去重后按命令行顺序排列的主机
+    """
+    aliases: list[str] | None = None
+    hosts: dict[str, None] = {}
+    for spec in specs:
+        match = HOST_RANGE.match(spec)
+        if match:
+            prefix, start, end = match.groups()
+            for number in range(int(start), int(end) + 1):
+                hosts.setdefault(f"{prefix}{number}")
+        elif any(c in spec for c in HOST_WILDCARDS):
+            if aliases is None:
+                aliases = get_ssh_aliases()
+            matched = fnmatch.filter(aliases, spec)
+            if not matched:
+                print_warn(f"~/.ssh/config 中没有主机别名匹配 {spec}")
+            for alias in matched:
+                hosts.setdefault(alias)
+        else:
+            hosts.setdefault(spec)
+    return list(hosts)
+
+
+def get_exec_ssh_cmd(ssh_conf: dict, command: str, persist: str | None = SSH_CONTROL_PERSIST) -> list[str]:
+    """组合在主机上执行命令的参数，不分配终端，无法使用密钥登录时直接失败，不等待输入密码
+
+    :param ssh_conf ssh主机信息
+    :example ssh_conf {"hostname": "10.10.100.1", "user": "root", "port": 22, "identityfile": "~/.ssh/id_rsa"}
+
+    :param command 要执行的命令
+    :example command uptime
+
+    :param persist 主连接在最后一个会话结束后保持的时间
+    :example persist 10m
+    """
+    return [*shlex.split(get_login_ssh_cmd(**ssh_conf, persist=persist)), "-T", "-o", "BatchMode=yes", command]
+
+
+async def run_host(host: str, argv: list[str], timeout: float, semaphore: asyncio.Semaphore) -> HostResult:
+    """在一台主机上执行命令
+
+    :param host 命令行中的主机
+    :example host 1
+
+    :param argv ssh命令的参数
+    :example argv ["ssh", "root@10.10.100.1", "-p", "22", "uptime"]
+
+    :param timeout 超时时间，超时后结束ssh进程
+    :example timeout 60
+
+    :param semaphore 限制同时执行的主机数量
+    :example semaphore asyncio.Semaphore(64)
+    """
+    result = HostResult(host)
+    async with semaphore:
+        try:
+            p = await asyncio.create_subprocess_exec(
+                *argv,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+        except OSError as e:
+            result.error = str(e)
+            return result
+        try:
+            stdout, _ = await asyncio.wait_for(p.communicate(), timeout)
+        except asyncio.TimeoutError:
+            p.kill()
+            await p.wait()
+            result.error = f"timeout after {timeout}s"
+            return result
+    result.returncode = p.returncode
+    result.output = ensure_str(stdout, errors="replace").rstrip("\n")
+    return result
+
+
+async def run_hosts(commands: dict[str, list[str]], concurrency: int, timeout: float) -> list[HostResult]:
+    """在多台主机上并发执行命令
+
+    :param commands 主机和ssh命令的参数
+    :example commands {"1": ["ssh", "root@10.10.100.1", "-p", "22", "uptime"]}
+
+    :param concurrency 同时执行的主机数量
+    :example concurrency 64
+
+    :param timeout 每台主机的超时时间
+    :example timeout 60
+
+    :return 和 `commands` 顺序一致的执行结果
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    return await asyncio.gather(*(run_host(host, argv, timeout, semaphore) for host, argv in commands.items()))
+
+
+def fold_hosts(hosts: Iterable[str]) -> str:
+    """合并以数字结尾的主机名
+
+    :param hosts 主机
+    :example hosts ["1", "2", "3", "5", "web-1", "web-2", "db"]
+
+    :return 1-3,5,web-[1-2],db
+    """
+    groups: dict[tuple[str, int], list[int]] = {}
+    for host in hosts:
+        match = HOST_NUMBER.match(host)
+        if match is None:
+            groups.setdefault((host, -1), [])
+            continue
+        prefix, digits = match.groups()
+        # 以0开头的数字保留位数，如 web-01
+        width = len(digits) if digits.startswith("0") and len(digits) > 1 else 0
+        groups.setdefault((prefix, width), []).append(int(digits))
+    items = []
+    for (prefix, width), numbers in groups.items():
+        if width < 0:
+            items.append(prefix)
+            continue
+        numbers = sorted(set(numbers))
+        ranges = []
+        start = end = numbers[0]
+        for number in [*numbers[1:], None]:
+            if number is not None and number == end + 1:
+                end = number
+                continue
+            ranges.append(str(start).zfill(width) if start == end else f"{start:0{width}}-{end:0{width}}")
+            if number is not None:
+                start = end = number
+        folded = ",".join(ranges)
+        if prefix and (len(ranges) > 1 or "-" in ranges[0]):
+            folded = f"[{folded}]"
+        items.append(f"{prefix}{folded}")
+    return ",".join(items)
+
+
+def print_results(results: Iterable[HostResult]) -> None:
+    """输出执行结果，输出和退出码都相同的主机合并显示
+
+    :param results 执行结果
+    :example results [HostResult("1", 0, "ok")]
+    """
+    groups: dict[tuple[str, int | None, str | None], list[str]] = {}
+    for result in results:
+        groups.setdefault((result.output, result.returncode, result.error), []).append(result.host)
+    for (output, returncode, error), hosts in groups.items():
+        header = f"{fold_hosts(hosts)} ({len(hosts)})"
+        if error is not None:
+            header = get_red(f"{header} {error}")
+        elif returncode != 0:
+            header = get_red(f"{header} exit {returncode}")
+        else:
+            header = get_green(header)
+        print_text(SEPARATOR)
+        print_text(header)
+        print_text(SEPARATOR)
+        if output:
+            print_text(output)
+
+
+# pylint: disable=too-many-positional-arguments,too-many-arguments
+def get_exec_ssh_cmds(
+    hosts: Iterable[str],
+    command: str,
+    host_type: str,
+    user: str,
+    port: int,
+    identityfile: str,
+    persist: str | None = SSH_CONTROL_PERSIST,
+) -> dict[str, list[str]]:
+    """生成每台主机执行命令的ssh命令
+
+    :param hosts 展开后的主机
+    :example hosts ["10.10.100.1", "web-1"]
+
+    :param command 要执行的命令
+    :example command uptime
+
+    :param host_type ip类型,不同的ip类型，ip前缀不一样
+    :example host_type default
+
+    :param user ssh登陆用户名
+    :example user root
+
+    :param port ssh登陆端口
+    :example port 22
+
+    :param identityfile ssh登陆私钥文件路径
+    :example identityfile ~/.ssh/id_rsa
+
+    :param persist 主连接在最后一个会话结束后保持的时间
+    :example persist 10m
+
+    :return 主机和ssh命令，~/.ssh/config中没有配置的主机别名不在结果中
+    """
+    return {
+        host: get_exec_ssh_cmd(merge_ssh_config(host, host_type, user, port, identityfile), command, persist)
+        for host in hosts
+        if is_known_host(host)
+    }
+
+
+# pylint: disable=too-many-positional-arguments,too-many-arguments
+def execute(
+    specs: Iterable[str],
+    command: str,
+    host_type: str,
+    user: str,
+    port: int,
+    identityfile: str,
+    concurrency: int = PSSH_CONCURRENCY,
+    timeout: float = PSSH_TIMEOUT,
+    persist: str | None = SSH_CONTROL_PERSIST,
+) -> bool:
+    """在多台主机上并发执行命令并输出结果
+
+    :param specs 主机描述
+    :example specs ["1-40", "web-*"]
+
+    :param command 要执行的命令
+    :example command uptime
+
+    :param host_type ip类型,不同的ip类型，ip前缀不一样
+    :example host_type default
+
+    :param user ssh登陆用户名
+    :example user root
+
+    :param port ssh登陆端口
+    :example port 22
+
+    :param identityfile ssh登陆私钥文件路径
+    :example identityfile ~/.ssh/id_rsa
+
+    :param concurrency 同时执行的主机数量
+    :example concurrency 64
+
+    :param timeout 每台主机的超时时间
+    :example timeout 60
+
+    :param persist 主连接在最后一个会话结束后保持的时间
+    :example persist 10m
+
+    :return 是否所有主机都执行成功
+    """
+    hosts = expand_hosts(specs)
+    if not hosts:
+        print_error("没有需要执行命令的主机")
+        return False
+    commands = get_exec_ssh_cmds(hosts, command, host_type, user, port, identityfile, persist)
+    errors = {host: HostResult(host, error="unknown host") for host in hosts if host not in commands}
+    finished = {result.host: result for result in asyncio.run(run_hosts(commands, concurrency, timeout))}
+    results = [errors.get(host) or finished[host] for host in hosts]
+    print_results(results)
+    return all(result.ok for result in results)
+
+
+def control(operation: str) -> None:
+    """查看、关闭ssh主连接
+
+    :param operation status 查看所有主连接 / stop 关闭所有主连接
+    :example operation status
+    """
+    masters = stop_masters() if operation == "stop" else list_masters()
+    if not masters:
+        print_text("no master connections")
+    for master in masters:
+        if operation == "stop":
+            print_text(f"stopped {master.name}" if master.running else f"removed stale {master.name}")
+        elif master.running:
+            print_text(f"{get_green('running')} pid={master.pid} {master.name}")
+        else:
+            print_text(f"{get_red('stale')} {master.name}")
+
+
 def main() -> None:
     """程序主入口"""
     parser = get_base_parser()
-    parser.add_argument(dest="host", action="store", help="specify server")
+    parser.add_argument(dest="host", action="store", nargs="?", default=None, help="specify server")
+    parser.add_argument(dest="hosts", action="store", nargs="*", help="more servers, used with --command")
 
     parser.add_argument(
         "-t",
@@ -114,8 +449,73 @@ def main() -> None:
         default=0,
         help="ssh login port",
     )
+    parser.add_argument(
+        "-c",
+        "--command",
+        action="store",
+        required=False,
+        dest="command",
+        default=None,
+        help="run command on all servers instead of login",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        required=False,
+        dest="jobs",
+        type=int,
+        default=PSSH_CONCURRENCY,
+        help="number of servers running command at the same time",
+    )
+    parser.add_argument(
+        "--timeout",
+        action="store",
+        required=False,
+        dest="timeout",
+        type=float,
+        default=PSSH_TIMEOUT,
+        help="command timeout in seconds for each server",
+    )
+    parser.add_argument(
+        "--persist",
+        action="store",
+        required=False,
+        dest="persist",
+        default=SSH_CONTROL_PERSIST,
+        help="how long an idle master connection is kept, such as 10m, 'no' disables connection sharing",
+    )
+    parser.add_argument(
+        "--ctl",
+        action="store",
+        required=False,
+        dest="ctl",
+        choices=["status", "stop"],
+        default=None,
+        help="show or stop master connections",
+    )
 
     args = parser.parse_args()
+    if args.ctl is not None:
+        control(args.ctl)
+        return
+    if args.host is None:
+        parser.error("the following arguments are required: host")
+    if args.command is not None:
+        ok = execute(
+            [args.host, *args.hosts],
+            args.command,
+            args.type,
+            args.user,
+            args.port,
+            args.identityfile,
+            args.jobs,
+            args.timeout,
+            args.persist,
+        )
+        sys.exit(0 if ok else 1)
+    if args.hosts:
+        parser.error("multiple servers require --command")
     host, host_type, user, port, identityfile = (
         args.host,
         args.type,
@@ -124,4 +524,4 @@ def main() -> None:
         args.identityfile,
     )
     # 执行登陆操作
-    login(host, host_type, user, port, identityfile)
+    login(host, host_type, user, port, identityfile, args.persist)
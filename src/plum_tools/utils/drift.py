@@ -0,0 +1,183 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: drift
+#         Desc: 离线检查仓库所有分支和上游分支、本地镜像的差异
+#               直接读取 refs 和 packed-refs，提交相同时不执行git命令
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 20:10
+#=============================================================================
+"""
+
+import os
+from dataclasses import dataclass
+
+from ..conf import GitCommand
+from ..exceptions import RunCmdError
+from .git import run_git
+from .gitbatch import count_divergence, get_cat_file, resolve_ref
+from .gitmeta import GitMeta
+
+HEADS_PREFIX = "refs/heads/"
+
+
+@dataclass
+class BranchDrift:  # pylint: disable=too-many-instance-attributes
+    """分支和上游分支、镜像中同名分支的差异，无法比较时提交数为None
+
+    字段和 gitrepo --drift 输出的列一一对应，通过 dataclasses.asdict 直接输出，不拆分成嵌套的结构
+    """
+
+    branch: str  # 分支名
+    commit: str  # 分支的提交
+    upstream: str | None = None  # 上游分支的本地引用，没有设置上游分支时为None
+    ahead: int | None = None  # 超前上游分支的提交数
+    behind: int | None = None  # 落后上游分支的提交数
+    mirror_ahead: int | None = None  # 超前镜像中同名分支的提交数
+    mirror_behind: int | None = None  # 落后镜像中同名分支的提交数
+    error: str | None = None  # 无法比较的原因
+
+    @property
+    def drifted(self) -> bool:
+        """是否和上游分支或镜像不一致"""
+        return bool(self.error or self.ahead or self.behind or self.mirror_ahead or self.mirror_behind)
+
+
+def find_mirror(mirror_dir: str, repo: str) -> GitMeta | None:
+    """在镜像目录中查找和仓库同名的裸仓库
+
+    :param mirror_dir 保存裸仓库镜像的目录
+    :example mirror_dir /data/mirrors
+
+    :param repo 仓库路径
+    :example repo /tmp/git
+
+    :return 依次查找 <name>.git、<name>，都不存在时返回None
+    """
+    name = os.path.basename(os.path.normpath(repo))
+    for candidate in (f"{name}.git", name):
+        meta = GitMeta.open_bare(os.path.join(mirror_dir, candidate))
+        if meta is not None:
+            return meta
+    return None
+
+
+def count_commits(
+    repo: str,
+    commit: str,
+    other: str,
+    timeout: float | None = None,
+    objects: str | None = None,
+) -> tuple[int, int]:
+    """统计两个提交各自独有的提交数
+
+    先通过仓库的 git cat-file 常驻进程遍历提交，分叉的提交太多等无法准确统计时再执行 git rev-list
+
+    :param repo 仓库路径
+    :example repo /tmp/git
+
+    :param commit 本地提交
+    :example commit 4b825dc642cb6eb9a060e54bf8d69288fbee4904
+
+    :param other 比较的提交
+    :example other 4b825dc642cb6eb9a060e54bf8d69288fbee4904
+
+    :param timeout 超时时间
+    :example timeout 3
+
+    :param objects 额外的对象目录，比较的提交只存在于镜像中时使用镜像的对象目录
+    :example objects /data/mirrors/git.git/objects
+
+    :return 超前的提交数, 落后的提交数
+
+    :raise RunCmdError 提交不存在
+    """
+    try:
+        counts = count_divergence(get_cat_file(repo, objects), commit, other, timeout=timeout)
+    except RunCmdError:
+        counts = None
+    if counts is not None:
+        return counts
+    env = {"GIT_ALTERNATE_OBJECT_DIRECTORIES": objects} if objects else None
+    output = run_git(GitCommand.REV_LIST_COUNT % (commit, other), repo, timeout, env)
+    ahead, behind = output.split()
+    return int(ahead), int(behind)
+
+
+def check_upstream(repo: str, meta: GitMeta, drift: BranchDrift, timeout: float | None = None) -> None:
+    """比较分支和上游分支，结果记录在 drift 中
+
+    :param repo 仓库路径
+    :example repo /tmp/git
+
+    :param meta 仓库元数据
+    :example meta GitMeta.open("/tmp/git")
+
+    :param drift 分支的差异，没有设置上游分支时不比较
+    :example drift BranchDrift("master", "4b825dc", "refs/remotes/origin/master")
+
+    :param timeout 每个git命令的超时时间
+    :example timeout 3
+
+    :raise RunCmdError git命令执行失败
+    :raise RunCmdTimeout git命令执行超时
+    """
+    if not drift.upstream:
+        return
+    upstream_commit = resolve_ref(repo, drift.upstream, meta, timeout)
+    if upstream_commit is None:
+        drift.error = "upstream gone"
+    elif upstream_commit == drift.commit:
+        drift.ahead = drift.behind = 0
+    else:
+        drift.ahead, drift.behind = count_commits(repo, drift.commit, upstream_commit, timeout)
+
+
+def check_drift(repo: str, mirror: GitMeta | None = None, timeout: float | None = None) -> list[BranchDrift]:
+    """检查仓库每个本地分支和上游分支、镜像中同名分支的差异
+
+    只读取本地的引用，不访问远程仓库，上游分支是上次 fetch 的结果。
+    引用指向同一个提交时直接认为一致，只有不一致的分支才执行git命令统计提交数
+
+    :param repo 仓库路径
+    :example repo /tmp/git
+
+    :param mirror 仓库的镜像，None表示不和镜像比较，镜像不存在由调用方按仓库提示，不记录到每个分支中
+    :example mirror find_mirror("/data/mirrors", "/tmp/git")
+
+    :param timeout 每个git命令的超时时间
+    :example timeout 3
+
+    :return 每个本地分支的差异，按分支名排序，git命令执行失败的分支记录在 error 中
+
+    :raise RunCmdTimeout git命令执行超时
+    """
+    meta = GitMeta.open(repo)
+    if meta is None:
+        return []
+    mirror_refs = mirror.list_refs(HEADS_PREFIX) if mirror is not None else {}
+    mirror_objects = os.path.join(mirror.common_dir, "objects") if mirror is not None else None
+    results = []
+    for ref, commit in sorted(meta.list_refs(HEADS_PREFIX).items()):
+        drift = BranchDrift(ref[len(HEADS_PREFIX) :], commit)
+        results.append(drift)
+        drift.upstream = meta.get_upstream(drift.branch)
+        try:
+            check_upstream(repo, meta, drift, timeout)
+            if mirror is None:
+                continue
+            mirror_commit = mirror_refs.get(ref)
+            if mirror_commit is None:
+                drift.error = drift.error or "missing in mirror"
+            elif mirror_commit == commit:
+                drift.mirror_ahead = drift.mirror_behind = 0
+            else:
+                drift.mirror_ahead, drift.mirror_behind = count_commits(
+                    repo, commit, mirror_commit, timeout, mirror_objects
+                )
+        except RunCmdError as e:
+            # 只影响当前分支，其他分支继续检查
+            drift.error = drift.error or (e.err_msg or str(e)).strip()
+    return results
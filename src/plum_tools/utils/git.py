@@ -11,9 +11,349 @@
 """
 
 import os
+import shlex
+import subprocess
+import tempfile
+import threading
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
 
 from ..conf import GitCommand
-from .utils import cd, run_cmd
+from ..exceptions import RunCmdError, RunCmdTimeout
+from .gitmeta import GitMeta
+from .utils import ensure_str
+
+
+@dataclass
+class RepoStatus:  # pylint: disable=too-many-instance-attributes
+    """仓库状态
+
+    字段和 `git status --porcelain=v2 --branch --show-stash` 输出的分支信息、储藏数量、文件列表一一对应，
+    gitrepo、gitstash 直接按字段读取，不拆分成嵌套的结构
+    """
+
+    path: str  # 仓库路径
+    branch: str | None = None  # 当前分支名，分离头指针时为None
+    commit: str | None = None  # 当前提交，没有提交时为None
+    upstream: str | None = None  # 上游分支名，没有设置上游分支时为None
+    ahead: int = 0  # 超前上游分支的提交数
+    behind: int = 0  # 落后上游分支的提交数
+    changed: list[tuple[str, str]] = field(default_factory=list)  # 改动的文件 (XY状态, 路径)
+    untracked: list[str] = field(default_factory=list)  # 未跟踪的文件
+    ignored: list[str] = field(default_factory=list)  # 被忽略的目录，以/结尾，被忽略的文件只有快照用不到，不保存
+    stash: int = 0  # 储藏数量
+    omitted_changed: int = 0  # 超过数量限制没有保存的改动文件数
+    omitted_untracked: int = 0  # 超过数量限制没有保存的未跟踪文件数
+
+    @property
+    def dirty(self) -> bool:
+        """是否有文件未提交"""
+        return bool(self.changed or self.untracked or self.omitted_changed or self.omitted_untracked)
+
+    @property
+    def changed_count(self) -> int:
+        """改动的文件总数"""
+        return len(self.changed) + self.omitted_changed
+
+    @property
+    def untracked_count(self) -> int:
+        """未跟踪的文件总数"""
+        return len(self.untracked) + self.omitted_untracked
+
+    @property
+    def modified(self) -> bool:
+        """是否有文件未提交或者和上游分支不一致，和 `check_repository_modify_status` 的判断一致"""
+        return self.dirty or bool(self.ahead or self.behind)
+
+
+def run_git(cmd: str, cwd: str, timeout: float | None = None, env: dict[str, str] | None = None) -> str:
+    """在仓库目录下执行git命令
+
+    不经过shell，也不切换当前进程的工作目录，可以在多个线程中同时执行
+
+    :param cmd git命令
+    :example cmd git status
+
+    :param cwd 仓库路径
+    :example cwd /tmp/git
+
+    :param timeout 超时时间
+    :example timeout 3
+
+    :param env 额外的环境变量
+    :example env {"GIT_ALTERNATE_OBJECT_DIRECTORIES": "/data/mirrors/git.git/objects"}
+
+    :return 命令输出
+
+    :raise RunCmdError 命令执行失败
+    :raise RunCmdTimeout 命令执行超时
+    """
+    # 只读的命令不需要获取 index.lock，避免和用户正在执行的git命令冲突
+    env = dict(os.environ, GIT_OPTIONAL_LOCKS="0", **(env or {}))
+    try:
+        p = subprocess.run(  # nosec B603
+            shlex.split(cmd),
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+            check=False,
+        )
+    except subprocess.TimeoutExpired as e:
+        raise RunCmdTimeout(f"run `{cmd}` timeout, timeout is {timeout}") from e
+    out_msg = ensure_str(p.stdout, errors="replace")
+    if p.returncode != 0:
+        err_msg = ensure_str(p.stderr, errors="replace")
+        raise RunCmdError(f"run `{cmd}` fail", out_msg, err_msg)
+    return out_msg
+
+
+def iter_git(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+    cmd: str,
+    cwd: str,
+    timeout: float | None = None,
+    sep: bytes = b"\0",
+    env: dict[str, str] | None = None,
+    chunk_size: int = 65536,
+) -> Iterator[str]:
+    """在仓库目录下执行git命令，边读取边按分隔符返回输出，不会把全部输出读到内存中
+
+    调用方提前结束遍历时结束git进程
+
+    :param cmd git命令
+    :example cmd git status --porcelain=v2 -z
+
+    :param cwd 仓库路径
+    :example cwd /tmp/git
+
+    :param timeout 超时时间
+    :example timeout 3
+
+    :param sep 输出的分隔符
+    :example sep b"\0"
+
+    :param env 额外的环境变量
+    :example env {"GIT_ALTERNATE_OBJECT_DIRECTORIES": "/data/mirrors/git.git/objects"}
+
+    :param chunk_size 每次读取的字节数
+    :example chunk_size 65536
+
+    :raise RunCmdError 命令执行失败，在输出全部返回后抛出
+    :raise RunCmdTimeout 命令执行超时
+    """
+    env = dict(os.environ, GIT_OPTIONAL_LOCKS="0", **(env or {}))
+    # 错误信息写到临时文件中，避免git在标准错误的管道写满时阻塞
+    with tempfile.TemporaryFile() as stderr:
+        with subprocess.Popen(  # nosec B603
+            shlex.split(cmd),
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+        ) as p:
+            timed_out = threading.Event()
+
+            def kill() -> None:
+                timed_out.set()
+                p.kill()
+
+            timer = threading.Timer(timeout, kill) if timeout else None
+            if timer is not None:
+                timer.start()
+            try:
+                buffer = b""
+                while chunk := p.stdout.read1(chunk_size):  # type: ignore[union-attr]
+                    *items, buffer = (buffer + chunk).split(sep)
+                    for item in items:
+                        if item:
+                            yield ensure_str(item, errors="replace")
+                if buffer:
+                    yield ensure_str(buffer, errors="replace")
+                p.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                if p.poll() is None:
+                    p.kill()
+        if timed_out.is_set():
+            raise RunCmdTimeout(f"run `{cmd}` timeout, timeout is {timeout}")
+        if p.returncode != 0:
+            stderr.seek(0)
+            raise RunCmdError(f"run `{cmd}` fail", "", ensure_str(stderr.read(), errors="replace"))
+
+
+def parse_status(path: str, records: Iterable[str], limit: int | None = None) -> RepoStatus:
+    """解析 `git status --porcelain=v2 --branch --show-stash -z` 的输出
+
+    :param path 仓库路径
+    :example path /tmp/git
+
+    :param records 以 \0 分隔的输出
+    :example records ["# branch.head master", "? a.txt"]
+
+    :param limit 改动的文件、未跟踪的文件最多保存的数量，超过的只计数，None表示不限制
+    :example limit 20
+
+    :return 仓库状态
+    """
+    status = RepoStatus(path)
+    records = iter(records)
+    for record in records:
+        _parse_record(status, record, records, limit)
+    return status
+
+
+def _parse_record(status: RepoStatus, record: str, records: Iterator[str], limit: int | None = None) -> None:
+    """解析一条输出，保存到仓库状态中"""
+    if record.startswith("# "):
+        _parse_header(status, record[2:])
+    elif record.startswith(("1 ", "u ", "2 ")):
+        if record[0] == "2":
+            # 重命名、复制的原路径在下一条记录中
+            next(records, None)
+        if limit is not None and len(status.changed) >= limit:
+            status.omitted_changed += 1
+            return
+        parts = record.split(" ", {"1": 8, "2": 9, "u": 10}[record[0]])
+        status.changed.append((parts[1], parts[-1]))
+    elif record.startswith("? "):
+        if limit is not None and len(status.untracked) >= limit:
+            status.omitted_untracked += 1
+            return
+        status.untracked.append(record[2:])
+    elif record.startswith("! ") and record.endswith("/"):
+        # 被忽略的文件可能非常多(如每个 .pyc)，只保存记录快照时需要跳过的目录
+        status.ignored.append(record[2:])
+
+
+def _parse_header(status: RepoStatus, header: str) -> None:
+    """解析分支、储藏信息"""
+    key, _, value = header.partition(" ")
+    if key == "branch.oid":
+        status.commit = None if value == "(initial)" else value
+    elif key == "branch.head":
+        status.branch = None if value == "(detached)" else value
+    elif key == "branch.upstream":
+        status.upstream = value
+    elif key == "branch.ab":
+        ahead, behind = value.split()
+        status.ahead, status.behind = int(ahead), -int(behind)
+    elif key == "stash":
+        status.stash = int(value)
+
+
+def get_repository_status(
+    repo_path: str,
+    timeout: float | None = None,
+    ignored: bool = False,
+    limit: int | None = None,
+) -> RepoStatus:
+    """执行一次git命令查询仓库状态，边读取输出边解析
+
+    :param repo_path 仓库路径
+    :example repo_path /tmp/git
+
+    :param timeout 超时时间
+    :example timeout 3
+
+    :param ignored 是否查询被忽略的文件
+    :example ignored False
+
+    :param limit 改动的文件、未跟踪的文件最多保存的数量，超过的只计数，None表示不限制
+    :example limit 20
+
+    :return 仓库状态
+    """
+    cmd = GitCommand.STATUS_IGNORED if ignored else GitCommand.STATUS_PORCELAIN
+    return parse_status(repo_path, iter_git(cmd, repo_path, timeout), limit)
+
+
+def _format_head(status: RepoStatus) -> str:
+    """`git status -sb` 风格的分支信息"""
+    head = f"## {status.branch or 'HEAD (no branch)'}"
+    if status.upstream:
+        head += f"...{status.upstream}"
+    track = [f"{name} {count}" for name, count in (("ahead", status.ahead), ("behind", status.behind)) if count]
+    if track:
+        head += f" [{', '.join(track)}]"
+    return head
+
+
+def _format_entries(status: RepoStatus) -> Iterator[str]:
+    """`git status -sb` 风格的文件列表"""
+    for xy, path in status.changed:
+        yield f"{xy.replace('.', ' ')} {path}"
+    for path in status.untracked:
+        yield f"?? {path}"
+
+
+def format_status(status: RepoStatus) -> str:
+    """把仓库状态格式化为 `git status -sb` 风格的文本
+
+    :param status 仓库状态
+    :example status RepoStatus("/tmp/git", "master")
+
+    :return 格式化后的文本
+    """
+    lines = [_format_head(status), *_format_entries(status)]
+    omitted = [
+        f"{count} more {name}"
+        for name, count in (("changed", status.omitted_changed), ("untracked", status.omitted_untracked))
+        if count
+    ]
+    if omitted:
+        lines.append(f"## ... {', '.join(omitted)}")
+    if status.stash:
+        lines.append(f"## stash {status.stash}")
+    return "\n".join(lines)
+
+
+def iter_status_lines(repo_path: str, timeout: float | None = None) -> Iterator[str]:
+    """执行git命令，逐行返回 `format_status` 风格的完整状态，不保存文件列表
+
+    :param repo_path 仓库路径
+    :example repo_path /tmp/git
+
+    :param timeout 超时时间
+    :example timeout 3
+    """
+    status = RepoStatus(repo_path)
+    records = iter_git(GitCommand.STATUS_PORCELAIN, repo_path, timeout)
+    head = False
+    for record in records:
+        _parse_record(status, record, records)
+        if record.startswith("# "):
+            continue
+        # 分支信息在所有文件之前输出
+        if not head:
+            yield _format_head(status)
+            head = True
+        yield from _format_entries(status)
+        status.changed.clear()
+        status.untracked.clear()
+    if not head:
+        yield _format_head(status)
+    if status.stash:
+        yield f"## stash {status.stash}"
+
+
+def get_stash_messages(repo_path: str, timeout: float | None = None) -> list[str]:
+    """查询所有储藏的说明，优先直接读取 `refs/stash` 的引用日志，不执行git命令
+
+    :param repo_path 仓库中的任意目录
+    :example repo_path /tmp/git
+
+    :param timeout 引用日志无法使用时执行git命令的超时时间
+    :example timeout 3
+
+    :return 从新到旧的说明，第n项对应 `stash@{n}`，如 ["On master: master-plum123456789987654321plum"]
+    """
+    meta = GitMeta.discover(repo_path)
+    entries = meta.read_reflog("refs/stash") if meta is not None else None
+    if entries is not None:
+        return [message for _, message in entries]
+    return run_git(GitCommand.STASH_MESSAGES, repo_path, timeout).splitlines()
 
 
 def get_current_branch_name() -> str:
@@ -21,7 +361,7 @@ def get_current_branch_name() -> str:
 
     :return 当前分支名
     """
-    return run_cmd(GitCommand.BRANCH_ABBREV).strip()
+    return run_git(GitCommand.BRANCH_ABBREV, os.getcwd()).strip()
 
 
 def check_is_git_repository(path: str) -> bool:
@@ -53,24 +393,21 @@ def check_repository_modify_status(repo_path: str) -> tuple[bool, str]:
         True 仓库有文件进行了修改未提交
         False 仓库没有文件进行了修改
 
-    >>> check_repository_modify_status("`pwd`")#doctest: +ELLIPSIS
+    >>> check_repository_modify_status(".")#doctest: +ELLIPSIS
     (True, '...')
 
     :return output 命令输出
     """
-    with cd(repo_path):
-        output = run_cmd(GitCommand.STATUS_DEFAULT)
+    output = run_git(GitCommand.STATUS_DEFAULT, repo_path)
 
     result = False
 
     # 检查是否落后、超前远程分支
     if GitCommand.PULL_KEYWORD in output or GitCommand.PUSH_KEYWORD in output:
         result = True
-    else:
-        with cd(repo_path):
-            # 检查本地是否还有文件未提交
-            if run_cmd(GitCommand.STATUS_SHORT):
-                result = True
+    # 检查本地是否还有文件未提交
+    elif run_git(GitCommand.STATUS_SHORT, repo_path):
+        result = True
     return result, output
 
 
@@ -84,13 +421,12 @@ def check_repository_stash(repo_path: str) -> tuple[bool, str]:
         True 仓库有文件在储藏区
         False 仓库中储藏区是干净的
 
-    >>> check_repository_stash("`pwd`")
+    >>> check_repository_stash(".")
     (False, '')
 
     :return output 命令输出
     """
-    with cd(repo_path):
-        output = run_cmd(GitCommand.STASH_LIST)
+    output = run_git(GitCommand.STASH_LIST, repo_path)
     result = False
     if output:
         result = True
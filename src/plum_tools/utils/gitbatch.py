@@ -0,0 +1,500 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: gitbatch
+#         Desc: 每个仓库保留常驻的 git cat-file --batch-check / --batch 进程查询引用和对象，
+#               多次查询只需要读写管道，不需要每次都启动git进程
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 23:10
+#=============================================================================
+"""
+
+import atexit
+import heapq
+import os
+import shlex
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from ..conf import GITBATCH_MAX_PROCESSES, GITBATCH_WALK_LIMIT, GitCommand
+from ..exceptions import RunCmdError, RunCmdTimeout
+from .gitmeta import GitMeta
+from .utils import ensure_str
+
+OBJECT_TYPES = (b"commit", b"tree", b"blob", b"tag")
+
+# 统计超前落后的提交数时提交的标记
+LEFT = 1  # 可以从本地提交访问
+RIGHT = 2  # 可以从比较的提交访问
+BOTH = LEFT | RIGHT  # 共同祖先
+
+
+@dataclass
+class ObjectInfo:
+    """对象信息"""
+
+    sha: str  # 对象名
+    type: str  # 对象类型 commit/tree/blob/tag
+    size: int  # 对象大小，单位字节
+
+
+class CatFile:
+    """仓库的 git cat-file 常驻进程，第一次查询时启动，进程退出后下次查询时重新启动
+
+    只查询对象信息时使用 --batch-check，需要读取内容时才启动 --batch，可以在多个线程中同时使用
+    """
+
+    def __init__(self, repo: str, objects: str | None = None) -> None:
+        """初始化
+
+        :param repo 仓库路径
+        :example repo /tmp/git
+
+        :param objects 额外的对象目录，需要读取只存在于镜像中的对象时使用镜像的对象目录
+        :example objects /data/mirrors/git.git/objects
+        """
+        self.repo = repo
+        self.objects = objects
+        self._processes: dict[str, subprocess.Popen] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, cmd: str) -> subprocess.Popen:
+        """获取正在运行的进程，没有时启动
+
+        :param cmd git命令
+        :example cmd git cat-file --batch-check
+
+        :raise RunCmdError git命令无法执行
+        """
+        p = self._processes.get(cmd)
+        if p is not None and p.poll() is None:
+            return p
+        # 只读的命令不需要获取 index.lock，避免和用户正在执行的git命令冲突
+        env = dict(os.environ, GIT_OPTIONAL_LOCKS="0")
+        if self.objects:
+            env["GIT_ALTERNATE_OBJECT_DIRECTORIES"] = self.objects
+        try:
+            p = subprocess.Popen(  # pylint: disable=consider-using-with  # nosec B603
+                shlex.split(cmd),
+                cwd=self.repo,
+                env=env,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise RunCmdError(f"run `{cmd}` fail", "", str(e)) from e
+        self._processes[cmd] = p
+        return p
+
+    def _stop(self, cmd: str) -> None:
+        """结束进程
+
+        :param cmd git命令
+        :example cmd git cat-file --batch-check
+        """
+        p = self._processes.pop(cmd, None)
+        if p is None:
+            return
+        try:
+            p.stdin.close()  # type: ignore[union-attr]
+        except OSError:
+            pass
+        try:
+            p.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            p.kill()
+            p.wait()
+        p.stdout.close()  # type: ignore[union-attr]
+
+    def _request(self, cmd: str, name: str, timeout: float | None) -> tuple[ObjectInfo | None, bytes]:
+        """向进程发送一个对象名，读取对象信息和内容
+
+        :param cmd git命令
+        :example cmd git cat-file --batch
+
+        :param name 对象名，可以是提交、引用名或者 `stash@{0}` 等git能解析的名称
+        :example name refs/heads/master
+
+        :param timeout 超时时间，超时后结束进程
+        :example timeout 3
+
+        :return 对象信息，对象不存在时为None; --batch 时的对象内容
+
+        :raise ValueError 对象名中有换行符
+        :raise RunCmdError 进程异常退出
+        :raise RunCmdTimeout 超时
+        """
+        if not name or "\n" in name or "\0" in name:
+            raise ValueError(f"invalid object name: {name!r}")
+        expired = threading.Event()
+        with self._lock:
+            p = self._start(cmd)
+
+            def kill() -> None:
+                expired.set()
+                p.kill()
+
+            timer = threading.Timer(timeout, kill) if timeout else None
+            if timer is not None:
+                timer.start()
+            try:
+                p.stdin.write(name.encode("utf-8") + b"\n")  # type: ignore[union-attr]
+                p.stdin.flush()  # type: ignore[union-attr]
+                header = p.stdout.readline()  # type: ignore[union-attr]
+                info = self._parse_header(header)
+                content = b""
+                if info is not None and cmd == GitCommand.CAT_FILE_BATCH:
+                    # 内容之后还有一个换行符
+                    content = p.stdout.read(info.size + 1)[: info.size]  # type: ignore[union-attr]
+                    if len(content) != info.size:
+                        header = b""
+            except OSError:
+                header = b""
+            finally:
+                if timer is not None:
+                    timer.cancel()
+            if not header:
+                self._stop(cmd)
+                if expired.is_set():
+                    raise RunCmdTimeout(f"run `{cmd}` timeout, timeout is {timeout}")
+                raise RunCmdError(f"run `{cmd}` fail", "", "process exited")
+        return info, content
+
+    @staticmethod
+    def _parse_header(header: bytes) -> ObjectInfo | None:
+        """解析输出的第一行
+
+        :param header 输出的第一行
+        :example header b"4b825dc642cb6eb9a060e54bf8d69288fbee4904 tree 0\\n"
+
+        :return 对象信息，对象不存在、对象名有歧义时为None
+        """
+        parts = header.rstrip(b"\n").rsplit(b" ", 2)
+        if len(parts) != 3 or parts[1] not in OBJECT_TYPES or not parts[2].isdigit():
+            return None
+        return ObjectInfo(ensure_str(parts[0]), ensure_str(parts[1]), int(parts[2]))
+
+    def info(self, name: str, timeout: float | None = None) -> ObjectInfo | None:
+        """查询对象信息
+
+        :param name 对象名
+        :example name refs/heads/master
+
+        :param timeout 超时时间
+        :example timeout 3
+
+        :return 对象信息，对象不存在时为None
+        """
+        info, _ = self._request(GitCommand.CAT_FILE_CHECK, name, timeout)
+        return info
+
+    def resolve(self, name: str, timeout: float | None = None) -> str | None:
+        """查询引用指向的对象
+
+        :param name 引用名
+        :example name refs/stash
+
+        :param timeout 超时时间
+        :example timeout 3
+
+        :return 对象名，引用不存在时为None
+        """
+        info = self.info(name, timeout)
+        return info.sha if info is not None else None
+
+    def read(self, name: str, timeout: float | None = None) -> tuple[ObjectInfo, bytes] | None:
+        """读取对象内容
+
+        :param name 对象名
+        :example name HEAD
+
+        :param timeout 超时时间
+        :example timeout 3
+
+        :return 对象信息和内容，对象不存在时为None
+        """
+        info, content = self._request(GitCommand.CAT_FILE_BATCH, name, timeout)
+        if info is None:
+            return None
+        return info, content
+
+    def close(self) -> None:
+        """结束所有进程"""
+        with self._lock:
+            for cmd in list(self._processes):
+                self._stop(cmd)
+
+    def __enter__(self) -> "CatFile":
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+
+class CatFilePool:
+    """按仓库缓存 git cat-file 常驻进程，超过数量时关闭最久没有使用的"""
+
+    def __init__(self, size: int = GITBATCH_MAX_PROCESSES) -> None:
+        """初始化
+
+        :param size 最多缓存的仓库数量
+        :example size 32
+        """
+        self._size = size
+        self._items: OrderedDict[tuple[str, str | None], CatFile] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, repo: str, objects: str | None = None) -> CatFile:
+        """获取仓库的常驻进程
+
+        :param repo 仓库路径
+        :example repo /tmp/git
+
+        :param objects 额外的对象目录
+        :example objects /data/mirrors/git.git/objects
+        """
+        key = (os.path.realpath(repo), objects)
+        evicted = []
+        with self._lock:
+            cat = self._items.get(key)
+            if cat is None:
+                cat = self._items[key] = CatFile(repo, objects)
+            self._items.move_to_end(key)
+            while len(self._items) > self._size:
+                _, item = self._items.popitem(last=False)
+                evicted.append(item)
+        for item in evicted:
+            item.close()
+        return cat
+
+    def close(self) -> None:
+        """结束所有进程"""
+        with self._lock:
+            items = list(self._items.values())
+            self._items.clear()
+        for item in items:
+            item.close()
+
+
+_POOL = CatFilePool()
+atexit.register(_POOL.close)
+
+
+def get_cat_file(repo: str, objects: str | None = None) -> CatFile:
+    """获取仓库共用的 git cat-file 常驻进程
+
+    :param repo 仓库路径
+    :example repo /tmp/git
+
+    :param objects 额外的对象目录
+    :example objects /data/mirrors/git.git/objects
+    """
+    return _POOL.get(repo, objects)
+
+
+def resolve_ref(repo: str, ref: str, meta: GitMeta | None = None, timeout: float | None = None) -> str | None:
+    """查询引用指向的提交
+
+    先直接读取 .git 目录中的引用，读取不到时(如引用不存在、使用 reftable 保存引用)再通过常驻进程查询
+
+    :param repo 仓库路径
+    :example repo /tmp/git
+
+    :param ref 引用名
+    :example ref refs/stash
+
+    :param meta 仓库元数据，None表示无法直接读取 .git 目录
+    :example meta GitMeta.discover("/tmp/git")
+
+    :param timeout 超时时间
+    :example timeout 3
+
+    :return 提交，引用不存在或者查询失败时返回None
+    """
+    commit = meta.resolve_ref(ref) if meta is not None else None
+    if commit:
+        return commit
+    try:
+        return get_cat_file(repo).resolve(ref, timeout)
+    except (RunCmdError, RunCmdTimeout):
+        return None
+
+
+def parse_commit(content: bytes) -> tuple[list[str], int]:
+    """解析提交对象
+
+    :param content 提交对象的内容
+    :example content b"tree ...\\nparent ...\\ncommitter a <a@b.c> 1700000000 +0800\\n\\nmessage\\n"
+
+    :return 父提交, 提交时间戳
+    """
+    headers, _, _ = content.partition(b"\n\n")
+    parents = []
+    timestamp = 0
+    for line in headers.split(b"\n"):
+        if line.startswith(b"parent "):
+            parents.append(ensure_str(line[7:]))
+        elif line.startswith(b"committer "):
+            fields = line.rsplit(b" ", 2)
+            if len(fields) == 3 and fields[1].isdigit():
+                timestamp = int(fields[1])
+    return parents, timestamp
+
+
+class _CommitGraph:
+    """统计分叉时读取过的提交，以及每个提交可以从哪一边访问"""
+
+    def __init__(self, cat: CatFile, timeout: float | None = None) -> None:
+        """初始化
+
+        :param cat 仓库的常驻进程
+        :example cat get_cat_file("/tmp/git")
+
+        :param timeout 每次读取的超时时间
+        :example timeout 3
+        """
+        self._cat = cat
+        self._timeout = timeout
+        self.flags: dict[str, int] = {}
+        self.commits: dict[str, tuple[list[str], int]] = {}  # 父提交, 提交时间戳
+        self.done: set[str] = set()
+        self.counts = {LEFT: 0, RIGHT: 0, BOTH: 0}
+        self.active = 0  # 队列中不是共同祖先的提交数量
+
+    def load(self, sha: str, flag: int) -> int | None:
+        """读取提交并标记
+
+        :param sha 提交
+        :example sha 4b825dc642cb6eb9a060e54bf8d69288fbee4904
+
+        :param flag 提交可以从哪一边访问
+        :example flag 1
+
+        :return 提交时间戳，提交不存在时返回None
+        """
+        item = self._cat.read(sha, self._timeout)
+        if item is None or item[0].type != "commit":
+            return None
+        self.commits[sha] = parse_commit(item[1])
+        self.flags[sha] = flag
+        self.active += flag != BOTH
+        return self.commits[sha][1]
+
+    def mark(self, sha: str, flag: int) -> None:
+        """把标记传递给已经读取的提交，已经统计过的提交修正统计结果并继续标记父提交
+
+        :param sha 提交
+        :example sha 4b825dc642cb6eb9a060e54bf8d69288fbee4904
+
+        :param flag 提交可以从哪一边访问
+        :example flag 2
+        """
+        stack = [sha]
+        while stack:
+            sha = stack.pop()
+            old = self.flags[sha]
+            new = old | flag
+            if new == old:
+                continue
+            self.flags[sha] = new
+            if sha not in self.done:
+                self.active -= new == BOTH
+                continue
+            self.counts[old] -= 1
+            self.counts[new] += 1
+            stack.extend(self.commits[sha][0])
+
+    def visit(self, sha: str) -> int:
+        """统计出队的提交
+
+        :param sha 提交
+        :example sha 4b825dc642cb6eb9a060e54bf8d69288fbee4904
+
+        :return 提交的标记
+        """
+        flag = self.flags[sha]
+        self.done.add(sha)
+        self.counts[flag] += 1
+        self.active -= flag != BOTH
+        return flag
+
+
+def _push_commit(graph: _CommitGraph, heap: list[tuple[int, str]], sha: str, flag: int) -> bool:
+    """把提交加入按提交时间从新到旧排序的队列，已经读取过的提交只传递标记
+
+    :return 提交不存在时返回False
+    """
+    if sha in graph.flags:
+        graph.mark(sha, flag)
+        return True
+    date = graph.load(sha, flag)
+    if date is None:
+        return False
+    heapq.heappush(heap, (-date, sha))
+    return True
+
+
+def _walk_finished(graph: _CommitGraph, heap: list[tuple[int, str]], single: list[tuple[int, str]]) -> bool:
+    """队列中都是共同祖先，并且都早于已经统计的独有提交时，继续遍历不会再修正统计结果
+
+    `single` 是已经统计的独有提交的最小堆，标记只会增加，变成共同祖先的提交到堆顶时再删除
+    """
+    if graph.active:
+        return False
+    while single and graph.flags[single[0][1]] == BOTH:
+        heapq.heappop(single)
+    return not single or -heap[0][0] < single[0][0]
+
+
+def count_divergence(
+    cat: CatFile,
+    commit: str,
+    other: str,
+    limit: int = GITBATCH_WALK_LIMIT,
+    timeout: float | None = None,
+) -> tuple[int, int] | None:
+    """通过常驻进程读取提交，统计两个提交各自独有的提交数，结果和 `git rev-list --left-right --count` 一致
+
+    按提交时间从新到旧遍历，并把标记传递给父提交，提交时间相同时后读取的提交可能修正已经统计过的提交。
+    队列中的提交都是共同祖先，并且都早于已经统计的独有提交时停止。
+    读取的提交超过数量限制、提交时间晚于子提交、提交不存在(如浅克隆)时无法保证结果准确，返回None
+
+    :param cat 仓库的常驻进程
+    :example cat get_cat_file("/tmp/git")
+
+    :param commit 本地提交
+    :example commit 4b825dc642cb6eb9a060e54bf8d69288fbee4904
+
+    :param other 比较的提交
+    :example other 4b825dc642cb6eb9a060e54bf8d69288fbee4904
+
+    :param limit 最多读取的提交数量
+    :example limit 2000
+
+    :param timeout 每次读取的超时时间
+    :example timeout 3
+
+    :return 超前的提交数, 落后的提交数，无法统计时返回None
+    """
+    graph = _CommitGraph(cat, timeout)
+    heap: list[tuple[int, str]] = []
+    single: list[tuple[int, str]] = []
+    if not _push_commit(graph, heap, commit, LEFT) or not _push_commit(graph, heap, other, RIGHT):
+        return None
+    while heap and not _walk_finished(graph, heap, single):
+        if len(graph.done) >= limit:
+            return None
+        _, sha = heapq.heappop(heap)
+        flag = graph.visit(sha)
+        parents, date = graph.commits[sha]
+        if flag != BOTH:
+            heapq.heappush(single, (date, sha))
+        for parent in parents:
+            if not _push_commit(graph, heap, parent, flag) or graph.commits[parent][1] > date:
+                return None
+    return graph.counts[LEFT], graph.counts[RIGHT]
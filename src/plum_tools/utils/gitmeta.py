@@ -0,0 +1,644 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: gitmeta
+#         Desc: 直接读取 .git 目录下的元数据判断仓库状态，不需要执行git命令
+#               能确定仓库干净或者有改动时直接返回结果，无法确定时由调用方执行git命令
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 17:10
+#=============================================================================
+"""
+
+import json
+import os
+import stat
+import struct
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+from ..conf import GITMETA_MAX_ENTRIES
+
+STATE_CLEAN = "clean"  # 确定没有改动
+STATE_DIRTY = "dirty"  # 确定有改动
+STATE_UNKNOWN = "unknown"  # 无法确定，需要执行git命令
+
+SNAPSHOT_DIR = "plum_tools"  # 在 .git 目录下保存数据的目录
+SNAPSHOT_NAME = "worktree.json"  # 仓库干净时工作区的快照
+# 最近这段时间内修改过的目录，mtime可能在同一个时间片内再次变化，不能信任，单位纳秒
+RACY_INTERVAL_NS = 2 * 10**9
+
+_INDEX_ENTRY = struct.Struct(">10I20sH")
+_MASK32 = 0xFFFFFFFF
+_GITLINK = 0o160000  # 子模块在索引中的文件类型
+_FLAG_ASSUME_VALID = 0x8000
+_FLAG_EXTENDED = 0x4000
+_FLAG_SKIP_WORKTREE = 0x4000
+_FLAG_INTENT_TO_ADD = 0x2000
+_UNSUPPORTED_EXTENSIONS = (b"link", b"sdir")  # 拆分索引、稀疏索引中的条目不完整
+
+
+@dataclass
+class IndexStat:
+    """索引中记录的文件信息，大小、inode只保存低32位"""
+
+    mtime_s: int
+    mtime_ns: int
+    ino: int
+    mode: int
+    size: int
+
+    def matches(self, st: os.stat_result) -> bool:
+        """和工作区中文件的信息是否一致
+
+        :param st 工作区中文件的 os.lstat 结果
+        """
+        if (st.st_mtime_ns // 10**9, st.st_mtime_ns % 10**9) != (self.mtime_s, self.mtime_ns):
+            return False
+        if (st.st_size & _MASK32, st.st_ino & _MASK32) != (self.size, self.ino):
+            return False
+        # 文件类型、可执行权限一致
+        same_type = stat.S_IFMT(st.st_mode) == stat.S_IFMT(self.mode)
+        return same_type and bool(st.st_mode & stat.S_IXUSR) == bool(self.mode & stat.S_IXUSR)
+
+
+@dataclass
+class IndexEntry:
+    """索引中的一个文件"""
+
+    path: str
+    file_stat: IndexStat
+    stage: int = 0  # 冲突时不为0
+    assume_valid: bool = False  # git update-index --assume-unchanged
+    skip_worktree: bool = False  # 稀疏检出、git update-index --skip-worktree
+    intent_to_add: bool = False  # git add -N
+
+
+@dataclass
+class QuickStatus:
+    """不执行git命令得到的仓库状态"""
+
+    state: str  # clean/dirty/unknown
+    branch: str | None = None  # 当前分支名
+    stash: int = 0  # 储藏数量
+
+
+def _read_text(path: str) -> str | None:
+    """读取文件内容，文件不存在时返回None"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _file_stat(path: str) -> list[int] | None:
+    """文件的 [mtime, 大小]，文件不存在时返回None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def parse_config(text: str) -> dict[str, list[str]]:
+    """解析git配置文件
+
+    只支持 `[section "subsection"]` 和 `key = value` 格式，不处理 include
+
+    :param text 配置文件内容
+    :example text [branch "master"]\\n\\tremote = origin
+
+    :return 配置 {"branch.master.remote": ["origin"]}, section和key不区分大小写，subsection区分大小写
+    """
+    config: dict[str, list[str]] = {}
+    section = ""
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line or line[0] in "#;":
+            continue
+        if line.startswith("["):
+            header = line[1 : line.find("]")]
+            name, _, subsection = header.partition(" ")
+            subsection = subsection.strip().strip('"')
+            section = f"{name.lower()}.{subsection}" if subsection else name.lower()
+            continue
+        key, _, value = line.partition("=")
+        value = value.strip()
+        if len(value) > 1 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        config.setdefault(f"{section}.{key.strip().lower()}", []).append(value)
+    return config
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """读取索引v4中路径前缀压缩的长度"""
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+
+def _parse_index_entry(data: bytes, pos: int, version: int, previous: bytes) -> tuple[IndexEntry, int, bytes]:
+    """解析索引中的一个条目
+
+    :param data 索引文件内容
+    :param pos 条目开始的位置
+    :param version 索引版本
+    :param previous 上一个条目的路径，v4中路径和上一个条目共享前缀
+
+    :return 条目, 下一个条目开始的位置, 条目的路径
+    """
+    start = pos
+    _, _, mtime_s, mtime_ns, _, ino, mode, _, _, size, _, flags = _INDEX_ENTRY.unpack_from(data, pos)
+    pos += _INDEX_ENTRY.size
+    extended = 0
+    if version >= 3 and flags & _FLAG_EXTENDED:
+        (extended,) = struct.unpack_from(">H", data, pos)
+        pos += 2
+    if version == 4:
+        strip, pos = _read_varint(data, pos)
+        end = data.index(b"\0", pos)
+        name = previous[: len(previous) - strip] + data[pos:end]
+        pos = end + 1
+    else:
+        end = data.index(b"\0", pos)
+        name = data[pos:end]
+        # 条目长度补齐到8的倍数，至少有一个\0
+        pos = start + ((end - start) // 8 + 1) * 8
+    return (
+        IndexEntry(
+            name.decode("utf-8", "surrogateescape"),
+            IndexStat(mtime_s, mtime_ns, ino, mode, size),
+            (flags >> 12) & 0x3,
+            bool(flags & _FLAG_ASSUME_VALID),
+            bool(extended & _FLAG_SKIP_WORKTREE),
+            bool(extended & _FLAG_INTENT_TO_ADD),
+        ),
+        pos,
+        name,
+    )
+
+
+def parse_index(data: bytes) -> list[IndexEntry] | None:
+    """解析 .git/index 文件，支持v2、v3、v4格式
+
+    :param data 索引文件内容
+
+    :return 索引中的文件，格式不支持时返回None
+    """
+    if len(data) < 12 or data[:4] != b"DIRC":
+        return None
+    version, count = struct.unpack(">II", data[4:12])
+    if version not in (2, 3, 4):
+        return None
+    entries = []
+    pos = 12
+    previous = b""
+    for _ in range(count):
+        entry, pos, previous = _parse_index_entry(data, pos, version, previous)
+        entries.append(entry)
+    # 扩展数据，最后20个字节是校验和
+    while pos + 8 <= len(data) - 20:
+        signature, length = struct.unpack_from(">4sI", data, pos)
+        if signature in _UNSUPPORTED_EXTENSIONS:
+            return None
+        pos += 8 + length
+    return entries
+
+
+class GitMeta:
+    """读取仓库 .git 目录下的元数据"""
+
+    def __init__(self, worktree: str, git_dir: str, common_dir: str) -> None:
+        """初始化
+
+        :param worktree 工作区目录
+        :example worktree /tmp/git
+
+        :param git_dir 工作区对应的git目录，保存HEAD、index
+        :example git_dir /tmp/git/.git
+
+        :param common_dir 多个工作区共享的git目录，保存refs、config
+        :example common_dir /tmp/git/.git
+        """
+        self.worktree = worktree
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self._packed_refs: dict[str, str] | None = None
+        self._config: dict[str, list[str]] | None = None
+
+    @classmethod
+    def open(cls, worktree: str) -> "GitMeta | None":
+        """打开仓库，`.git` 为文件时(工作树、子模块)读取其中记录的git目录
+
+        :param worktree 工作区目录
+        :example worktree /tmp/git
+
+        :return 不是git仓库时返回None
+        """
+        git_dir = os.path.join(worktree, ".git")
+        if not os.path.isdir(git_dir):
+            text = _read_text(git_dir)
+            if not text or not text.startswith("gitdir:"):
+                return None
+            git_dir = os.path.normpath(os.path.join(worktree, text[len("gitdir:") :].strip()))
+        common_dir = git_dir
+        text = _read_text(os.path.join(git_dir, "commondir"))
+        if text:
+            common_dir = os.path.normpath(os.path.join(git_dir, text.strip()))
+        return cls(worktree, git_dir, common_dir)
+
+    @classmethod
+    def discover(cls, path: str) -> "GitMeta | None":
+        """从目录开始逐级向上查找所在的仓库，和git查找仓库的方式一致
+
+        :param path 仓库中的任意目录
+        :example path /tmp/git/src
+
+        :return 不在git仓库中时返回None
+        """
+        path = os.path.abspath(path)
+        while True:
+            if os.path.lexists(os.path.join(path, ".git")):
+                return cls.open(path)
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    @classmethod
+    def open_bare(cls, path: str) -> "GitMeta | None":
+        """打开裸仓库，如 `git clone --mirror` 创建的镜像
+
+        :param path 裸仓库目录
+        :example path /data/mirrors/git.git
+
+        :return 不是裸仓库时返回None
+        """
+        if not os.path.isfile(os.path.join(path, "HEAD")) or not os.path.isdir(os.path.join(path, "objects")):
+            return None
+        return cls(path, path, path)
+
+    @property
+    def config(self) -> dict[str, list[str]]:
+        if self._config is None:
+            self._config = parse_config(_read_text(os.path.join(self.common_dir, "config")) or "")
+        return self._config
+
+    @property
+    def packed_refs(self) -> dict[str, str]:
+        if self._packed_refs is None:
+            self._packed_refs = {}
+            for line in (_read_text(os.path.join(self.common_dir, "packed-refs")) or "").splitlines():
+                if not line or line[0] in "#^":
+                    continue
+                sha, _, ref = line.partition(" ")
+                self._packed_refs[ref.strip()] = sha
+        return self._packed_refs
+
+    def resolve_ref(self, ref: str, depth: int = 5) -> str | None:
+        """查询引用对应的提交
+
+        :param ref 引用名
+        :example ref refs/heads/master
+
+        :param depth 符号引用最多解析的层数
+
+        :return 提交的sha，引用不存在时返回None
+        """
+        # HEAD 等每个工作区独立的引用在工作区的git目录下，其他引用在共享的git目录下
+        base = self.git_dir if "/" not in ref else self.common_dir
+        text = _read_text(os.path.join(base, ref))
+        if text is None:
+            return self.packed_refs.get(ref)
+        text = text.strip()
+        if text.startswith("ref:"):
+            if depth <= 0:
+                return None
+            return self.resolve_ref(text[len("ref:") :].strip(), depth - 1)
+        return text or None
+
+    def list_refs(self, prefix: str = "refs/heads/") -> dict[str, str]:
+        """批量读取引用，松散引用覆盖 packed-refs 中的同名引用
+
+        :param prefix 引用前缀
+        :example prefix refs/heads/
+
+        :return 引用名和提交的sha {"refs/heads/master": "4b825dc..."}，不包含符号引用
+        """
+        refs = {ref: sha for ref, sha in self.packed_refs.items() if ref.startswith(prefix)}
+        for root, _, files in os.walk(os.path.join(self.common_dir, prefix)):
+            for name in files:
+                # git 更新引用时先写锁文件
+                if name.endswith(".lock"):
+                    continue
+                path = os.path.join(root, name)
+                sha = (_read_text(path) or "").strip()
+                if not sha or sha.startswith("ref:"):
+                    continue
+                refs[os.path.relpath(path, self.common_dir).replace(os.sep, "/")] = sha
+        return refs
+
+    def read_head(self) -> tuple[str | None, str | None]:
+        """查询当前分支和提交
+
+        :return 分支名(分离头指针时为None), 提交的sha(没有提交时为None)
+        """
+        text = (_read_text(os.path.join(self.git_dir, "HEAD")) or "").strip()
+        if not text.startswith("ref:"):
+            return None, text or None
+        ref = text[len("ref:") :].strip()
+        branch = ref[len("refs/heads/") :] if ref.startswith("refs/heads/") else None
+        return branch, self.resolve_ref(ref)
+
+    def get_upstream(self, branch: str) -> str | None:
+        """查询分支的上游分支对应的本地引用
+
+        :param branch 分支名
+        :example branch master
+
+        :return 上游分支的引用 refs/remotes/origin/master，没有设置上游分支时返回None
+        """
+        remote = self.config.get(f"branch.{branch}.remote", [None])[-1]
+        merge = self.config.get(f"branch.{branch}.merge", [None])[-1]
+        if not remote or not merge:
+            return None
+        if remote == ".":
+            return merge
+        # 根据远程仓库的fetch规则把远程分支映射为本地的远程跟踪分支
+        for refspec in self.config.get(f"remote.{remote}.fetch", []):
+            src, _, dst = refspec.lstrip("+").partition(":")
+            if "*" in src and "*" in dst:
+                prefix, suffix = src.split("*", 1)
+                if merge.startswith(prefix) and merge.endswith(suffix):
+                    matched = merge[len(prefix) : len(merge) - len(suffix)]
+                    return dst.replace("*", matched, 1)
+            elif src == merge and dst:
+                return dst
+        return None
+
+    def list_worktrees(self) -> dict[str, str]:
+        """读取仓库的所有工作区和检出的分支，不执行 `git worktree list`
+
+        :return 分支名和工作区路径 {"master": "/tmp/git", "feature": "/tmp/feature"}，不包含分离头指针和已经删除的工作区
+        """
+        git_dirs = []
+        if os.path.basename(self.common_dir) == ".git":
+            git_dirs.append((os.path.dirname(self.common_dir), self.common_dir))
+        base = os.path.join(self.common_dir, "worktrees")
+        try:
+            names = sorted(os.listdir(base))
+        except OSError:
+            names = []
+        for name in names:
+            text = _read_text(os.path.join(base, name, "gitdir"))
+            # 工作区目录被删除后记录还在，直到执行 `git worktree prune`
+            if text and os.path.exists(text.strip()):
+                git_dirs.append((os.path.dirname(text.strip()), os.path.join(base, name)))
+        worktrees = {}
+        for worktree, git_dir in git_dirs:
+            head = (_read_text(os.path.join(git_dir, "HEAD")) or "").strip()
+            if head.startswith("ref: refs/heads/"):
+                worktrees[head[len("ref: refs/heads/") :]] = worktree
+        return worktrees
+
+    def read_reflog(self, ref: str) -> list[tuple[str, str]] | None:
+        """读取引用日志
+
+        :param ref 引用名
+        :example ref refs/stash
+
+        :return 从新到旧的 (提交的sha, 日志说明)，第n项对应 `ref@{n}`，日志和引用不一致时返回None
+        """
+        commit = self.resolve_ref(ref)
+        if commit is None:
+            return []
+        text = _read_text(os.path.join(self.common_dir, "logs", ref))
+        if text is None:
+            return None
+        entries = []
+        for line in text.splitlines():
+            info, _, message = line.partition("\t")
+            parts = info.split(" ", 2)
+            if len(parts) < 3:
+                return None
+            entries.append((parts[1], message))
+        entries.reverse()
+        # 引用日志被截断或者正在被修改
+        if not entries or entries[0][0] != commit:
+            return None
+        return entries
+
+    def stash_count(self) -> int:
+        """储藏数量，`refs/stash` 的引用日志中每一行对应一个储藏"""
+        if self.resolve_ref("refs/stash") is None:
+            return 0
+        text = _read_text(os.path.join(self.common_dir, "logs", "refs", "stash")) or ""
+        return max(len(text.splitlines()), 1)
+
+    def read_index(self) -> list[IndexEntry] | None:
+        """读取索引，不存在或格式不支持时返回None"""
+        try:
+            with open(os.path.join(self.git_dir, "index"), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            return parse_index(data)
+        except (struct.error, ValueError, IndexError):
+            return None
+
+    def exclude_files(self) -> Iterator[str]:
+        """影响未跟踪文件判断的忽略规则文件，不包括工作区中的 .gitignore"""
+        yield os.path.join(self.common_dir, "info", "exclude")
+        home = os.path.expanduser("~")
+        global_config = parse_config(_read_text(os.path.join(home, ".gitconfig")) or "")
+        for path in self.config.get("core.excludesfile", global_config.get("core.excludesfile", [])):
+            yield os.path.expanduser(path)
+        config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(home, ".config")
+        yield os.path.join(config_home, "git", "ignore")
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.git_dir, SNAPSHOT_DIR, SNAPSHOT_NAME)
+
+
+def _check_entries(meta: GitMeta, entries: list[IndexEntry], index_mtime_ns: int) -> str:
+    """比较索引中记录的文件信息和工作区中的文件
+
+    :return
+        dirty: 有冲突、新增或者已跟踪的文件被删除
+        unknown: 文件信息不一致，但内容可能相同
+        clean: 所有文件信息都一致
+    """
+    index_mtime = (index_mtime_ns // 10**9, index_mtime_ns % 10**9)
+    result = STATE_CLEAN
+    for entry in entries:
+        if entry.stage or entry.intent_to_add:
+            return STATE_DIRTY
+        if stat.S_IFMT(entry.file_stat.mode) == _GITLINK:
+            # 子模块中的改动也会显示在git status中，交给git命令判断
+            return STATE_UNKNOWN
+        if entry.assume_valid or entry.skip_worktree:
+            continue
+        try:
+            st = os.lstat(os.path.join(meta.worktree, entry.path))
+        except (FileNotFoundError, NotADirectoryError):
+            return STATE_DIRTY
+        except OSError:
+            result = STATE_UNKNOWN
+            continue
+        if result != STATE_CLEAN:
+            continue
+        if not entry.file_stat.matches(st):
+            result = STATE_UNKNOWN
+        elif (entry.file_stat.mtime_s, entry.file_stat.mtime_ns) >= index_mtime:
+            # 文件在写索引的同一时间片内修改过，无法通过mtime判断内容是否改变
+            result = STATE_UNKNOWN
+    return result
+
+
+def _load_snapshot(meta: GitMeta) -> dict | None:
+    """读取仓库干净时保存的快照"""
+    text = _read_text(meta.snapshot_path)
+    if not text:
+        return None
+    try:
+        snapshot = json.loads(text)
+    except ValueError:
+        return None
+    return snapshot if isinstance(snapshot, dict) else None
+
+
+def _check_snapshot(meta: GitMeta, snapshot: dict, head: str) -> bool:
+    """检查仓库保存快照之后是否可能有变化
+
+    提交、索引没有变化说明没有暂存的改动；
+    工作区中所有目录的mtime没有变化说明没有新增文件，也就不会有新的未跟踪文件
+    """
+    if snapshot.get("commit") != head:
+        return False
+    if snapshot.get("index") != _file_stat(os.path.join(meta.git_dir, "index")):
+        return False
+    excludes = snapshot.get("excludes") or {}
+    # 忽略规则文件有增减或者内容有变化
+    if set(excludes) != set(meta.exclude_files()) or any(_file_stat(path) != value for path, value in excludes.items()):
+        return False
+    for path, mtime in (snapshot.get("dirs") or {}).items():
+        try:
+            if os.stat(os.path.join(meta.worktree, path)).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def quick_status(worktree: str, max_entries: int = GITMETA_MAX_ENTRIES) -> QuickStatus:
+    """不执行git命令判断仓库是否有改动
+
+    :param worktree 仓库路径
+    :example worktree /tmp/git
+
+    :param max_entries 索引中文件数量超过此值时不判断，逐个比较文件信息比执行git命令更慢
+    :example max_entries 5000
+
+    :return 仓库状态，`state` 为unknown时需要执行git命令确认
+    """
+    meta = GitMeta.open(worktree)
+    if meta is None:
+        return QuickStatus(STATE_UNKNOWN)
+    branch, head = meta.read_head()
+    result = QuickStatus(STATE_UNKNOWN, branch, meta.stash_count())
+    if head is None:
+        return result
+    if branch is not None:
+        upstream = meta.get_upstream(branch)
+        upstream_head = meta.resolve_ref(upstream) if upstream else None
+        # 上游分支已经被删除时，git 不会提示超前、落后
+        if upstream_head is not None and upstream_head != head:
+            result.state = STATE_DIRTY
+            return result
+    index_stat = _file_stat(os.path.join(meta.git_dir, "index"))
+    entries = meta.read_index()
+    if index_stat is None or entries is None or len(entries) > max_entries:
+        return result
+    result.state = _check_entries(meta, entries, index_stat[0])
+    if result.state != STATE_CLEAN:
+        return result
+    snapshot = _load_snapshot(meta)
+    if snapshot is None or not _check_snapshot(meta, snapshot, head):
+        result.state = STATE_UNKNOWN
+    return result
+
+
+def _iter_worktree_dirs(worktree: str, skip: set[str]) -> Iterator[tuple[str, int]]:
+    """遍历工作区中git会检查未跟踪文件的目录
+
+    :param worktree 工作区目录
+    :param skip 不需要遍历的目录，相对工作区的路径
+
+    :return 目录相对工作区的路径, mtime
+    """
+    stack = [""]
+    while stack:
+        relpath = stack.pop()
+        path = os.path.join(worktree, relpath) if relpath else worktree
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as entries:
+                names = [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            continue
+        yield relpath, mtime
+        for name in names:
+            child = f"{relpath}/{name}" if relpath else name
+            if name != ".git" and child not in skip:
+                stack.append(child)
+
+
+def record_clean(worktree: str, ignored: Iterable[str]) -> bool:
+    """git命令确认仓库干净后保存工作区快照，之后 `quick_status` 可以不执行git命令判断仓库是否干净
+
+    :param worktree 仓库路径
+    :example worktree /tmp/git
+
+    :param ignored `git status --ignored=matching` 输出的被忽略的文件和目录
+    :example ignored ["node_modules/", "a.pyc"]
+
+    :return 是否保存了快照
+    """
+    meta = GitMeta.open(worktree)
+    if meta is None:
+        return False
+    _, head = meta.read_head()
+    index = _file_stat(os.path.join(meta.git_dir, "index"))
+    if head is None or index is None:
+        return False
+    skip = {path.rstrip("/") for path in ignored if path.endswith("/")}
+    now = time.time_ns()
+    dirs = {}
+    for relpath, mtime in _iter_worktree_dirs(worktree, skip):
+        # 刚修改过的目录不能信任，记录为0下次一定会执行git命令
+        dirs[relpath] = mtime if now - mtime >= RACY_INTERVAL_NS else 0
+    snapshot = {
+        "commit": head,
+        "index": index,
+        "excludes": {path: _file_stat(path) for path in meta.exclude_files()},
+        "dirs": dirs,
+    }
+    try:
+        os.makedirs(os.path.dirname(meta.snapshot_path), exist_ok=True)
+        temp_path = f"{meta.snapshot_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(temp_path, meta.snapshot_path)
+    except OSError:
+        return False
+    return True
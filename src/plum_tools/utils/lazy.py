@@ -0,0 +1,64 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: lazy
+#         Desc: 延迟导入耗时较长的依赖，第一次访问模块属性时才导入，
+#               --help、--version 等不需要这些依赖的命令可以更快启动
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-18 01:10
+#=============================================================================
+"""
+
+import importlib
+import sys
+import threading
+from types import ModuleType
+from typing import Any
+
+
+class LazyModule(ModuleType):
+    """第一次访问属性时才导入的模块"""
+
+    def __init__(self, name: str) -> None:
+        """初始化
+
+        :param name 模块名
+        :example name paramiko
+        """
+        super().__init__(name)
+        self._lock = threading.Lock()
+        self._module: ModuleType | None = None
+
+    def _load(self) -> ModuleType:
+        """导入模块，依赖没有安装时抛出 ModuleNotFoundError"""
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self.__name__)
+            return self._module
+
+    def __getattr__(self, name: str) -> Any:
+        # 只有实例中没有的属性才会调用，mock.patch 设置的属性优先使用
+        return getattr(self._load(), name)
+
+    def __dir__(self) -> list[str]:
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name: str) -> ModuleType:
+    """延迟导入模块
+
+    :param name 模块名
+    :example name concurrent.futures
+
+    :return 模块已经导入时直接返回模块，否则返回第一次访问属性时才导入的模块
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
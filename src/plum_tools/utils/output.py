@@ -0,0 +1,144 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: output
+#         Desc: 机器可读的结构化输出，每条记录写完立即刷新，不在内存中缓存
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 14:10
+#=============================================================================
+"""
+
+import abc
+import csv
+import json
+import sys
+from collections.abc import Sequence
+from typing import Any, TextIO
+
+STRUCTURED_FORMATS = ("json", "ndjson", "csv")
+
+
+class RecordWriter(abc.ABC):
+    """逐条输出记录"""
+
+    def __init__(self, fields: Sequence[str], stream: TextIO | None = None) -> None:
+        """初始化
+
+        :param fields 记录的字段，决定输出字段的顺序
+        :example fields ["ip", "state"]
+
+        :param stream 输出流，默认为标准输出
+        :example stream sys.stdout
+        """
+        self._fields = list(fields)
+        self._stream = stream or sys.stdout
+        self._count = 0
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Exception, exc_tb: Any) -> None:  # noqa
+        self.close()
+
+    def _select(self, record: dict) -> dict:
+        """按字段顺序取出记录中的值"""
+        return {field: record.get(field) for field in self._fields}
+
+    @abc.abstractmethod
+    def _write(self, record: dict) -> None:
+        """输出一条已经按字段顺序取出值的记录"""
+
+    def write(self, record: dict) -> None:
+        """输出一条记录
+
+        :param record 记录
+        :example record {"ip": "10.10.100.1", "state": "up"}
+        """
+        self._write(self._select(record))
+        self._count += 1
+        self._stream.flush()
+
+    def close(self) -> None:  # noqa: B027
+        """结束输出，需要输出结尾的格式覆盖"""
+
+
+class NdjsonWriter(RecordWriter):
+    """每行一个json对象"""
+
+    def _write(self, record: dict) -> None:
+        self._stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class JsonWriter(RecordWriter):
+    """json数组，边探测边输出数组元素"""
+
+    def _write(self, record: dict) -> None:
+        prefix = ",\n" if self._count else "[\n"
+        self._stream.write(prefix + json.dumps(record, ensure_ascii=False))
+
+    def close(self) -> None:
+        self._stream.write("\n]\n" if self._count else "[]\n")
+        self._stream.flush()
+
+
+class CsvWriter(RecordWriter):
+    """csv格式，第一行为表头"""
+
+    def __init__(self, fields: Sequence[str], stream: TextIO | None = None) -> None:
+        super().__init__(fields, stream)
+        self._writer = csv.DictWriter(self._stream, fieldnames=self._fields, lineterminator="\n")
+        self._writer.writeheader()
+
+    def _write(self, record: dict) -> None:
+        self._writer.writerow(record)
+
+
+class TableWriter(RecordWriter):
+    """对齐的文本表格，第一行为表头
+
+    为了边检查边输出，除最后一列外每列使用固定宽度，超出宽度的值会把后面的列挤开，最后一列不需要对齐
+    """
+
+    min_width = 8  # 每列最小宽度
+
+    def __init__(self, fields: Sequence[str], stream: TextIO | None = None) -> None:
+        super().__init__(fields, stream)
+        self._widths = [max(len(field), self.min_width) for field in self._fields[:-1]]
+        self._write_row(self._fields)
+
+    def _write_row(self, values: Sequence[str]) -> None:
+        cells = [value.ljust(width) for value, width in zip(values[:-1], self._widths, strict=True)]
+        cells.append(values[-1])
+        self._stream.write("  ".join(cells).rstrip() + "\n")
+
+    def _write(self, record: dict) -> None:
+        self._write_row(["-" if value is None else str(value) for value in record.values()])
+
+
+def get_writer(fmt: str, fields: Sequence[str], stream: TextIO | None = None) -> RecordWriter:
+    """根据输出格式创建输出对象
+
+    :param fmt 输出格式 json/ndjson/csv/table
+    :example fmt ndjson
+
+    :param fields 记录的字段
+    :example fields ["ip", "state"]
+
+    :param stream 输出流，默认为标准输出
+    :example stream sys.stdout
+
+    :return 输出对象
+    """
+    writers: dict[str, type[RecordWriter]] = {
+        "json": JsonWriter,
+        "ndjson": NdjsonWriter,
+        "csv": CsvWriter,
+        "table": TableWriter,
+    }
+    try:
+        writer_class = writers[fmt]
+    except KeyError as e:
+        raise ValueError(f"不支持的输出格式: {fmt}") from e
+    return writer_class(fields, stream)
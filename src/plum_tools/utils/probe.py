@@ -0,0 +1,550 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: probe
+#         Desc: 基于asyncio的主机存活探测，单进程内并发探测大量ip
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 10:12
+#=============================================================================
+"""
+
+import abc
+import asyncio
+import itertools
+import math
+import resource
+import socket
+import struct
+import time
+from asyncio import FIRST_COMPLETED
+from collections import deque
+from collections.abc import AsyncGenerator, Iterable, Sequence
+from dataclasses import dataclass, field
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """按最近秩法计算百分位数
+
+    :param values 样本，需要已经排好序
+    :example values [0.1, 0.2, 0.3]
+
+    :param pct 百分位
+    :example pct 95
+
+    :return 百分位数
+    """
+    index = max(0, math.ceil(pct / 100 * len(values)) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+@dataclass
+class ProbeResult:
+    """单个ip的探测结果"""
+
+    ip: str
+    alive: bool
+    rtt: float | None = None  # 往返时间的平均值，单位秒
+    probe: str = ""  # 探测方式 icmp/tcp
+    rtts: list[float] = field(default_factory=list)  # 每次有应答的往返时间
+    sent: int = 0  # 发送的探测次数
+
+    @property
+    def rtt_min(self) -> float | None:
+        """最小往返时间"""
+        return min(self.rtts) if self.rtts else None
+
+    @property
+    def rtt_p95(self) -> float | None:
+        """往返时间的 p95"""
+        return percentile(sorted(self.rtts), 95) if self.rtts else None
+
+
+class TokenBucket:
+    """令牌桶限速，控制每秒发出的探测数量"""
+
+    def __init__(self, rate: float, burst: int = 0) -> None:
+        """初始化
+
+        :param rate 每秒产生的令牌数量，小于等于0表示不限速
+        :example rate 1000
+
+        :param burst 令牌桶容量，默认可以攒下 0.1 秒的令牌
+        :example burst 100
+        """
+        self._rate = rate
+        self._capacity = float(burst or max(1, math.ceil(rate / 10)))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        """获取一个令牌，没有令牌时等待"""
+        if self._rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class AdaptiveTimeout:
+    """根据已观测到的往返时间调整探测超时时间
+
+    样本足够后超时时间取 最近往返时间的p95 * factor，并限制在 [minimum, initial] 之间，
+    已经发出的探测也会按新的超时时间提前结束
+    """
+
+    min_samples = 10  # 开始调整超时需要的最少样本数量
+    window = 512  # 参与计算的最近样本数量
+    factor = 4  # p95 的倍数
+
+    def __init__(self, initial: float, minimum: float) -> None:
+        """初始化
+
+        :param initial 初始超时时间，也是超时时间的上限，单位秒
+        :example initial 3
+
+        :param minimum 超时时间的下限，大于等于 initial 时表示不调整超时时间
+        :example minimum 0.2
+        """
+        self._initial = initial
+        self._minimum = min(minimum, initial)
+        self._samples: deque[float] = deque(maxlen=self.window)
+        self._current = initial
+        self._pending = 0  # 上次计算后新增的样本数量
+
+    @property
+    def current(self) -> float:
+        """当前的超时时间"""
+        return self._current
+
+    def observe(self, rtt: float) -> None:
+        """记录一次往返时间
+
+        :param rtt 往返时间，单位秒
+        :example rtt 0.001
+        """
+        if self._minimum >= self._initial:
+            return
+        self._samples.append(rtt)
+        self._pending += 1
+        # 每新增一批样本才重新计算一次，避免每个应答都排序
+        if len(self._samples) < self.min_samples or self._pending < self.min_samples:
+            return
+        self._pending = 0
+        p95 = percentile(sorted(self._samples), 95)
+        self._current = min(self._initial, max(self._minimum, p95 * self.factor))
+
+    async def wait(self, futures: set[asyncio.Future], start: float) -> set[asyncio.Future]:
+        """等待任意一个future完成，超时后返回空集合
+
+        超时时间变短后，正在等待的探测最多再等 `minimum` 秒就会结束
+
+        :param futures 需要等待的future
+        :example futures {future}
+
+        :param start 探测开始的时间点
+        :example start 1.0
+
+        :return 已完成的future
+        """
+        while True:
+            remaining = start + self._current - time.perf_counter()
+            if remaining <= 0:
+                return set()
+            done, _ = await asyncio.wait(futures, timeout=min(remaining, self._minimum), return_when=FIRST_COMPLETED)
+            if done:
+                return done
+
+
+def checksum(data: bytes) -> int:
+    """计算ICMP报文校验和
+
+    :param data 报文内容
+    :example data b"\\x08\\x00\\x00\\x00"
+
+    :return 校验和
+    """
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(seq: int, payload: bytes = b"plum_tools") -> bytes:
+    """构造ICMP回显请求报文
+
+    identifier 字段在 datagram socket 下会被内核改写，这里填 0 即可
+
+    :param seq 报文序号
+    :example seq 1
+
+    :return ICMP报文
+    """
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, 0, seq)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum(header + payload), 0, seq) + payload
+
+
+def parse_echo_reply(data: bytes) -> int | None:
+    """解析ICMP回显应答，返回报文序号
+
+    Linux 下 datagram socket 收到的数据不带IP头，mac 下会带上IP头
+
+    :param data 收到的报文
+    :example data b"\\x00\\x00..."
+
+    :return 回显应答的序号，不是回显应答时返回 None
+    """
+    if data and data[0] >> 4 == 4 and len(data) >= 20:
+        data = data[(data[0] & 0x0F) * 4 :]
+    if len(data) < 8:
+        return None
+    icmp_type, _, _, _, seq = struct.unpack("!BBHHH", data[:8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return seq
+
+
+def icmp_available() -> bool:
+    """检查当前用户能否创建非特权的ICMP datagram socket
+
+    Linux 下由 net.ipv4.ping_group_range 控制
+
+    :return
+        True 可以使用ICMP探测
+        False 只能使用TCP探测
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    except OSError:
+        return False
+    sock.close()
+    return True
+
+
+class BaseProber(abc.ABC):
+    """探测器基类，负责限速、多次探测和超时控制"""
+
+    name = ""
+
+    def __init__(self, timeout: float, rate: float = 0, count: int = 1, min_timeout: float | None = None) -> None:
+        """初始化
+
+        :param timeout 单个探测的超时时间，单位秒
+        :example timeout 3
+
+        :param rate 每秒最多发出的探测数量，0表示不限速
+        :example rate 1000
+
+        :param count 每个ip的探测次数
+        :example count 3
+
+        :param min_timeout 自适应超时时间的下限，None表示不调整超时时间
+        :example min_timeout 0.2
+        """
+        self._timeout = AdaptiveTimeout(timeout, timeout if min_timeout is None else min_timeout)
+        self._limiter = TokenBucket(rate)
+        self._count = max(1, count)
+
+    def open(self) -> None:  # noqa: B027
+        """创建探测需要的资源，不需要资源的探测器不用覆盖"""
+
+    def close(self) -> None:  # noqa: B027
+        """释放探测需要的资源，不需要资源的探测器不用覆盖"""
+
+    @abc.abstractmethod
+    async def _probe_once(self, ip: str) -> float | None:
+        """探测一次，返回往返时间，超时或不可达时返回 None"""
+
+    async def probe(self, ip: str) -> ProbeResult:
+        """探测ip是否存活
+
+        :param ip 主机ip
+        :example ip 10.10.100.1
+
+        :return 探测结果
+        """
+        rtts = []
+        for _ in range(self._count):
+            await self._limiter.acquire()
+            rtt = await self._probe_once(ip)
+            if rtt is not None:
+                self._timeout.observe(rtt)
+                rtts.append(rtt)
+        if not rtts:
+            return ProbeResult(ip, False, probe=self.name, sent=self._count)
+        return ProbeResult(ip, True, sum(rtts) / len(rtts), self.name, rtts, self._count)
+
+
+class IcmpProber(BaseProber):
+    """通过一个共享的ICMP datagram socket 并发探测所有ip"""
+
+    name = "icmp"
+
+    def __init__(self, timeout: float, rate: float = 0, count: int = 1, min_timeout: float | None = None) -> None:
+        super().__init__(timeout, rate, count, min_timeout)
+        self._sock: socket.socket | None = None
+        self._seq = itertools.count()
+        self._waiters: dict[tuple[str, int], asyncio.Future] = {}
+
+    def open(self) -> None:
+        """创建socket并注册到事件循环"""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        self._sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+
+    def close(self) -> None:
+        """关闭socket"""
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+
+    def _on_readable(self) -> None:
+        """读取所有已到达的应答，唤醒对应的等待者"""
+        while self._sock is not None:
+            try:
+                data, address = self._sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # ICMP错误报文等，忽略后继续读取
+                continue
+            seq = parse_echo_reply(data)
+            if seq is None:
+                continue
+            waiter = self._waiters.get((address[0], seq))
+            if waiter is not None and not waiter.done():
+                waiter.set_result(time.perf_counter())
+
+    async def _send(self, packet: bytes, ip: str) -> None:
+        """发送报文，发送缓冲区满时稍后重试"""
+        while True:
+            try:
+                self._sock.sendto(packet, (ip, 0))  # type: ignore[union-attr]
+                return
+            except (BlockingIOError, InterruptedError):
+                await asyncio.sleep(0.001)
+
+    async def _probe_once(self, ip: str) -> float | None:
+        seq = next(self._seq) & 0xFFFF
+        key = (ip, seq)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[key] = waiter
+        start = time.perf_counter()
+        try:
+            await self._send(build_echo_request(seq), ip)
+            if not await self._timeout.wait({waiter}, start):
+                return None
+        except OSError:
+            return None
+        finally:
+            self._waiters.pop(key, None)
+            waiter.cancel()
+        return waiter.result() - start
+
+
+class TcpProber(BaseProber):
+    """通过TCP connect探测ip是否存活
+
+    端口能连接或者被主机拒绝连接（RST）都说明主机是存活的
+    """
+
+    name = "tcp"
+
+    # pylint: disable=too-many-positional-arguments,too-many-arguments
+    def __init__(
+        self,
+        timeout: float,
+        ports: Sequence[int],
+        rate: float = 0,
+        count: int = 1,
+        min_timeout: float | None = None,
+    ) -> None:
+        """初始化
+
+        :param ports 需要探测的端口
+        :example ports [22, 80, 443]
+        """
+        super().__init__(timeout, rate, count, min_timeout)
+        self._ports = tuple(ports)
+
+    @property
+    def ports(self) -> tuple[int, ...]:
+        """需要探测的端口"""
+        return self._ports
+
+    @staticmethod
+    async def _connect(ip: str, port: int) -> float:
+        """连接指定端口，返回应答时间点
+
+        :raise OSError 主机不可达
+        """
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, (ip, port))
+        except ConnectionRefusedError:
+            # 主机回复了RST
+            pass
+        finally:
+            sock.close()
+        return time.perf_counter()
+
+    async def _probe_once(self, ip: str) -> float | None:
+        """任意一个端口有应答即认为存活"""
+        start = time.perf_counter()
+        tasks: set[asyncio.Future] = {asyncio.ensure_future(self._connect(ip, port)) for port in self._ports}
+        try:
+            while tasks:
+                done = await self._timeout.wait(tasks, start)
+                if not done:
+                    return None
+                tasks -= done
+                for task in done:
+                    if task.exception() is None:
+                        return task.result() - start
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def limit_concurrency(concurrency: int, prober: BaseProber) -> int:
+    """根据进程可打开的文件描述符数量限制并发数量
+
+    ICMP探测共享一个socket，TCP探测每个端口占用一个socket
+
+    :param concurrency 期望的并发数量
+    :example concurrency 1024
+
+    :param prober 探测器
+    :example prober TcpProber(3, [22])
+
+    :return 实际使用的并发数量
+    """
+    if not isinstance(prober, TcpProber):
+        return concurrency
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit == resource.RLIM_INFINITY:
+        return concurrency
+    # 预留部分文件描述符给标准输入输出等
+    return max(1, min(concurrency, (soft_limit - 64) // max(1, len(prober.ports))))
+
+
+# pylint: disable=too-many-positional-arguments,too-many-arguments
+def create_prober(
+    mode: str,
+    timeout: float,
+    ports: Sequence[int],
+    rate: float = 0,
+    count: int = 1,
+    min_timeout: float | None = None,
+) -> BaseProber:
+    """根据探测方式创建探测器
+
+    :param mode 探测方式 auto/icmp/tcp, auto 表示优先使用icmp，不可用时使用tcp
+    :example mode auto
+
+    :param timeout 单个探测的超时时间，单位秒
+    :example timeout 3
+
+    :param ports tcp探测的端口
+    :example ports [22, 80, 443]
+
+    :param rate 每秒最多发出的探测数量，0表示不限速
+    :example rate 1000
+
+    :param count 每个ip的探测次数
+    :example count 3
+
+    :param min_timeout 自适应超时时间的下限，None表示不调整超时时间
+    :example min_timeout 0.2
+
+    :return 探测器
+    """
+    if mode == "icmp" or (mode == "auto" and icmp_available()):
+        return IcmpProber(timeout, rate, count, min_timeout)
+    return TcpProber(timeout, ports, rate, count, min_timeout)
+
+
+async def iter_sweep(
+    targets: Iterable[str],
+    prober: BaseProber,
+    concurrency: int,
+) -> AsyncGenerator[ProbeResult, None]:
+    """并发探测所有ip，按完成顺序返回结果
+
+    目标按需从迭代器中取出，同一时间最多只有 `concurrency` 个探测在进行
+
+    :param targets 需要探测的ip
+    :example targets ["10.10.100.1", "10.10.100.2"]
+
+    :param prober 探测器
+    :example prober TcpProber(3, [22])
+
+    :param concurrency 并发数量
+    :example concurrency 1024
+    """
+    iterator = iter(targets)
+    pending = {asyncio.ensure_future(prober.probe(ip)) for ip in itertools.islice(iterator, concurrency)}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                ip = next(iterator, None)
+                if ip is not None:
+                    pending.add(asyncio.ensure_future(prober.probe(ip)))
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        # 等待取消完成，避免调用方提前结束遍历后任务还在事件循环中
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def iter_sweep_ordered(
+    targets: Iterable[str],
+    prober: BaseProber,
+    concurrency: int,
+) -> AsyncGenerator[ProbeResult, None]:
+    """并发探测所有ip，按目标顺序返回结果
+
+    只有最早的探测完成后才会取出新的目标，缓存的结果不会超过 `concurrency` 个
+
+    :param targets 需要探测的ip
+    :example targets ["10.10.100.1", "10.10.100.2"]
+
+    :param prober 探测器
+    :example prober TcpProber(3, [22])
+
+    :param concurrency 并发数量
+    :example concurrency 1024
+    """
+    iterator = iter(targets)
+    pending = deque(asyncio.ensure_future(prober.probe(ip)) for ip in itertools.islice(iterator, concurrency))
+    try:
+        while pending:
+            result = await pending[0]
+            pending.popleft()
+            ip = next(iterator, None)
+            if ip is not None:
+                pending.append(asyncio.ensure_future(prober.probe(ip)))
+            yield result
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,254 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: reachability
+#         Desc: 主机存活状态的本地缓存，按网段记录每个ip最后一次在线/离线的时间
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 13:05
+#=============================================================================
+"""
+
+import os
+import sqlite3
+import time
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+from ..conf import PING_CACHE_TIMEOUT
+from .printer import print_warn
+
+STATE_UP = "up"
+STATE_DOWN = "down"
+
+_SCHEMA_VERSION = 2
+# 缓存的表结构变化时直接重建，previous 保存最后一次更新前的状态
+_SCHEMA = f"""
+DROP TABLE IF EXISTS hosts;
+CREATE TABLE hosts (
+    prefix TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    last_up REAL NOT NULL DEFAULT 0,
+    last_down REAL NOT NULL DEFAULT 0,
+    fails INTEGER NOT NULL DEFAULT 0,
+    next_check REAL NOT NULL DEFAULT 0,
+    previous TEXT,
+    PRIMARY KEY (prefix, ip)
+);
+PRAGMA user_version = {_SCHEMA_VERSION};
+"""
+# 更新时 SET 中的字段都是更新前的值，退避时间为 base * 2^(连续失败次数-1)
+_UPSERT = f"""
+INSERT INTO hosts (prefix, ip, last_up, last_down, fails, next_check)
+VALUES (:prefix, :ip, :last_up, :last_down, :fails, :next_check)
+ON CONFLICT (prefix, ip) DO UPDATE SET
+    previous = CASE WHEN last_up > last_down THEN '{STATE_UP}' ELSE '{STATE_DOWN}' END,
+    last_up = CASE WHEN :alive THEN :now ELSE last_up END,
+    last_down = CASE WHEN :alive THEN last_down ELSE :now END,
+    fails = CASE WHEN :alive THEN 0 ELSE fails + 1 END,
+    next_check = CASE WHEN :alive THEN 0 ELSE :now + MIN(:base * (1 << MIN(fails, 30)), :max) END
+RETURNING previous
+"""
+
+
+class ReachabilityCache:
+    """主机存活状态缓存
+
+    离线的主机按 base * 2^(连续失败次数-1) 退避，退避期间增量探测会跳过这些主机
+    """
+
+    commit_interval = 1000  # 每更新多少条记录提交一次，每轮探测结束时也会提交，避免长时间占用写锁
+
+    def __init__(self, path: str, backoff_base: float, backoff_max: float) -> None:
+        """初始化
+
+        :param path 缓存文件路径
+        :example path ~/.cache/plum_tools/pping.db
+
+        :param backoff_base 离线主机第一次退避的时间，单位秒
+        :example backoff_base 60
+
+        :param backoff_max 离线主机最长的退避时间，单位秒
+        :example backoff_max 3600
+        """
+        self._path = path
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._conn: sqlite3.Connection | None = None
+        self._uncommitted = 0
+        self.disabled = False  # 缓存不可用时不再读写缓存
+
+    def __enter__(self) -> "ReachabilityCache":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Exception, exc_tb: Any) -> None:  # noqa
+        self.close()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            raise RuntimeError("缓存未打开")
+        return self._conn
+
+    def open(self) -> bool:
+        """打开缓存文件，不存在时创建
+
+        :return 是否打开成功，数据库被其他进程锁定等情况下返回False，此时不使用缓存
+        """
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            self._conn = sqlite3.connect(self._path, timeout=PING_CACHE_TIMEOUT)
+            # WAL 模式下读写互不阻塞，多个 pping 可以同时使用缓存
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                self._conn.executescript(_SCHEMA)
+        except sqlite3.DatabaseError as e:
+            self.disable(e)
+            return False
+        return True
+
+    def disable(self, error: Exception) -> None:
+        """不再使用缓存，丢弃未提交的记录
+
+        :param error 缓存不可用的原因
+        :example error sqlite3.OperationalError("database is locked")
+        """
+        print_warn(f"主机存活状态缓存 {self._path} 不可用: {error}, 不使用缓存")
+        self.disabled = True
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def commit(self) -> None:
+        """提交未保存的记录"""
+        if self._conn is None:
+            return
+        try:
+            self._conn.commit()
+        except sqlite3.DatabaseError as e:
+            self.disable(e)
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        """提交未保存的记录并关闭缓存文件"""
+        self.commit()
+        if self._conn is None:
+            return
+        self._conn.close()
+        self._conn = None
+
+    def get_state(self, prefix: str, ip: str) -> str | None:
+        """查询ip最后一次的状态
+
+        :param prefix 网段
+        :example prefix 10.10.100
+
+        :param ip 主机ip
+        :example ip 10.10.100.1
+
+        :return up/down, 没有记录时返回 None
+        """
+        row = self.conn.execute(
+            "SELECT last_up, last_down FROM hosts WHERE prefix = ? AND ip = ?",
+            (prefix, ip),
+        ).fetchone()
+        if row is None:
+            return None
+        return STATE_UP if row[0] > row[1] else STATE_DOWN
+
+    def update(self, prefix: str, ip: str, alive: bool, now: float | None = None) -> str | None:
+        """记录一次探测结果
+
+        :param prefix 网段
+        :example prefix 10.10.100
+
+        :param ip 主机ip
+        :example ip 10.10.100.1
+
+        :param alive 主机是否存活
+        :example alive True
+
+        :param now 探测时间
+        :example now 1700000000.0
+
+        :return 更新前的状态 up/down, 没有记录或者缓存不可用时返回 None
+        """
+        if self.disabled:
+            return None
+        now = time.time() if now is None else now
+        params = {
+            "prefix": prefix,
+            "ip": ip,
+            "alive": alive,
+            "now": now,
+            "base": self._backoff_base,
+            "max": self._backoff_max,
+            "last_up": now if alive else 0,
+            "last_down": 0 if alive else now,
+            "fails": 0 if alive else 1,
+            "next_check": 0 if alive else now + min(self._backoff_base, self._backoff_max),
+        }
+        try:
+            (previous,) = self.conn.execute(_UPSERT, params).fetchone()
+        except sqlite3.DatabaseError as e:
+            self.disable(e)
+            return None
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_interval:
+            self.commit()
+        return previous
+
+    def iter_up(self, prefix: str) -> Iterator[str]:
+        """按最后在线时间倒序返回网段内在线的主机
+
+        :param prefix 网段
+        :example prefix 10.10.100
+        """
+        cursor = self.conn.execute(
+            "SELECT ip FROM hosts WHERE prefix = ? AND last_up > last_down ORDER BY last_up DESC",
+            (prefix,),
+        )
+        for (ip,) in cursor:
+            yield ip
+
+    def get_backoff(self, prefix: str, now: float | None = None) -> set[str]:
+        """查询网段内还在退避期的离线主机
+
+        :param prefix 网段
+        :example prefix 10.10.100
+
+        :param now 当前时间
+        :example now 1700000000.0
+
+        :return 不需要探测的ip
+        """
+        now = time.time() if now is None else now
+        cursor = self.conn.execute(
+            "SELECT ip FROM hosts WHERE prefix = ? AND last_down >= last_up AND next_check > ?",
+            (prefix, now),
+        )
+        return {ip for (ip,) in cursor}
+
+    def plan(self, prefix: str, targets: Iterable[str], now: float | None = None) -> Iterator[str]:
+        """增量探测的顺序：先探测最近在线的主机，再探测其余不在退避期的主机
+
+        :param prefix 网段
+        :example prefix 10.10.100
+
+        :param targets 网段内所有的ip
+        :example targets ["10.10.100.1"]
+
+        :param now 当前时间
+        :example now 1700000000.0
+        """
+        up = list(self.iter_up(prefix))
+        yield from up
+        skip = self.get_backoff(prefix, now)
+        skip.update(up)
+        for ip in targets:
+            if ip not in skip:
+                yield ip
@@ -0,0 +1,133 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: repoindex
+#         Desc: git仓库查找结果的本地索引，记录遍历过的目录mtime，目录没有变化时不再读取目录项
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 16:05
+#=============================================================================
+"""
+
+import json
+import os
+import time
+from collections.abc import Iterable
+from typing import Any
+
+from ..conf import GITREPO_IGNORE
+from .printer import print_warn
+from .scanner import list_directory
+
+INDEX_VERSION = 1
+# 最近这段时间内修改过的目录，mtime可能在同一个时间片内再次变化，不能信任，单位纳秒
+RACY_INTERVAL_NS = 2 * 10**9
+
+
+class RepositoryIndex:
+    """git仓库索引
+
+    每个遍历过的目录记录 [mtime, 是否为仓库, 子目录名]。
+    目录下增加、删除、重命名文件或子目录都会改变目录的mtime，
+    所以mtime不变时可以直接使用上次的结果，只有mtime变化的目录才重新读取目录项
+    """
+
+    def __init__(self, path: str, ignore: Iterable[str] = GITREPO_IGNORE, rebuild: bool = False) -> None:
+        """初始化
+
+        :param path 索引文件路径
+        :example path ~/.cache/plum_tools/gitrepo_index.json
+
+        :param ignore 不需要遍历的目录名，和上次不一致时索引失效
+        :example ignore (".git", "node_modules")
+
+        :param rebuild 是否忽略已有的索引，重新遍历所有目录
+        :example rebuild False
+        """
+        self._path = path
+        self._ignore = sorted(set(ignore))
+        self._rebuild = rebuild
+        self._dirs: dict[str, list] = {}
+        self._visited: dict[str, list] = {}
+        self.hits = 0  # 直接使用索引的目录数量
+        self.misses = 0  # 重新读取目录项的目录数量
+
+    def __enter__(self) -> "RepositoryIndex":
+        self.load()
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Exception, exc_tb: Any) -> None:  # noqa
+        if exc_type is None:
+            self.save()
+
+    def load(self) -> None:
+        """读取索引文件，文件不存在、格式错误或忽略的目录不一致时使用空索引"""
+        self._dirs = {}
+        if self._rebuild:
+            return
+        try:
+            with open(self._path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION or data.get("ignore") != self._ignore:
+            return
+        self._dirs = data.get("dirs") or {}
+
+    def save(self) -> None:
+        """保存索引文件
+
+        本次遍历过的目录使用新的结果，本次没有遍历到的目录(其他查找路径下的目录)保留原来的结果，
+        本次查找路径下没有遍历到的目录说明已经被删除，不再保留。
+        索引只是缓存，写入失败(如缓存目录只读、磁盘已满)时只提示，不影响检查结果
+        """
+        roots = [path for path, entry in self._visited.items() if entry[3]]
+        dirs = {
+            path: entry
+            for path, entry in self._dirs.items()
+            if not any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+        }
+        dirs.update((path, entry[:3]) for path, entry in self._visited.items())
+        directory = os.path.dirname(self._path)
+        temp_path = f"{self._path}.{os.getpid()}.tmp"
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "ignore": self._ignore, "dirs": dirs}, f, separators=(",", ":"))
+            os.replace(temp_path, self._path)
+        except OSError as e:
+            print_warn(f"保存仓库索引 {self._path} 失败: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def list_directory(self, path: str, root: bool = False) -> tuple[bool, list[str]]:
+        """列出目录下需要继续遍历的子目录，目录mtime没有变化时直接使用索引中的结果
+
+        :param path 目录路径
+        :example path /tmp
+
+        :param root 是否为查找路径
+        :example root False
+
+        :return 目录是否为git仓库, 子目录名
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False, []
+        entry = self._dirs.get(path)
+        if entry is not None and entry[0] == mtime:
+            self.hits += 1
+            is_repo, subdirs = entry[1], entry[2]
+        else:
+            self.misses += 1
+            is_repo, subdirs = list_directory(path, self._ignore)
+        if time.time_ns() - mtime < RACY_INTERVAL_NS:
+            # 记录为0，下次一定会重新读取
+            mtime = 0
+        self._visited[path] = [mtime, is_repo, subdirs, root]
+        return is_repo, subdirs
@@ -0,0 +1,143 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: scanner
+#         Desc: 并行查找目录下的git仓库，找到仓库根目录或遇到忽略的目录时不再向下遍历
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 15:20
+#=============================================================================
+"""
+
+import os
+import queue
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from ..conf import GITREPO_IGNORE, GITREPO_SCAN_BATCH, GITREPO_SCAN_WORKERS
+
+if TYPE_CHECKING:
+    from .repoindex import RepositoryIndex
+
+GIT_DIR_NAME = ".git"
+
+
+def list_directory(path: str, ignore: Iterable[str] = GITREPO_IGNORE) -> tuple[bool, list[str]]:
+    """列出目录下需要继续遍历的子目录
+
+    只读取一次目录项，通过目录项自带的类型判断是否为目录，不对每个子目录调用stat
+
+    :param path 目录路径
+    :example path /tmp
+
+    :param ignore 不需要遍历的目录名
+    :example ignore (".git", "node_modules")
+
+    :return is_repo 目录是否为git仓库，`.git` 为文件时(工作树、子模块)也认为是仓库
+    :return subdirs 子目录名，不包含符号链接和忽略的目录
+    """
+    is_repo = False
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name == GIT_DIR_NAME:
+                    is_repo = True
+                    continue
+                if entry.name in ignore:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        # 没有权限或遍历过程中目录被删除
+        return False, []
+    return is_repo, subdirs
+
+
+class RepositoryScanner:
+    """用线程池并行遍历目录，查找git仓库"""
+
+    def __init__(
+        self,
+        ignore: Iterable[str] = GITREPO_IGNORE,
+        nested: bool = False,
+        workers: int = GITREPO_SCAN_WORKERS,
+        index: "RepositoryIndex | None" = None,
+    ) -> None:
+        """初始化
+
+        :param ignore 不需要遍历的目录名
+        :example ignore (".git", "node_modules")
+
+        :param nested 是否继续查找仓库内嵌套的仓库
+        :example nested False
+
+        :param workers 遍历目录的线程数量
+        :example workers 16
+
+        :param index 仓库索引，目录没有变化时直接使用索引中的结果，None表示不使用索引
+        :example index RepositoryIndex("~/.cache/plum_tools/gitrepo_index.json")
+        """
+        self._ignore = frozenset(ignore)
+        self._nested = nested
+        self._workers = max(workers, 1)
+        self._index = index
+
+    def list_directory(self, path: str, root: bool = False) -> tuple[bool, list[str]]:
+        """列出目录下需要继续遍历的子目录
+
+        :param path 目录路径
+        :example path /tmp
+
+        :param root 是否为查找路径
+        :example root False
+
+        :return 目录是否为git仓库, 子目录名
+        """
+        if self._index is not None:
+            return self._index.list_directory(path, root)
+        return list_directory(path, self._ignore)
+
+    def _list_batch(self, paths: list[str], results: queue.SimpleQueue, root: bool = False) -> None:
+        """遍历一批目录，结果放入队列中"""
+        try:
+            results.put([(path, *self.list_directory(path, root)) for path in paths])
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            results.put(e)
+
+    def scan(self, paths: Iterable[str]) -> Iterator[str]:
+        """查找目录下所有的git仓库，找到一个返回一个
+
+        :param paths 要查找的目录
+        :example paths ["/tmp"]
+        """
+        results: queue.SimpleQueue = queue.SimpleQueue()
+        pending = 0
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            try:
+                for path in paths:
+                    pool.submit(self._list_batch, [path], results, True)
+                    pending += 1
+                while pending:
+                    batch = results.get()
+                    pending -= 1
+                    if isinstance(batch, Exception):
+                        raise batch
+                    children: list[str] = []
+                    for path, is_repo, subdirs in batch:
+                        if is_repo:
+                            yield path
+                            if not self._nested:
+                                continue
+                        children.extend(os.path.join(path, name) for name in subdirs)
+                    for i in range(0, len(children), GITREPO_SCAN_BATCH):
+                        pool.submit(self._list_batch, children[i : i + GITREPO_SCAN_BATCH], results)
+                        pending += 1
+            finally:
+                # 调用方提前结束遍历时，取消还没有开始的任务
+                pool.shutdown(wait=False, cancel_futures=True)
@@ -10,12 +10,28 @@
 #=============================================================================
 """
 
+import functools
+import getpass
+import glob
+import heapq
+import json
+import os
 import re
+import shlex
 import sys
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass
 
 from ..conf import PathConfig
 from .utils import YmlConfig, print_error
 
+SSH_CONFIG_INDEX_VERSION = 1
+SSH_INCLUDE_DEPTH = 16  # Include 最多嵌套的层数，和 OpenSSH 一致
+SSH_CONFIG_LINE = re.compile(r"^\s*(\S+?)(?:\s*=\s*|\s+)(.*?)\s*$")  # 配置名和参数之间是空白或者 =
+SHORT_IP = re.compile(r"^(?:\d+\.){0,3}\d+$")  # ip或者ip的简写
+
+_LOADED: dict[str, "SSHConfigIndex"] = {}  # 已经加载的索引
+
 
 class SSHConf:
     """SSH相关配置"""
@@ -136,47 +152,431 @@ def get_host_ip(host: str, host_type: str) -> str:
     return f"{prefix_host}.{host}"
 
 
+@dataclass
+class SSHBlock:
+    """~/.ssh/config 中的一段配置"""
+
+    conditions: list[list[str]]  # 生效的条件，都满足时生效，如 [["host", "web-*", "!web-0"], ["match", "user", "root"]]
+    options: list[list[str]]  # 配置项，配置名为小写，如 [["hostname", "10.10.100.1"], ["port", "22"]]
+
+    @property
+    def specific(self) -> bool:
+        """是否只对指定的主机生效，Host * 等对所有主机生效的配置不能说明主机已经配置"""
+        for kind, *args in self.conditions:
+            if kind == "host" and args != ["*"]:
+                return True
+            if kind == "match" and any(arg.lstrip("!").lower() in ("host", "originalhost") for arg in args):
+                return True
+        return False
+
+
+def _split_args(value: str) -> list[str]:
+    """拆分配置的参数，支持双引号包裹的参数"""
+    try:
+        return shlex.split(value)
+    except ValueError:
+        return value.split()
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_pattern(pattern: str) -> re.Pattern:
+    """把 OpenSSH 的模式转换为正则表达式，* 匹配任意字符，? 匹配一个字符，不区分大小写"""
+    regex = "".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern)
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+def match_pattern_list(name: str, patterns: Iterable[str]) -> bool:
+    """和 OpenSSH 一致的模式列表匹配
+
+    :param name 主机名或用户名
+    :example name web-1
+
+    :param patterns 模式列表，!开头的模式匹配时整体不匹配
+    :example patterns ["web-*", "!web-0"]
+    """
+    matched = False
+    for pattern in patterns:
+        if pattern.startswith("!"):
+            if _compile_pattern(pattern[1:]).fullmatch(name):
+                return False
+        elif _compile_pattern(pattern).fullmatch(name):
+            matched = True
+    return matched
+
+
+def _get_mtime(path: str) -> int | None:
+    """文件的修改时间，文件不存在时为None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _expand_include(base: str, patterns: list[str], files: dict[str, int | None]) -> list[str]:
+    """展开 Include 中的文件
+
+    :param base Include 中相对路径的起始目录
+    :example base ~/.ssh
+
+    :param patterns Include 的参数，可以包含通配符
+    :example patterns ["conf.d/*"]
+
+    :param files 解析过的文件和修改时间，通配符所在的目录也记录在其中
+    :example files {}
+
+    :return 按顺序需要解析的文件
+    """
+    included = []
+    for pattern in patterns:
+        pattern = os.path.join(base, os.path.expanduser(pattern))
+        if glob.has_magic(pattern):
+            # 目录中新增的文件也需要重新解析
+            directory = os.path.dirname(pattern)
+            files[directory] = _get_mtime(directory)
+            included.extend(sorted(glob.glob(pattern)))
+        else:
+            included.append(pattern)
+    return included
+
+
+class SSHConfigIndex:
+    """~/.ssh/config 的索引
+
+    解析时展开 Include，按 OpenSSH 的规则(每个配置项第一次出现的值生效)计算每个主机别名的配置，
+    查询主机别名时直接读取字典，查询其他主机时只检查包含这个主机名的配置和带通配符、Match 的配置
+    """
+
+    def __init__(self, blocks: list[SSHBlock], files: dict[str, int | None], aliases: dict | None = None) -> None:
+        """初始化
+
+        :param blocks 按出现顺序排列的配置
+        :example blocks [SSHBlock([["host", "dev"]], [["hostname", "10.10.100.1"]])]
+
+        :param files 解析过的文件、Include 中通配符所在的目录和它们的修改时间，任何一个变化时都需要重新解析
+        :example files {"/root/.ssh/config": 1700000000000000000}
+
+        :param aliases 已经计算好的主机别名的配置，None表示重新计算
+        :example aliases {"dev": {"host": "dev", "hostname": "10.10.100.1"}}
+        """
+        self.blocks = blocks
+        self.files = files
+        self._literal: dict[str, list[int]] = {}  # 小写的主机名 -> 只用主机名匹配的配置序号
+        self._dynamic: list[int] = []  # 带通配符、Match 或者对所有主机生效的配置序号
+        names: dict[str, None] = {}
+        for position, block in enumerate(blocks):
+            hosts = [args for kind, *args in block.conditions if kind == "host"]
+            # 只有不带通配符的主机名才能匹配，! 开头的模式在计算配置时检查
+            literal = [name for name in hosts[0] if not name.startswith("!")] if hosts else []
+            if not literal or len(hosts) != len(block.conditions) or any(c in "".join(literal) for c in "*?"):
+                self._dynamic.append(position)
+                continue
+            for name in literal:
+                self._literal.setdefault(name.lower(), []).append(position)
+                names.setdefault(name)
+        if aliases is None:
+            aliases = {}
+            for name in names:
+                options = self._resolve(name)
+                if options is not None:
+                    aliases[name] = options
+        self.aliases: dict[str, dict] = aliases
+
+    @classmethod
+    def parse(cls, path: str) -> "SSHConfigIndex":
+        """解析配置文件
+
+        :param path 配置文件路径
+        :example path ~/.ssh/config
+        """
+        blocks: list[SSHBlock] = []
+        files: dict[str, int | None] = {}
+        cls._parse_file(path, os.path.dirname(path), [], blocks, files, 0)
+        return cls(blocks, files)
+
+    # pylint: disable=too-many-positional-arguments,too-many-arguments
+    @classmethod
+    def _parse_file(
+        cls,
+        path: str,
+        base: str,
+        conditions: list[list[str]],
+        blocks: list[SSHBlock],
+        files: dict[str, int | None],
+        depth: int,
+    ) -> None:
+        """解析一个配置文件
+
+        :param path 配置文件路径
+        :example path ~/.ssh/config
+
+        :param base Include 中相对路径的起始目录
+        :example base ~/.ssh
+
+        :param conditions Include 所在配置的生效条件，被包含的文件中所有配置都要满足
+        :example conditions [["host", "web-*"]]
+
+        :param blocks 解析结果
+        :example blocks []
+
+        :param files 解析过的文件和修改时间
+        :example files {}
+
+        :param depth Include 的层数
+        :example depth 0
+        """
+        files[path] = _get_mtime(path)
+        if depth > SSH_INCLUDE_DEPTH:
+            return
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        # Host、Match 之前的配置属于 Include 所在的配置
+        block = SSHBlock(list(conditions), [])
+        blocks.append(block)
+        for line in lines:
+            match = SSH_CONFIG_LINE.match(line)
+            if match is None or match.group(1).startswith("#"):
+                continue
+            key, args = match.group(1).lower(), _split_args(match.group(2))
+            if not args:
+                continue
+            if key in ("host", "match"):
+                block = SSHBlock([*conditions, [key, *args]], [])
+                blocks.append(block)
+            elif key == "include":
+                for item in _expand_include(base, args, files):
+                    cls._parse_file(item, base, block.conditions, blocks, files, depth + 1)
+                # Include 之后的配置排在被包含的配置之后
+                block = SSHBlock(block.conditions, [])
+                blocks.append(block)
+            else:
+                block.options.append([key, " ".join(args)])
+
+    def _check(self, block: SSHBlock, host: str, options: dict) -> bool:
+        """检查配置对主机是否生效
+
+        :param block 配置
+        :example block SSHBlock([["host", "dev"]], [])
+
+        :param host 主机名
+        :example host dev
+
+        :param options 已经生效的配置，Match host/user 使用其中的主机名和用户名
+        :example options {"hostname": "10.10.100.1"}
+        """
+        for kind, *args in block.conditions:
+            if kind == "host":
+                if not match_pattern_list(host, args):
+                    return False
+            elif not self._check_match(args, host, options):
+                return False
+        return True
+
+    @staticmethod
+    def _check_match(args: list[str], host: str, options: dict) -> bool:
+        """检查 Match 的条件，不支持需要执行命令的 exec 和依赖网络环境的 localnetwork 等条件，这些条件都不满足"""
+        position = 0
+        while position < len(args):
+            criterion = args[position].lower()
+            negate = criterion.startswith("!")
+            criterion = criterion.lstrip("!")
+            if criterion in ("all", "canonical", "final"):
+                # 只计算最终的配置，不会进行主机名规范化
+                result = criterion != "canonical"
+            else:
+                position += 1
+                if position >= len(args):
+                    return False
+                patterns = args[position].split(",")
+                if criterion == "host":
+                    result = match_pattern_list(expand_hostname(options.get("hostname", host), host), patterns)
+                elif criterion == "originalhost":
+                    result = match_pattern_list(host, patterns)
+                elif criterion == "user":
+                    result = match_pattern_list(options.get("user", getpass.getuser()), patterns)
+                elif criterion == "localuser":
+                    result = match_pattern_list(getpass.getuser(), patterns)
+                else:
+                    result = False
+            if result == negate:
+                return False
+            position += 1
+        return True
+
+    def _resolve(self, host: str) -> dict | None:
+        """计算主机的配置
+
+        :param host 主机名
+        :example host dev
+
+        :return 主机的配置，主机没有单独配置时返回None
+        """
+        options: dict[str, str] = {"host": host}
+        known = False
+        for position in heapq.merge(self._literal.get(host.lower(), []), self._dynamic):
+            block = self.blocks[position]
+            if not self._check(block, host, options):
+                continue
+            known = known or block.specific
+            for key, value in block.options:
+                options.setdefault(key, value)
+        if not known:
+            return None
+        options["hostname"] = expand_hostname(options.get("hostname", host), host)
+        return options
+
+    def resolve(self, host: str) -> dict | None:
+        """查询主机的配置
+
+        :param host 主机别名或者主机名
+        :example host dev
+
+        :return 主机的配置 {"host": "dev", "hostname": "10.10.100.1", "port": "22"}，主机没有单独配置时返回None
+        """
+        options = self.aliases.get(host)
+        if options is not None:
+            return dict(options)
+        return self._resolve(host)
+
+    @property
+    def fresh(self) -> bool:
+        """解析过的文件是否都没有变化"""
+        return all(_get_mtime(path) == mtime for path, mtime in self.files.items())
+
+    @classmethod
+    def load(cls, cache_path: str, path: str) -> "SSHConfigIndex | None":
+        """读取缓存的索引
+
+        :param cache_path 缓存文件路径
+        :example cache_path ~/.cache/plum_tools/ssh_config_index.json
+
+        :param path 配置文件路径
+        :example path ~/.ssh/config
+
+        :return 索引，缓存不存在、格式错误或者文件有变化时返回None
+        """
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != SSH_CONFIG_INDEX_VERSION or data.get("path") != path:
+                return None
+            blocks = [SSHBlock(block["conditions"], block["options"]) for block in data["blocks"]]
+            index = cls(blocks, data["files"], data["aliases"])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return index if index.fresh else None
+
+    def save(self, cache_path: str, path: str) -> None:
+        """保存索引
+
+        :param cache_path 缓存文件路径
+        :example cache_path ~/.cache/plum_tools/ssh_config_index.json
+
+        :param path 配置文件路径
+        :example path ~/.ssh/config
+        """
+        data = {
+            "version": SSH_CONFIG_INDEX_VERSION,
+            "path": path,
+            "files": self.files,
+            "blocks": [asdict(block) for block in self.blocks],
+            "aliases": self.aliases,
+        }
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, cache_path)
+
+
+def expand_hostname(hostname: str, host: str) -> str:
+    """替换 HostName 中的 %h 和 %%
+
+    :param hostname HostName 配置
+    :example hostname %h.example.com
+
+    :param host 命令行中的主机名
+    :example host web-1
+
+    :return web-1.example.com
+    """
+    if "%" not in hostname:
+        return hostname
+    return re.sub(r"%([h%])", lambda m: host if m.group(1) == "h" else "%", hostname)
+
+
+def load_ssh_config(path: str | None = None, cache_path: str | None = None) -> SSHConfigIndex:
+    """加载ssh配置的索引，同一个进程中只加载一次
+
+    优先使用缓存的索引，配置文件和 Include 的文件都没有变化时不需要解析
+
+    :param path 配置文件路径，默认为 ~/.ssh/config
+    :example path ~/.ssh/config
+
+    :param cache_path 缓存文件路径
+    :example cache_path ~/.cache/plum_tools/ssh_config_index.json
+    """
+    path = path or PathConfig.SSH_CONFIG_PATH
+    cache_path = cache_path or PathConfig.SSH_CONFIG_INDEX_PATH
+    index = _LOADED.get(path)
+    if index is not None:
+        return index
+    index = SSHConfigIndex.load(cache_path, path)
+    if index is None:
+        index = SSHConfigIndex.parse(path)
+        try:
+            index.save(cache_path, path)
+        except OSError:
+            pass
+    _LOADED[path] = index
+    return index
+
+
 def get_ssh_alias_conf(host: str) -> dict:
     """解析~/.ssh/config配置信息
 
+    :param host: 主机别名
+    :example host dev
+
     :return ssh_conf ssh主机信息
     :example ssh_conf
     {
+        'host': 'dev',
         'identityfile': '~/.ssh/seekplum',
         'hostname': 'github.com',
         'user': 'seekplum',
-        'port': 22
+        'port': '22'
     }
     """
-    begin = False
-    # 查询默认的ssh信息
-    ssh_conf = {}
-    with open(PathConfig.SSH_CONFIG_PATH, encoding="utf-8") as f:
-        for line in f:
-            data = line.split()
-            # config配置都是两列
-            if len(data) != 2:
-                continue
+    ssh_conf = load_ssh_config().resolve(host)
+    if ssh_conf is None:
+        print_error(f"未在 {PathConfig.SSH_CONFIG_PATH} 中配置主机 {host} 的ssh登陆信息")
+        sys.exit(1)
+    return ssh_conf
 
-            key = data[0].lower()
-            value = data[1]
 
-            # 多个主机信息已 Host 进行分隔
-            if key == "host":
-                if begin:  # pylint: disable=R1723
-                    break
-                if value == host:
-                    begin = True
-                else:
-                    continue
+def is_known_host(host: str) -> bool:
+    """判断主机能否生成ssh配置，不输出错误信息也不退出
 
-            if begin:
-                ssh_conf[key] = value
+    :param host: ip的简写或者主机的别名
+    :example host dev
 
-    if not begin:
-        print_error(f"未在 {PathConfig.SSH_CONFIG_PATH} 中配置主机 {host} 的ssh登陆信息")
-        sys.exit(1)
-    return ssh_conf
+    :return 是ip的简写或者在~/.ssh/config中配置了主机别名
+    """
+    return bool(SHORT_IP.match(host)) or load_ssh_config().resolve(host) is not None
+
+
+def get_ssh_aliases() -> list[str]:
+    """查询~/.ssh/config中配置的所有主机别名，不包含 `*`、`?` 等通配符
+
+    :return 按配置顺序排列的主机别名，配置文件不存在时为空列表
+    :example ["github", "web-1", "web-2"]
+    """
+    return list(load_ssh_config().aliases)
 
 
 def merge_ssh_config(host: str, host_type: str, user: str, port: int, identityfile: str) -> dict:
@@ -209,8 +609,7 @@ def merge_ssh_config(host: str, host_type: str, user: str, port: int, identityfi
         'port': 22
     }
     """
-    pattern = re.compile(r"^(?:\d+\.){0,3}\d+$")
-    match = pattern.match(host)
+    match = SHORT_IP.match(host)
     conf_obj = SSHConf(user, port, identityfile)
     # 传入的是ip的简写
     if match:
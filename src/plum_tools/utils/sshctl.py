@@ -0,0 +1,198 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: sshctl
+#         Desc: 管理 ssh ControlMaster 主连接，同一台主机的多次 ssh、rsync 复用已经建立的连接，
+#               不需要每次都进行 TCP 连接、密钥交换和认证
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-18 00:20
+#=============================================================================
+"""
+
+import os
+import stat
+import subprocess
+from dataclasses import dataclass
+
+from ..conf import COMMAND_TIMEOUT, SSH_CONTROL_PATH_MAX, SSH_CONTROL_PERSIST, PathConfig
+
+
+@dataclass
+class ControlMaster:
+    """主连接的状态"""
+
+    name: str  # socket 文件名，一般为 user@hostname:port
+    path: str  # socket 路径
+    pid: int | None = None  # 主连接的进程id，主连接已经退出时为None
+
+    @property
+    def running(self) -> bool:
+        """主连接是否还在运行"""
+        return self.pid is not None
+
+
+def get_control_dir(create: bool = True) -> str | None:
+    """查询保存主连接 socket 的目录
+
+    :param create 目录不存在时是否创建
+    :example create True
+
+    :return 目录路径，目录无法创建、不属于当前用户或者其他用户可以访问时返回None，此时不复用连接
+    """
+    path = PathConfig.SSH_CONTROL_DIR
+    try:
+        if create:
+            os.makedirs(path, mode=0o700, exist_ok=True)
+        st = os.lstat(path)
+        parent = os.lstat(os.path.dirname(path))
+    except OSError:
+        return None
+    # 临时目录中的目录可能被其他用户提前创建
+    for item, mask in ((parent, 0o022), (st, 0o077)):
+        if not stat.S_ISDIR(item.st_mode) or item.st_uid != os.getuid() or item.st_mode & mask:
+            return None
+    return path
+
+
+def get_control_path(user: str, hostname: str, port: int, directory: str) -> str:
+    """主连接的 socket 路径
+
+    :param user ssh登陆使用的用户名
+    :example user root
+
+    :param hostname 主机ip
+    :example hostname 10.10.100.1
+
+    :param port ssh登陆使用的端口号
+    :example port 22
+
+    :param directory 保存 socket 的目录
+    :example directory /run/user/1000/plum_tools/ssh
+
+    :return 路径较短时使用 user@hostname:port 作为文件名，便于查看主连接属于哪台主机，否则使用ssh计算的哈希值
+    """
+    # ssh 会替换路径中以 % 开头的变量
+    name = f"{user}@{hostname}:{port}".replace("%", "%%")
+    path = os.path.join(directory, name)
+    if len(path) > SSH_CONTROL_PATH_MAX:
+        path = os.path.join(directory, "%C")
+    return path
+
+
+def get_control_options(user: str, hostname: str, port: int, persist: str | None = SSH_CONTROL_PERSIST) -> list[str]:
+    """复用主连接的ssh参数
+
+    :param user ssh登陆使用的用户名
+    :example user root
+
+    :param hostname 主机ip
+    :example hostname 10.10.100.1
+
+    :param port ssh登陆使用的端口号
+    :example port 22
+
+    :param persist 主连接在最后一个会话结束后保持的时间，None 或 no 表示不复用连接
+    :example persist 10m
+
+    :return ["-o", "ControlMaster=auto", "-o", "ControlPath=...", "-o", "ControlPersist=10m"]，不复用连接时为空列表
+    """
+    if not persist or persist == "no":
+        return []
+    directory = get_control_dir()
+    if directory is None:
+        return []
+    path = get_control_path(user, hostname, port, directory)
+    return ["-o", "ControlMaster=auto", "-o", f"ControlPath={path}", "-o", f"ControlPersist={persist}"]
+
+
+def format_control_options(user: str, hostname: str, port: int, persist: str | None = SSH_CONTROL_PERSIST) -> str:
+    """复用主连接的ssh参数，和其他ssh参数一样用双引号包裹，可以拼接到shell命令或者 rsync -e 的单引号中
+
+    :param user ssh登陆使用的用户名
+    :example user root
+
+    :param hostname 主机ip
+    :example hostname 10.10.100.1
+
+    :param port ssh登陆使用的端口号
+    :example port 22
+
+    :param persist 主连接在最后一个会话结束后保持的时间
+    :example persist 10m
+
+    :return -o "ControlMaster=auto" -o "ControlPath=..." -o "ControlPersist=10m"
+    """
+    options = get_control_options(user, hostname, port, persist)
+    return " ".join(f'-o "{option}"' for option in options[1::2])
+
+
+def control_command(path: str, operation: str) -> subprocess.CompletedProcess:
+    """向主连接发送控制命令
+
+    :param path socket 路径
+    :example path /run/user/1000/plum_tools/ssh/root@10.10.100.1:22
+
+    :param operation 控制命令 check/exit
+    :example operation check
+    """
+    # 指定了 socket 路径时主机名不会被使用
+    return subprocess.run(  # nosec B603 B607
+        ["ssh", "-O", operation, "-o", f"ControlPath={path.replace('%', '%%')}", "plum_tools"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=COMMAND_TIMEOUT,
+        check=False,
+        text=True,
+    )
+
+
+def list_masters() -> list[ControlMaster]:
+    """查询所有主连接的状态
+
+    :return 按文件名排序的主连接
+    """
+    directory = get_control_dir(create=False)
+    if directory is None:
+        return []
+    masters = []
+    with os.scandir(directory) as entries:
+        for entry in sorted(entries, key=lambda item: item.name):
+            try:
+                if not stat.S_ISSOCK(entry.stat(follow_symlinks=False).st_mode):
+                    continue
+            except OSError:
+                continue
+            master = ControlMaster(entry.name, entry.path)
+            try:
+                result = control_command(entry.path, "check")
+            except subprocess.TimeoutExpired:
+                result = None
+            # 输出为 Master running (pid=1234)
+            if result is not None and result.returncode == 0 and "pid=" in result.stderr:
+                pid = result.stderr.split("pid=", 1)[1].split(")", 1)[0]
+                master.pid = int(pid) if pid.isdigit() else 0
+            masters.append(master)
+    return masters
+
+
+def stop_masters() -> list[ControlMaster]:
+    """关闭所有主连接，删除已经失效的 socket
+
+    :return 关闭的主连接
+    """
+    masters = list_masters()
+    for master in masters:
+        if master.running:
+            try:
+                control_command(master.path, "exit")
+            except subprocess.TimeoutExpired:
+                pass
+        else:
+            try:
+                os.remove(master.path)
+            except OSError:
+                pass
+    return masters
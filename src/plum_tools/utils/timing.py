@@ -0,0 +1,221 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: timing
+#         Desc: 记录每个阶段、每个仓库的耗时，输出最慢的仓库、耗时分布和 Chrome trace 文件
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 21:00
+#=============================================================================
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TextIO
+
+# 耗时分布的区间上限，单位秒
+HISTOGRAM_BOUNDS = (0.001, 0.01, 0.1, 1, 10)
+HISTOGRAM_WIDTH = 40
+
+
+@dataclass
+class Span:
+    """一段耗时"""
+
+    name: str  # 阶段名
+    key: str  # 所属的对象，如仓库路径，整体的阶段为空字符串
+    start: float  # 开始时间，time.perf_counter() 的值
+    duration: float  # 耗时，单位秒
+    thread: int  # 线程id
+
+
+class Profiler:
+    """记录耗时，可以在多个线程中同时记录"""
+
+    def __init__(self) -> None:
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    @property
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def add(self, name: str, key: str, start: float, duration: float) -> None:
+        """记录一段耗时
+
+        :param name 阶段名
+        :example name status
+
+        :param key 所属的对象
+        :example key /tmp/git
+
+        :param start 开始时间
+        :example start 1.5
+
+        :param duration 耗时，单位秒
+        :example duration 0.02
+        """
+        span = Span(name, key, start, duration, threading.get_ident())
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, key: str = "") -> Iterator[None]:
+        """记录代码块的耗时
+
+        :param name 阶段名
+        :example name status
+
+        :param key 所属的对象
+        :example key /tmp/git
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, key, start, time.perf_counter() - start)
+
+    def iter_span(self, name: str, items: Iterable) -> Iterator:
+        """记录遍历生成器的总耗时，包括调用方处理每一项的时间
+
+        :param name 阶段名
+        :example name discovery
+
+        :param items 要遍历的对象
+        :example items RepositoryScanner().scan(["/tmp"])
+        """
+        with self.span(name):
+            yield from items
+
+    def totals(self, key: str | None = None) -> dict[str, float]:
+        """每个阶段的总耗时
+
+        :param key 只统计这个对象的耗时，None表示统计所有对象
+        :example key /tmp/git
+        """
+        totals: dict[str, float] = {}
+        for span in self.spans:
+            if key is None or span.key == key:
+                totals[span.name] = totals.get(span.name, 0) + span.duration
+        return totals
+
+    def slowest(self, name: str, count: int) -> list[Span]:
+        """耗时最长的对象
+
+        :param name 阶段名
+        :example name repo
+
+        :param count 数量
+        :example count 10
+        """
+        spans = [span for span in self.spans if span.name == name]
+        return sorted(spans, key=lambda span: span.duration, reverse=True)[:count]
+
+    def to_trace(self) -> dict:
+        """转换为 Chrome trace event 格式，可以用 chrome://tracing 或 Perfetto 打开"""
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            args = {"key": span.key} if span.key else {}
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": "plum_tools",
+                    "ph": "X",
+                    "ts": round((span.start - self._origin) * 1e6, 3),
+                    "dur": round(span.duration * 1e6, 3),
+                    "pid": pid,
+                    "tid": span.thread,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: str) -> None:
+        """保存 Chrome trace event 文件
+
+        :param path 文件路径
+        :example path /tmp/gitrepo.trace.json
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_trace(), f)
+
+
+def format_duration(seconds: float) -> str:
+    """格式化耗时
+
+    :param seconds 耗时，单位秒
+    :example seconds 0.0123
+
+    :return 12.3ms
+    """
+    if seconds < 1:
+        return f"{seconds * 1000:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+def histogram(durations: Iterable[float], bounds: Iterable[float] = HISTOGRAM_BOUNDS) -> list[tuple[str, int]]:
+    """统计耗时分布
+
+    :param durations 耗时，单位秒
+    :example durations [0.002, 0.3]
+
+    :param bounds 区间上限
+    :example bounds (0.001, 0.01)
+
+    :return 每个区间的名称和数量 [("<1.0ms", 0), ("<10.0ms", 1), (">=10.0ms", 1)]
+    """
+    bounds = sorted(bounds)
+    counts = [0] * (len(bounds) + 1)
+    for duration in durations:
+        for i, bound in enumerate(bounds):
+            if duration < bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    names = [f"<{format_duration(bound)}" for bound in bounds] + [f">={format_duration(bounds[-1])}"]
+    return list(zip(names, counts, strict=True))
+
+
+def print_profile(profiler: Profiler, name: str, count: int, stream: TextIO | None = None) -> None:
+    """输出各阶段总耗时、最慢的对象和耗时分布
+
+    :param profiler 耗时记录
+    :example profiler Profiler()
+
+    :param name 每个对象整体耗时的阶段名
+    :example name repo
+
+    :param count 输出最慢的对象数量
+    :example count 10
+
+    :param stream 输出位置，默认为标准错误，不影响标准输出中的结构化数据
+    :example stream sys.stderr
+    """
+    stream = stream or sys.stderr
+    totals = profiler.totals()
+    stream.write("phases: " + ", ".join(f"{key} {format_duration(value)}" for key, value in totals.items()) + "\n")
+    slowest = profiler.slowest(name, count)
+    if slowest:
+        stream.write(f"slowest {len(slowest)}:\n")
+    for span in slowest:
+        phases = ", ".join(
+            f"{key} {format_duration(value)}" for key, value in profiler.totals(span.key).items() if key != name
+        )
+        stream.write(f"{format_duration(span.duration):>10}  {span.key}" + (f"  ({phases})" if phases else "") + "\n")
+    buckets = histogram(span.duration for span in profiler.spans if span.name == name)
+    most = max((value for _, value in buckets), default=0) or 1
+    stream.write("histogram:\n")
+    for bucket, value in buckets:
+        marks = "#" * round(value / most * HISTOGRAM_WIDTH)
+        stream.write(f"{bucket:>10} | {marks} {value}\n")
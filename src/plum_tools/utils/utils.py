@@ -10,21 +10,31 @@
 #=============================================================================
 """
 
+import marshal
 import os
 import platform
 import re
 import signal
 import subprocess
 import sys
+import time
 from dataclasses import asdict, dataclass
-from typing import Any
-
-import yaml
+from typing import TYPE_CHECKING, Any
 
 from ..conf import OsCommand, PathConfig
 from ..exceptions import RunCmdError, RunCmdTimeout, SystemTypeError
+from .lazy import lazy_import
 from .printer import print_error, print_text
 
+if TYPE_CHECKING:
+    import yaml
+else:
+    # 有配置快照时不需要解析yml
+    yaml = lazy_import("yaml")
+
+YML_SNAPSHOT_VERSION = 1
+RACY_INTERVAL_NS = 2 * 10**9
+
 
 class cd:  # pylint: disable=invalid-name
     """进入目录执行对应操作后回到目录"""
@@ -98,10 +108,62 @@ class GlobalConf:
 
 
 class YmlConfig:
-    """解析yml配置"""
+    """解析yml配置
+
+    校验后的配置以 marshal 格式保存到缓存目录，yml文件路径、大小和修改时间都没有变化时直接读取，不需要解析yml
+    """
 
     _yml_data = {}  # type: ignore
 
+    @staticmethod
+    def _load_snapshot(yml_path: str, st: os.stat_result) -> dict | None:
+        """读取配置快照
+
+        :param yml_path 项目依赖的yml配置文件路径
+        :example yml_path ~/.plum_tools.yml
+
+        :param st yml文件的状态
+        :example st os.stat_result
+
+        :return 配置内容，快照不存在、格式错误或者yml文件有变化时返回None
+        """
+        try:
+            with open(PathConfig.PLUM_YML_CACHE_PATH, "rb") as f:
+                version, path, size, mtime, data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if (version, path, size, mtime) != (YML_SNAPSHOT_VERSION, yml_path, st.st_size, st.st_mtime_ns):
+            return None
+        return data if isinstance(data, dict) else None
+
+    @staticmethod
+    def _save_snapshot(yml_path: str, st: os.stat_result, data: dict) -> None:
+        """保存配置快照，保存失败时不影响使用
+
+        :param yml_path 项目依赖的yml配置文件路径
+        :example yml_path ~/.plum_tools.yml
+
+        :param st yml文件的状态
+        :example st os.stat_result
+
+        :param data 校验后的配置内容
+        :example data {"ipmi_interval": 100}
+        """
+        if time.time_ns() - st.st_mtime_ns < RACY_INTERVAL_NS:
+            # 修改时间太近时，同一时间内再次修改文件无法通过修改时间发现
+            return
+        path = PathConfig.PLUM_YML_CACHE_PATH
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            content = marshal.dumps((YML_SNAPSHOT_VERSION, yml_path, st.st_size, st.st_mtime_ns, data))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except (OSError, ValueError):
+            # 日期等 marshal 不支持的类型不保存
+            pass
+
     @classmethod
     def parse_config_yml(cls, yml_path: str) -> dict:
         """解析配置程序依赖的配置yml文件
@@ -114,9 +176,16 @@ class YmlConfig:
         if cls._yml_data:
             return cls._yml_data
         try:
+            st = os.stat(yml_path)
+            data = cls._load_snapshot(yml_path, st)
+            if data is not None:
+                cls._yml_data = data
+                return cls._yml_data
             with open(yml_path, encoding="utf-8") as f:
                 try:
-                    obj = GlobalConf(**yaml.safe_load(f.read()))
+                    # 安装了 libyaml 时使用C实现的解析器
+                    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+                    obj = GlobalConf(**yaml.load(f.read(), Loader=loader))  # nosec B506
                     data = obj.get_data()
                 except TypeError as e:
                     print_error(f"yml文件: {PathConfig.PLUM_YML_PATH} 格式错误, {e.args[0]}, 请参照以下格式进行修改")
@@ -125,6 +194,7 @@ class YmlConfig:
                     print_text(text)
                     sys.exit(1)
                 else:
+                    cls._save_snapshot(yml_path, st, data)
                     cls._yml_data = data
                     return cls._yml_data
         except OSError:
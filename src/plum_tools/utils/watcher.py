@@ -0,0 +1,350 @@
+"""
+#=============================================================================
+#  ProjectName: plum_tools
+#     FileName: watcher
+#         Desc: 监听目录中的文件变化，Linux下使用inotify，其他系统定时检查目录中文件的mtime
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 19:00
+#=============================================================================
+"""
+
+import abc
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from collections.abc import Iterable, Iterator
+
+from ..conf import GITREPO_IGNORE, GITREPO_WATCH_INTERVAL
+from .gitmeta import GitMeta
+
+# inotify 事件，见 /usr/include/linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+    | IN_EXCL_UNLINK
+)
+_EVENT = struct.Struct("iIII")
+
+
+def _iter_work_dirs(root: str, ignore: set[str]) -> Iterator[str]:
+    """工作区中root和它下面需要监听的目录，跳过不需要监听的目录和嵌套的仓库
+
+    :param root 工作区中的目录
+    :example root /tmp/git/src
+
+    :param ignore 不需要监听的目录名
+    :example ignore {".git", "node_modules"}
+    """
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        yield path
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name in ignore or entry.name == ".git" or not entry.is_dir(follow_symlinks=False):
+                        continue
+                    # 嵌套的仓库单独监听
+                    if os.path.lexists(os.path.join(entry.path, ".git")):
+                        continue
+                    stack.append(entry.path)
+        except OSError:
+            continue
+
+
+def iter_watch_dirs(repo: str, ignore: Iterable[str] = GITREPO_IGNORE) -> Iterator[str]:
+    """仓库中需要监听的目录：工作区中的目录和保存HEAD、index、引用的git目录
+
+    :param repo 仓库路径
+    :example repo /tmp/git
+
+    :param ignore 不需要监听的目录名
+    :example ignore (".git", "node_modules")
+    """
+    yield from _iter_work_dirs(repo, set(ignore))
+    meta = GitMeta.open(repo)
+    if meta is None:
+        return
+    yield meta.git_dir
+    if meta.common_dir != meta.git_dir:
+        yield meta.common_dir
+    for root, _, _ in os.walk(os.path.join(meta.common_dir, "refs")):
+        yield root
+
+
+def iter_new_watch_dirs(repo: str, path: str, ignore: Iterable[str] = GITREPO_IGNORE) -> Iterator[str]:
+    """仓库中新建的目录和它下面需要监听的目录，和 iter_watch_dirs 的规则一致，不需要重新遍历整个仓库
+
+    :param repo 仓库路径
+    :example repo /tmp/git
+
+    :param path 新建的目录，等于仓库路径时表示无法知道新建了哪些目录，重新遍历整个仓库
+    :example path /tmp/git/src/lib
+
+    :param ignore 不需要监听的目录名
+    :example ignore (".git", "node_modules")
+    """
+    if path == repo:
+        yield from iter_watch_dirs(repo, ignore)
+        return
+    ignore = set(ignore)
+    parts = os.path.relpath(path, repo).split(os.sep)
+    if parts[0] != os.pardir and not ignore.intersection(parts) and ".git" not in parts:
+        # 嵌套的仓库单独监听
+        if not os.path.lexists(os.path.join(path, ".git")):
+            yield from _iter_work_dirs(path, ignore)
+        return
+    meta = GitMeta.open(repo)
+    if meta is None:
+        return
+    # git目录中只监听引用目录
+    refs = os.path.join(meta.common_dir, "refs")
+    if os.path.commonpath([refs, path]) == refs:
+        for root, _, _ in os.walk(path):
+            yield root
+
+
+class BaseWatcher(abc.ABC):
+    """监听目录变化，每个目录属于一个key(仓库)"""
+
+    @abc.abstractmethod
+    def add(self, key: str, path: str) -> None:
+        """监听目录，不会递归监听子目录
+
+        :param key 目录所属的仓库
+        :example key /tmp/git
+
+        :param path 目录路径
+        :example path /tmp/git/src
+        """
+
+    @abc.abstractmethod
+    def wait(self, timeout: float | None = None) -> set[str]:
+        """等待目录变化
+
+        :param timeout 最长等待时间，None表示一直等待
+        :example timeout 0.1
+
+        :return 有变化的目录所属的仓库，超时返回空集合
+        """
+
+    def pop_new_dirs(self) -> set[tuple[str, str]]:
+        """返回上次调用后监听的目录中新建的目录并清空
+
+        :return (目录所属的仓库, 新建的目录)，目录等于仓库路径时表示无法知道新建了哪些目录
+        """
+        return set()
+
+    def close(self) -> None:  # noqa: B027
+        """停止监听，没有需要释放的资源时不用覆盖"""
+
+    def __enter__(self) -> "BaseWatcher":
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+
+class InotifyWatcher(BaseWatcher):
+    """通过ctypes调用Linux的inotify"""
+
+    def __init__(self) -> None:
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._fd = fd
+        self._keys: dict[int, set[str]] = {}  # watch descriptor -> 仓库
+        self._paths: dict[int, str] = {}  # watch descriptor -> 目录
+        self._new_dirs: set[tuple[str, str]] = set()
+
+    @staticmethod
+    def available() -> bool:
+        """当前系统是否支持inotify"""
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+        except OSError:
+            return False
+        return hasattr(libc, "inotify_init1")
+
+    def add(self, key: str, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self._keys.setdefault(wd, set()).add(key)
+        self._paths[wd] = path
+
+    def _read_events(self) -> set[str]:
+        """读取所有已经产生的事件"""
+        changed: set[str] = set()
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return changed
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, pos)
+                name = data[pos + _EVENT.size : pos + _EVENT.size + length].rstrip(b"\0")
+                pos += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # 事件太多被丢弃，无法知道哪些目录变化了，也无法知道新建了哪些目录
+                    changed.update(key for keys in self._keys.values() for key in keys)
+                    self._new_dirs.update((key, key) for key in changed)
+                    continue
+                keys = self._keys.get(wd, set())
+                if mask & IN_IGNORED:
+                    # 目录被删除，监听自动失效
+                    self._keys.pop(wd, None)
+                    self._paths.pop(wd, None)
+                    continue
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and wd in self._paths:
+                    path = os.path.join(self._paths[wd], os.fsdecode(name))
+                    self._new_dirs.update((key, path) for key in keys)
+                # git 执行时创建、删除的锁文件不代表仓库状态变化，锁文件重命名为目标文件时才会变化
+                if name.endswith(b".lock"):
+                    continue
+                changed.update(keys)
+
+    def wait(self, timeout: float | None = None) -> set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return set()
+            changed = self._read_events()
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def pop_new_dirs(self) -> set[tuple[str, str]]:
+        new_dirs, self._new_dirs = self._new_dirs, set()
+        return new_dirs
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher(BaseWatcher):
+    """定时检查目录中每个文件的mtime和大小，不支持inotify时使用"""
+
+    def __init__(self, interval: float = GITREPO_WATCH_INTERVAL) -> None:
+        """初始化
+
+        :param interval 检查间隔，单位秒
+        :example interval 1
+        """
+        self._interval = interval
+        self._dirs: dict[str, set[str]] = {}  # 目录 -> 仓库
+        self._fingerprints: dict[str, frozenset | None] = {}
+        self._new_dirs: set[tuple[str, str]] = set()
+
+    @staticmethod
+    def _fingerprint(path: str) -> frozenset | None:
+        """目录中每个文件的 (文件名, mtime, 大小)"""
+        items = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    items.append((entry.name, st.st_mtime_ns, st.st_size))
+        except OSError:
+            return None
+        return frozenset(items)
+
+    def add(self, key: str, path: str) -> None:
+        if path not in self._dirs:
+            self._fingerprints[path] = self._fingerprint(path)
+        self._dirs.setdefault(path, set()).add(key)
+
+    def _scan(self) -> set[str]:
+        changed: set[str] = set()
+        for path, keys in list(self._dirs.items()):
+            fingerprint = self._fingerprint(path)
+            previous = self._fingerprints[path]
+            if fingerprint != previous:
+                self._fingerprints[path] = fingerprint
+                changed.update(keys)
+                self._add_new_dirs(path, keys, previous, fingerprint)
+            if fingerprint is None:
+                # 目录被删除
+                del self._dirs[path]
+                del self._fingerprints[path]
+        return changed
+
+    def _add_new_dirs(self, path: str, keys: set[str], previous: frozenset | None, current: frozenset | None) -> None:
+        """记录目录中新出现的子目录"""
+        if previous is None or current is None:
+            return
+        for name in {item[0] for item in current} - {item[0] for item in previous}:
+            child = os.path.join(path, name)
+            if os.path.isdir(child) and not os.path.islink(child):
+                self._new_dirs.update((key, child) for key in keys)
+
+    def pop_new_dirs(self) -> set[tuple[str, str]]:
+        new_dirs, self._new_dirs = self._new_dirs, set()
+        return new_dirs
+
+    def wait(self, timeout: float | None = None) -> set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self._scan()
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self._interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return set()
+            time.sleep(min(self._interval, remaining))
+
+
+def create_watcher(polling: bool = False) -> BaseWatcher:
+    """创建监听对象，优先使用inotify
+
+    :param polling 是否强制使用定时检查
+    :example polling False
+    """
+    if not polling and InotifyWatcher.available():
+        return InotifyWatcher()
+    return PollingWatcher()
@@ -1,28 +1,9 @@
 import os
 import shutil
+import subprocess
 import tempfile
-from collections.abc import Callable, Generator
+from collections.abc import Generator
 from contextlib import contextmanager
-from typing import Any
-
-
-class MockPool:
-    def __init__(self, processes: int = 0) -> None:
-        self.processes = processes
-
-    def __call__(self, processes: int) -> None:
-        assert processes == 100
-
-    def map(self, func: Callable, targets: list[str]) -> list:
-        assert callable(func)
-        assert isinstance(targets, list)
-        return [func(target) for target in targets]
-
-    def __enter__(self) -> "MockPool":
-        return self
-
-    def __exit__(self, exc_type: Any, exc_val: Exception, exc_tb: Any) -> None:  # noqa
-        pass
 
 
 @contextmanager
@@ -55,3 +36,26 @@ def make_temp_file(
     finally:
         if clean and os.path.isfile(temp_file):
             os.remove(temp_file)
+
+
+def git(repo: str, *args: str) -> str:
+    """在仓库中执行git命令，不依赖全局的用户配置"""
+    return subprocess.run(
+        ["git", "-c", "user.name=plum", "-c", "user.email=plum@example.com", "-c", "commit.gpgsign=false", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def make_repository(path: str) -> str:
+    """创建一个有远程仓库的git仓库，返回仓库路径"""
+    origin = os.path.join(path, "origin")
+    os.makedirs(origin)
+    git(origin, "init", "-q", "-b", "master")
+    git(origin, "commit", "-q", "--allow-empty", "-m", "init")
+    git(origin, "config", "receive.denyCurrentBranch", "ignore")
+    repo = os.path.join(path, "repo")
+    git(path, "clone", "-q", origin, repo)
+    return repo
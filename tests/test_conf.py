@@ -47,7 +47,7 @@ class TestGitCommand(unittest.TestCase):
         assert self.g.STASH_POP == "git stash pop --index %s"
 
     def test_stash_save(self) -> None:
-        assert self.g.STASH_SAVE == 'git stash save "%s"'
+        assert self.g.STASH_SAVE == "git stash save %s"
 
     def test_status_default(self) -> None:
         assert self.g.STATUS_DEFAULT == "git status"
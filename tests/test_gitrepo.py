@@ -10,197 +10,220 @@
 #=============================================================================
 """
 
+import json
 import os
+import threading
+from collections.abc import Iterator
+from pathlib import Path
 from unittest import mock
 
 import pytest
 
-from plum_tools.gitrepo import check_project, check_projects, find_git_project_for_python, main
-from tests.common import MockPool
+from plum_tools.conf import GITREPO_DETAIL_LIMIT, GITREPO_IGNORE, GITREPO_WORKERS
+from plum_tools.exceptions import RunCmdError
+from plum_tools.gitrepo import (
+    TABLE_FIELDS,
+    check_project,
+    check_project_drift,
+    check_projects,
+    drift_projects,
+    find_git_project_for_python,
+    format_drift,
+    iter_check_projects,
+    main,
+    make_check,
+    to_record,
+    watch_projects,
+)
+from plum_tools.utils.drift import BranchDrift
+from plum_tools.utils.git import RepoStatus, format_status
+from plum_tools.utils.gitmeta import STATE_CLEAN, STATE_DIRTY, STATE_UNKNOWN, QuickStatus
+from plum_tools.utils.repoindex import RepositoryIndex
+from plum_tools.utils.watcher import BaseWatcher, PollingWatcher
+from tests.common import git, make_repository, make_temp_dir
+
+
+def make_repositories(root: str) -> None:
+    for name in ("1", "2", "4", "5", "4/6"):
+        os.makedirs(os.path.join(root, name, ".git"))
+    os.makedirs(os.path.join(root, "3", "node_modules", "7", ".git"))
+
+
+def test_find_git_project_for_python() -> None:
+    with make_temp_dir() as temp_dir:
+        make_repositories(temp_dir)
+
+        result = sorted(find_git_project_for_python(temp_dir))
+        assert result == [os.path.join(temp_dir, name) for name in ("1", "2", "4", "5")]
 
+        result = sorted(find_git_project_for_python(temp_dir, nested=True, ignore=[]))
+        assert result == [os.path.join(temp_dir, name) for name in ("1", "2", "3/node_modules/7", "4", "4/6", "5")]
 
-# @mock.patch("builtins.os")
-@mock.patch(
-    "plum_tools.gitrepo.check_is_git_repository",
-    side_effect=[True, True, False, True, True],
+
+def summary(result: dict) -> dict:
+    return {key: result[key] for key in ("path", "status", "output") if key in result}
+
+
+@pytest.mark.parametrize(
+    "status, stash, result",
+    [
+        (RepoStatus("/tmp", "master", changed=[(".M", "a.txt")]), True, True),
+        (RepoStatus("/tmp", "master", untracked=["a.txt"]), False, True),
+        (RepoStatus("/tmp", "master", upstream="origin/master", behind=1), False, True),
+        (RepoStatus("/tmp", "master", stash=1), True, True),
+        (RepoStatus("/tmp", "master", stash=1), False, False),
+        (RepoStatus("/tmp", "master"), True, False),
+    ],
 )
-def test_find_git_project_for_python(mock_check: mock.MagicMock) -> None:
-    mock_os_result = [(f"/tmp/{i + 1}", None, None) for i in range(5)]
-
-    with mock.patch("plum_tools.gitrepo.os") as mock_os:
-        mock_os.walk.return_value = mock_os_result
-        result = list(find_git_project_for_python("/tmp"))
-        assert result == ["/tmp/1", "/tmp/2", "/tmp/4", "/tmp/5"]
-    mock_os.walk.assert_called_once_with("/tmp")
-    mock_check.assert_has_calls(
-        [
-            mock.call("/tmp/1"),
-            mock.call("/tmp/2"),
-            mock.call("/tmp/3"),
-            mock.call("/tmp/4"),
-            mock.call("/tmp/5"),
-        ]
-    )
+def test_check_project(status: RepoStatus, stash: bool, result: bool) -> None:
+    with mock.patch("plum_tools.gitrepo.get_repository_status", return_value=status) as mock_status:
+        expected = {"path": "/tmp", "status": result}
+        if result:
+            expected["output"] = format_status(status)
+        actual = check_project("/tmp", stash)
+        assert summary(actual) == expected
+        assert actual["repo"] is status
+        assert actual["latency"] >= 0
+    mock_status.assert_called_once_with("/tmp", ignored=False, limit=GITREPO_DETAIL_LIMIT)
 
 
-def test_check_project_with_modify() -> None:
+def test_check_project_with_broken_repository() -> None:
     with mock.patch(
-        "plum_tools.gitrepo.check_repository_modify_status",
-        return_value=(True, "test1"),
-    ) as mock_modify:
-        result = check_project("/tmp")
-        assert result == {
-            "path": "/tmp",
-            "status": True,
-            "output": "test1",
-        }
-        mock_modify.assert_called_with("/tmp")
-    with (
-        mock.patch(
-            "plum_tools.gitrepo.check_repository_modify_status",
-            return_value=(False, "test1"),
-        ) as mock_modify,
-        mock.patch("plum_tools.gitrepo.check_repository_stash", return_value=(True, "test2")) as mock_stash,
-    ):
-        result = check_project("/tmp")
-        assert result == {
-            "path": "/tmp",
-            "status": True,
-            "output": "test2",
-        }
-        mock_modify.assert_called_with("/tmp")
-        mock_stash.assert_called_with("/tmp")
-    with (
-        mock.patch(
-            "plum_tools.gitrepo.check_repository_modify_status",
-            return_value=(False, "test1"),
-        ) as mock_modify,
-        mock.patch("plum_tools.gitrepo.check_repository_stash", return_value=(False, "test2")) as mock_stash,
+        "plum_tools.gitrepo.get_repository_status",
+        side_effect=RunCmdError("run `git status` fail", "", "fatal: not a git repository"),
     ):
         result = check_project("/tmp")
-        assert result == {
-            "path": "/tmp",
-            "status": False,
-        }
-        mock_modify.assert_called_with("/tmp")
-        mock_stash.assert_called_with("/tmp")
+    assert summary(result) == {"path": "/tmp", "status": True, "output": "fatal: not a git repository"}
+    assert result["error"] == "fatal: not a git repository"
+    assert to_record(result)["state"] == "error"
 
 
-@mock.patch(
-    "plum_tools.gitrepo.check_is_git_repository",
-    side_effect=[True, True, False, True, True],
+@pytest.mark.parametrize(
+    "quick, stash, detail, result, run_git",
+    [
+        (QuickStatus(STATE_CLEAN), True, True, {"path": "/tmp", "status": False}, False),
+        (QuickStatus(STATE_CLEAN, stash=1), False, True, {"path": "/tmp", "status": False}, False),
+        (QuickStatus(STATE_DIRTY), True, False, {"path": "/tmp", "status": True, "output": ""}, False),
+        (QuickStatus(STATE_DIRTY), True, True, {"path": "/tmp", "status": False}, True),
+        (QuickStatus(STATE_CLEAN, stash=1), True, True, {"path": "/tmp", "status": False}, True),
+        (QuickStatus(STATE_UNKNOWN), True, False, {"path": "/tmp", "status": False}, True),
+    ],
 )
-def test_check_projects(mock_check: mock.MagicMock, capsys: pytest.CaptureFixture) -> None:
-    mock_os_result = [(f"/tmp/{i + 1}", None, None) for i in range(5)]
-
+def test_check_project_fast(quick: QuickStatus, stash: bool, detail: bool, result: dict, run_git: bool) -> None:
+    status = RepoStatus("/tmp", "master", ignored=["build/"])
     with (
-        mock.patch("plum_tools.gitrepo.Pool", return_value=MockPool()) as mock_pool,
-        mock.patch("plum_tools.gitrepo.os") as mock_os,
-        mock.patch(
-            "plum_tools.gitrepo.check_repository_modify_status",
-            side_effect=[
-                (True, "test1"),
-                (True, "test2"),
-                (False, "test3"),
-                (False, "test4"),
-            ],
-        ) as mock_modify,
-        mock.patch(
-            "plum_tools.gitrepo.check_repository_stash",
-            side_effect=[(True, "test5"), (False, "test6")],
-        ) as mock_stash,
+        mock.patch("plum_tools.gitrepo.quick_status", return_value=quick),
+        mock.patch("plum_tools.gitrepo.get_repository_status", return_value=status) as mock_status,
+        mock.patch("plum_tools.gitrepo.record_clean") as mock_record,
     ):
-        mock_os.walk.return_value = mock_os_result
-        check_projects(["/tmp"], True)
-    mock_pool.assert_called_once_with(processes=100)
-    mock_os.walk.assert_called_once_with("/tmp")
-    mock_check.assert_has_calls(
-        [
-            mock.call("/tmp/1"),
-            mock.call("/tmp/2"),
-            mock.call("/tmp/3"),
-            mock.call("/tmp/4"),
-            mock.call("/tmp/5"),
-        ]
-    )
-    mock_modify.assert_has_calls(
-        [
-            mock.call("/tmp/1"),
-            mock.call("/tmp/2"),
-            mock.call("/tmp/4"),
-            mock.call("/tmp/5"),
-        ]
-    )
-    mock_stash.assert_has_calls([mock.call("/tmp/4"), mock.call("/tmp/5")])
+        assert summary(check_project("/tmp", stash, fast=True, detail=detail)) == result
+    assert mock_status.called is run_git
+    if run_git:
+        mock_status.assert_called_once_with("/tmp", ignored=True, limit=GITREPO_DETAIL_LIMIT)
+        mock_record.assert_called_once_with("/tmp", ["build/"])
+        assert status.ignored == []
 
-    captured = capsys.readouterr()
-    assert "/tmp/1" in captured.out
-    assert "/tmp/2" in captured.out
-    assert "/tmp/3" not in captured.out
-    assert "/tmp/4" in captured.out
-    assert "/tmp/5" not in captured.out
-    assert "test5" in captured.out
 
+def test_to_record() -> None:
+    repo = RepoStatus("/tmp", "master", "abc", "origin/master", 1, 2, [(".M", "a")], ["b", "c"], stash=3)
+    item = {"path": "/tmp", "status": True, "repo": repo, "error": None, "latency": 0.0123456}
 
-@mock.patch(
-    "plum_tools.gitrepo.check_is_git_repository",
-    side_effect=[True, True, False, True, True],
-)
-def test_check_projects_with_not_detail(mock_check: mock.MagicMock, capsys: pytest.CaptureFixture) -> None:
-    mock_os_result = [(f"/tmp/{i + 1}", None, None) for i in range(5)]
+    assert to_record(item) == {
+        "path": "/tmp",
+        "state": "modified",
+        "error": None,
+        "latency_ms": 12.346,
+        "branch": "master",
+        "upstream": "origin/master",
+        "ahead": 1,
+        "behind": 2,
+        "dirty": 1,
+        "untracked": 2,
+        "stash": 3,
+    }
+    # 不执行git命令确定有改动时没有详细信息
+    assert to_record({"path": "/tmp", "status": True, "latency": 0})["state"] == "modified"
 
-    with (
-        mock.patch("plum_tools.gitrepo.Pool", return_value=MockPool()) as mock_pool,
-        mock.patch("plum_tools.gitrepo.os") as mock_os,
-        mock.patch(
-            "plum_tools.gitrepo.check_repository_modify_status",
-            side_effect=[
-                (True, "test1"),
-                (True, "test2"),
-                (False, "test3"),
-                (False, "test4"),
+
+@pytest.mark.parametrize("fmt", ["ndjson", "json"])
+def test_check_projects_structured_output(fmt: str, capsys: pytest.CaptureFixture) -> None:
+    with make_temp_dir() as temp_dir:
+        make_repositories(temp_dir)
+        with mock.patch("plum_tools.gitrepo.get_repository_status", side_effect=mock_repository_status):
+            check_projects([temp_dir], False, stash=True, workers=2, fmt=fmt)
+
+    out = capsys.readouterr().out
+    records = [json.loads(line) for line in out.splitlines()] if fmt == "ndjson" else json.loads(out)
+    states = {os.path.basename(record["path"]): record["state"] for record in records}
+    assert states == {"1": "modified", "2": "modified", "4": "modified", "5": "clean"}
+    assert all(record["branch"] == "master" for record in records)
+
+
+def test_check_projects_table_output(capsys: pytest.CaptureFixture) -> None:
+    with make_temp_dir() as temp_dir:
+        make_repositories(temp_dir)
+        with mock.patch("plum_tools.gitrepo.get_repository_status", side_effect=mock_repository_status):
+            check_projects([temp_dir], False, workers=2, fmt="table")
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == list(TABLE_FIELDS)
+    assert len(lines) == 5
+
+
+def mock_repository_status(path: str, ignored: bool = False, limit: int | None = None) -> RepoStatus:
+    name = os.path.basename(path)
+    if name in ("1", "2"):
+        return RepoStatus(path, "master", changed=[(".M", f"test{name}")])
+    return RepoStatus(path, "master", stash=1 if name == "4" else 0)
+
+
+@pytest.mark.parametrize("detail", [True, False])
+def test_check_projects(detail: bool, capsys: pytest.CaptureFixture) -> None:
+    with make_temp_dir() as temp_dir:
+        make_repositories(temp_dir)
+        with mock.patch(
+            "plum_tools.gitrepo.get_repository_status",
+            side_effect=mock_repository_status,
+        ) as mock_status:
+            check_projects([temp_dir], detail, stash=True, workers=2)
+        mock_status.assert_has_calls(
+            [
+                mock.call(os.path.join(temp_dir, name), ignored=False, limit=GITREPO_DETAIL_LIMIT)
+                for name in ("1", "2", "4", "5")
             ],
-        ) as mock_modify,
-        mock.patch(
-            "plum_tools.gitrepo.check_repository_stash",
-            side_effect=[(True, "test5"), (False, "test6")],
-        ) as mock_stash,
-    ):
-        mock_os.walk.return_value = mock_os_result
-        check_projects(["/tmp"], False)
-    mock_pool.assert_called_once_with(processes=100)
-    mock_os.walk.assert_called_once_with("/tmp")
-    mock_check.assert_has_calls(
-        [
-            mock.call("/tmp/1"),
-            mock.call("/tmp/2"),
-            mock.call("/tmp/3"),
-            mock.call("/tmp/4"),
-            mock.call("/tmp/5"),
-        ]
-    )
-    mock_modify.assert_has_calls(
-        [
-            mock.call("/tmp/1"),
-            mock.call("/tmp/2"),
-            mock.call("/tmp/4"),
-            mock.call("/tmp/5"),
-        ]
-    )
-    mock_stash.assert_has_calls([mock.call("/tmp/4"), mock.call("/tmp/5")])
+            any_order=True,
+        )
 
     captured = capsys.readouterr()
-    assert "/tmp/1" in captured.out
-    assert "/tmp/2" in captured.out
-    assert "/tmp/3" not in captured.out
-    assert "/tmp/4" in captured.out
-    assert "/tmp/5" not in captured.out
-    assert "test5" not in captured.out
+    assert os.path.join(temp_dir, "1") in captured.out
+    assert os.path.join(temp_dir, "2") in captured.out
+    assert os.path.join(temp_dir, "3") not in captured.out
+    assert os.path.join(temp_dir, "4") in captured.out
+    assert os.path.join(temp_dir, "5") not in captured.out
+    assert ("## stash 1" in captured.out) is detail
+    assert ("test1" in captured.out) is detail
 
 
 def test_main() -> None:
     mock_parser = mock.Mock()
-    mock_args = mock.Mock(path="/tmp/test111", detail=True, stash=False)
+    mock_args = mock.Mock(
+        path="/tmp/test111",
+        detail=True,
+        stash=False,
+        nested=False,
+        ignore=["node_modules"],
+        no_index=True,
+        fast=False,
+        jobs=4,
+        format="text",
+        watch=False,
+        drift=False,
+        mirror=None,
+        profile=0,
+        trace=None,
+        limit=20,
+        full=False,
+    )
     mock_parser.parse_args.return_value = mock_args
     with (
         mock.patch("plum_tools.gitrepo.get_base_parser", return_value=mock_parser) as mock_argparse,
@@ -238,7 +261,404 @@ def test_main() -> None:
                     default=False,
                     help="display stash details",
                 ),
+                mock.call(
+                    "--nested",
+                    action="store_true",
+                    required=False,
+                    dest="nested",
+                    default=False,
+                    help="continue searching for repositories nested inside a repository",
+                ),
+                mock.call(
+                    "--ignore",
+                    action="store",
+                    required=False,
+                    dest="ignore",
+                    nargs="*",
+                    default=list(GITREPO_IGNORE),
+                    help="directory names that are not searched",
+                ),
+                mock.call(
+                    "--rebuild-index",
+                    action="store_true",
+                    required=False,
+                    dest="rebuild_index",
+                    default=False,
+                    help="ignore the repository index and walk every directory again",
+                ),
+                mock.call(
+                    "--no-index",
+                    action="store_true",
+                    required=False,
+                    dest="no_index",
+                    default=False,
+                    help="do not read or update the repository index",
+                ),
+                mock.call(
+                    "--fast",
+                    action="store_true",
+                    required=False,
+                    dest="fast",
+                    default=False,
+                    help="read .git metadata directly and only run git when the state cannot be decided",
+                ),
+                mock.call(
+                    "-j",
+                    "--jobs",
+                    action="store",
+                    required=False,
+                    type=int,
+                    dest="jobs",
+                    default=GITREPO_WORKERS,
+                    help="number of repositories checked at the same time",
+                ),
+                mock.call(
+                    "-f",
+                    "--format",
+                    action="store",
+                    required=False,
+                    dest="format",
+                    choices=("text", "json", "ndjson", "csv", "table"),
+                    default="text",
+                    help="output format, structured formats stream one record per repository",
+                ),
+                mock.call(
+                    "-w",
+                    "--watch",
+                    action="store_true",
+                    required=False,
+                    dest="watch",
+                    default=False,
+                    help="keep running and re-check repositories whose files change",
+                ),
+                mock.call(
+                    "--poll",
+                    action="store_true",
+                    required=False,
+                    dest="poll",
+                    default=False,
+                    help="watch by polling file mtimes instead of inotify",
+                ),
+                mock.call(
+                    "--drift",
+                    action="store_true",
+                    required=False,
+                    dest="drift",
+                    default=False,
+                    help="compare every local branch with its upstream using local refs only, without fetching",
+                ),
+                mock.call(
+                    "--mirror",
+                    action="store",
+                    required=False,
+                    dest="mirror",
+                    default=None,
+                    help="directory of bare mirrors (<name>.git) to compare branches with, implies --drift",
+                ),
+                mock.call(
+                    "--profile",
+                    action="store",
+                    required=False,
+                    type=int,
+                    dest="profile",
+                    default=0,
+                    help="print phase timings, the N slowest repositories and a latency histogram to stderr",
+                ),
+                mock.call(
+                    "--trace",
+                    action="store",
+                    required=False,
+                    dest="trace",
+                    default=None,
+                    help="write a Chrome trace-event JSON file with the timing of every repository",
+                ),
+                mock.call(
+                    "--limit",
+                    action="store",
+                    required=False,
+                    type=int,
+                    dest="limit",
+                    default=GITREPO_DETAIL_LIMIT,
+                    help="maximum changed and untracked paths shown per repository, the rest are only counted",
+                ),
+                mock.call(
+                    "--full",
+                    action="store_true",
+                    required=False,
+                    dest="full",
+                    default=False,
+                    help="stream the complete status of every modified repository, implies --detail",
+                ),
             ]
         )
         mock_parser.parse_args.assert_called_once_with()
-        mock_check.assert_called_once_with("/tmp/test111", True, False)
+        mock_check.assert_called_once_with(
+            "/tmp/test111", True, False, False, ["node_modules"], None, False, 4, "text", None, 20, False
+        )
+
+
+def test_main_with_index(tmp_path: Path) -> None:
+    index_path = str(tmp_path / "index.json")
+    with (
+        mock.patch("plum_tools.gitrepo.PathConfig", mock.Mock(GITREPO_INDEX_PATH=index_path)),
+        mock.patch("plum_tools.gitrepo.check_projects") as mock_check,
+        mock.patch("sys.argv", ["gitrepo", "-p", str(tmp_path), "--ignore", "node_modules", "--rebuild-index"]),
+    ):
+        main()
+    index = mock_check.call_args[0][5]
+    assert isinstance(index, RepositoryIndex)
+    mock_check.assert_called_once_with(
+        [str(tmp_path)],
+        False,
+        False,
+        False,
+        ["node_modules"],
+        index,
+        False,
+        GITREPO_WORKERS,
+        "text",
+        None,
+        GITREPO_DETAIL_LIMIT,
+        False,
+    )
+    assert os.path.exists(index_path)
+
+
+@pytest.mark.parametrize(
+    "drift, text",
+    [
+        (BranchDrift("master", "a", "refs/remotes/origin/master", 0, 0), "master...origin/master"),
+        (BranchDrift("dev", "a", "refs/remotes/origin/dev", 2, 1), "dev...origin/dev [ahead 2, behind 1]"),
+        (BranchDrift("dev", "a", "refs/heads/master", 0, 3), "dev...master [behind 3]"),
+        (BranchDrift("dev", "a", mirror_ahead=1, mirror_behind=0), "dev mirror [ahead 1]"),
+        (BranchDrift("dev", "a", "refs/remotes/origin/dev", error="upstream gone"), "dev...origin/dev (upstream gone)"),
+    ],
+)
+def test_format_drift(drift: BranchDrift, text: str) -> None:
+    assert format_drift(drift) == text
+
+
+def test_drift_projects(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    clean = make_repository(str(tmp_path / "clean"))
+    ahead = make_repository(str(tmp_path / "ahead"))
+    with open(os.path.join(ahead, "a.txt"), "w", encoding="utf-8") as f:
+        f.write("a")
+    # 工作区的改动不影响分支差异
+    assert not check_project_drift(ahead)["status"]
+    git(ahead, "add", "a.txt")
+    git(ahead, "commit", "-q", "-m", "a")
+
+    drift_projects([str(tmp_path / "clean"), ahead], workers=2)
+    out = capsys.readouterr().out
+    assert ahead in out and "master...origin/master [ahead 1]" in out
+    assert clean not in out
+
+    drift_projects([clean, ahead], workers=2, fmt="ndjson")
+    records = sorted((json.loads(line) for line in capsys.readouterr().out.splitlines()), key=lambda r: r["path"])
+    assert [(r["path"], r["branch"], r["ahead"], r["behind"]) for r in records] == [
+        (ahead, "master", 1, 0),
+        (clean, "master", 0, 0),
+    ]
+
+
+def test_drift_projects_mirror_not_found(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    repo = make_repository(str(tmp_path / "repo"))
+    mirrors = tmp_path / "mirrors"
+    mirrors.mkdir()
+
+    item = check_project_drift(repo, str(mirrors))
+    # 没有镜像只按仓库提示一次，不算作分支不一致
+    assert item["mirror_error"] == "mirror not found"
+    assert not item["status"]
+    assert [(drift.branch, drift.mirror_ahead, drift.error) for drift in item["branches"]] == [("master", None, None)]
+
+    drift_projects([repo], str(mirrors))
+    assert capsys.readouterr().out.count("mirror not found") == 1
+
+    drift_projects([repo], str(mirrors), fmt="ndjson")
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(r["branch"], r["mirror_error"]) for r in records] == [(None, "mirror not found"), ("master", None)]
+
+
+def test_main_drift(tmp_path: Path) -> None:
+    with (
+        mock.patch("plum_tools.gitrepo.drift_projects") as mock_drift,
+        mock.patch("sys.argv", ["gitrepo", "-p", str(tmp_path), "--no-index", "--mirror", "/data/mirrors"]),
+    ):
+        main()
+    mock_drift.assert_called_once_with(
+        [str(tmp_path)], "/data/mirrors", False, list(GITREPO_IGNORE), None, GITREPO_WORKERS, "text", None
+    )
+
+
+def test_main_profile(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    make_repositories(str(tmp_path))
+    trace = str(tmp_path / "trace.json")
+    with (
+        mock.patch("plum_tools.gitrepo.get_repository_status", side_effect=mock_repository_status),
+        mock.patch(
+            "sys.argv",
+            ["gitrepo", "-p", str(tmp_path), "--no-index", "-f", "ndjson", "--profile", "2", "--trace", trace],
+        ),
+    ):
+        main()
+
+    captured = capsys.readouterr()
+    # 耗时输出到标准错误，标准输出中只有结构化数据
+    assert len([json.loads(line) for line in captured.out.splitlines()]) == 4
+    assert captured.err.startswith("phases: ")
+    assert "slowest 2:" in captured.err and "histogram:" in captured.err
+    with open(trace, encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    names = [event["name"] for event in events]
+    assert names.count("repo") == names.count("status") == 4
+    assert names.count("discovery") == 1
+
+
+@pytest.mark.parametrize("full", [False, True])
+def test_check_projects_limit_details(full: bool, tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    repo = make_repository(str(tmp_path))
+    for i in range(5):
+        with open(os.path.join(repo, f"{i}.txt"), "w", encoding="utf-8") as f:
+            f.write(str(i))
+
+    check_projects([repo], True, workers=1, limit=2, full=full)
+
+    out = capsys.readouterr().out
+    assert ("4.txt" in out) is full
+    assert ("## ... 3 more untracked" in out) is not full
+
+    check_projects([repo], False, workers=1, fmt="ndjson", limit=2, full=full)
+    assert json.loads(capsys.readouterr().out)["untracked"] == 5
+
+
+def test_iter_check_projects_streams_results() -> None:
+    released = threading.Event()
+
+    def check(path: str) -> dict:
+        # 第一个仓库检查得很慢，不会阻塞其他仓库的结果
+        if path == "slow":
+            released.wait(5)
+        return {"path": path, "status": False}
+
+    results = iter_check_projects(iter(["slow", "a", "b"]), check, 3)
+    first = [next(results)["path"], next(results)["path"]]
+    released.set()
+
+    assert sorted(first) == ["a", "b"]
+    assert [item["path"] for item in results] == ["slow"]
+
+
+def test_iter_check_projects_raises_scan_error() -> None:
+    def targets() -> Iterator[str]:
+        yield "a"
+        raise OSError("scan failed")
+
+    with pytest.raises(OSError):
+        list(iter_check_projects(targets(), lambda path: {"path": path, "status": False}, 2))
+
+
+def test_check_projects_does_not_change_cwd(tmp_path: Path) -> None:
+    cwd = os.getcwd()
+    for name in ("a", "b"):
+        make_repository(str(tmp_path / name))
+    check_projects([str(tmp_path)], False, workers=4)
+
+    assert os.getcwd() == cwd
+
+
+class FakeWatcher(BaseWatcher):
+    def __init__(self, changes: list[set[str]]) -> None:
+        self.changes = changes
+        self.watched: dict[str, set[str]] = {}
+        self.added: list[str] = []
+        self.new_dirs: set[tuple[str, str]] = set()
+        self.closed = False
+
+    def add(self, key: str, path: str) -> None:
+        self.watched.setdefault(key, set()).add(path)
+        self.added.append(path)
+
+    def pop_new_dirs(self) -> set[tuple[str, str]]:
+        new_dirs, self.new_dirs = self.new_dirs, set()
+        return new_dirs
+
+    def wait(self, timeout: float | None = None) -> set[str]:
+        if timeout is None:
+            return self.changes.pop(0)
+        return set()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_watch_projects_prints_transitions(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    repos = [make_repository(str(tmp_path / name)) for name in ("a", "b")]
+    watcher = FakeWatcher([{repos[0]}, {repos[0], repos[1]}])
+    check = make_check(stash=False, fast=False, detail=False, fmt="text")
+
+    with open(os.path.join(repos[0], "new.txt"), "w", encoding="utf-8") as f:
+        f.write("new")
+    watch_projects(repos, check, False, watcher, workers=2, rounds=1)
+    lines = capsys.readouterr().out.splitlines()
+    # 第一次检查输出有改动的仓库，第一轮 a 没有变化不输出
+    assert len(lines) == 1 and repos[0] in lines[0]
+    assert os.path.join(repos[0], ".git") in watcher.watched[repos[0]]
+    assert watcher.closed
+
+    os.remove(os.path.join(repos[0], "new.txt"))
+    watcher.closed = False
+    watch_projects(repos, check, False, FakeWatcher([{repos[0]}]), workers=2, rounds=1)
+    lines = capsys.readouterr().out.splitlines()
+    # 第一次检查时 a 已经是干净的，之后没有状态变化
+    assert lines == []
+
+
+def test_watch_projects_watches_new_dirs(tmp_path: Path) -> None:
+    repo = make_repository(str(tmp_path))
+    check = make_check(stash=False, fast=False, detail=False, fmt="text")
+
+    class CreatingWatcher(FakeWatcher):
+        def wait(self, timeout: float | None = None) -> set[str]:
+            if timeout is None:
+                os.makedirs(os.path.join(repo, "src", "lib"))
+                self.new_dirs.add((repo, os.path.join(repo, "src")))
+                self.added.clear()
+            return super().wait(timeout)
+
+    watcher = CreatingWatcher([{repo}])
+    watch_projects([repo], check, False, watcher, rounds=1)
+
+    # 有变化时只监听新建的目录，不重新遍历整个仓库
+    assert sorted(watcher.added) == [os.path.join(repo, "src"), os.path.join(repo, "src", "lib")]
+
+
+def test_watch_projects_reports_state_changes(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    repo = make_repository(str(tmp_path))
+    check = make_check(stash=False, fast=False, detail=False, fmt="ndjson")
+
+    class ChangingWatcher(FakeWatcher):
+        def wait(self, timeout: float | None = None) -> set[str]:
+            if timeout is None:
+                with open(os.path.join(repo, "new.txt"), "w", encoding="utf-8") as f:
+                    f.write("new")
+            return super().wait(timeout)
+
+    watch_projects([repo], check, False, ChangingWatcher([{repo}]), fmt="ndjson", rounds=1)
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [record["state"] for record in records] == ["clean", "modified"]
+    assert records[1]["untracked"] == 1
+
+
+def test_main_watch(tmp_path: Path) -> None:
+    repo = make_repository(str(tmp_path))
+    with (
+        mock.patch("plum_tools.gitrepo.watch_projects", side_effect=KeyboardInterrupt) as mock_watch,
+        mock.patch("sys.argv", ["gitrepo", "-p", str(tmp_path), "--no-index", "--watch", "--poll"]),
+    ):
+        main()
+    targets, _, detail, watcher = mock_watch.call_args[0][:4]
+    assert targets == [os.path.join(str(tmp_path), "origin"), repo]
+    assert detail is False
+    assert isinstance(watcher, PollingWatcher)
@@ -10,31 +10,80 @@
 #=============================================================================
 """
 
+import json
+import os
+import shlex
+import shutil
+from pathlib import Path
 from unittest import mock
 
 import pytest
 
-from plum_tools.conf import STASH_UUID, GitCommand
+from plum_tools.conf import GITSTASH_WORKERS, STASH_UUID, GitCommand
 from plum_tools.exceptions import RunCmdError
-from plum_tools.gitstash import GitCheckoutStash, main
+from plum_tools.gitstash import GitCheckoutStash, main, switch_repositories, switch_repository
+from plum_tools.utils.git import RepoStatus
+from tests.common import git, make_repository
 
 
-def test_main() -> None:
+@pytest.mark.parametrize("head, branch", [(("test1", "abc"), "test1"), ((None, "abc"), "HEAD")])
+def test_main(head: tuple, branch: str) -> None:
     mock_parser = mock.Mock()
     mock_stash_instance = mock.Mock()
-    mock_args = mock.Mock(branch="test")
+    mock_args = mock.Mock(branch="test", repos=None, worktree=False, link=None)
     mock_parser.parse_args.return_value = mock_args
+    mock_meta = mock.Mock()
+    mock_meta.read_head.return_value = head
     with (
         mock.patch("plum_tools.gitstash.get_base_parser", return_value=mock_parser) as mock_argparse,
-        mock.patch("plum_tools.gitstash.get_current_branch_name", return_value="master") as mock_current_branch,
+        mock.patch("plum_tools.gitstash.GitMeta.discover", return_value=mock_meta) as mock_discover,
         mock.patch("plum_tools.gitstash.GitCheckoutStash", return_value=mock_stash_instance) as mock_git_stash,
     ):
         main()
         mock_argparse.assert_called_once_with()
-        mock_parser.add_argument.assert_called_once_with(dest="branch", action="store", help="specify branch")
+        mock_parser.add_argument.assert_has_calls(
+            [
+                mock.call(dest="branch", action="store", help="specify branch"),
+                mock.call(
+                    "--repos",
+                    action="store",
+                    required=False,
+                    dest="repos",
+                    nargs="+",
+                    default=None,
+                    help="switch every repository in these directories at the same time",
+                ),
+                mock.call(
+                    "-j",
+                    "--jobs",
+                    action="store",
+                    required=False,
+                    type=int,
+                    dest="jobs",
+                    default=GITSTASH_WORKERS,
+                    help="number of repositories switched at the same time",
+                ),
+                mock.call(
+                    "--worktree",
+                    action="store_true",
+                    required=False,
+                    dest="worktree",
+                    default=False,
+                    help="switch by reusing a cached git worktree of the branch and print its path",
+                ),
+                mock.call(
+                    "--link",
+                    action="store",
+                    required=False,
+                    dest="link",
+                    default=None,
+                    help="symlink to point at the worktree of the branch, implies --worktree",
+                ),
+            ]
+        )
         mock_parser.parse_args.assert_called_once_with()
-        mock_current_branch.assert_called_once_with()
-        mock_git_stash.assert_called_once_with("master", "test")
+        mock_discover.assert_called_once_with(os.getcwd())
+        mock_git_stash.assert_called_once_with(branch, "test")
         mock_stash_instance.checkout.assert_called_once_with()
 
 
@@ -42,12 +91,14 @@ def test_git_checkout_stash_skips_checkout_when_branch_matches() -> None:
     stash = GitCheckoutStash("master", "master")
 
     with (
+        mock.patch("plum_tools.gitstash.get_repository_status") as mock_status,
         mock.patch.object(stash, "_stash") as mock_stash,
         mock.patch.object(stash, "_checkout") as mock_checkout,
         mock.patch.object(stash, "_apply") as mock_apply,
     ):
         stash.checkout()
 
+    mock_status.assert_not_called()
     mock_stash.assert_not_called()
     mock_checkout.assert_not_called()
     mock_apply.assert_not_called()
@@ -55,108 +106,316 @@ def test_git_checkout_stash_skips_checkout_when_branch_matches() -> None:
 
 def test_git_checkout_stash_stashes_when_repository_has_changes() -> None:
     stash = GitCheckoutStash("master", "feature")
-    expected_cmd = GitCommand.STASH_SAVE % f"master-{STASH_UUID}"
+    expected_cmd = GitCommand.STASH_SAVE % shlex.quote(f"master-{STASH_UUID}")
+
+    with mock.patch("plum_tools.gitstash.run_git") as mock_run_git:
+        assert stash._stash(RepoStatus("/tmp", "master", omitted_changed=1))
+
+    mock_run_git.assert_called_once_with(expected_cmd, stash._current_path)
 
-    with (
-        mock.patch("plum_tools.gitstash.check_repository_modify_status", return_value=(True, "M test")) as mock_status,
-        mock.patch("plum_tools.gitstash.run_cmd") as mock_run_cmd,
-    ):
-        stash._stash()
 
-    mock_status.assert_called_once_with(stash._current_path)
-    mock_run_cmd.assert_called_once_with(expected_cmd)
+def test_git_checkout_stash_quotes_branch_in_stash_message(tmp_path: Path) -> None:
+    repo = make_repository(str(tmp_path))
+    branch = 'fix-"quote"'
+    git(repo, "checkout", "-q", "-b", branch)
+    git(repo, "branch", "feature")
+    with open(os.path.join(repo, "a.txt"), "w", encoding="utf-8") as f:
+        f.write("a")
+    git(repo, "add", "a.txt")
 
+    GitCheckoutStash(branch, "feature", repo).checkout()
 
-def test_git_checkout_stash_does_not_stash_clean_repository() -> None:
+    assert git(repo, "stash", "list").strip().endswith(f"On {branch}: {branch}-{STASH_UUID}")
+
+
+@pytest.mark.parametrize(
+    "status",
+    [
+        RepoStatus("/tmp", "master"),
+        RepoStatus("/tmp", "master", ahead=1),
+        RepoStatus("/tmp", "master", untracked=["a.txt"]),
+    ],
+)
+def test_git_checkout_stash_does_not_stash_clean_repository(status: RepoStatus) -> None:
     stash = GitCheckoutStash("master", "feature")
 
-    with (
-        mock.patch("plum_tools.gitstash.check_repository_modify_status", return_value=(False, "")) as mock_status,
-        mock.patch("plum_tools.gitstash.run_cmd") as mock_run_cmd,
-    ):
-        stash._stash()
+    with mock.patch("plum_tools.gitstash.run_git") as mock_run_git:
+        assert not stash._stash(status)
 
-    mock_status.assert_called_once_with(stash._current_path)
-    mock_run_cmd.assert_not_called()
+    mock_run_git.assert_not_called()
 
 
-def test_git_checkout_stash_applies_matching_stash_entry() -> None:
+def test_git_checkout_stash_finds_stashes_by_message() -> None:
     stash = GitCheckoutStash("master", "feature")
-    stash_out = "stash@{0}: On feature-plum123456789987654321plum\nstash@{1}: On master-other\n"
+    messages = [
+        f"On feature: feature-{STASH_UUID}",
+        f"On hotfeature: hotfeature-{STASH_UUID}",
+        "WIP on master: abc init",
+        f"On feature: feature-{STASH_UUID}",
+    ]
 
-    with (
-        mock.patch("plum_tools.gitstash.check_repository_stash", return_value=(True, stash_out)) as mock_check_stash,
-        mock.patch("plum_tools.gitstash.run_cmd") as mock_run_cmd,
-    ):
-        stash._apply()
+    with mock.patch("plum_tools.gitstash.get_stash_messages", return_value=messages) as mock_messages:
+        stashes = stash._find_stashes()
 
-    mock_check_stash.assert_called_once_with(stash._current_path)
-    mock_run_cmd.assert_called_once_with(GitCommand.STASH_POP % "stash@{0}")
+    mock_messages.assert_called_once_with(stash._current_path)
+    # 同一个说明只保留最新的储藏
+    assert stashes == {f"feature-{STASH_UUID}": 0, f"hotfeature-{STASH_UUID}": 1, "abc init": 2}
 
 
-def test_git_checkout_stash_applies_only_latest_matching_stash_entry() -> None:
+@pytest.mark.parametrize("offset, ref", [(0, "stash@{1}"), (1, "stash@{2}")])
+def test_git_checkout_stash_applies_matching_stash_entry(offset: int, ref: str) -> None:
     stash = GitCheckoutStash("master", "feature")
-    stash_out = "\n".join(
-        [
-            "stash@{0}: On feature-plum123456789987654321plum",
-            "stash@{1}: On feature-plum123456789987654321plum",
-        ]
-    )
 
-    with (
-        mock.patch("plum_tools.gitstash.check_repository_stash", return_value=(True, stash_out)) as mock_check_stash,
-        mock.patch("plum_tools.gitstash.run_cmd") as mock_run_cmd,
-    ):
-        stash._apply()
+    with mock.patch("plum_tools.gitstash.run_git") as mock_run_git:
+        stash._apply(1, offset)
 
-    mock_check_stash.assert_called_once_with(stash._current_path)
-    mock_run_cmd.assert_called_once_with(GitCommand.STASH_POP % "stash@{0}")
+    mock_run_git.assert_called_once_with(GitCommand.STASH_POP % ref, stash._current_path)
+    assert stash.popped == ref
 
 
 def test_git_checkout_stash_ignores_missing_stash_entries() -> None:
     stash = GitCheckoutStash("master", "feature")
 
-    with (
-        mock.patch("plum_tools.gitstash.check_repository_stash", return_value=(False, "")) as mock_check_stash,
-        mock.patch("plum_tools.gitstash.run_cmd") as mock_run_cmd,
-    ):
-        stash._apply()
+    with mock.patch("plum_tools.gitstash.run_git") as mock_run_git:
+        stash._apply(None)
+
+    mock_run_git.assert_not_called()
+    assert stash.popped is None
+
 
-    mock_check_stash.assert_called_once_with(stash._current_path)
-    mock_run_cmd.assert_not_called()
+def test_git_checkout_stash_finds_stash_by_commit() -> None:
+    stash = GitCheckoutStash("master", "feature")
+    meta = mock.Mock()
+    meta.read_reflog.return_value = [("c", "On master: x"), ("b", "On feature: y"), ("a", "On feature: z")]
+
+    with mock.patch.object(stash, "_find_stashes") as mock_find_stashes:
+        # 按索引中记录的提交定位，不需要匹配储藏说明
+        assert stash._find_stash(meta, {"feature": "b"}) == 1
+    mock_find_stashes.assert_not_called()
+    meta.read_reflog.assert_called_once_with("refs/stash")
+
+    with mock.patch.object(stash, "_find_stashes", return_value={f"feature-{STASH_UUID}": 2}):
+        # 记录的储藏已经被删除，或者没有记录
+        assert stash._find_stash(meta, {"feature": "d"}) == 2
+        assert stash._find_stash(meta, {}) == 2
+        assert stash._find_stash(None, {"feature": "b"}) == 2
 
 
 def test_git_checkout_stash_checkout_runs_git_checkout() -> None:
     stash = GitCheckoutStash("master", "feature")
 
-    with mock.patch("plum_tools.gitstash.run_cmd") as mock_run_cmd:
+    with mock.patch("plum_tools.gitstash.run_git") as mock_run_git:
         stash._checkout()
 
-    mock_run_cmd.assert_called_once_with(GitCommand.GIT_CHECKOUT % "feature")
+    mock_run_git.assert_called_once_with(GitCommand.GIT_CHECKOUT % "feature", stash._current_path)
 
 
 def test_git_checkout_stash_runs_full_flow_when_switching_branch() -> None:
     stash = GitCheckoutStash("master", "feature")
+    status = RepoStatus("/tmp", "master")
 
     with (
-        mock.patch.object(stash, "_stash") as mock_stash,
+        mock.patch("plum_tools.gitstash.get_repository_status", return_value=status) as mock_status,
+        mock.patch("plum_tools.gitstash.GitMeta.discover", return_value=None),
+        mock.patch.object(stash, "_find_stash", return_value=0) as mock_find_stash,
+        mock.patch.object(stash, "_stash", return_value=True) as mock_stash,
         mock.patch.object(stash, "_checkout") as mock_checkout,
         mock.patch.object(stash, "_apply") as mock_apply,
     ):
         stash.checkout()
 
-    mock_stash.assert_called_once_with()
+    mock_status.assert_called_once_with(stash._current_path, limit=0)
+    mock_find_stash.assert_called_once_with(None, {})
+    mock_stash.assert_called_once_with(status)
     mock_checkout.assert_called_once_with()
-    mock_apply.assert_called_once_with()
+    mock_apply.assert_called_once_with(0, 1)
+
+
+def test_git_checkout_stash_round_trip(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    repo = make_repository(str(tmp_path))
+    with open(os.path.join(repo, "a.txt"), "w", encoding="utf-8") as f:
+        f.write("a")
+    git(repo, "add", "a.txt")
+    git(repo, "commit", "-q", "-m", "a")
+    git(repo, "branch", "feature")
+    os.makedirs(os.path.join(repo, "src"))
+    monkeypatch.chdir(os.path.join(repo, "src"))
+
+    def write(text: str) -> None:
+        with open(os.path.join(repo, "a.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def read() -> str:
+        with open(os.path.join(repo, "a.txt"), encoding="utf-8") as f:
+            return f.read()
+
+    write("master change")
+    GitCheckoutStash("master", "feature").checkout()
+    assert read() == "a"
+    write("feature change")
+    GitCheckoutStash("feature", "master").checkout()
+    assert read() == "master change"
+    assert git(repo, "rev-parse", "--abbrev-ref", "HEAD").strip() == "master"
+    GitCheckoutStash("master", "feature").checkout()
+    assert read() == "feature change"
+    assert git(repo, "stash", "list", "--format=%gs").splitlines() == [f"On master: master-{STASH_UUID}"]
+    with open(os.path.join(repo, ".git", "plum_tools", "stash.json"), encoding="utf-8") as f:
+        assert json.load(f) == {"master": git(repo, "rev-parse", "stash@{0}").strip()}
+
+
+def test_git_checkout_stash_pops_recorded_stash(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    repo = make_repository(str(tmp_path))
+    with open(os.path.join(repo, "a.txt"), "w", encoding="utf-8") as f:
+        f.write("a")
+    git(repo, "add", "a.txt")
+    git(repo, "commit", "-q", "-m", "a")
+    git(repo, "branch", "feature")
+    monkeypatch.chdir(repo)
+
+    with open(os.path.join(repo, "a.txt"), "w", encoding="utf-8") as f:
+        f.write("master change")
+    GitCheckoutStash("master", "feature").checkout()
+    # 其他储藏使用同样的说明，也不会被错误恢复
+    for i in range(3):
+        with open(os.path.join(repo, "a.txt"), "w", encoding="utf-8") as f:
+            f.write(str(i))
+        git(repo, "stash", "save", "-q", f"master-{STASH_UUID}")
+
+    with mock.patch("plum_tools.gitstash.get_stash_messages") as mock_messages:
+        GitCheckoutStash("feature", "master").checkout()
+    mock_messages.assert_not_called()
+    with open(os.path.join(repo, "a.txt"), encoding="utf-8") as f:
+        assert f.read() == "master change"
+    assert len(git(repo, "stash", "list").splitlines()) == 3
+    with open(os.path.join(repo, ".git", "plum_tools", "stash.json"), encoding="utf-8") as f:
+        assert json.load(f) == {}
+
+
+def test_git_checkout_stash_restores_stash_when_checkout_fails() -> None:
+    stash = GitCheckoutStash("master", "feature", "/tmp/git")
+
+    with (
+        mock.patch("plum_tools.gitstash.get_repository_status", return_value=RepoStatus("/tmp/git", "master")),
+        mock.patch("plum_tools.gitstash.GitMeta.discover", return_value=None),
+        mock.patch.object(stash, "_find_stash", return_value=None),
+        mock.patch.object(stash, "_stash", return_value=True),
+        mock.patch.object(stash, "_checkout", side_effect=RunCmdError("fail", "", "error")),
+        mock.patch("plum_tools.gitstash.run_git") as mock_run_git,
+    ):
+        with pytest.raises(RunCmdError):
+            stash.checkout()
+
+    mock_run_git.assert_called_once_with(GitCommand.STASH_POP % "stash@{0}", "/tmp/git")
+    assert not stash.stashed
+
+
+def test_git_checkout_stash_sidecar_error_does_not_mask_checkout_error(tmp_path: Path) -> None:
+    repo = make_repository(str(tmp_path))
+    stash = GitCheckoutStash("master", "feature", repo)
+    error = RunCmdError("fail", "", "error")
+
+    with (
+        mock.patch("plum_tools.gitstash.get_repository_status", return_value=RepoStatus(repo, "master")),
+        mock.patch.object(stash, "_stash", return_value=True),
+        mock.patch("plum_tools.gitstash.resolve_ref", return_value="abc"),
+        mock.patch.object(stash, "_checkout", side_effect=error),
+        # 恢复储藏也失败，储藏记录需要保存
+        mock.patch("plum_tools.gitstash.run_git", side_effect=error),
+        mock.patch("plum_tools.gitstash.save_sidecar", side_effect=OSError("read-only")) as mock_save,
+        mock.patch("plum_tools.gitstash.print_warn") as mock_warn,
+    ):
+        with pytest.raises(RunCmdError):
+            stash.checkout()
+
+    assert mock_save.call_args.args[1:] == ("stash.json", {"master": "abc"})
+    mock_warn.assert_called_once_with("保存储藏记录失败: read-only")
+
+
+def test_git_checkout_stash_skips_unchanged_sidecar(tmp_path: Path) -> None:
+    repo = make_repository(str(tmp_path))
+    git(repo, "branch", "feature")
+
+    GitCheckoutStash("master", "feature", repo).checkout()
+
+    assert git(repo, "rev-parse", "--abbrev-ref", "HEAD").strip() == "feature"
+    assert not os.path.exists(os.path.join(repo, ".git", "plum_tools", "stash.json"))
+
+
+def make_services(root: Path) -> list[str]:
+    """创建3个仓库：有修改的、已经在 feature 分支的、没有 feature 分支的"""
+    repos = [make_repository(str(root / name)) for name in ("a", "b", "c")]
+    for repo in repos[:2]:
+        git(repo, "branch", "feature")
+    git(repos[1], "checkout", "-q", "feature")
+    for repo in (repos[0], repos[2]):
+        with open(os.path.join(repo, "a.txt"), "w", encoding="utf-8") as f:
+            f.write("a")
+        git(repo, "add", "a.txt")
+    return repos
+
+
+def test_switch_repository(tmp_path: Path) -> None:
+    repos = make_services(tmp_path)
+
+    result = switch_repository(repos[0], "feature")
+    assert {key: result[key] for key in ("state", "from", "to", "stashed", "popped")} == {
+        "state": "switched",
+        "from": "master",
+        "to": "feature",
+        "stashed": True,
+        "popped": None,
+    }
+    assert switch_repository(repos[0], "master")["popped"] == "stash@{0}"
+    assert switch_repository(repos[1], "feature")["state"] == "skipped"
+
+    result = switch_repository(repos[2], "feature")
+    assert result["state"] == "error" and "feature" in result["error"]
+    # 切换失败时储藏的文件已经恢复
+    assert not result["stashed"]
+    assert git(repos[2], "status", "--porcelain") == "A  a.txt\n"
+    assert switch_repository(str(tmp_path), "feature")["error"] == "not a git repository"
+
+
+def test_switch_repositories(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    repos = make_services(tmp_path)
+
+    # 目录下的仓库和 gitrepo 一样查找
+    assert not switch_repositories([str(tmp_path / "a" / "repo"), str(tmp_path / "b"), repos[2]], "feature", 3)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ["state", "from", "to", "stashed", "popped", "latency_ms", "path"]
+    states = {line.split()[-1]: line.split()[0] for line in lines[1:5]}
+    # origin 仓库和 c 没有 feature 分支，切换失败但不影响其他仓库
+    assert states == {
+        repos[0]: "switched",
+        str(tmp_path / "b" / "origin"): "error",
+        repos[1]: "skipped",
+        repos[2]: "error",
+    }
+    assert len([line for line in lines[5:] if repos[2] in line]) == 1
+    assert git(repos[0], "rev-parse", "--abbrev-ref", "HEAD").strip() == "feature"
+    assert not switch_repositories([str(tmp_path / "empty")], "feature")
+
+
+def test_main_switches_repositories() -> None:
+    with (
+        mock.patch("plum_tools.gitstash.switch_repositories", return_value=False) as mock_switch,
+        mock.patch("sys.argv", ["gitstash", "feature", "--repos", "/tmp/a", "/tmp/b", "-j", "2"]),
+    ):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+
+    assert exc_info.value.code == 1
+    mock_switch.assert_called_once_with(["/tmp/a", "/tmp/b"], "feature", 2)
 
 
 def test_main_exits_when_not_in_git_repository() -> None:
     mock_parser = mock.Mock()
-    mock_parser.parse_args.return_value = mock.Mock(branch="test")
+    mock_parser.parse_args.return_value = mock.Mock(branch="test", repos=None, worktree=False, link=None)
 
     with (
         mock.patch("plum_tools.gitstash.get_base_parser", return_value=mock_parser),
-        mock.patch("plum_tools.gitstash.get_current_branch_name", side_effect=RunCmdError("fail", "", "")),
+        mock.patch("plum_tools.gitstash.GitMeta.discover", return_value=None),
         mock.patch("plum_tools.gitstash.print_warn") as mock_print_warn,
     ):
         with pytest.raises(SystemExit) as exc_info:
@@ -164,3 +423,137 @@ def test_main_exits_when_not_in_git_repository() -> None:
 
     assert exc_info.value.code == 1
     mock_print_warn.assert_called_once_with("当前目录不是一个git仓库")
+
+
+@pytest.fixture
+def branches(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    repo = make_repository(str(tmp_path))
+    for branch in ("b1", "b2", "feature/b3"):
+        git(repo, "branch", branch)
+    monkeypatch.chdir(repo)
+    return repo
+
+
+def test_checkout_worktree(branches: str, tmp_path: Path) -> None:
+    root = os.path.join(branches, ".git", "plum_tools", "worktrees")
+    assert GitCheckoutStash("master", "master").checkout_worktree() == branches
+
+    path = GitCheckoutStash("master", "b1").checkout_worktree()
+    assert path == os.path.join(root, "b1")
+    assert git(path, "rev-parse", "--abbrev-ref", "HEAD").strip() == "b1"
+    with mock.patch("plum_tools.gitstash.run_git") as mock_run_git:
+        assert GitCheckoutStash("master", "b1").checkout_worktree() == path
+    # 已经缓存的工作区不需要执行git命令
+    mock_run_git.assert_not_called()
+
+    link = str(tmp_path / "current")
+    path = GitCheckoutStash("master", "feature/b3").checkout_worktree(link)
+    assert path == os.path.join(root, "feature%2Fb3")
+    assert os.readlink(link) == path
+    GitCheckoutStash("master", "b1").checkout_worktree(link)
+    assert os.readlink(link) == os.path.join(root, "b1")
+
+
+def test_checkout_worktree_evicts_least_recently_used(branches: str) -> None:
+    root = os.path.join(branches, ".git", "plum_tools", "worktrees")
+    for branch in ("b1", "b2"):
+        GitCheckoutStash("master", branch).checkout_worktree(capacity=2)
+    GitCheckoutStash("master", "b1").checkout_worktree(capacity=2)
+    with open(os.path.join(root, "b1", "dirty.txt"), "w", encoding="utf-8") as f:
+        f.write("dirty")
+    git(os.path.join(root, "b1"), "add", "dirty.txt")
+
+    GitCheckoutStash("master", "feature/b3").checkout_worktree(capacity=2)
+    assert not os.path.exists(os.path.join(root, "b2"))
+    assert os.path.exists(os.path.join(root, "feature%2Fb3"))
+
+    GitCheckoutStash("master", "b2").checkout_worktree(capacity=2)
+    # 有未提交修改的工作区不会被删除
+    assert os.path.exists(os.path.join(root, "b1", "dirty.txt"))
+    assert not os.path.exists(os.path.join(root, "feature%2Fb3"))
+
+
+def test_checkout_worktree_recreates_deleted_worktree(branches: str) -> None:
+    path = GitCheckoutStash("master", "b1").checkout_worktree()
+    shutil.rmtree(path)
+
+    assert GitCheckoutStash("master", "b1").checkout_worktree() == path
+    assert git(path, "rev-parse", "--abbrev-ref", "HEAD").strip() == "b1"
+
+    git(path, "checkout", "-q", "b2")
+    assert GitCheckoutStash("master", "b2").checkout_worktree() == path
+    # 在缓存的工作区中切换到其他分支后，切换回原来的分支
+    assert GitCheckoutStash("master", "b1").checkout_worktree() == path
+    assert git(path, "rev-parse", "--abbrev-ref", "HEAD").strip() == "b1"
+    assert GitCheckoutStash("master", "b2").checkout_worktree() != path
+
+    os.makedirs(os.path.join(os.path.dirname(path), "feature%2Fb3"))
+    with pytest.raises(RunCmdError):
+        GitCheckoutStash("master", "feature/b3").checkout_worktree()
+
+
+def test_checkout_worktree_evicts_stale_worktree(branches: str) -> None:
+    root = os.path.join(branches, ".git", "plum_tools", "worktrees")
+    path = GitCheckoutStash("master", "b1").checkout_worktree(capacity=1)
+    git(path, "checkout", "-q", "b2")
+
+    GitCheckoutStash("master", "feature/b3").checkout_worktree(capacity=1)
+    # 切换到其他分支的工作区仍然按最久没有使用删除
+    assert not os.path.exists(path)
+    with open(os.path.join(branches, ".git", "plum_tools", "worktrees.json"), encoding="utf-8") as f:
+        assert list(json.load(f)) == ["feature/b3"]
+    shutil.rmtree(os.path.join(root, "feature%2Fb3"))
+    assert GitCheckoutStash("master", "b1").checkout_worktree(capacity=1) == path
+
+
+def test_main_worktree(branches: str, capsys: pytest.CaptureFixture) -> None:
+    with mock.patch("sys.argv", ["gitstash", "b1", "--worktree"]):
+        main()
+    assert capsys.readouterr().out.strip() == os.path.join(branches, ".git", "plum_tools", "worktrees", "b1")
+
+    with mock.patch("sys.argv", ["gitstash", "not-exists", "--worktree"]):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 1
+    assert "not-exists" in capsys.readouterr().out
+
+
+def test_checkout_worktree_sidecar_error_only_warns(branches: str) -> None:
+    with (
+        mock.patch("plum_tools.gitstash.save_sidecar", side_effect=OSError("read-only")),
+        mock.patch("plum_tools.gitstash.print_warn") as mock_warn,
+    ):
+        path = GitCheckoutStash("master", "b1").checkout_worktree()
+
+    assert path == os.path.join(branches, ".git", "plum_tools", "worktrees", "b1")
+    mock_warn.assert_called_once_with("保存工作区记录失败: read-only")
+
+
+def test_main_worktree_link_error(branches: str, tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    link = str(tmp_path / "not-exists" / "current")
+    with (
+        mock.patch("sys.argv", ["gitstash", "b1", "--link", link]),
+        mock.patch("plum_tools.gitstash.print_error") as mock_print_error,
+    ):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+
+    assert exc_info.value.code == 1
+    # 工作区已经创建，先输出路径再提示创建符号链接失败
+    assert capsys.readouterr().out.strip() == os.path.join(branches, ".git", "plum_tools", "worktrees", "b1")
+    assert mock_print_error.call_args.args[0].startswith(f"创建符号链接 {link} 失败")
+
+
+def test_main_worktree_link_is_directory(branches: str, tmp_path: Path) -> None:
+    link = tmp_path / "current"
+    link.mkdir()
+    with (
+        mock.patch("sys.argv", ["gitstash", "b1", "--link", str(link)]),
+        mock.patch("plum_tools.gitstash.print_error") as mock_print_error,
+    ):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+
+    assert exc_info.value.code == 1
+    mock_print_error.assert_called_once()
+    assert not os.path.exists(os.path.join(branches, ".git", "plum_tools", "worktrees", "b1"))
@@ -55,6 +55,13 @@ def test_pssh_client_run_cmd_raises_on_stderr() -> None:
     assert exc_info.value.err_msg == "boom"
 
 
+def test_pssh_client_without_client_raises_attribute_error() -> None:
+    client = PSSHClient.__new__(PSSHClient)
+
+    with pytest.raises(AttributeError, match="exec_command"):
+        client.exec_command("hostname")
+
+
 def test_ssh_tool_get_ssh_connects_with_expected_args() -> None:
     ssh_client = mock.Mock()
     tool = SSHTool("10.0.0.1", "root", 22, password="secret", identityfile="~/.ssh/id_rsa")
@@ -10,54 +10,180 @@
 #=============================================================================
 """
 
+import ipaddress
+import itertools
+import json
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Any
 from unittest import mock
 
 import pytest
 
-from plum_tools.pping import main, ping, run
-from tests.common import MockPool
+from plum_tools.pping import (
+    SweepOptions,
+    SweepSummary,
+    format_stats,
+    get_spec,
+    get_target_specs,
+    iter_targets,
+    main,
+    parse_target,
+    ping,
+    plan_targets,
+    run,
+    to_record,
+    watch,
+)
+from plum_tools.utils.probe import ProbeResult
+from plum_tools.utils.reachability import ReachabilityCache
+
+
+class FakeProber:
+    name = "fake"
+    ports = (22,)
+
+    def __init__(self, alive: Sequence[str] = ()) -> None:
+        self.alive = set(alive)
+        self.probed: list[str] = []
+        self.opened = False
+        self.closed = False
+
+    def open(self) -> None:
+        self.opened = True
+
+    def close(self) -> None:
+        self.closed = True
+
+    async def probe(self, ip: str) -> ProbeResult:
+        self.probed.append(ip)
+        if ip in self.alive:
+            return ProbeResult(ip, True, 0.001, self.name, [0.001], 1)
+        return ProbeResult(ip, False, probe=self.name)
 
 
 def test_ping() -> None:
-    with mock.patch("plum_tools.pping.run_cmd") as mock_run_cmd:
+    prober = FakeProber(["2.2.2.2"])
+    with mock.patch("plum_tools.pping.create_prober", return_value=prober) as mock_create:
         ip = ping("2.2.2.2")
     assert ip == "2.2.2.2"
-    mock_run_cmd.assert_called_once_with("ping -W 3 -c 1 2.2.2.2")
+    assert prober.probed == ["2.2.2.2"]
+    assert prober.opened and prober.closed
+    mock_create.assert_called_once_with("auto", 3, (22, 80, 443), 5000, 1, 0.2)
 
 
-def test_ping_with_cmd_error() -> None:
-    ip = ping("1.1.1.999")
-    assert ip is None
+def test_ping_with_unreachable_host_ip_is_none() -> None:
+    with mock.patch("plum_tools.pping.create_prober", return_value=FakeProber()):
+        assert ping("1.1.1.1") is None
 
 
-def test_run(capsys: pytest.CaptureFixture) -> None:
-    mock_ips = [f"1.1.1.{i}" if i < 10 else "" for i in range(1, 255)]
-    with (
-        mock.patch("plum_tools.pping.Pool", return_value=MockPool()) as mock_pool,
-        mock.patch("plum_tools.pping.get_prefix_host_ip", return_value="1.1.1") as mock_prefix,
-        mock.patch("plum_tools.pping.ping", side_effect=mock_ips) as mock_ping,
-    ):
-        run("test", "")
+@pytest.mark.parametrize(
+    "spec, first, last, count",
+    [
+        ("10.10.0.0/16", "10.10.0.1", "10.10.255.254", 65534),
+        ("10.10.1.7/24", "10.10.1.1", "10.10.1.254", 254),
+        ("10.10.1.8/31", "10.10.1.8", "10.10.1.9", 2),
+        ("10.10.1.8/32", "10.10.1.8", "10.10.1.8", 1),
+        ("10.10.1.1-10.10.2.3", "10.10.1.1", "10.10.2.3", 259),
+        ("10.10.1.5-50", "10.10.1.5", "10.10.1.50", 46),
+        ("1.1.1", "1.1.1.1", "1.1.1.254", 254),
+        ("1.1.1.", "1.1.1.1", "1.1.1.254", 254),
+        ("1.1.1.9", "1.1.1.9", "1.1.1.9", 1),
+    ],
+)
+def test_parse_target(spec: str, first: str, last: str, count: int) -> None:
+    targets = parse_target(spec)
+
+    assert len(targets) == count
+    assert str(ipaddress.IPv4Address(targets[0])) == first
+    assert str(ipaddress.IPv4Address(targets[-1])) == last
+
+
+@pytest.mark.parametrize("spec", ["1.1", "1.1.1.256", "10.0.0.0/33", "1.1.1.9-1.1.1.1", "host"])
+def test_parse_target_with_invalid_spec(spec: str) -> None:
+    with pytest.raises(ValueError):
+        parse_target(spec)
+
+
+def test_iter_targets_is_lazy() -> None:
+    targets = iter_targets(["1.1.1.1-2", "10.0.0.0/8"])
+
+    assert isinstance(targets, Iterator)
+    assert list(itertools.islice(targets, 4)) == ["1.1.1.1", "1.1.1.2", "10.0.0.1", "10.0.0.2"]
 
-    mock_pool.assert_called_once_with(processes=100)
-    mock_prefix.assert_called_once_with("test")
-    mock_ping.assert_has_calls([mock.call(f"1.1.1.{i}") for i in range(1, 255)])
+
+def test_get_target_specs() -> None:
+    with mock.patch("plum_tools.pping.get_prefix_host_ip", side_effect=["1.1.1", "2.2.0.0/16"]) as mock_prefix:
+        assert get_target_specs(["a", "b"], []) == ["1.1.1", "2.2.0.0/16"]
+        assert get_target_specs(["a"], ["3.3.3.3"]) == ["3.3.3.3"]
+    mock_prefix.assert_has_calls([mock.call("a"), mock.call("b")])
+
+
+@pytest.mark.parametrize("order", ["sorted", "arrival"])
+def test_run(order: str, capsys: pytest.CaptureFixture) -> None:
+    alive = [f"1.1.1.{i}" for i in range(9, 0, -1)] + ["2.2.2.2"]
+    prober = FakeProber(alive)
+    with mock.patch("plum_tools.pping.create_prober", return_value=prober) as mock_create:
+        run(["1.1.1", "2.2.2.0/30"], SweepOptions(mode="tcp", timeout=1, ports=[22], rate=0), order)
+
+    mock_create.assert_called_once_with("tcp", 1, [22], 0, 1, 0.2)
+    assert sorted(prober.probed) == sorted([f"1.1.1.{i}" for i in range(1, 255)] + ["2.2.2.1", "2.2.2.2"])
     captured = capsys.readouterr()
-    output = captured.out
-    for ip in mock_ips:
-        if ip:
-            assert ip in output
+    output = captured.out.split()
+    expected = [f"1.1.1.{i}" for i in range(1, 10)] + ["2.2.2.2"]
+    if order == "sorted":
+        assert output == expected
+    else:
+        assert sorted(output) == sorted(expected)
 
 
-def test_main() -> None:
+def test_run_streams_results_before_sweep_finishes(capsys: pytest.CaptureFixture) -> None:
+    class SlowProber(FakeProber):
+        async def probe(self, ip: str) -> ProbeResult:
+            if ip == "1.1.1.2":
+                # 第一个结果应当在最慢的探测结束前输出
+                assert capsys.readouterr().out == "1.1.1.1\n"
+            return await super().probe(ip)
+
+    with mock.patch("plum_tools.pping.create_prober", return_value=SlowProber(["1.1.1.1", "1.1.1.2"])):
+        run(["1.1.1.1-2"], SweepOptions(concurrency=1), "sorted")
+
+
+def _get_parser(**kwargs: Any) -> mock.Mock:
     mock_parser = mock.Mock()
-    mock_args = mock.Mock(type="1", prefix_host="1.1.1")
-    mock_parser.parse_args.return_value = mock_args
+    args = {
+        "targets": [],
+        "types": ["1"],
+        "prefix_host": "1.1.1",
+        "mode": "tcp",
+        "timeout": 1.0,
+        "ports": [22],
+        "concurrency": 10,
+        "order": "arrival",
+        "rate": 100.0,
+        "min_timeout": 0.5,
+        "fixed_timeout": False,
+        "count": None,
+        "stats": False,
+        "incremental": False,
+        "watch": None,
+        "no_cache": True,
+        "format": "text",
+        "exit_status": False,
+    }
+    args.update(kwargs)
+    mock_parser.parse_args.return_value = mock.Mock(**args)
+    return mock_parser
+
+
+def test_main() -> None:
+    mock_parser = _get_parser()
     with (
         mock.patch("plum_tools.pping.get_base_parser", return_value=mock_parser) as mock_argparse,
         mock.patch("plum_tools.pping.run") as mock_run,
     ):
-        main()
+        with pytest.raises(SystemExit):
+            main()
         mock_argparse.assert_called_once_with()
         mock_parser.add_argument.assert_has_calls(
             [
@@ -66,9 +192,10 @@ def test_main() -> None:
                     "--type",
                     action="store",
                     required=False,
-                    dest="type",
-                    default="default",
-                    help="host type",
+                    dest="types",
+                    nargs="+",
+                    default=["default"],
+                    help="host types, used when no targets are given",
                 ),
                 mock.call(
                     "-p",
@@ -79,7 +206,288 @@ def test_main() -> None:
                     default=None,
                     help="host prefix",
                 ),
+                mock.call(
+                    "-m",
+                    "--mode",
+                    action="store",
+                    required=False,
+                    dest="mode",
+                    choices=["auto", "icmp", "tcp"],
+                    default="auto",
+                    help="probe mode, auto uses icmp when the kernel allows it and falls back to tcp",
+                ),
+                mock.call(
+                    "-w",
+                    "--timeout",
+                    action="store",
+                    required=False,
+                    dest="timeout",
+                    type=float,
+                    default=3,
+                    help="probe timeout in seconds",
+                ),
             ]
         )
         mock_parser.parse_args.assert_called_once_with()
-        mock_run.assert_called_once_with("1", "1.1.1")
+        mock_run.assert_called_once_with(
+            ["1.1.1"],
+            SweepOptions(mode="tcp", timeout=1.0, ports=[22], concurrency=10, rate=100.0, count=1, min_timeout=0.5),
+            "arrival",
+            False,
+            None,
+            False,
+            fmt="text",
+        )
+
+
+def test_main_uses_host_types_without_targets() -> None:
+    mock_parser = _get_parser(prefix_host=None, types=["a", "b"])
+    with (
+        mock.patch("plum_tools.pping.get_base_parser", return_value=mock_parser),
+        mock.patch("plum_tools.pping.get_prefix_host_ip", side_effect=["1.1.1", "2.2.0.0/16"]),
+        mock.patch("plum_tools.pping.run") as mock_run,
+    ):
+        with pytest.raises(SystemExit):
+            main()
+    assert mock_run.call_args.args[0] == ["1.1.1", "2.2.0.0/16"]
+
+
+@pytest.mark.parametrize(
+    "count, fixed_timeout, stats, options_count, min_timeout",
+    [
+        (None, False, True, 3, 0.5),
+        (5, True, True, 5, None),
+        (None, True, False, 1, None),
+    ],
+)
+def test_main_with_stats_options(
+    count: int | None,
+    fixed_timeout: bool,
+    stats: bool,
+    options_count: int,
+    min_timeout: float | None,
+) -> None:
+    mock_parser = _get_parser(count=count, fixed_timeout=fixed_timeout, stats=stats)
+    with (
+        mock.patch("plum_tools.pping.get_base_parser", return_value=mock_parser),
+        mock.patch("plum_tools.pping.run") as mock_run,
+    ):
+        with pytest.raises(SystemExit):
+            main()
+    _, options, _, run_stats, _, _ = mock_run.call_args.args
+    assert options.count == options_count
+    assert options.min_timeout == min_timeout
+    assert run_stats == stats
+
+
+def test_main_exits_with_invalid_target() -> None:
+    mock_parser = _get_parser(targets=["10.0.0.0/40"])
+    with (
+        mock.patch("plum_tools.pping.get_base_parser", return_value=mock_parser),
+        mock.patch("plum_tools.pping.run") as mock_run,
+    ):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 1
+    mock_run.assert_not_called()
+
+
+def test_format_stats() -> None:
+    result = ProbeResult("10.0.0.1", True, 0.002, "icmp", [0.001, 0.002, 0.003], 4)
+
+    assert format_stats(result) == "10.0.0.1  min/avg/p95 = 1.000/2.000/3.000 ms  3/4 icmp"
+
+
+def test_run_with_stats(capsys: pytest.CaptureFixture) -> None:
+    with mock.patch("plum_tools.pping.create_prober", return_value=FakeProber(["1.1.1.1"])):
+        run(["1.1.1.1-2"], SweepOptions(), stats=True)
+
+    assert capsys.readouterr().out.startswith("1.1.1.1  min/avg/p95 = ")
+
+
+def test_get_spec() -> None:
+    spec_ranges = [(spec, parse_target(spec)) for spec in ["1.1.1", "1.1.0.0/16"]]
+
+    assert get_spec("1.1.1.1", spec_ranges) == "1.1.1"
+    assert get_spec("1.1.2.1", spec_ranges) == "1.1.0.0/16"
+    with pytest.raises(ValueError):
+        get_spec("2.2.2.2", spec_ranges)
+
+
+def test_plan_targets_without_incremental(tmp_path: Path) -> None:
+    with ReachabilityCache(str(tmp_path / "pping.db"), 60, 3600) as cache:
+        cache.update("1.1.1.1-3", "1.1.1.3", True)
+        assert list(plan_targets(["1.1.1.1-3"], cache, False)) == ["1.1.1.1", "1.1.1.2", "1.1.1.3"]
+        assert list(plan_targets(["1.1.1.1-3"], None, True)) == ["1.1.1.1", "1.1.1.2", "1.1.1.3"]
+
+
+def test_plan_targets_with_incremental(tmp_path: Path) -> None:
+    with ReachabilityCache(str(tmp_path / "pping.db"), 60, 3600) as cache:
+        cache.update("1.1.1.1-4", "1.1.1.3", True)
+        cache.update("1.1.1.1-4", "1.1.1.2", False)
+        assert list(plan_targets(["1.1.1.1-4", "2.2.2.2"], cache, True)) == ["1.1.1.3", "1.1.1.1", "1.1.1.4", "2.2.2.2"]
+
+
+def test_run_records_results_in_cache(tmp_path: Path) -> None:
+    with (
+        ReachabilityCache(str(tmp_path / "pping.db"), 60, 3600) as cache,
+        mock.patch("plum_tools.pping.create_prober", return_value=FakeProber(["1.1.1.2"])),
+    ):
+        run(["1.1.1.1-2", "2.2.2.2"], SweepOptions(), cache=cache)
+        assert cache.get_state("1.1.1.1-2", "1.1.1.1") == "down"
+        assert cache.get_state("1.1.1.1-2", "1.1.1.2") == "up"
+        assert cache.get_state("2.2.2.2", "2.2.2.2") == "down"
+        # 探测结束时已经提交，不会占用写锁
+        assert not cache.conn.in_transaction
+
+
+def test_watch_prints_only_transitions(capsys: pytest.CaptureFixture) -> None:
+    class FlappingProber(FakeProber):
+        def open(self) -> None:
+            super().open()
+            # 每一轮探测都会重新打开探测器
+            self.alive = rounds.pop(0)
+
+    rounds = [{"1.1.1.1", "1.1.1.2"}, {"1.1.1.1", "1.1.1.2"}, {"1.1.1.2", "1.1.1.3"}]
+    with mock.patch("plum_tools.pping.create_prober", return_value=FlappingProber()):
+        watch(["1.1.1.1-3"], SweepOptions(), 0, rounds=3)
+
+    output = capsys.readouterr().out.splitlines()
+    assert sorted(output[:2]) == ["1.1.1.1", "1.1.1.2"]
+    assert sorted(output[2:]) == ["\x1b[31m1.1.1.1 down\x1b[0m", "\x1b[32m1.1.1.3 up\x1b[0m"]
+
+
+@pytest.mark.parametrize("watch_interval", [None, 5.0])
+def test_main_with_cache(watch_interval: float | None, tmp_path: Path) -> None:
+    mock_parser = _get_parser(no_cache=False, incremental=True, watch=watch_interval)
+    cache_path = tmp_path / "cache" / "pping.db"
+    with (
+        mock.patch("plum_tools.pping.get_base_parser", return_value=mock_parser),
+        mock.patch("plum_tools.pping.PathConfig", mock.Mock(PING_CACHE_PATH=str(cache_path))),
+        mock.patch("plum_tools.pping.run") as mock_run,
+        mock.patch("plum_tools.pping.watch") as mock_watch,
+    ):
+        with pytest.raises(SystemExit):
+            main()
+
+    assert cache_path.exists()
+    if watch_interval is None:
+        cache = mock_run.call_args.args[4]
+        assert mock_run.call_args.args[5] is True
+        mock_watch.assert_not_called()
+    else:
+        cache = mock_watch.call_args.args[3]
+        assert mock_watch.call_args.args[2] == watch_interval
+        mock_run.assert_not_called()
+    assert isinstance(cache, ReachabilityCache)
+
+
+def test_main_without_cache_when_cache_is_locked() -> None:
+    mock_parser = _get_parser(no_cache=False)
+    with (
+        mock.patch("plum_tools.pping.get_base_parser", return_value=mock_parser),
+        mock.patch.object(ReachabilityCache, "open", return_value=False),
+        mock.patch("plum_tools.pping.run") as mock_run,
+    ):
+        with pytest.raises(SystemExit):
+            main()
+
+    assert mock_run.call_args.args[4] is None
+
+
+@pytest.mark.parametrize("total, up, code", [(3, 3, 0), (3, 1, 3), (3, 0, 4), (0, 0, 4)])
+def test_sweep_summary_exit_code(total: int, up: int, code: int) -> None:
+    summary = SweepSummary(total, up)
+
+    assert summary.exit_code == code
+    assert str(summary) == f"swept {total} hosts, {up} up, {total - up} down"
+
+
+def test_to_record() -> None:
+    record = to_record(ProbeResult("10.0.0.1", True, 0.002, "icmp", [0.001, 0.003], 2))
+
+    assert record["ip"] == "10.0.0.1"
+    assert record["state"] == "up"
+    assert record["rtt"] == 2.0
+    assert record["rtt_min"] == 1.0
+    assert record["rtt_p95"] == 3.0
+    assert record["received"] == 2
+    assert record["probe"] == "icmp"
+    assert record["timestamp"].endswith("+00:00")
+    assert to_record(ProbeResult("10.0.0.2", False, probe="tcp", sent=1))["rtt"] is None
+
+
+def test_run_with_ndjson(capsys: pytest.CaptureFixture) -> None:
+    with mock.patch("plum_tools.pping.create_prober", return_value=FakeProber(["1.1.1.2"])):
+        summary = run(["1.1.1.1-3"], SweepOptions(), fmt="ndjson")
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(record["ip"], record["state"]) for record in records] == [
+        ("1.1.1.1", "down"),
+        ("1.1.1.2", "up"),
+        ("1.1.1.3", "down"),
+    ]
+    assert summary == SweepSummary(3, 1)
+
+
+def test_run_with_json(capsys: pytest.CaptureFixture) -> None:
+    with mock.patch("plum_tools.pping.create_prober", return_value=FakeProber(["1.1.1.2"])):
+        run(["1.1.1.1-2"], SweepOptions(), fmt="json")
+
+    records = json.loads(capsys.readouterr().out)
+    assert [record["state"] for record in records] == ["down", "up"]
+
+
+def test_run_with_csv(capsys: pytest.CaptureFixture) -> None:
+    with mock.patch("plum_tools.pping.create_prober", return_value=FakeProber(["1.1.1.1"])):
+        run(["1.1.1.1"], SweepOptions(), fmt="csv")
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "ip,state,rtt,rtt_min,rtt_p95,sent,received,probe,timestamp"
+    assert lines[1].startswith("1.1.1.1,up,1.0,1.0,1.0,1,1,fake,")
+
+
+def test_watch_with_ndjson(capsys: pytest.CaptureFixture) -> None:
+    class FlappingProber(FakeProber):
+        def open(self) -> None:
+            super().open()
+            self.alive = rounds.pop(0)
+
+    rounds = [{"1.1.1.1"}, set()]
+    with mock.patch("plum_tools.pping.create_prober", return_value=FlappingProber()):
+        summary = watch(["1.1.1.1-2"], SweepOptions(), 0, rounds=2, fmt="ndjson")
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(record["ip"], record["state"]) for record in records] == [("1.1.1.1", "up"), ("1.1.1.1", "down")]
+    assert summary == SweepSummary(2, 0)
+
+
+@pytest.mark.parametrize(
+    "fmt, exit_status, has_summary, code",
+    [("text", False, False, 0), ("text", True, False, 3), ("ndjson", True, True, 3)],
+)
+def test_main_exits_with_summary_code(
+    fmt: str, exit_status: bool, has_summary: bool, code: int, capsys: pytest.CaptureFixture
+) -> None:
+    mock_parser = _get_parser(format=fmt, exit_status=exit_status)
+    with (
+        mock.patch("plum_tools.pping.get_base_parser", return_value=mock_parser),
+        mock.patch("plum_tools.pping.run", return_value=SweepSummary(5, 2)),
+    ):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+
+    assert exc_info.value.code == code
+    assert ("swept 5 hosts, 2 up, 3 down in" in capsys.readouterr().err) == has_summary
+
+
+def test_main_exits_when_watch_is_interrupted_before_first_round() -> None:
+    mock_parser = _get_parser(watch=1.0, exit_status=True)
+    with (
+        mock.patch("plum_tools.pping.get_base_parser", return_value=mock_parser),
+        mock.patch("plum_tools.pping.create_prober", side_effect=KeyboardInterrupt),
+    ):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+
+    assert exc_info.value.code == 130
@@ -302,7 +302,10 @@ def test_translate(capsys: pytest.CaptureFixture) -> None:
     )
     exclude: list[str] = []
     u = SyncFiles(hostname, user, port, identityfile, src, dest, exclude, delete)
-    with mock.patch("plum_tools.prn.run_cmd") as m:
+    with (
+        mock.patch("plum_tools.prn.run_cmd") as m,
+        mock.patch("plum_tools.prn.format_control_options", return_value=""),
+    ):
         u.translate()
         m.assert_called_once_with(
             "rsync -rtv '--rsync-path=mkdir -p / && rsync' -e "
@@ -327,7 +330,10 @@ def test_translate_ignore_rsync_path(capsys: pytest.CaptureFixture) -> None:
         ignore_rsync_path=True,
     )
 
-    with mock.patch("plum_tools.prn.run_cmd") as m:
+    with (
+        mock.patch("plum_tools.prn.run_cmd") as m,
+        mock.patch("plum_tools.prn.format_control_options", return_value=""),
+    ):
         u.translate()
         m.assert_called_once_with(
             'rsync -rtv -e \'ssh -p 22 -i  -o "UserKnownHostsFile=/dev/null" '
@@ -338,6 +344,22 @@ def test_translate_ignore_rsync_path(capsys: pytest.CaptureFixture) -> None:
     assert captured.out == "[32m上传 /tmp/ 到 user@1.1.1.1 服务器(端口: 22) /tmp 成功[0m\n"
 
 
+def test_translate_reuse_master_connection() -> None:
+    u = SyncFiles("1.1.1.1", "user", 0, "", "/tmp", "/tmp", [], 0, ignore_rsync_path=True)
+    control = '-o "ControlMaster=auto" -o "ControlPath=/run/ssh/user@1.1.1.1:22" -o "ControlPersist=10m"'
+    with (
+        mock.patch("plum_tools.prn.run_cmd") as m,
+        mock.patch("plum_tools.prn.format_control_options", return_value=control) as mock_control,
+    ):
+        u.translate()
+    # 没有指定端口时和 pssh 一样使用默认端口的主连接
+    mock_control.assert_called_once_with("user", "1.1.1.1", 22)
+    m.assert_called_once_with(
+        'rsync -rtv -e \'ssh -i  -o "UserKnownHostsFile=/dev/null" '
+        f'-o "StrictHostKeyChecking no" -o "ConnectTimeout=2" {control}\' /tmp/ user@1.1.1.1:/tmp'
+    )
+
+
 def test_main() -> None:
     mock_parser = mock.Mock()
     mock_args = mock.Mock(
@@ -10,11 +10,28 @@
 #=============================================================================
 """
 
+import asyncio
+import sys
 from typing import TypedDict
 from unittest import mock
 
-from plum_tools.conf import SSHConfig
-from plum_tools.pssh import get_login_ssh_cmd, login, main
+import pytest
+
+from plum_tools.conf import PSSH_CONCURRENCY, PSSH_TIMEOUT, SSH_CONTROL_PERSIST, SSHConfig
+from plum_tools.pssh import (
+    HostResult,
+    control,
+    execute,
+    expand_hosts,
+    fold_hosts,
+    get_exec_ssh_cmd,
+    get_login_ssh_cmd,
+    login,
+    main,
+    print_results,
+    run_hosts,
+)
+from plum_tools.utils.sshctl import ControlMaster
 
 
 class SSHConfDict(TypedDict):
@@ -25,7 +42,7 @@ class SSHConfDict(TypedDict):
 
 
 def test_get_login_ssh_cmd_builds_expected_command() -> None:
-    cmd = get_login_ssh_cmd("10.0.0.1", "root", 2222, "~/.ssh/id_rsa")
+    cmd = get_login_ssh_cmd("10.0.0.1", "root", 2222, "~/.ssh/id_rsa", persist=None)
 
     assert cmd == (
         "ssh  -i ~/.ssh/id_rsa "
@@ -36,6 +53,14 @@ def test_get_login_ssh_cmd_builds_expected_command() -> None:
     )
 
 
+def test_get_login_ssh_cmd_reuses_master_connection() -> None:
+    control = '-o "ControlMaster=auto" -o "ControlPath=/run/ssh/root@10.0.0.1:22" -o "ControlPersist=5m"'
+    with mock.patch("plum_tools.pssh.format_control_options", return_value=control) as mock_control:
+        cmd = get_login_ssh_cmd("10.0.0.1", "root", 22, "~/.ssh/id_rsa", persist="5m")
+    mock_control.assert_called_once_with("root", "10.0.0.1", 22, "5m")
+    assert cmd.endswith(f'"ConnectTimeout={SSHConfig.CONNECT_TIMEOUT}" {control} root@10.0.0.1 -p 22')
+
+
 def test_login_merges_ssh_config_and_executes_command() -> None:
     ssh_conf: SSHConfDict = {
         "hostname": "10.0.0.1",
@@ -48,15 +73,27 @@ def test_login_merges_ssh_config_and_executes_command() -> None:
         mock.patch("plum_tools.pssh.merge_ssh_config", return_value=ssh_conf) as mock_merge_ssh_config,
         mock.patch("plum_tools.pssh.os.system") as mock_system,
     ):
-        login("host1", "default", "", 0, "")
+        login("host1", "default", "", 0, "", persist=None)
 
     mock_merge_ssh_config.assert_called_once_with("host1", "default", "", 0, "")
-    mock_system.assert_called_once_with(get_login_ssh_cmd(**ssh_conf))
+    mock_system.assert_called_once_with(get_login_ssh_cmd(**ssh_conf, persist=None))
 
 
 def test_main() -> None:
     mock_parser = mock.Mock()
-    mock_args = mock.Mock(host="dev", type="default", identityfile="", user="", port=0)
+    mock_args = mock.Mock(
+        host="dev",
+        hosts=[],
+        type="default",
+        identityfile="",
+        user="",
+        port=0,
+        command=None,
+        jobs=PSSH_CONCURRENCY,
+        timeout=PSSH_TIMEOUT,
+        persist="10m",
+        ctl=None,
+    )
     mock_parser.parse_args.return_value = mock_args
     with (
         mock.patch("plum_tools.pssh.get_base_parser", return_value=mock_parser) as mock_argparse,
@@ -66,7 +103,8 @@ def test_main() -> None:
         mock_argparse.assert_called_once_with()
         mock_parser.add_argument.assert_has_calls(
             [
-                mock.call(dest="host", action="store", help="specify server"),
+                mock.call(dest="host", action="store", nargs="?", default=None, help="specify server"),
+                mock.call(dest="hosts", action="store", nargs="*", help="more servers, used with --command"),
                 mock.call(
                     "-t",
                     "--type",
@@ -104,7 +142,184 @@ def test_main() -> None:
                     default=0,
                     help="ssh login port",
                 ),
+                mock.call(
+                    "-c",
+                    "--command",
+                    action="store",
+                    required=False,
+                    dest="command",
+                    default=None,
+                    help="run command on all servers instead of login",
+                ),
+                mock.call(
+                    "-j",
+                    "--jobs",
+                    action="store",
+                    required=False,
+                    dest="jobs",
+                    type=int,
+                    default=PSSH_CONCURRENCY,
+                    help="number of servers running command at the same time",
+                ),
+                mock.call(
+                    "--timeout",
+                    action="store",
+                    required=False,
+                    dest="timeout",
+                    type=float,
+                    default=PSSH_TIMEOUT,
+                    help="command timeout in seconds for each server",
+                ),
+                mock.call(
+                    "--persist",
+                    action="store",
+                    required=False,
+                    dest="persist",
+                    default=SSH_CONTROL_PERSIST,
+                    help="how long an idle master connection is kept, such as 10m, 'no' disables connection sharing",
+                ),
+                mock.call(
+                    "--ctl",
+                    action="store",
+                    required=False,
+                    dest="ctl",
+                    choices=["status", "stop"],
+                    default=None,
+                    help="show or stop master connections",
+                ),
             ]
         )
         mock_parser.parse_args.assert_called_once_with()
-        mock_login.assert_called_once_with("dev", mock_args.type, "", 0, "")
+        mock_login.assert_called_once_with("dev", mock_args.type, "", 0, "", "10m")
+
+
+def test_main_with_command() -> None:
+    mock_parser = mock.Mock()
+    mock_parser.parse_args.return_value = mock.Mock(
+        host="1-3",
+        hosts=["web-*"],
+        type="default",
+        identityfile="",
+        user="",
+        port=0,
+        command="uptime",
+        jobs=8,
+        timeout=5.0,
+        persist="no",
+        ctl=None,
+    )
+    with (
+        mock.patch("plum_tools.pssh.get_base_parser", return_value=mock_parser),
+        mock.patch("plum_tools.pssh.execute", return_value=False) as mock_execute,
+        mock.patch("plum_tools.pssh.login") as mock_login,
+    ):
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+    assert exc_info.value.code == 1
+    mock_execute.assert_called_once_with(["1-3", "web-*"], "uptime", "default", "", 0, "", 8, 5.0, "no")
+    mock_login.assert_not_called()
+
+
+def test_expand_hosts() -> None:
+    with mock.patch("plum_tools.pssh.get_ssh_aliases", return_value=["web-1", "web-2", "db"]) as mock_aliases:
+        hosts = expand_hosts(["1-3", "100.4-5", "2", "web-*", "db", "cache-*"])
+    assert hosts == ["1", "2", "3", "100.4", "100.5", "web-1", "web-2", "db"]
+    # 只读取一次 ~/.ssh/config
+    mock_aliases.assert_called_once_with()
+
+
+def test_fold_hosts() -> None:
+    assert fold_hosts(["1", "2", "3", "5", "web-2", "web-1", "db", "web-07", "web-08"]) == (
+        "1-3,5,web-[1-2],db,web-[07-08]"
+    )
+    assert fold_hosts(["web-1", "10.0.0.2"]) == "web-1,10.0.0.2"
+
+
+def test_get_exec_ssh_cmd() -> None:
+    ssh_conf = {"hostname": "10.0.0.1", "user": "root", "port": 22, "identityfile": "~/.ssh/id_rsa"}
+    argv = get_exec_ssh_cmd(ssh_conf, "uptime && hostname", None)
+    assert argv[0] == "ssh"
+    assert "root@10.0.0.1" in argv
+    assert argv[-4:] == ["-T", "-o", "BatchMode=yes", "uptime && hostname"]
+
+
+def test_run_hosts() -> None:
+    commands = {
+        "1": [sys.executable, "-c", "print('ok')"],
+        "2": [sys.executable, "-c", "import sys; print('fail'); sys.exit(3)"],
+        "3": [sys.executable, "-c", "import time; time.sleep(5)"],
+        "4": ["/nonexistent/ssh"],
+    }
+    results = asyncio.run(run_hosts(commands, 2, 1))
+    assert [(r.host, r.returncode, r.output, r.ok) for r in results[:2]] == [
+        ("1", 0, "ok", True),
+        ("2", 3, "fail", False),
+    ]
+    assert results[2].error == "timeout after 1s"
+    assert results[3].error and not results[3].ok
+
+
+def test_print_results(capsys: pytest.CaptureFixture) -> None:
+    print_results(
+        [
+            HostResult("1", 0, "ok"),
+            HostResult("2", 0, "ok"),
+            HostResult("3", 1, "ok"),
+            HostResult("web-1", 0, "ok"),
+            HostResult("4", error="timeout after 1s"),
+        ]
+    )
+    out = capsys.readouterr().out
+    assert "1-2,web-1 (3)" in out
+    assert "3 (1) exit 1" in out
+    assert "4 (1) timeout after 1s" in out
+    assert out.count("ok") == 2
+
+
+def test_execute(capsys: pytest.CaptureFixture) -> None:
+    def merge_ssh_config(host: str, *_: object) -> dict:
+        return {"hostname": host}
+
+    def get_exec_ssh_cmd(ssh_conf: dict, command: str, _: str) -> list[str]:
+        return [sys.executable, "-c", f"print({command!r})"]
+
+    with (
+        mock.patch("plum_tools.pssh.is_known_host", side_effect=lambda host: host != "missing"),
+        mock.patch("plum_tools.pssh.merge_ssh_config", side_effect=merge_ssh_config),
+        mock.patch("plum_tools.pssh.get_exec_ssh_cmd", side_effect=get_exec_ssh_cmd),
+    ):
+        assert execute(["1-2"], "up", "default", "", 0, "")
+        assert not execute(["1", "missing"], "up", "default", "", 0, "")
+        assert not execute([], "up", "default", "", 0, "")
+    out = capsys.readouterr().out
+    assert "1-2 (2)" in out
+    assert "missing (1) unknown host" in out
+
+
+def test_main_with_ctl() -> None:
+    mock_parser = mock.Mock()
+    mock_parser.parse_args.return_value = mock.Mock(host=None, hosts=[], ctl="status")
+    with (
+        mock.patch("plum_tools.pssh.get_base_parser", return_value=mock_parser),
+        mock.patch("plum_tools.pssh.control") as mock_control,
+        mock.patch("plum_tools.pssh.login") as mock_login,
+    ):
+        main()
+    mock_control.assert_called_once_with("status")
+    mock_login.assert_not_called()
+
+
+def test_control(capsys: pytest.CaptureFixture) -> None:
+    masters = [ControlMaster("root@1.1.1.1:22", "/run/a", 1234), ControlMaster("root@1.1.1.2:22", "/run/b")]
+    with mock.patch("plum_tools.pssh.list_masters", return_value=masters):
+        control("status")
+    out = capsys.readouterr().out
+    assert "pid=1234 root@1.1.1.1:22" in out
+    assert "stale" in out
+    with mock.patch("plum_tools.pssh.stop_masters", return_value=masters) as mock_stop:
+        control("stop")
+    mock_stop.assert_called_once_with()
+    assert capsys.readouterr().out == "stopped root@1.1.1.1:22\nremoved stale root@1.1.1.2:22\n"
+    with mock.patch("plum_tools.pssh.list_masters", return_value=[]):
+        control("status")
+    assert capsys.readouterr().out == "no master connections\n"
@@ -0,0 +1,83 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_startup
+#         Desc: 测试命令行工具的启动耗时，通过 python -X importtime 统计导入耗时
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-18 01:20
+#=============================================================================
+"""
+
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+# 只在真正使用时才需要的依赖，--version、--help 时不能导入
+HEAVY_MODULES = ("paramiko", "cryptography", "yaml")
+# 每个命令导入耗时的上限，机器性能不同时可以通过环境变量调整
+STARTUP_BUDGET_US = int(float(os.environ.get("PLUM_STARTUP_BUDGET_MS", "150")) * 1000)
+STARTUP_RUNS = 5
+
+
+def get_entry_points() -> dict[str, str]:
+    """读取 pyproject.toml 中 [project.scripts] 的命令，python3.10 没有 tomllib，只解析这一节的 key = "value" """
+    with open(ROOT / "pyproject.toml", encoding="utf-8") as f:
+        section = re.search(r"^\[project\.scripts\]\n(.*?)(?=^\[|\Z)", f.read(), re.M | re.S)
+    assert section is not None
+    return dict(re.findall(r'^([\w-]+)\s*=\s*"([^"]+)"', section.group(1), re.M))
+
+
+ENTRY_POINTS = get_entry_points()
+
+
+def import_time(code: str) -> dict[str, int]:
+    """在新的解释器中执行代码，返回每个模块导入的累计耗时(微秒)"""
+    env = dict(os.environ, PYTHONPATH=str(ROOT / "src"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+        cwd=ROOT,
+    )
+    assert result.returncode == 0, result.stderr
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+@pytest.mark.parametrize("name", sorted(ENTRY_POINTS))
+def test_entry_point_skips_heavy_imports(name: str) -> None:
+    module, func = ENTRY_POINTS[name].split(":")
+    code = (
+        f"import sys; sys.argv = [{name!r}, '--version']\n"
+        f"from {module} import {func}\n"
+        f"try:\n    {func}()\nexcept SystemExit as e:\n    assert not e.code, e.code\n"
+    )
+    modules = import_time(code)
+
+    assert module in modules
+    assert [item for item in HEAVY_MODULES if item in modules] == []
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("name", sorted(ENTRY_POINTS))
+def test_entry_point_import_time(name: str) -> None:
+    module = ENTRY_POINTS[name].split(":")[0]
+    # 取多次中的最小值，减少机器负载的影响
+    cost = min(import_time(f"import {module}")[module] for _ in range(STARTUP_RUNS))
+
+    assert cost <= STARTUP_BUDGET_US, f"{name} 导入耗时 {cost / 1000:.1f}ms 超过 {STARTUP_BUDGET_US / 1000:.1f}ms"
@@ -0,0 +1,118 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_drift
+#         Desc: 测试离线检查分支和上游分支、镜像的差异
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 20:40
+#=============================================================================
+"""
+
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from plum_tools.exceptions import RunCmdError
+from plum_tools.utils.drift import BranchDrift, check_drift, find_mirror
+from tests.common import git, make_repository
+
+
+@pytest.fixture
+def repository(tmp_path: Path) -> str:
+    repo = make_repository(str(tmp_path))
+    git(repo, "checkout", "-q", "-b", "feature")
+    git(repo, "push", "-q", "-u", "origin", "feature")
+    git(repo, "checkout", "-q", "master")
+    return repo
+
+
+def test_check_drift_in_sync(repository: str) -> None:
+    with mock.patch("plum_tools.utils.drift.run_git") as mock_run_git:
+        drifts = check_drift(repository)
+    # 引用指向同一个提交时不执行git命令
+    mock_run_git.assert_not_called()
+    assert [(d.branch, d.upstream, d.ahead, d.behind, d.drifted) for d in drifts] == [
+        ("feature", "refs/remotes/origin/feature", 0, 0, False),
+        ("master", "refs/remotes/origin/master", 0, 0, False),
+    ]
+
+
+def test_check_drift_ahead_and_behind(repository: str, tmp_path: Path) -> None:
+    git(repository, "commit", "-q", "--allow-empty", "-m", "local")
+    git(repository, "checkout", "-q", "feature")
+    git(repository, "commit", "-q", "--allow-empty", "-m", "local")
+    git(repository, "push", "-q", "origin", "feature")
+    git(repository, "reset", "-q", "--hard", "HEAD~1")
+    git(repository, "branch", "-q", "local-only")
+    git(repository, "pack-refs", "--all")
+
+    drifts = {drift.branch: drift for drift in check_drift(repository)}
+    assert (drifts["master"].ahead, drifts["master"].behind) == (1, 0)
+    assert (drifts["feature"].ahead, drifts["feature"].behind) == (0, 1)
+    assert drifts["local-only"] == BranchDrift("local-only", drifts["feature"].commit)
+    assert not drifts["local-only"].drifted
+
+    git(str(tmp_path / "origin"), "branch", "-q", "-D", "feature")
+    git(repository, "fetch", "-q", "--prune")
+    drift = [drift for drift in check_drift(repository) if drift.branch == "feature"][0]
+    assert drift.error == "upstream gone"
+    assert drift.drifted
+
+
+def test_check_drift_with_mirror(repository: str, tmp_path: Path) -> None:
+    mirrors = tmp_path / "mirrors"
+    mirrors.mkdir()
+    assert find_mirror(str(mirrors), repository) is None
+
+    mirror = str(mirrors / "repo.git")
+    git(str(mirrors), "clone", "-q", "--mirror", str(tmp_path / "origin"), mirror)
+    git(str(tmp_path / "origin"), "commit", "-q", "--allow-empty", "-m", "remote")
+    git(mirror, "fetch", "-q")
+    git(repository, "commit", "-q", "--allow-empty", "-m", "local")
+    found = find_mirror(str(mirrors), repository)
+    assert found is not None
+    assert os.path.samefile(found.common_dir, mirror)
+
+    git(repository, "branch", "-q", "local-only")
+    branches = {drift.branch: drift for drift in check_drift(repository, found)}
+    # 镜像中的新提交不在本地仓库中，通过镜像的对象目录统计
+    assert (branches["master"].ahead, branches["master"].behind) == (1, 0)
+    assert (branches["master"].mirror_ahead, branches["master"].mirror_behind) == (1, 1)
+    feature = branches["feature"]
+    assert (feature.mirror_ahead, feature.mirror_behind, feature.error) == (0, 0, None)
+    assert branches["local-only"].error == "missing in mirror"
+
+
+def test_check_drift_not_repository(tmp_path: Path) -> None:
+    assert not check_drift(str(tmp_path))
+
+
+def test_check_drift_fallback(repository: str) -> None:
+    git(repository, "commit", "-q", "--allow-empty", "-m", "local")
+    with mock.patch("plum_tools.utils.drift.run_git") as mock_run_git:
+        drift = check_drift(repository)[1]
+    # 分叉的提交较少时通过 git cat-file 常驻进程统计
+    mock_run_git.assert_not_called()
+    assert (drift.branch, drift.ahead, drift.behind) == ("master", 1, 0)
+
+    with mock.patch("plum_tools.utils.drift.count_divergence", return_value=None):
+        drift = check_drift(repository)[1]
+    assert (drift.branch, drift.ahead, drift.behind) == ("master", 1, 0)
+
+
+def test_check_drift_error_only_affects_branch(repository: str) -> None:
+    git(repository, "commit", "-q", "--allow-empty", "-m", "local")
+    error = RunCmdError("run git fail", out_msg="", err_msg="fatal: bad object\n")
+    with (
+        mock.patch("plum_tools.utils.drift.count_divergence", return_value=None),
+        mock.patch("plum_tools.utils.drift.run_git", side_effect=error),
+    ):
+        drifts = {drift.branch: drift for drift in check_drift(repository)}
+
+    assert (drifts["master"].ahead, drifts["master"].error) == (None, "fatal: bad object")
+    assert drifts["master"].drifted
+    assert (drifts["feature"].ahead, drifts["feature"].behind, drifts["feature"].error) == (0, 0, None)
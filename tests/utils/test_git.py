@@ -11,18 +11,29 @@
 """
 
 import os
+import subprocess
+from pathlib import Path
 from unittest import mock
 
 import pytest
 
+from plum_tools.exceptions import RunCmdError, RunCmdTimeout
 from plum_tools.utils.git import (
+    RepoStatus,
     check_is_git_repository,
     check_repository_modify_status,
     check_repository_stash,
+    format_status,
     get_current_branch_name,
+    get_repository_status,
+    get_stash_messages,
+    iter_git,
+    iter_status_lines,
+    parse_status,
+    run_git,
 )
 from plum_tools.utils.utils import cd
-from tests.common import make_temp_dir
+from tests.common import git, make_repository, make_temp_dir
 
 
 @pytest.mark.parametrize(
@@ -36,9 +47,9 @@ from tests.common import make_temp_dir
     ],
 )
 def test_get_current_branch_name(mock_data: str, data: str) -> None:
-    with mock.patch("plum_tools.utils.git.run_cmd", return_value=mock_data) as m:
+    with mock.patch("plum_tools.utils.git.run_git", return_value=mock_data) as m:
         assert get_current_branch_name() == data
-        m.assert_called_with("git rev-parse --abbrev-ref HEAD")
+        m.assert_called_with("git rev-parse --abbrev-ref HEAD", os.getcwd())
 
 
 def test_check_is_git_repository_with_is_repository() -> None:
@@ -69,10 +80,10 @@ def test_check_is_git_repository_with_not_repository() -> None:
     ],
 )
 def test_check_repository_modify_status_with_pull_or_push(status_output: str) -> None:
-    with mock.patch("plum_tools.utils.git.run_cmd", return_value=status_output) as m:
+    with mock.patch("plum_tools.utils.git.run_git", return_value=status_output) as m:
         with make_temp_dir() as temp_dir:
             assert check_repository_modify_status(temp_dir)
-        m.assert_called_with("git status")
+        m.assert_called_with("git status", temp_dir)
 
 
 @pytest.mark.parametrize(
@@ -83,11 +94,11 @@ def test_check_repository_modify_status_with_pull_or_push(status_output: str) ->
     ],
 )
 def test_check_repository_modify_status(status_output: str, short_output: str, result: bool) -> None:
-    def run_cmd(cmd: str) -> str:
+    def run_git(cmd: str, _: str) -> str:
         data = {"git status": status_output, "git status -s": short_output}
         return data[cmd]
 
-    with mock.patch("plum_tools.utils.git.run_cmd", new=run_cmd):
+    with mock.patch("plum_tools.utils.git.run_git", new=run_git):
         with make_temp_dir() as temp_dir:
             r, output = check_repository_modify_status(temp_dir)
             assert result == r
@@ -102,9 +113,153 @@ def test_check_repository_modify_status(status_output: str, short_output: str, r
     ],
 )
 def test_check_repository_stash(stash_output: str, result: bool) -> None:
-    with mock.patch("plum_tools.utils.git.run_cmd", return_value=stash_output) as m:
+    with mock.patch("plum_tools.utils.git.run_git", return_value=stash_output) as m:
         with make_temp_dir() as temp_dir:
             r, output = check_repository_stash(temp_dir)
             assert result == r
             assert output == stash_output
-            m.assert_called_with("git stash list")
+            m.assert_called_with("git stash list", temp_dir)
+
+
+@pytest.fixture
+def repository(tmp_path: Path) -> str:
+    return make_repository(str(tmp_path))
+
+
+def test_run_git(repository: str) -> None:
+    assert run_git("git rev-parse --abbrev-ref HEAD", repository) == "master\n"
+    with pytest.raises(RunCmdError) as e:
+        run_git("git rev-parse not-exists", repository)
+    assert "not-exists" in e.value.err_msg
+
+
+def test_run_git_with_timeout() -> None:
+    with mock.patch("plum_tools.utils.git.subprocess.run", side_effect=subprocess.TimeoutExpired("git", 1)):
+        with pytest.raises(RunCmdTimeout):
+            run_git("git status", "/tmp", 1)
+
+
+def test_get_repository_status_clean(repository: str) -> None:
+    status = get_repository_status(repository)
+
+    assert status == RepoStatus(repository, "master", status.commit, "origin/master")
+    assert status.commit and len(status.commit) == 40
+    assert not status.dirty
+    assert not status.modified
+
+
+def test_get_repository_status(repository: str) -> None:
+    with open(os.path.join(repository, "a b.txt"), "w", encoding="utf-8") as f:
+        f.write("a")
+    git(repository, "add", "a b.txt")
+    git(repository, "commit", "-q", "-m", "a")
+    with open(os.path.join(repository, "a b.txt"), "w", encoding="utf-8") as f:
+        f.write("b")
+    git(repository, "stash", "-q")
+    git(repository, "mv", "a b.txt", "c.txt")
+    with open(os.path.join(repository, "d.txt"), "w", encoding="utf-8") as f:
+        f.write("d")
+
+    status = get_repository_status(repository)
+
+    assert status.branch == "master"
+    assert (status.ahead, status.behind) == (1, 0)
+    assert status.changed == [("R.", "c.txt")]
+    assert status.untracked == ["d.txt"]
+    assert status.stash == 1
+    assert status.dirty
+    assert format_status(status) == "## master...origin/master [ahead 1]\nR  c.txt\n?? d.txt\n## stash 1"
+
+
+def test_parse_status() -> None:
+    records = [
+        "# branch.oid (initial)",
+        "# branch.head (detached)",
+        "# branch.ab +0 -3",
+        "1 .M N... 100644 100644 100644 abc abc x y.txt",
+        "u UU N... 100644 100644 100644 100644 a b c conflict file.txt",
+        "2 R. N... 100644 100644 100644 a a R100 new.txt",
+        "old.txt",
+        "? new dir/",
+        "! ignored.txt",
+        "! build/",
+    ]
+
+    status = parse_status("/tmp", records)
+
+    assert status.commit is None
+    assert status.branch is None
+    assert status.behind == 3
+    assert status.changed == [(".M", "x y.txt"), ("UU", "conflict file.txt"), ("R.", "new.txt")]
+    assert status.untracked == ["new dir/"]
+    assert status.ignored == ["build/"]
+    assert status.modified
+    assert format_status(status).startswith("## HEAD (no branch) [behind 3]\n M x y.txt")
+
+
+def test_parse_status_with_limit() -> None:
+    records = [
+        "# branch.head master",
+        "1 .M N... 100644 100644 100644 abc abc a.txt",
+        "2 R. N... 100644 100644 100644 a a R100 new.txt",
+        "old.txt",
+        "1 .M N... 100644 100644 100644 abc abc b.txt",
+        "? c.txt",
+        "? d.txt",
+    ]
+
+    status = parse_status("/tmp", records, limit=1)
+
+    assert status.changed == [(".M", "a.txt")]
+    assert status.untracked == ["c.txt"]
+    assert (status.changed_count, status.untracked_count) == (3, 2)
+    assert format_status(status) == "## master\n M a.txt\n?? c.txt\n## ... 2 more changed, 1 more untracked"
+    status = parse_status("/tmp", records[:1] + records[-1:], limit=0)
+    assert status.untracked == [] and status.dirty
+
+
+def test_iter_git(repository: str) -> None:
+    for name in ("a.txt", "b.txt", "c.txt"):
+        with open(os.path.join(repository, name), "w", encoding="utf-8") as f:
+            f.write(name)
+    records = list(iter_git("git status --porcelain -z", repository, chunk_size=4))
+    assert records == ["?? a.txt", "?? b.txt", "?? c.txt"]
+    assert list(iter_git("git rev-parse --abbrev-ref HEAD", repository, sep=b"\n")) == ["master"]
+
+    with pytest.raises(RunCmdError) as e:
+        list(iter_git("git rev-parse not-exists", repository))
+    assert "not-exists" in e.value.err_msg
+    with pytest.raises(RunCmdTimeout):
+        list(iter_git("sleep 5", repository, timeout=0.1))
+
+
+def test_iter_status_lines(repository: str) -> None:
+    assert list(iter_status_lines(repository)) == ["## master...origin/master"]
+    for name in ("a.txt", "b.txt"):
+        with open(os.path.join(repository, name), "w", encoding="utf-8") as f:
+            f.write(name)
+    git(repository, "add", "a.txt")
+    git(repository, "stash", "-q")
+    with open(os.path.join(repository, "c.txt"), "w", encoding="utf-8") as f:
+        f.write("c")
+
+    lines = list(iter_status_lines(repository))
+    assert lines == ["## master...origin/master", "?? b.txt", "?? c.txt", "## stash 1"]
+    assert lines == format_status(get_repository_status(repository)).splitlines()
+
+
+def test_get_stash_messages(repository: str) -> None:
+    assert get_stash_messages(repository) == []
+    for i in range(2):
+        with open(os.path.join(repository, "a.txt"), "w", encoding="utf-8") as f:
+            f.write(str(i))
+        git(repository, "add", "a.txt")
+        git(repository, "stash", "save", "-q", f"stash {i}")
+    expected = ["On master: stash 1", "On master: stash 0"]
+    with mock.patch("plum_tools.utils.git.run_git") as mock_run_git:
+        assert get_stash_messages(repository) == expected
+    mock_run_git.assert_not_called()
+
+    # 引用日志无法使用时执行git命令
+    with mock.patch("plum_tools.utils.gitmeta.GitMeta.read_reflog", return_value=None):
+        assert get_stash_messages(repository) == expected
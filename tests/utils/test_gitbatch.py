@@ -0,0 +1,104 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_gitbatch
+#         Desc: 测试通过 git cat-file 常驻进程查询引用和对象
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 23:40
+#=============================================================================
+"""
+
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from plum_tools.exceptions import RunCmdError
+from plum_tools.utils.gitbatch import CatFile, CatFilePool, count_divergence, parse_commit, resolve_ref
+from plum_tools.utils.gitmeta import GitMeta
+from tests.common import git, make_repository
+
+
+@pytest.fixture
+def repository(tmp_path: Path) -> str:
+    return make_repository(str(tmp_path))
+
+
+def rev_list_count(repo: str, commit: str, other: str) -> tuple[int, int]:
+    ahead, behind = git(repo, "rev-list", "--left-right", "--count", f"{commit}...{other}").split()
+    return int(ahead), int(behind)
+
+
+def test_cat_file_info_and_read(repository: str) -> None:
+    head = git(repository, "rev-parse", "HEAD").strip()
+    with CatFile(repository) as cat:
+        info = cat.info("HEAD")
+        assert info is not None
+        assert (info.sha, info.type) == (head, "commit")
+        assert cat.resolve("refs/heads/master") == head
+        assert cat.info("refs/heads/nope") is None
+        assert cat.info("no such name") is None
+        item = cat.read("HEAD")
+        assert item is not None
+        info, content = item
+        assert len(content) == info.size
+        assert parse_commit(content)[0] == []
+        assert cat.read("refs/heads/nope") is None
+        with pytest.raises(ValueError):
+            cat.info("HEAD\nHEAD")
+
+
+def test_cat_file_restart(repository: str) -> None:
+    head = git(repository, "rev-parse", "HEAD").strip()
+    with CatFile(repository) as cat:
+        assert cat.resolve("HEAD") == head
+        # 没有上游分支时 cat-file 进程会退出
+        with pytest.raises(RunCmdError):
+            cat.resolve("refs/heads/nope@{upstream}")
+        assert cat.resolve("HEAD") == head
+
+
+def test_cat_file_pool(tmp_path: Path) -> None:
+    first = make_repository(str(tmp_path / "first"))
+    second = make_repository(str(tmp_path / "second"))
+    pool = CatFilePool(1)
+    cat = pool.get(first)
+    assert pool.get(first) is cat
+    cat.resolve("HEAD")
+    with mock.patch.object(cat, "close", wraps=cat.close) as mock_close:
+        assert pool.get(second) is not cat
+    mock_close.assert_called_once_with()
+    pool.close()
+
+
+def test_count_divergence(repository: str) -> None:
+    for i in range(3):
+        git(repository, "commit", "-q", "--allow-empty", "-m", f"master {i}")
+    git(repository, "checkout", "-q", "-b", "feature", "HEAD~2")
+    for i in range(2):
+        git(repository, "commit", "-q", "--allow-empty", "-m", f"feature {i}")
+    git(repository, "merge", "-q", "--no-edit", "master~1")
+    git(repository, "commit", "-q", "--allow-empty", "-m", "feature 2")
+    with CatFile(repository) as cat:
+        for commit, other in [("feature", "master"), ("master", "feature"), ("master", "master~3")]:
+            left = git(repository, "rev-parse", commit).strip()
+            right = git(repository, "rev-parse", other).strip()
+            assert count_divergence(cat, left, right) == rev_list_count(repository, left, right)
+        left = git(repository, "rev-parse", "feature").strip()
+        right = git(repository, "rev-parse", "master").strip()
+        # 超过数量限制时无法统计
+        assert count_divergence(cat, left, right, limit=2) is None
+        assert count_divergence(cat, left, "0" * 40) is None
+
+
+def test_resolve_ref(repository: str) -> None:
+    head = git(repository, "rev-parse", "HEAD").strip()
+    meta = GitMeta.open(repository)
+    with mock.patch("plum_tools.utils.gitbatch.get_cat_file") as mock_cat_file:
+        assert resolve_ref(repository, "refs/heads/master", meta) == head
+    mock_cat_file.assert_not_called()
+    # 无法直接读取 .git 目录时通过常驻进程查询
+    assert resolve_ref(repository, "refs/heads/master") == head
+    assert resolve_ref(repository, "refs/heads/nope", meta) is None
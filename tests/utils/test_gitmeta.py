@@ -0,0 +1,235 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_gitmeta
+#         Desc: 测试直接读取 .git 目录判断仓库状态
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 17:50
+#=============================================================================
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from plum_tools.utils.git import get_repository_status
+from plum_tools.utils.gitmeta import (
+    STATE_CLEAN,
+    STATE_DIRTY,
+    STATE_UNKNOWN,
+    GitMeta,
+    parse_config,
+    parse_index,
+    quick_status,
+    record_clean,
+)
+from tests.common import git, make_repository
+
+
+def make_old(repo: str) -> None:
+    """把工作区文件和目录的mtime改到很久以前，然后刷新索引，避免被当作刚修改过的文件"""
+    for root, dirs, files in os.walk(repo):
+        dirs[:] = [name for name in dirs if name != ".git"]
+        for name in files:
+            os.utime(os.path.join(root, name), (1000, 1000))
+        os.utime(root, (1000, 1000))
+    git(repo, "update-index", "--refresh")
+
+
+@pytest.fixture
+def repository(tmp_path: Path) -> str:
+    repo = make_repository(str(tmp_path))
+    for name in ("a.txt", "src/b.txt"):
+        os.makedirs(os.path.dirname(os.path.join(repo, name)), exist_ok=True)
+        with open(os.path.join(repo, name), "w", encoding="utf-8") as f:
+            f.write(name)
+    with open(os.path.join(repo, ".gitignore"), "w", encoding="utf-8") as f:
+        f.write("build/\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-q", "-m", "files")
+    git(repo, "push", "-q", "origin", "master")
+    os.makedirs(os.path.join(repo, "build", "lib"))
+    make_old(repo)
+    return repo
+
+
+def record(repo: str) -> None:
+    status = get_repository_status(repo, ignored=True)
+    assert not status.dirty
+    assert status.ignored == ["build/"]
+    assert record_clean(repo, status.ignored)
+
+
+def test_parse_config() -> None:
+    config = parse_config("""
+[core]
+    bare = false
+# comment
+[remote "origin"]
+    url = git@github.com:seekplum/plum_tools.git
+    fetch = +refs/heads/*:refs/remotes/origin/*
+[Branch "Feature"]
+    Remote = "origin"
+""")
+
+    assert config["core.bare"] == ["false"]
+    assert config["remote.origin.fetch"] == ["+refs/heads/*:refs/remotes/origin/*"]
+    assert config["branch.Feature.remote"] == ["origin"]
+
+
+@pytest.mark.parametrize("version", ["2", "3", "4"])
+def test_parse_index(repository: str, version: str) -> None:
+    git(repository, "update-index", "--index-version", version)
+    with open(os.path.join(repository, ".git", "index"), "rb") as f:
+        entries = parse_index(f.read())
+
+    assert entries is not None
+    assert [entry.path for entry in entries] == [".gitignore", "a.txt", "src/b.txt"]
+    assert entries[2].file_stat.size == len("src/b.txt")
+    assert entries[2].file_stat.mtime_s == 1000
+
+
+def test_parse_index_with_invalid_data() -> None:
+    assert parse_index(b"") is None
+    assert parse_index(b"DIRC\x00\x00\x00\x09\x00\x00\x00\x00") is None
+
+
+def test_git_meta(repository: str) -> None:
+    meta = GitMeta.open(repository)
+    assert meta is not None
+    branch, head = meta.read_head()
+    assert branch == "master"
+    assert head == git(repository, "rev-parse", "HEAD").strip()
+    assert meta.get_upstream("master") == "refs/remotes/origin/master"
+    assert meta.get_upstream("not-exists") is None
+    assert meta.stash_count() == 0
+
+    git(repository, "pack-refs", "--all")
+    meta = GitMeta.open(repository)
+    assert meta is not None
+    assert not os.path.exists(os.path.join(repository, ".git", "refs", "heads", "master"))
+    assert meta.resolve_ref("refs/remotes/origin/master") == head
+
+    for i in range(2):
+        with open(os.path.join(repository, "a.txt"), "w", encoding="utf-8") as f:
+            f.write(str(i))
+        git(repository, "stash", "-q")
+    assert meta.stash_count() == 2
+
+
+def test_list_refs(repository: str, tmp_path: Path) -> None:
+    head = git(repository, "rev-parse", "HEAD").strip()
+    git(repository, "branch", "feature/a")
+    git(repository, "pack-refs", "--all")
+    git(repository, "commit", "-q", "--allow-empty", "-m", "loose")
+    meta = GitMeta.open(repository)
+    assert meta is not None
+    # 松散引用覆盖 packed-refs 中的旧值
+    assert meta.list_refs() == {
+        "refs/heads/master": git(repository, "rev-parse", "HEAD").strip(),
+        "refs/heads/feature/a": head,
+    }
+    assert meta.list_refs("refs/remotes/") == {"refs/remotes/origin/master": head}
+
+    mirror = str(tmp_path / "mirror.git")
+    git(str(tmp_path), "clone", "-q", "--mirror", repository, mirror)
+    bare = GitMeta.open_bare(mirror)
+    assert bare is not None
+    assert bare.list_refs()["refs/heads/feature/a"] == head
+    assert GitMeta.open_bare(repository) is None
+
+
+def test_discover_and_read_reflog(repository: str) -> None:
+    meta = GitMeta.discover(os.path.join(repository, "src"))
+    assert meta is not None and meta.worktree == repository
+    assert meta.read_reflog("refs/stash") == []
+
+    for i in range(2):
+        with open(os.path.join(repository, "a.txt"), "w", encoding="utf-8") as f:
+            f.write(str(i))
+        git(repository, "stash", "save", "-q", f"stash {i}")
+    entries = meta.read_reflog("refs/stash")
+    assert entries is not None
+    assert [message for _, message in entries] == ["On master: stash 1", "On master: stash 0"]
+    assert entries[0][0] == git(repository, "rev-parse", "stash@{0}").strip()
+
+    # 引用日志和引用不一致时不能使用
+    os.remove(os.path.join(repository, ".git", "logs", "refs", "stash"))
+    assert meta.read_reflog("refs/stash") is None
+
+
+def test_git_meta_with_worktree(repository: str, tmp_path: Path) -> None:
+    worktree = str(tmp_path / "worktree")
+    git(repository, "worktree", "add", "-q", "-b", "feature", worktree)
+
+    meta = GitMeta.open(worktree)
+    assert meta is not None
+    assert meta.common_dir == os.path.join(repository, ".git")
+    assert meta.read_head() == ("feature", git(repository, "rev-parse", "HEAD").strip())
+    assert GitMeta.open(str(tmp_path)) is None
+    assert meta.list_worktrees() == {"master": repository, "feature": worktree}
+    git(worktree, "checkout", "-q", "--detach")
+    assert meta.list_worktrees() == {"master": repository}
+
+
+def test_quick_status_without_snapshot(repository: str) -> None:
+    assert quick_status(repository).state == STATE_UNKNOWN
+
+    record(repository)
+    result = quick_status(repository)
+    assert result.state == STATE_CLEAN
+    assert result.branch == "master"
+
+
+def test_quick_status_with_changes(repository: str) -> None:
+    record(repository)
+
+    # 忽略的目录中新增文件不影响
+    with open(os.path.join(repository, "build", "lib", "c.o"), "w", encoding="utf-8") as f:
+        f.write("c")
+    assert quick_status(repository).state == STATE_CLEAN
+
+    # 新增文件，可能是未跟踪的文件
+    with open(os.path.join(repository, "src", "d.txt"), "w", encoding="utf-8") as f:
+        f.write("d")
+    assert quick_status(repository).state == STATE_UNKNOWN
+    os.remove(os.path.join(repository, "src", "d.txt"))
+    make_old(repository)
+    record(repository)
+    assert quick_status(repository).state == STATE_CLEAN
+
+    # 文件内容修改
+    with open(os.path.join(repository, "a.txt"), "w", encoding="utf-8") as f:
+        f.write("changed")
+    assert quick_status(repository).state == STATE_UNKNOWN
+
+    # 文件被删除
+    os.remove(os.path.join(repository, "src", "b.txt"))
+    assert quick_status(repository).state == STATE_DIRTY
+
+
+def test_quick_status_with_staged_changes(repository: str) -> None:
+    record(repository)
+    with open(os.path.join(repository, "a.txt"), "w", encoding="utf-8") as f:
+        f.write("staged")
+    git(repository, "add", "a.txt")
+    os.utime(os.path.join(repository, "a.txt"), (1000, 1000))
+    git(repository, "update-index", "--refresh")
+
+    assert quick_status(repository).state == STATE_UNKNOWN
+
+
+def test_quick_status_ahead_of_upstream(repository: str) -> None:
+    record(repository)
+    git(repository, "commit", "-q", "--allow-empty", "-m", "ahead")
+
+    assert quick_status(repository).state == STATE_DIRTY
+
+
+def test_quick_status_with_too_many_entries(repository: str) -> None:
+    record(repository)
+
+    assert quick_status(repository, max_entries=2).state == STATE_UNKNOWN
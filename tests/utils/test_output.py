@@ -0,0 +1,95 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_output
+#         Desc: 测试结构化输出
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 14:40
+#=============================================================================
+"""
+
+import io
+import json
+
+import pytest
+
+from plum_tools.utils.output import CsvWriter, JsonWriter, NdjsonWriter, RecordWriter, TableWriter, get_writer
+
+RECORDS: list[dict[str, object]] = [{"ip": "10.0.0.1", "state": "up", "extra": 1}, {"state": "down", "ip": "10.0.0.2"}]
+
+
+def test_ndjson_writer_streams_one_line_per_record() -> None:
+    stream = io.StringIO()
+    with NdjsonWriter(["ip", "state"], stream) as writer:
+        writer.write(RECORDS[0])
+        # 写完一条记录就能被解析，不需要等待结束
+        assert json.loads(stream.getvalue()) == {"ip": "10.0.0.1", "state": "up"}
+        writer.write(RECORDS[1])
+
+    assert stream.getvalue().splitlines()[1] == '{"ip": "10.0.0.2", "state": "down"}'
+
+
+def test_json_writer_outputs_array() -> None:
+    stream = io.StringIO()
+    with JsonWriter(["ip", "state"], stream) as writer:
+        for record in RECORDS:
+            writer.write(record)
+
+    assert json.loads(stream.getvalue()) == [
+        {"ip": "10.0.0.1", "state": "up"},
+        {"ip": "10.0.0.2", "state": "down"},
+    ]
+
+
+def test_json_writer_without_records() -> None:
+    stream = io.StringIO()
+    with JsonWriter(["ip"], stream):
+        pass
+
+    assert json.loads(stream.getvalue()) == []
+
+
+def test_csv_writer() -> None:
+    stream = io.StringIO()
+    with CsvWriter(["ip", "state", "rtt"], stream) as writer:
+        for record in RECORDS:
+            writer.write(record)
+
+    assert stream.getvalue() == "ip,state,rtt\n10.0.0.1,up,\n10.0.0.2,down,\n"
+
+
+def test_table_writer() -> None:
+    stream = io.StringIO()
+    with TableWriter(["state", "rtt", "ip"], stream) as writer:
+        for record in RECORDS:
+            writer.write(record)
+
+    assert stream.getvalue().splitlines() == [
+        "state     rtt       ip",
+        "up        -         10.0.0.1",
+        "down      -         10.0.0.2",
+    ]
+
+
+@pytest.mark.parametrize(
+    "fmt, writer_class",
+    [("json", JsonWriter), ("ndjson", NdjsonWriter), ("csv", CsvWriter), ("table", TableWriter)],
+)
+def test_get_writer(fmt: str, writer_class: type) -> None:
+    assert isinstance(get_writer(fmt, ["ip"], io.StringIO()), writer_class)
+
+
+def test_get_writer_with_unknown_format() -> None:
+    with pytest.raises(ValueError):
+        get_writer("xml", ["ip"])
+
+
+def test_record_writer_requires_write() -> None:
+    class IncompleteWriter(RecordWriter):
+        pass
+
+    # 没有实现 _write 的子类在创建时就报错，而不是输出时才报错
+    with pytest.raises(TypeError):
+        IncompleteWriter(["ip"])  # type: ignore[abstract]
@@ -0,0 +1,305 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_probe
+#         Desc: 测试主机存活探测模块
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 10:40
+#=============================================================================
+"""
+
+import asyncio
+import socket
+import struct
+import time
+from unittest import mock
+
+import pytest
+
+from plum_tools.utils.probe import (
+    AdaptiveTimeout,
+    IcmpProber,
+    ProbeResult,
+    TcpProber,
+    TokenBucket,
+    build_echo_request,
+    checksum,
+    create_prober,
+    icmp_available,
+    iter_sweep,
+    iter_sweep_ordered,
+    limit_concurrency,
+    parse_echo_reply,
+    percentile,
+)
+
+
+def test_build_echo_request_has_valid_checksum() -> None:
+    packet = build_echo_request(7)
+
+    assert packet[0] == 8
+    assert struct.unpack("!H", packet[6:8])[0] == 7
+    assert checksum(packet) == 0
+
+
+@pytest.mark.parametrize("with_ip_header", [False, True])
+def test_parse_echo_reply(with_ip_header: bool) -> None:
+    reply = struct.pack("!BBHHH", 0, 0, 0, 0, 42) + b"data"
+    if with_ip_header:
+        reply = b"\x45" + b"\x00" * 19 + reply
+
+    assert parse_echo_reply(reply) == 42
+
+
+@pytest.mark.parametrize("data", [b"", b"\x00\x00", struct.pack("!BBHHH", 3, 1, 0, 0, 42)])
+def test_parse_echo_reply_ignores_other_messages(data: bytes) -> None:
+    assert parse_echo_reply(data) is None
+
+
+def test_icmp_available_when_permission_denied() -> None:
+    with mock.patch("plum_tools.utils.probe.socket.socket", side_effect=PermissionError):
+        assert not icmp_available()
+
+
+def test_icmp_available() -> None:
+    with mock.patch("plum_tools.utils.probe.socket.socket") as mock_socket:
+        assert icmp_available()
+    mock_socket.assert_called_once_with(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    mock_socket.return_value.close.assert_called_once_with()
+
+
+@pytest.mark.parametrize(
+    "mode, available, prober_class",
+    [
+        ("auto", True, IcmpProber),
+        ("auto", False, TcpProber),
+        ("icmp", False, IcmpProber),
+        ("tcp", True, TcpProber),
+    ],
+)
+def test_create_prober(mode: str, available: bool, prober_class: type) -> None:
+    with mock.patch("plum_tools.utils.probe.icmp_available", return_value=available):
+        assert isinstance(create_prober(mode, 1, [22]), prober_class)
+
+
+def test_limit_concurrency() -> None:
+    assert limit_concurrency(5000, IcmpProber(1)) == 5000
+    with mock.patch("plum_tools.utils.probe.resource.getrlimit", return_value=(1024, 4096)):
+        assert limit_concurrency(5000, TcpProber(1, [22, 80])) == 480
+        assert limit_concurrency(10, TcpProber(1, [22, 80])) == 10
+
+
+def test_tcp_prober_with_listening_port() -> None:
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+        result = asyncio.run(TcpProber(1, [port]).probe("127.0.0.1"))
+
+    assert result.alive
+    assert result.probe == "tcp"
+    assert result.rtt is not None
+
+
+def test_tcp_prober_with_refused_port() -> None:
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        port = server.getsockname()[1]
+        result = asyncio.run(TcpProber(1, [port]).probe("127.0.0.1"))
+
+    assert result.alive
+
+
+def test_tcp_prober_with_unreachable_host() -> None:
+    async def unreachable(*_: object) -> float:
+        raise OSError("No route to host")
+
+    with mock.patch.object(TcpProber, "_connect", side_effect=unreachable):
+        result = asyncio.run(TcpProber(1, [22, 80]).probe("10.0.0.1"))
+
+    assert result == ProbeResult("10.0.0.1", False, None, "tcp", [], 1)
+
+
+def test_tcp_prober_with_timeout() -> None:
+    async def hang(*_: object) -> float:
+        await asyncio.sleep(10)
+        return 0
+
+    with mock.patch.object(TcpProber, "_connect", side_effect=hang):
+        result = asyncio.run(TcpProber(0.01, [22]).probe("10.0.0.1"))
+
+    assert not result.alive
+
+
+def test_icmp_prober_matches_reply_by_address_and_sequence() -> None:
+    sent: list[bytes] = []
+
+    async def probe() -> ProbeResult:
+        prober = IcmpProber(1)
+        sock = mock.Mock()
+        sock.sendto.side_effect = lambda packet, _: sent.append(packet)
+        prober._sock = sock
+        task = asyncio.ensure_future(prober.probe("10.0.0.1"))
+        await asyncio.sleep(0)
+        seq = struct.unpack("!H", sent[0][6:8])[0]
+        reply = struct.pack("!BBHHH", 0, 0, 0, 0, seq)
+        sock.recvfrom.side_effect = [(reply, ("10.0.0.2", 0)), (reply, ("10.0.0.1", 0)), BlockingIOError]
+        prober._on_readable()
+        return await task
+
+    result = asyncio.run(probe())
+
+    assert result.alive
+    assert result.probe == "icmp"
+
+
+def test_iter_sweep_bounds_in_flight_probes() -> None:
+    in_flight = 0
+    max_in_flight = 0
+
+    class Prober:
+        async def probe(self, ip: str) -> ProbeResult:
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+            return ProbeResult(ip, ip.endswith("1"))
+
+    async def collect() -> list[ProbeResult]:
+        targets = (f"10.0.0.{i}" for i in range(1, 101))
+        return [item async for item in iter_sweep(targets, Prober(), 8)]  # type: ignore[arg-type]
+
+    results = asyncio.run(collect())
+
+    assert len(results) == 100
+    assert max_in_flight == 8
+    alive = {f"10.0.0.{i}" for i in (1, 11, 21, 31, 41, 51, 61, 71, 81, 91)}
+    assert {item.ip for item in results if item.alive} == alive
+
+
+def test_iter_sweep_ordered_keeps_target_order() -> None:
+    started: list[str] = []
+
+    class Prober:
+        async def probe(self, ip: str) -> ProbeResult:
+            started.append(ip)
+            # 越靠前的目标应答越慢
+            await asyncio.sleep(0.001 * (10 - int(ip.rsplit(".", 1)[1])))
+            return ProbeResult(ip, True)
+
+    async def collect() -> list[str]:
+        results: list[str] = []
+        async for item in iter_sweep_ordered((f"10.0.0.{i}" for i in range(1, 10)), Prober(), 3):  # type: ignore
+            # 结果按顺序返回时，已经开始的探测最多只比已返回的多 `concurrency` 个
+            assert len(started) <= len(results) + 3
+            results.append(item.ip)
+        return results
+
+    assert asyncio.run(collect()) == [f"10.0.0.{i}" for i in range(1, 10)]
+
+
+def test_iter_sweep_awaits_cancelled_probes() -> None:
+    cancelled: list[str] = []
+
+    class Prober:
+        async def probe(self, ip: str) -> ProbeResult:
+            try:
+                await asyncio.sleep(0 if ip.endswith(".1") else 10)
+            except asyncio.CancelledError:
+                cancelled.append(ip)
+                raise
+            return ProbeResult(ip, True)
+
+    async def first() -> str:
+        sweep = iter_sweep((f"10.0.0.{i}" for i in range(1, 5)), Prober(), 4)  # type: ignore[arg-type]
+        item = await sweep.__anext__()
+        await sweep.aclose()
+        # 关闭后取消的探测已经结束，不需要再等待事件循环调度
+        assert sorted(cancelled) == ["10.0.0.2", "10.0.0.3", "10.0.0.4"]
+        return item.ip
+
+    assert asyncio.run(first()) == "10.0.0.1"
+
+
+@pytest.mark.parametrize("pct, value", [(0, 1), (50, 5), (95, 10), (100, 10)])
+def test_percentile(pct: float, value: float) -> None:
+    assert percentile(list(range(1, 11)), pct) == value
+
+
+def test_probe_result_stats() -> None:
+    result = ProbeResult("10.0.0.1", True, 0.2, "icmp", [0.3, 0.1, 0.2], 3)
+
+    assert result.rtt_min == 0.1
+    assert result.rtt_p95 == 0.3
+    assert ProbeResult("10.0.0.2", False).rtt_p95 is None
+
+
+def test_token_bucket_limits_rate() -> None:
+    async def acquire_all() -> float:
+        bucket = TokenBucket(200, burst=1)
+        start = time.monotonic()
+        for _ in range(11):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # 第一个令牌立即可用，后面10个令牌需要 10 / 200 = 0.05 秒
+    assert asyncio.run(acquire_all()) >= 0.045
+
+
+def test_token_bucket_without_limit() -> None:
+    with mock.patch("plum_tools.utils.probe.asyncio.sleep") as mock_sleep:
+        asyncio.run(TokenBucket(0).acquire())
+    mock_sleep.assert_not_called()
+
+
+def test_adaptive_timeout_shrinks_to_observed_rtt() -> None:
+    timeout = AdaptiveTimeout(3, 0.2)
+    for _ in range(9):
+        timeout.observe(0.1)
+    assert timeout.current == 3
+
+    timeout.observe(0.1)
+    assert timeout.current == pytest.approx(0.4)
+
+    for _ in range(200):
+        timeout.observe(0.001)
+    # 不会低于下限
+    assert timeout.current == 0.2
+
+
+def test_adaptive_timeout_is_fixed_without_minimum() -> None:
+    timeout = AdaptiveTimeout(3, 3)
+    for _ in range(20):
+        timeout.observe(0.001)
+
+    assert timeout.current == 3
+
+
+def test_adaptive_timeout_cuts_off_pending_probe() -> None:
+    async def wait() -> float:
+        timeout = AdaptiveTimeout(5, 0.01)
+        future = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        task = asyncio.ensure_future(timeout.wait({future}, start))
+        await asyncio.sleep(0.02)
+        # 等待过程中超时时间变短，正在等待的探测会提前结束
+        for _ in range(10):
+            timeout.observe(0.001)
+        assert await task == set()
+        return time.perf_counter() - start
+
+    assert asyncio.run(wait()) < 1
+
+
+def test_prober_sends_count_probes() -> None:
+    prober = TcpProber(1, [22], count=3)
+    with mock.patch.object(TcpProber, "_probe_once", side_effect=[0.1, None, 0.3]):
+        result = asyncio.run(prober.probe("10.0.0.1"))
+
+    assert result.alive
+    assert result.rtts == [0.1, 0.3]
+    assert result.sent == 3
+    assert result.rtt == pytest.approx(0.2)
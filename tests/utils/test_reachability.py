@@ -0,0 +1,127 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_reachability
+#         Desc: 测试主机存活状态缓存
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 13:40
+#=============================================================================
+"""
+
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from plum_tools.utils.reachability import STATE_DOWN, STATE_UP, ReachabilityCache
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> Iterator[ReachabilityCache]:
+    cache = ReachabilityCache(str(tmp_path / "sub" / "pping.db"), 60, 300)
+    cache.open()
+    yield cache
+    cache.close()
+
+
+def test_update_returns_previous_state(cache: ReachabilityCache) -> None:
+    assert cache.get_state("10.0.0", "10.0.0.1") is None
+    assert cache.update("10.0.0", "10.0.0.1", True, now=100) is None
+    assert cache.update("10.0.0", "10.0.0.1", False, now=200) == STATE_UP
+    assert cache.update("10.0.0", "10.0.0.1", True, now=300) == STATE_DOWN
+    assert cache.get_state("10.0.0", "10.0.0.1") == STATE_UP
+    # 不同网段互不影响
+    assert cache.get_state("10.0.0.0/24", "10.0.0.1") is None
+
+
+def test_down_hosts_back_off_exponentially(cache: ReachabilityCache) -> None:
+    for now in (0, 1, 2):
+        cache.update("10.0.0", "10.0.0.1", False, now=now)
+
+    # 连续3次失败，退避 60 * 2^2 = 240 秒
+    assert cache.get_backoff("10.0.0", now=241) == {"10.0.0.1"}
+    assert cache.get_backoff("10.0.0", now=243) == set()
+
+    for now in range(3, 10):
+        cache.update("10.0.0", "10.0.0.1", False, now=now)
+    # 不超过最长退避时间
+    assert cache.get_backoff("10.0.0", now=310) == set()
+
+
+def test_up_resets_backoff(cache: ReachabilityCache) -> None:
+    cache.update("10.0.0", "10.0.0.1", False, now=0)
+    cache.update("10.0.0", "10.0.0.1", True, now=1)
+    cache.update("10.0.0", "10.0.0.1", False, now=2)
+
+    assert cache.get_backoff("10.0.0", now=61) == {"10.0.0.1"}
+    assert cache.get_backoff("10.0.0", now=63) == set()
+
+
+def test_plan_probes_recent_up_hosts_first(cache: ReachabilityCache) -> None:
+    cache.update("10.0.0", "10.0.0.4", True, now=1010)
+    cache.update("10.0.0", "10.0.0.3", True, now=1020)
+    cache.update("10.0.0", "10.0.0.2", False, now=1020)
+    cache.update("10.0.0", "10.0.0.5", False, now=960)
+
+    # 10.0.0.2 还在退避期，10.0.0.5 已经过了退避期
+    targets = [f"10.0.0.{i}" for i in range(1, 7)]
+    assert list(cache.plan("10.0.0", targets, now=1030)) == [
+        "10.0.0.3",
+        "10.0.0.4",
+        "10.0.0.1",
+        "10.0.0.5",
+        "10.0.0.6",
+    ]
+
+
+def test_cache_persists_between_opens(tmp_path: Path) -> None:
+    path = str(tmp_path / "pping.db")
+    with ReachabilityCache(path, 60, 300) as cache:
+        cache.update("10.0.0", "10.0.0.1", True)
+
+    with ReachabilityCache(path, 60, 300) as cache:
+        assert list(cache.iter_up("10.0.0")) == ["10.0.0.1"]
+
+
+def test_closed_cache_raises() -> None:
+    with pytest.raises(RuntimeError):
+        ReachabilityCache("/tmp/not-opened.db", 60, 300).get_state("10.0.0", "10.0.0.1")
+
+
+def test_locked_cache_falls_back(tmp_path: Path) -> None:
+    path = str(tmp_path / "pping.db")
+    with ReachabilityCache(path, 60, 300) as cache:
+        cache.update("10.0.0", "10.0.0.1", True, now=100)
+        cache.commit()
+        assert not cache.conn.in_transaction
+
+        # 其他 pping 正在写缓存时可以读取，写入超时后不再使用缓存
+        other = ReachabilityCache(path, 60, 300)
+        with mock.patch("plum_tools.utils.reachability.PING_CACHE_TIMEOUT", 0.01):
+            assert other.open()
+        cache.update("10.0.0", "10.0.0.2", True, now=100)
+        assert other.get_state("10.0.0", "10.0.0.1") == STATE_UP
+        with mock.patch("plum_tools.utils.reachability.print_warn") as mock_print_warn:
+            assert other.update("10.0.0", "10.0.0.1", False, now=200) is None
+        mock_print_warn.assert_called_once()
+        assert other.disabled
+        assert other.update("10.0.0", "10.0.0.1", False, now=300) is None
+        other.close()
+    with ReachabilityCache(path, 60, 300) as cache:
+        assert cache.get_state("10.0.0", "10.0.0.1") == STATE_UP
+
+
+def test_open_falls_back_when_database_is_locked(tmp_path: Path) -> None:
+    cache = ReachabilityCache(str(tmp_path / "pping.db"), 60, 300)
+    with (
+        mock.patch("plum_tools.utils.reachability.sqlite3.connect", side_effect=sqlite3.OperationalError("locked")),
+        mock.patch("plum_tools.utils.reachability.print_warn") as mock_print_warn,
+    ):
+        assert not cache.open()
+
+    assert cache.disabled
+    mock_print_warn.assert_called_once()
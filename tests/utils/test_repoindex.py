@@ -0,0 +1,136 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_repoindex
+#         Desc: 测试git仓库索引
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 16:30
+#=============================================================================
+"""
+
+import json
+import os
+from pathlib import Path
+from unittest import mock
+
+from plum_tools.utils.repoindex import RepositoryIndex
+from plum_tools.utils.scanner import RepositoryScanner
+
+
+def make_old(path: Path) -> None:
+    """把目录的mtime改到很久以前，避免被当作刚修改过的目录"""
+    for root, dirs, _ in os.walk(path):
+        for name in dirs:
+            os.utime(os.path.join(root, name), (1000, 1000))
+    os.utime(path, (1000, 1000))
+
+
+def scan(index_path: Path, root: Path, rebuild: bool = False, ignore: tuple = ()) -> tuple[list[str], RepositoryIndex]:
+    with RepositoryIndex(str(index_path), ignore, rebuild) as index:
+        result = sorted(RepositoryScanner(ignore, index=index).scan([str(root)]))
+    return result, index
+
+
+def test_unchanged_directories_are_not_listed(tmp_path: Path) -> None:
+    root = tmp_path / "root"
+    for path in ("a/.git", "b/c/.git", "d"):
+        (root / path).mkdir(parents=True)
+    make_old(root)
+    index_path = tmp_path / "index.json"
+
+    result, index = scan(index_path, root)
+    assert result == [str(root / "a"), str(root / "b" / "c")]
+    assert (index.hits, index.misses) == (0, 5)
+
+    with mock.patch("plum_tools.utils.repoindex.list_directory") as mock_list:
+        result, index = scan(index_path, root)
+    assert result == [str(root / "a"), str(root / "b" / "c")]
+    assert (index.hits, index.misses) == (5, 0)
+    mock_list.assert_not_called()
+
+
+def test_changed_subtree_is_walked_again(tmp_path: Path) -> None:
+    root = tmp_path / "root"
+    for path in ("a/.git", "d/e"):
+        (root / path).mkdir(parents=True)
+    make_old(root)
+    index_path = tmp_path / "index.json"
+    scan(index_path, root)
+
+    (root / "d" / "e" / "f" / ".git").mkdir(parents=True)
+    os.utime(root / "d" / "e" / "f", (1000, 1000))
+    os.utime(root / "d" / "e", (2000, 2000))
+
+    result, index = scan(index_path, root)
+    assert result == [str(root / "a"), str(root / "d" / "e" / "f")]
+    # 只有 d/e 和新增的 d/e/f 需要重新读取
+    assert index.misses == 2
+
+    (root / "a" / ".git").rmdir()
+    os.utime(root / "a", (3000, 3000))
+    result, _ = scan(index_path, root)
+    assert result == [str(root / "d" / "e" / "f")]
+
+
+def test_recently_modified_directory_is_not_trusted(tmp_path: Path) -> None:
+    root = tmp_path / "root"
+    (root / "a").mkdir(parents=True)
+    index_path = tmp_path / "index.json"
+    scan(index_path, root)
+
+    _, index = scan(index_path, root)
+    assert index.hits == 0
+
+
+def test_rebuild_and_ignore_change_invalidate_index(tmp_path: Path) -> None:
+    root = tmp_path / "root"
+    (root / "a" / ".git").mkdir(parents=True)
+    make_old(root)
+    index_path = tmp_path / "index.json"
+    scan(index_path, root)
+
+    _, index = scan(index_path, root, rebuild=True)
+    assert index.hits == 0
+    _, index = scan(index_path, root, ignore=("node_modules",))
+    assert index.hits == 0
+    _, index = scan(index_path, root, ignore=("node_modules",))
+    assert index.hits == 2
+
+
+def test_save_keeps_other_roots(tmp_path: Path) -> None:
+    for path in ("x/a/.git", "y/b/.git"):
+        (tmp_path / path).mkdir(parents=True)
+    index_path = tmp_path / "index.json"
+    scan(index_path, tmp_path / "x")
+    scan(index_path, tmp_path / "y")
+
+    with open(index_path, encoding="utf-8") as f:
+        dirs = json.load(f)["dirs"]
+    assert str(tmp_path / "x" / "a") in dirs
+    assert str(tmp_path / "y" / "b") in dirs
+
+
+def test_broken_index_file_is_ignored(tmp_path: Path) -> None:
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    index_path = tmp_path / "cache" / "index.json"
+    index_path.parent.mkdir()
+    index_path.write_text("{not json")
+
+    result, _ = scan(index_path, tmp_path)
+    assert result == [str(tmp_path / "a")]
+
+
+def test_save_failure_only_warns(tmp_path: Path) -> None:
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    # 缓存目录的位置是一个文件，无法创建目录
+    (tmp_path / "cache").write_text("")
+    index_path = tmp_path / "cache" / "index.json"
+
+    with mock.patch("plum_tools.utils.repoindex.print_warn") as mock_warn:
+        result, _ = scan(index_path, tmp_path)
+
+    assert result == [str(tmp_path / "a")]
+    mock_warn.assert_called_once()
+    assert not index_path.exists()
@@ -0,0 +1,83 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_scanner
+#         Desc: 测试并行查找git仓库
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 15:40
+#=============================================================================
+"""
+
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from plum_tools.utils.scanner import RepositoryScanner, list_directory
+
+
+@pytest.fixture
+def tree(tmp_path: Path) -> Path:
+    for path in ("a/.git", "a/sub/.git", "b/node_modules/c/.git", "d/e/.git/refs", "f/g"):
+        (tmp_path / path).mkdir(parents=True)
+    (tmp_path / "w").mkdir()
+    (tmp_path / "w" / ".git").write_text("gitdir: /tmp/a/.git/worktrees/w\n")
+    (tmp_path / "link").symlink_to(tmp_path / "a")
+    return tmp_path
+
+
+def test_list_directory(tree: Path) -> None:
+    is_repo, subdirs = list_directory(str(tree / "a"))
+    assert is_repo
+    assert subdirs == ["sub"]
+
+    is_repo, subdirs = list_directory(str(tree))
+    assert not is_repo
+    # 符号链接不会被遍历
+    assert sorted(subdirs) == ["a", "b", "d", "f", "w"]
+
+    assert list_directory(str(tree / "b")) == (False, [])
+    assert list_directory(str(tree / "not-exists")) == (False, [])
+
+
+def test_scan_stops_at_repository_root(tree: Path) -> None:
+    result = sorted(RepositoryScanner().scan([str(tree)]))
+
+    assert result == [str(tree / "a"), str(tree / "d" / "e"), str(tree / "w")]
+
+
+def test_scan_nested(tree: Path) -> None:
+    result = sorted(RepositoryScanner(nested=True, workers=2).scan([str(tree)]))
+
+    assert result == [str(tree / "a"), str(tree / "a" / "sub"), str(tree / "d" / "e"), str(tree / "w")]
+
+
+def test_scan_with_ignore(tree: Path) -> None:
+    result = sorted(RepositoryScanner(ignore=["d"]).scan([str(tree)]))
+
+    assert result == [str(tree / "a"), str(tree / "b" / "node_modules" / "c"), str(tree / "w")]
+
+
+def test_scan_many_directories(tmp_path: Path) -> None:
+    for i in range(200):
+        (tmp_path / str(i % 7) / str(i) / ".git").mkdir(parents=True)
+
+    result = list(RepositoryScanner(workers=4).scan([str(tmp_path)]))
+
+    assert len(result) == 200
+    assert len(set(result)) == 200
+
+
+def test_scan_reraises_worker_error(tree: Path) -> None:
+    with mock.patch.object(RepositoryScanner, "list_directory", side_effect=ValueError):
+        with pytest.raises(ValueError):
+            list(RepositoryScanner().scan([str(tree)]))
+
+
+def test_scan_stops_early(tree: Path) -> None:
+    scanner = RepositoryScanner(workers=1)
+
+    assert next(scanner.scan([str(tree / "a")])) == os.path.join(str(tree), "a")
@@ -10,13 +10,27 @@
 #=============================================================================
 """
 
+import os
+from collections.abc import Iterator
 from pathlib import Path
 from unittest import mock
 
 import pytest
 
 from plum_tools.conf import PathConfig
-from plum_tools.utils.sshconf import SSHConf, get_host_ip, get_prefix_host_ip, get_ssh_alias_conf, merge_ssh_config
+from plum_tools.utils.sshconf import (
+    _LOADED,
+    SSHConf,
+    SSHConfigIndex,
+    get_host_ip,
+    get_prefix_host_ip,
+    get_ssh_alias_conf,
+    get_ssh_aliases,
+    is_known_host,
+    load_ssh_config,
+    match_pattern_list,
+    merge_ssh_config,
+)
 
 
 class TestSSHConf:
@@ -231,30 +245,124 @@ def test_get_host_ip_returns_full_ip_unchanged() -> None:
     mock_prefix.assert_not_called()
 
 
-def test_get_ssh_alias_conf_reads_matching_alias(tmp_path: Path) -> None:
-    config_path = tmp_path / "config"
-    config_path.write_text(
+@pytest.fixture
+def ssh_config(tmp_path: Path) -> Iterator[Path]:
+    config_path = tmp_path / "ssh" / "config"
+    config_path.parent.mkdir()
+    path_config = mock.Mock(SSH_CONFIG_PATH=str(config_path), SSH_CONFIG_INDEX_PATH=str(tmp_path / "index.json"))
+    with (
+        mock.patch("plum_tools.utils.sshconf.PathConfig", path_config),
+        mock.patch.dict("plum_tools.utils.sshconf._LOADED", clear=True),
+    ):
+        yield config_path
+
+
+def test_get_ssh_alias_conf_reads_matching_alias(ssh_config: Path) -> None:
+    ssh_config.write_text(
         "Host dev\n  HostName 10.0.0.1\n  User root\n  Port 22\n\nHost other\n  HostName 10.0.0.2\n",
         encoding="utf-8",
     )
 
-    with mock.patch("builtins.open", mock.mock_open(read_data=config_path.read_text(encoding="utf-8"))):
-        ssh_conf = get_ssh_alias_conf("dev")
+    ssh_conf = get_ssh_alias_conf("dev")
 
     assert ssh_conf == {"host": "dev", "hostname": "10.0.0.1", "user": "root", "port": "22"}
 
 
-def test_get_ssh_alias_conf_exits_when_alias_missing(tmp_path: Path) -> None:
-    config_path = tmp_path / "config"
-    config_path.write_text("Host dev\n  HostName 10.0.0.1\n", encoding="utf-8")
+def test_get_ssh_alias_conf_exits_when_alias_missing(ssh_config: Path) -> None:
+    ssh_config.write_text("Host dev\n  HostName 10.0.0.1\n\nHost *\n  User root\n", encoding="utf-8")
 
-    with mock.patch("builtins.open", mock.mock_open(read_data=config_path.read_text(encoding="utf-8"))):
-        with pytest.raises(SystemExit) as exc_info:
-            get_ssh_alias_conf("missing")
+    with pytest.raises(SystemExit) as exc_info:
+        get_ssh_alias_conf("missing")
 
     assert exc_info.value.code == 1
 
 
+def test_get_ssh_alias_conf_first_match(ssh_config: Path) -> None:
+    ssh_config.write_text(
+        "User admin\n"
+        "Host web-1 web-2\n  Port 2222\n"
+        "Host web-* !web-0\n  HostName %h.example.com\n  Port 22\n  IdentityFile ~/.ssh/web\n"
+        "Host *\n  User root\n  IdentityFile ~/.ssh/id_rsa\n",
+        encoding="utf-8",
+    )
+
+    assert get_ssh_alias_conf("web-2") == {
+        "host": "web-2",
+        "user": "admin",
+        "port": "2222",
+        "hostname": "web-2.example.com",
+        "identityfile": "~/.ssh/web",
+    }
+    assert get_ssh_alias_conf("WEB-3")["hostname"] == "WEB-3.example.com"
+    with pytest.raises(SystemExit):
+        get_ssh_alias_conf("web-0")
+
+
+def test_get_ssh_alias_conf_include_and_match(ssh_config: Path) -> None:
+    (ssh_config.parent / "conf.d").mkdir()
+    (ssh_config.parent / "conf.d" / "01-db").write_text("Host db\n  HostName 10.0.0.3\n", encoding="utf-8")
+    (ssh_config.parent / "conf.d" / "02-bastion").write_text("HostName 10.0.0.9\n", encoding="utf-8")
+    ssh_config.write_text(
+        "Include conf.d/01-*\n"
+        "Host bastion\n  Include conf.d/02-bastion\n  User jump\n"
+        'Match host 10.0.0.3 exec "false"\n  Port 1\n'
+        "Match originalhost db user root\n  Port 3306\n"
+        "Match all\n  User root\n",
+        encoding="utf-8",
+    )
+
+    assert get_ssh_alias_conf("db") == {"host": "db", "hostname": "10.0.0.3", "user": "root", "port": "3306"}
+    assert get_ssh_alias_conf("bastion") == {"host": "bastion", "hostname": "10.0.0.9", "user": "jump"}
+    assert get_ssh_aliases() == ["db", "bastion"]
+
+
+def test_load_ssh_config_cache(ssh_config: Path, tmp_path: Path) -> None:
+    ssh_config.write_text("Include conf.d/*\nHost dev\n  HostName 10.0.0.1\n", encoding="utf-8")
+    index_path = str(tmp_path / "index.json")
+    index = load_ssh_config()
+    assert load_ssh_config() is index
+    assert os.path.exists(index_path)
+
+    # 文件没有变化时直接使用缓存的索引
+    with mock.patch.object(SSHConfigIndex, "parse") as mock_parse:
+        assert load_ssh_config(str(ssh_config), index_path) is index
+        cached = SSHConfigIndex.load(index_path, str(ssh_config))
+    mock_parse.assert_not_called()
+    assert cached is not None
+    assert cached.resolve("dev") == {"host": "dev", "hostname": "10.0.0.1"}
+    assert SSHConfigIndex.load(index_path, "/other/config") is None
+
+    # 通配符所在的目录新增文件时重新解析
+    (ssh_config.parent / "conf.d").mkdir()
+    (ssh_config.parent / "conf.d" / "dev").write_text("Host dev\n  HostName 10.0.0.2\n", encoding="utf-8")
+    assert SSHConfigIndex.load(index_path, str(ssh_config)) is None
+    assert SSHConfigIndex.parse(str(ssh_config)).resolve("dev") == {"host": "dev", "hostname": "10.0.0.2"}
+
+
+def test_match_pattern_list() -> None:
+    assert match_pattern_list("web-1", ["web-?"])
+    assert match_pattern_list("Web-1.example.com", ["db", "web-*"])
+    assert not match_pattern_list("web-1", ["*", "!web-1"])
+    assert not match_pattern_list("web-1", ["!db"])
+    assert not match_pattern_list("web-1.", ["web-?"])
+
+
+def test_get_ssh_aliases(ssh_config: Path) -> None:
+    assert get_ssh_aliases() == []
+    _LOADED.clear()
+    config = "Host *\n  User root\n\nHost web-1 web-2\n  HostName 10.0.0.1\n\nHost db web-1 !bastion\n"
+    ssh_config.write_text(config, encoding="utf-8")
+    assert get_ssh_aliases() == ["web-1", "web-2", "db"]
+
+
+def test_is_known_host(ssh_config: Path) -> None:
+    ssh_config.write_text("Host dev\n  HostName 10.0.0.1\n\nHost *\n  User root\n", encoding="utf-8")
+
+    assert is_known_host("dev")
+    assert is_known_host("100.1")
+    assert not is_known_host("missing")
+
+
 def test_merge_ssh_config_for_ip_path() -> None:
     with (
         mock.patch("plum_tools.utils.sshconf.get_host_ip", return_value="10.0.0.1") as mock_get_host_ip,
@@ -0,0 +1,99 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_sshctl
+#         Desc: 测试管理ssh主连接
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-18 00:50
+#=============================================================================
+"""
+
+import os
+import socket
+import subprocess
+from collections.abc import Iterator
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from plum_tools.utils.sshctl import (
+    ControlMaster,
+    format_control_options,
+    get_control_dir,
+    get_control_options,
+    get_control_path,
+    list_masters,
+    stop_masters,
+)
+
+
+@pytest.fixture
+def control_dir(tmp_path: Path) -> Iterator[str]:
+    path = str(tmp_path / "runtime" / "ssh")
+    with mock.patch("plum_tools.utils.sshctl.PathConfig", mock.Mock(SSH_CONTROL_DIR=path)):
+        yield path
+
+
+def test_get_control_dir(control_dir: str) -> None:
+    assert get_control_dir(create=False) is None
+    assert get_control_dir() == control_dir
+    assert os.stat(control_dir).st_mode & 0o777 == 0o700
+    # 其他用户可以访问的目录不能保存 socket
+    os.chmod(control_dir, 0o755)
+    assert get_control_dir() is None
+
+
+def test_get_control_path() -> None:
+    assert get_control_path("root", "10.0.0.1", 22, "/run/ssh") == "/run/ssh/root@10.0.0.1:22"
+    assert get_control_path("root", "a%h", 22, "/run/ssh") == "/run/ssh/root@a%%h:22"
+    assert get_control_path("root", "a" * 100, 22, "/run/ssh") == "/run/ssh/%C"
+
+
+def test_get_control_options(control_dir: str) -> None:
+    assert get_control_options("root", "10.0.0.1", 22, "no") == []
+    assert get_control_options("root", "10.0.0.1", 22, None) == []
+    assert get_control_options("root", "10.0.0.1", 22, "5m") == [
+        "-o",
+        "ControlMaster=auto",
+        "-o",
+        f"ControlPath={control_dir}/root@10.0.0.1:22",
+        "-o",
+        "ControlPersist=5m",
+    ]
+    assert format_control_options("root", "10.0.0.1", 22, "5m") == (
+        f'-o "ControlMaster=auto" -o "ControlPath={control_dir}/root@10.0.0.1:22" -o "ControlPersist=5m"'
+    )
+
+
+def test_list_and_stop_masters(control_dir: str) -> None:
+    assert not list_masters()
+    get_control_dir()
+    Path(control_dir, "not-a-socket").write_text("", encoding="utf-8")
+    sockets = []
+    for name in ("root@10.0.0.2:22", "root@10.0.0.1:22"):
+        sock = socket.socket(socket.AF_UNIX)
+        sock.bind(os.path.join(control_dir, name))
+        sockets.append(sock)
+
+    def control_command(path: str, operation: str) -> subprocess.CompletedProcess:
+        running = path.endswith("10.0.0.1:22")
+        stderr = "Master running (pid=1234)\r\n" if running and operation == "check" else ""
+        return subprocess.CompletedProcess([], 0 if running else 255, "", stderr)
+
+    try:
+        with mock.patch("plum_tools.utils.sshctl.control_command", side_effect=control_command) as mock_command:
+            masters = list_masters()
+            assert masters == [
+                ControlMaster("root@10.0.0.1:22", os.path.join(control_dir, "root@10.0.0.1:22"), 1234),
+                ControlMaster("root@10.0.0.2:22", os.path.join(control_dir, "root@10.0.0.2:22")),
+            ]
+            assert stop_masters() == masters
+        mock_command.assert_any_call(masters[0].path, "exit")
+        # 失效的 socket 直接删除
+        assert not os.path.exists(masters[1].path)
+    finally:
+        for sock in sockets:
+            sock.close()
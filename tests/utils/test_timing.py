@@ -0,0 +1,70 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_timing
+#         Desc: 测试耗时记录
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 21:30
+#=============================================================================
+"""
+
+import io
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from plum_tools.utils.timing import Profiler, format_duration, histogram, print_profile
+
+
+@pytest.mark.parametrize("seconds, text", [(0.0123, "12.3ms"), (0.0001, "0.1ms"), (1.5, "1.50s")])
+def test_format_duration(seconds: float, text: str) -> None:
+    assert format_duration(seconds) == text
+
+
+def test_histogram() -> None:
+    assert histogram([0.0005, 0.002, 0.003, 5], (0.001, 0.01)) == [("<1.0ms", 1), ("<10.0ms", 2), (">=10.0ms", 1)]
+
+
+def test_profiler(tmp_path: Path) -> None:
+    profiler = Profiler()
+    assert list(profiler.iter_span("discovery", ["a", "b"])) == ["a", "b"]
+    profiler.add("repo", "/tmp/a", 1, 0.5)
+    profiler.add("status", "/tmp/a", 1, 0.4)
+    thread = threading.Thread(target=profiler.add, args=("repo", "/tmp/b", 1, 0.1))
+    thread.start()
+    thread.join()
+    with profiler.span("repo", "/tmp/c"):
+        pass
+
+    assert [span.key for span in profiler.slowest("repo", 2)] == ["/tmp/a", "/tmp/b"]
+    assert profiler.totals("/tmp/a") == {"repo": 0.5, "status": 0.4}
+    assert profiler.totals()["repo"] >= 0.6
+    assert len({span.thread for span in profiler.spans}) == 2
+
+    path = str(tmp_path / "trace.json")
+    profiler.write_trace(path)
+    with open(path, encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == 5
+    assert events[1]["ph"] == "X" and events[1]["dur"] == 500000 and events[1]["args"] == {"key": "/tmp/a"}
+    assert events[0]["args"] == {}
+
+
+def test_print_profile() -> None:
+    profiler = Profiler()
+    profiler.add("repo", "/tmp/a", 0, 2)
+    profiler.add("status", "/tmp/a", 0, 1.5)
+    profiler.add("repo", "/tmp/b", 0, 0.002)
+    stream = io.StringIO()
+    print_profile(profiler, "repo", 1, stream)
+
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == "phases: repo 2.00s, status 1.50s"
+    assert lines[1:3] == ["slowest 1:", "     2.00s  /tmp/a  (status 1.50s)"]
+    assert "   <10.0ms | " + "#" * 40 + " 1" in lines
+    assert "   <10.00s | " + "#" * 40 + " 1" in lines
+    assert "  >=10.00s |  0" in lines
@@ -10,6 +10,8 @@
 #=============================================================================
 """
 
+import os
+from collections.abc import Iterator
 from pathlib import Path
 from typing import Any, cast
 from unittest import mock
@@ -56,7 +58,20 @@ def test_global_conf_validates_dynamic_data(kwargs: dict[str, Any], message: str
         conf.get_data()
 
 
-def test_parse_config_yml_returns_cached_data(tmp_path: Path) -> None:
+@pytest.fixture
+def yml_cache(tmp_path: Path) -> Iterator[Path]:
+    cache_path = tmp_path / "cache" / "plum_tools_yaml.marshal"
+    path_config = mock.Mock(
+        PLUM_YML_PATH=PathConfig.PLUM_YML_PATH,
+        PLUM_YML_CACHE_PATH=str(cache_path),
+        ROOT=PathConfig.ROOT,
+        PLUM_YML_NAME=PathConfig.PLUM_YML_NAME,
+    )
+    with mock.patch("plum_tools.utils.utils.PathConfig", path_config):
+        yield cache_path
+
+
+def test_parse_config_yml_returns_cached_data(tmp_path: Path, yml_cache: Path) -> None:
     yml_path = tmp_path / "config.yml"
     # flake8: noqa: E501
     yml_path.write_text(
@@ -70,9 +85,40 @@ def test_parse_config_yml_returns_cached_data(tmp_path: Path) -> None:
 
     assert data == cached
     assert data["host_type_default"] == "10.0.0"
+    # 刚修改过的文件不保存快照
+    assert not yml_cache.exists()
+
+
+def test_parse_config_yml_uses_snapshot(tmp_path: Path, yml_cache: Path) -> None:
+    yml_path = tmp_path / "config.yml"
+    yml_path.write_text(
+        "default_ssh_conf: {user: root, port: 22, identityfile: ~/.ssh/id_rsa}\n"
+        "ipmi_interval: 100\nprojects: []\nhost_type_default: 10.0.0\n",
+        encoding="utf-8",
+    )
+    os.utime(yml_path, ns=(10**18, 10**18))
+    YmlConfig._yml_data = {}
+    data = YmlConfig.parse_config_yml(str(yml_path))
+    assert yml_cache.exists()
+
+    # yml文件没有变化时不需要解析
+    YmlConfig._yml_data = {}
+    with mock.patch("plum_tools.utils.utils.yaml.load") as mock_load:
+        assert YmlConfig.parse_config_yml(str(yml_path)) == data
+    mock_load.assert_not_called()
+
+    # yml文件修改后重新解析
+    yml_path.write_text(yml_path.read_text(encoding="utf-8").replace("10.0.0", "10.0.1"), encoding="utf-8")
+    os.utime(yml_path, ns=(10**18, 10**18 + 1))
+    YmlConfig._yml_data = {}
+    assert YmlConfig.parse_config_yml(str(yml_path))["host_type_default"] == "10.0.1"
+    YmlConfig._yml_data = {}
+    yml_cache.write_bytes(b"broken")
+    assert YmlConfig.parse_config_yml(str(yml_path))["host_type_default"] == "10.0.1"
+    YmlConfig._yml_data = {}
 
 
-def test_parse_config_yml_exits_when_yaml_format_is_invalid(tmp_path: Path) -> None:
+def test_parse_config_yml_exits_when_yaml_format_is_invalid(tmp_path: Path, yml_cache: Path) -> None:
     yml_path = tmp_path / "config.yml"
     yml_path.write_text("default_ssh_conf: {}\nprojects: []\n", encoding="utf-8")
     YmlConfig._yml_data = {}
@@ -84,6 +130,7 @@ def test_parse_config_yml_exits_when_yaml_format_is_invalid(tmp_path: Path) -> N
     ]
 
     with (
+        mock.patch.object(YmlConfig, "_load_snapshot", return_value=None),
         mock.patch("builtins.open", open_mock),
         mock.patch("plum_tools.utils.utils.print_error") as mock_print_error,
         mock.patch("plum_tools.utils.utils.print_text") as mock_print_text,
@@ -96,7 +143,7 @@ def test_parse_config_yml_exits_when_yaml_format_is_invalid(tmp_path: Path) -> N
     mock_print_text.assert_called_once_with("template")
 
 
-def test_parse_config_yml_exits_when_file_is_missing() -> None:
+def test_parse_config_yml_exits_when_file_is_missing(yml_cache: Path) -> None:
     YmlConfig._yml_data = {}
 
     with mock.patch("plum_tools.utils.utils.print_error") as mock_print_error:
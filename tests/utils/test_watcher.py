@@ -0,0 +1,126 @@
+"""
+#=============================================================================
+#  ProjectName: plum-tools
+#     FileName: test_watcher
+#         Desc: 测试监听目录变化
+#       Author: seekplum
+#        Email: 1131909224m@sina.cn
+#     HomePage: seekplum.github.io
+#       Create: 2026-10-17 19:30
+#=============================================================================
+"""
+
+import os
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from plum_tools.utils.watcher import (
+    InotifyWatcher,
+    PollingWatcher,
+    create_watcher,
+    iter_new_watch_dirs,
+    iter_watch_dirs,
+)
+from tests.common import make_repository
+
+inotify = pytest.mark.skipif(not InotifyWatcher.available(), reason="inotify is not available")
+
+
+def test_iter_watch_dirs(tmp_path: Path) -> None:
+    repo = make_repository(str(tmp_path))
+    for path in ("src/lib", "node_modules/pkg", "nested/.git"):
+        os.makedirs(os.path.join(repo, path))
+
+    dirs = set(iter_watch_dirs(repo))
+
+    assert {repo, os.path.join(repo, "src"), os.path.join(repo, "src", "lib")} <= dirs
+    assert os.path.join(repo, ".git") in dirs
+    assert os.path.join(repo, ".git", "refs", "heads") in dirs
+    assert os.path.join(repo, "node_modules") not in dirs
+    assert os.path.join(repo, "nested") not in dirs
+
+
+def test_iter_new_watch_dirs(tmp_path: Path) -> None:
+    repo = make_repository(str(tmp_path))
+    for path in ("src/lib", "node_modules/pkg", "nested/.git", ".git/refs/heads/feature", ".git/rebase-merge"):
+        os.makedirs(os.path.join(repo, path))
+
+    def new_dirs(path: str) -> set[str]:
+        return set(iter_new_watch_dirs(repo, os.path.join(repo, path)))
+
+    assert new_dirs("src") == {os.path.join(repo, "src"), os.path.join(repo, "src", "lib")}
+    assert new_dirs("node_modules/pkg") == set()
+    assert new_dirs("nested") == set()
+    assert new_dirs(".git/refs/heads/feature") == {os.path.join(repo, ".git", "refs", "heads", "feature")}
+    # git目录中只监听引用目录
+    assert new_dirs(".git/rebase-merge") == set()
+    # 无法知道新建了哪些目录时重新遍历整个仓库
+    assert set(iter_new_watch_dirs(repo, repo)) == set(iter_watch_dirs(repo))
+
+
+@inotify
+def test_inotify_watcher(tmp_path: Path) -> None:
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+    with InotifyWatcher() as watcher:
+        watcher.add("repo-a", str(tmp_path / "a"))
+        watcher.add("repo-b", str(tmp_path / "b"))
+        assert watcher.wait(0.01) == set()
+
+        (tmp_path / "a" / "file").write_text("a")
+        assert watcher.wait(1) == {"repo-a"}
+
+        # git的锁文件不会触发
+        (tmp_path / "b" / "index.lock").write_text("b")
+        assert watcher.wait(0.05) == set()
+        os.rename(tmp_path / "b" / "index.lock", tmp_path / "b" / "index")
+        assert watcher.wait(1) == {"repo-b"}
+        assert watcher.pop_new_dirs() == set()
+
+        (tmp_path / "a" / "src").mkdir()
+        assert watcher.wait(1) == {"repo-a"}
+        assert watcher.pop_new_dirs() == {("repo-a", str(tmp_path / "a" / "src"))}
+        assert watcher.pop_new_dirs() == set()
+
+
+@inotify
+def test_inotify_watcher_with_missing_directory(tmp_path: Path) -> None:
+    with InotifyWatcher() as watcher:
+        with pytest.raises(OSError):
+            watcher.add("repo", str(tmp_path / "not-exists"))
+
+
+def test_polling_watcher(tmp_path: Path) -> None:
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "file").write_text("a")
+    watcher = PollingWatcher(interval=0.01)
+    watcher.add("repo", str(tmp_path / "a"))
+    assert watcher.wait(0.02) == set()
+
+    (tmp_path / "a" / "file").write_text("changed")
+    os.utime(tmp_path / "a" / "file", (1000, 1000))
+    assert watcher.wait(0.1) == {"repo"}
+    assert watcher.wait(0.02) == set()
+
+    assert watcher.pop_new_dirs() == set()
+
+    (tmp_path / "a" / "src").mkdir()
+    assert watcher.wait(0.1) == {"repo"}
+    assert watcher.pop_new_dirs() == {("repo", str(tmp_path / "a" / "src"))}
+    assert watcher.pop_new_dirs() == set()
+
+    (tmp_path / "a" / "src").rmdir()
+    assert watcher.wait(0.1) == {"repo"}
+    (tmp_path / "a" / "file").unlink()
+    (tmp_path / "a").rmdir()
+    assert watcher.wait(0.1) == {"repo"}
+    # 被删除的目录不再检查
+    assert watcher.wait(0.02) == set()
+
+
+def test_create_watcher() -> None:
+    assert isinstance(create_watcher(polling=True), PollingWatcher)
+    with mock.patch.object(InotifyWatcher, "available", return_value=False):
+        assert isinstance(create_watcher(), PollingWatcher)